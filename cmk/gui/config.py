@@ -28,8 +28,9 @@ import sys
 import errno
 import os
 import copy
+import cPickle
 import json
-from typing import Callable, Union, Tuple, Dict  # pylint: disable=unused-import
+from typing import Any, Callable, Union, Tuple, Dict  # pylint: disable=unused-import
 import six
 from pathlib2 import Path
 
@@ -148,7 +149,7 @@ aggregation_functions = {}
 
 def initialize():
     clear_user_login()
-    load_config()
+    _load_cached_config()
     log.set_log_levels(log_levels)
     cmk.gui.i18n.set_user_localizations(user_localizations)
 
@@ -165,17 +166,109 @@ def _load_config_file(path):
         raise MKConfigError(_("Cannot read configuration file %s: %s:") % (path, e))
 
 
-# Load multisite.mk and all files in multisite.d/. This will happen
-# for *each* HTTP request.
-# FIXME: Optimize this to cache the config etc. until either the config files or plugins
-# have changed. We could make this being cached for multiple requests just like the
-# plugins of other modules. This may save significant time in case of small requests like
-# the graph ajax page or similar.
+def _generation_file_path():
+    # type: () -> str
+    return config_dir + "/.config_generation"
+
+
+def bump_config_generation():
+    # type: () -> None
+    """Make all application processes load the configuration and the plugins again
+
+    Needs to be called after the configuration files or the plugins of the GUI have
+    been changed."""
+    store.save_file(_generation_file_path(), "%s\n" % utils.gen_id())
+
+
+def config_generation():
+    # type: () -> Tuple
+    """Identifies the state of the GUI configuration files and plugins
+
+    Instead of walking all configuration and plugin files only the generation file,
+    which is replaced on every change, and multisite.mk, which is often edited manually,
+    are checked."""
+    return tuple((path, _file_state(path)) for path in [
+        _generation_file_path(),
+        cmk.utils.paths.default_config_dir + "/multisite.mk",
+    ])
+
+
+def _file_state(path):
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+    return st.st_ino, st.st_mtime, st.st_size
+
+
+# The configuration values read by the last load_config() of this process together with
+# the configuration generation they were read with. The values do not depend on the
+# language: The configuration is loaded before the language of the user is known.
+_config_cache = {}  # type: Dict[str, Any]
+
+
+def _load_cached_config():
+    # type: () -> None
+    """Load the configuration or reuse the one loaded by a previous request of this process"""
+    if _config_cache.get("key") != config_generation():
+        load_config()
+        return
+
+    for varname, (is_pickled, value) in _config_cache["values"].items():
+        globals()[varname] = _thaw_config_value(is_pickled, value)
+
+    # The hooks update registries of other modules which may have been reset in the meantime,
+    # e.g. when the plugins have been loaded again for another language
+    execute_post_config_load_hooks()
+
+
+def _freeze_config_value(value):
+    # type: (Any) -> Tuple[bool, Any]
+    """Keep a copy of the given value which is not affected by changes made during a request
+
+    Unpickling is a lot faster than deep copying for the large structures found in the
+    configuration, e.g. the users. Values which can not be pickled are deep copied."""
+    if _is_immutable(value):
+        return False, value
+
+    try:
+        return True, cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return False, copy.deepcopy(value)
+
+
+def _thaw_config_value(is_pickled, value):
+    # type: (bool, Any) -> Any
+    if is_pickled:
+        return cPickle.loads(value)
+    if _is_immutable(value):
+        return value
+    return copy.deepcopy(value)
+
+
+def _is_immutable(value):
+    # type: (Any) -> bool
+    if value is None or isinstance(value, (bool, int, long, float, six.string_types)):
+        return True
+    if isinstance(value, (tuple, frozenset)):
+        return all(_is_immutable(element) for element in value)
+    return False
+
+
+# Load multisite.mk and all files in multisite.d/. The loaded configuration is kept
+# for the following requests of this process until the configuration generation changes.
 def load_config():
     global sites
 
+    # Determine the key before reading the files. Changes made while loading will then
+    # lead to loading the configuration again with the next request.
+    cache_key = config_generation()
+
     # Set default values for all user-changable configuration settings
     _initialize_with_default_config()
+    vars_before_config_files = all_nonfunction_vars(globals())
 
     # Initialze sites with default site configuration. Need to do it here to
     # override possibly deleted sites
@@ -203,6 +296,19 @@ def load_config():
         sites = default_single_site_configuration()
 
     _prepare_tag_config()
+
+    # Variables only defined by the configuration files already exist when loading the
+    # files again. Keep the ones found during the previous loads of this process.
+    varnames = set(default_config).union(
+        all_nonfunction_vars(globals()).difference(vars_before_config_files),
+        _config_cache.get("values", {}), ["sites", "tags"])
+    _config_cache["key"] = cache_key
+    _config_cache["values"] = {
+        varname: _freeze_config_value(value)
+        for varname, value in globals().items()
+        if varname in varnames
+    }
+
     execute_post_config_load_hooks()
 
 
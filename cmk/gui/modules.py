@@ -45,15 +45,13 @@
 #              import ...
 #
 
-import errno
-import os
 import sys
 from types import ModuleType
 
 import cmk
-import cmk.utils.paths
 
 import cmk.gui.utils as utils
+import cmk.gui.config as config
 import cmk.gui.pages
 from cmk.gui.globals import html, current_app
 
@@ -148,41 +146,22 @@ def _cmk_gui_top_level_modules():
     ]
 
 
-def _find_local_web_plugins():
-    basedir = cmk.utils.paths.local_web_dir + "/plugins/"
-
-    try:
-        plugin_dirs = os.listdir(basedir)
-    except OSError as e:
-        if e.errno == errno.ENOENT:
-            return
-        else:
-            raise
-
-    for plugins_dir in plugin_dirs:
-        dir_path = basedir + plugins_dir
-        yield dir_path  # Changes in the directory like deletion of files!
-        if os.path.isdir(dir_path):
-            for file_name in os.listdir(dir_path):
-                if file_name.endswith(".py") or file_name.endswith(".pyc"):
-                    yield dir_path + "/" + file_name
-
-
-_last_web_plugins_update = 0
+_last_plugins_generation = None
 
 
 def _local_web_plugins_have_changed():
-    global _last_web_plugins_update
+    """Whether or not the plugins have to be loaded again
+
+    The plugins are kept for the following requests of this process until the
+    configuration generation changes (see config.bump_config_generation())."""
+    global _last_plugins_generation
 
     if "local_web_plugins_have_changed" in current_app.g:
         return current_app.g["local_web_plugins_have_changed"]
 
-    this_time = 0.0
-    for path in _find_local_web_plugins():
-        this_time = max(os.stat(path).st_mtime, this_time)
-    last_time = _last_web_plugins_update
-    _last_web_plugins_update = this_time
+    generation = config.config_generation()
+    have_changed = generation != _last_plugins_generation
+    _last_plugins_generation = generation
 
-    have_changed = this_time > last_time
     current_app.g["local_web_plugins_have_changed"] = have_changed
     return have_changed
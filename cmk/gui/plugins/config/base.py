@@ -54,6 +54,7 @@ log_levels = {
     "cmk.web.auth": 30,
     "cmk.web.bi.compilation": 30,
     "cmk.web.automations": 30,
+    "cmk.web.setup": 30,
 }
 
 multisite_users = {}
@@ -100,6 +101,7 @@ failed_notification_horizon = 7 * 60 * 60 * 24
 
 soft_query_limit = 1000
 hard_query_limit = 5000
+view_page_size = 1000
 
 #    ____                        _
 #   / ___|  ___  _   _ _ __   __| |___
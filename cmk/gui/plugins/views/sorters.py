@@ -84,6 +84,10 @@ class SorterSvcstate(Sorter):
     def cmp(self, r1, r2):
         return cmp(cmp_state_equiv(r1), cmp_state_equiv(r2))
 
+    @property
+    def sort_key(self):
+        return cmp_state_equiv
+
 
 @sorter_registry.register
 class SorterHoststate(Sorter):
@@ -102,6 +106,10 @@ class SorterHoststate(Sorter):
     def cmp(self, r1, r2):
         return cmp(cmp_host_state_equiv(r1), cmp_host_state_equiv(r2))
 
+    @property
+    def sort_key(self):
+        return cmp_host_state_equiv
+
 
 @sorter_registry.register
 class SorterSiteHost(Sorter):
@@ -120,6 +128,10 @@ class SorterSiteHost(Sorter):
     def cmp(self, r1, r2):
         return cmp(r1["site"], r2["site"]) or cmp_num_split("host_name", r1, r2)
 
+    @property
+    def sort_key(self):
+        return lambda row: (row["site"], utils.num_split(row["host_name"].lower()))
+
 
 @sorter_registry.register
 class SorterHostName(Sorter):
@@ -138,6 +150,10 @@ class SorterHostName(Sorter):
     def cmp(self, r1, r2):
         return cmp_num_split("host_name", r1, r2)
 
+    @property
+    def sort_key(self):
+        return lambda row: utils.num_split(row["host_name"].lower())
+
 
 @sorter_registry.register
 class SorterSitealias(Sorter):
@@ -282,8 +298,14 @@ def cmp_service_name(column, r1, r2):
            cmp_num_split(column, r1, r2)
 
 
+def service_name_sort_key(row):
+    description = row["service_description"]
+    return cmp_service_name_equiv(description), utils.num_split(description.lower())
+
+
 #                      name                      title                              column                       sortfunction
-declare_simple_sorter("svcdescr", _("Service description"), "service_description", cmp_service_name)
+declare_simple_sorter("svcdescr", _("Service description"), "service_description", cmp_service_name,
+                      service_name_sort_key)
 declare_simple_sorter("svcdispname", _("Service alternative display name"), "service_display_name",
                       cmp_simple_string)
 declare_simple_sorter("svcoutput", _("Service plugin output"), "service_plugin_output",
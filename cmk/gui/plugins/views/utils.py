@@ -34,7 +34,7 @@ import time
 import re
 import hashlib
 import traceback
-from typing import Tuple, List, Optional, Union, Text, Dict, Callable, Type  # pylint: disable=unused-import
+from typing import Tuple, List, Optional, Union, Text, Dict, Callable, Type, Any  # pylint: disable=unused-import
 import six
 
 import livestatus
@@ -666,6 +666,14 @@ class RowTable(object):
     def query(self, view, columns, headers, only_sites, limit, all_active_filters):
         raise NotImplementedError()
 
+    def count(self, view, headers, only_sites, all_active_filters):
+        # type: (Any, str, Optional[List[str]], List) -> Optional[int]
+        """Count the rows query() would return without fetching them
+
+        Tables which are not able to count the rows on their own return None.
+        The rows are fetched and counted in this case."""
+        return None
+
 
 class RowTableLivestatus(RowTable):
     def __init__(self, table_name):
@@ -746,6 +754,27 @@ class RowTableLivestatus(RowTable):
 
         return rows
 
+    def count(self, view, headers, only_sites, all_active_filters):
+        """Count the rows with a Livestatus Stats: query
+
+        This is not possible in case the rows are merged or post processed
+        after fetching them, e.g. by a data source or a specialized table."""
+        datasource = view.datasource
+        if datasource.merge_by or not datasource.keys \
+           or "Stats:" in datasource.add_headers \
+           or type(datasource).post_process.__func__ is not DataSource.post_process.__func__ \
+           or type(self).query.__func__ is not RowTableLivestatus.query.__func__:
+            return None
+
+        # Every row has either an empty or a non empty key. This works for
+        # all column types and, in contrast to a dummy filter, never changes
+        # the result.
+        key_column = datasource.keys[0]
+        query = "GET %s\n" % self.table_name
+        query += headers + datasource.add_headers
+        query += "Stats: %s = \nStats: %s != \nStatsOr: 2\n" % (key_column, key_column)
+        return sum(query_livestatus_column(query, only_sites, datasource.auth_domain))
+
 
 def query_livestatus(query, only_sites, limit, auth_domain):
 
@@ -781,6 +810,19 @@ def query_livestatus(query, only_sites, limit, auth_domain):
     return data
 
 
+def query_livestatus_column(query, only_sites, auth_domain):
+    """Returns the first column of all rows, e.g. the results of a Stats: query per site"""
+    if only_sites:
+        sites.live().set_only_sites(only_sites)
+
+    sites.live().set_auth_domain(auth_domain)
+    data = sites.live().query_column(query)
+    sites.live().set_auth_domain("read")
+    sites.live().set_only_sites(None)
+
+    return data
+
+
 # TODO: Return value of render() could be cleaned up e.g. to a named tuple with an
 # optional CSS class. A lot of painters don't specify CSS classes.
 # TODO: Since we have the reporting also working with the painters it could be useful
@@ -985,6 +1027,17 @@ class Sorter(object):
         one service, etc."""
         raise NotImplementedError()
 
+    @property
+    def sort_key(self):
+        # type: () -> Optional[Callable[[Dict], Any]]
+        """Optional function computing a sort key of a data row
+
+        The rows of sorters having a sort key are sorted by the keys, which
+        are computed only once per row. This is a lot faster than calling
+        cmp() for each comparison. The keys must order the rows exactly like
+        cmp() does."""
+        return None
+
     @property
     def _args(self):
         # type: () -> Optional[List]
@@ -1022,6 +1075,7 @@ def register_sorter(ident, spec):
             "columns": property(lambda s: s._spec["columns"]),
             "load_inv": property(lambda s: s._spec.get("load_inv", False)),
             "cmp": spec["cmp"],
+            "sort_key": property(lambda s: s._spec.get("sort_key")),
         })
     sorter_registry.register(cls)
 
@@ -1202,12 +1256,21 @@ def paint_nagiosflag(row, field, bold_if_nonzero):
     return "goodflag", yesno
 
 
-def declare_simple_sorter(name, title, column, func):
-    register_sorter(name, {
-        "title": title,
-        "columns": [column],
-        "cmp": lambda self, r1, r2: func(column, r1, r2)
-    })
+def declare_simple_sorter(name, title, column, func, sort_key=None):
+    """Register a sorter comparing the values of one column with func
+
+    In case no sort_key function is given, it is derived from the well known
+    compare functions, e.g. cmp_simple_string()."""
+    if sort_key is None:
+        sort_key = column_sort_key(func, column)
+
+    register_sorter(
+        name, {
+            "title": title,
+            "columns": [column],
+            "cmp": lambda self, r1, r2: func(column, r1, r2),
+            "sort_key": sort_key,
+        })
 
 
 def declare_1to1_sorter(painter_name, func, col_num=0, reverse=False):
@@ -1215,13 +1278,16 @@ def declare_1to1_sorter(painter_name, func, col_num=0, reverse=False):
 
     if not reverse:
         cmp_func = lambda self, r1, r2: func(painter.columns[col_num], r1, r2)
+        sort_key = column_sort_key(func, painter.columns[col_num])
     else:
         cmp_func = lambda self, r1, r2: func(painter.columns[col_num], r2, r1)
+        sort_key = None
 
     register_sorter(painter_name, {
         "title": painter.title,
         "columns": painter.columns,
         "cmp": cmp_func,
+        "sort_key": sort_key,
     })
     return painter_name
 
@@ -1248,6 +1314,11 @@ def cmp_insensitive_string(v1, v2):
     return c
 
 
+def _insensitive_string_key(value):
+    """Sort key ordering like cmp_insensitive_string()"""
+    return value.lower(), value
+
+
 def cmp_string_list(column, r1, r2):
     v1 = ''.join(r1.get(column, []))
     v2 = ''.join(r2.get(column, []))
@@ -1273,16 +1344,35 @@ def cmp_custom_variable(r1, r2, key, cmp_func):
 
 
 def cmp_ip_address(column, r1, r2):
-    def split_ip(ip):
-        try:
-            return tuple(int(part) for part in ip.split('.'))
-        except:
-            return ip
-
-    v1, v2 = split_ip(r1.get(column, '')), split_ip(r2.get(column, ''))
+    v1, v2 = _split_ip_address(r1.get(column, '')), _split_ip_address(r2.get(column, ''))
     return cmp(v1, v2)
 
 
+def _split_ip_address(ip):
+    try:
+        return tuple(int(part) for part in ip.split('.'))
+    except:
+        return ip
+
+
+def column_sort_key(func, column):
+    # type: (Callable, str) -> Optional[Callable[[Dict], Any]]
+    """Returns the sort key function of a column compared by one of the compare functions above
+
+    Returns None in case there is no sort key function known for func."""
+    if func is cmp_simple_number:
+        return lambda row: row.get(column)
+    if func is cmp_num_split:
+        return lambda row: cmk.gui.utils.num_split(row[column].lower())
+    if func is cmp_simple_string:
+        return lambda row: _insensitive_string_key(row.get(column, ''))
+    if func is cmp_string_list:
+        return lambda row: _insensitive_string_key(''.join(row.get(column, [])))
+    if func is cmp_ip_address:
+        return lambda row: _split_ip_address(row.get(column, ''))
+    return None
+
+
 def get_custom_var(row, key):
     return row["custom_variables"].get(key, "")
 
@@ -195,7 +195,10 @@ class ConfigVariableLogLevels(ConfigVariable):
                "details for each executed compilation.")),
             ("cmk.web.automations", _("Automation calls"),
              _("Communication between different components of Check_MK (e.g. GUI and check engine) "
-               "will be logged in this log level."))
+               "will be logged in this log level.")),
+            ("cmk.web.setup", _("Request setup"),
+             _("If this option is set to \"Informational\", the time needed for loading the "
+               "configuration and the plugins is logged for each request.")),
         ]:
             elements.append((level_id,
                              LogLevelChoice(
@@ -416,6 +419,33 @@ class ConfigVariableHardQueryLimit(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableViewPageSize(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupUserInterface
+
+    def domain(self):
+        return ConfigDomainGUI
+
+    def ident(self):
+        return "view_page_size"
+
+    def valuespec(self):
+        return Optional(
+            Integer(
+                title=_("Rows per page"),
+                minvalue=1,
+                default_value=1000,
+            ),
+            title=_("Split views into pages"),
+            help=_("Views showing more rows than this are split into pages. Only the rows "
+                   "of the current page are rendered, the other pages can be reached with "
+                   "the links below the view. This keeps views with many thousands of rows "
+                   "usable. Commands are still applied to the rows of all pages."),
+            none_label=_("Show all rows on one page"),
+        )
+
+
 @config_variable_registry.register
 class ConfigVariableQuicksearchDropdownLimit(ConfigVariable):
     def group(self):
@@ -2407,6 +2437,54 @@ class ConfigVariableDelayPrecompile(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableNagiosIncrementalConfig(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "nagios_incremental_config"
+
+    def valuespec(self):
+        return Checkbox(
+            title=_("Incremental creation of the Nagios configuration"),
+            label=_("reuse the objects of unchanged hosts"),
+            help=_("When activating the changes, the object definitions of all hosts and "
+                   "services are created again. With this option enabled, the definitions "
+                   "of each host are saved together with a fingerprint of the configuration "
+                   "they were created from. Hosts having an unchanged fingerprint reuse their "
+                   "previous definitions. Any change of a rule or a global setting changes "
+                   "the fingerprint of all hosts. This option is only used by the Nagios core."),
+        )
+
+
+@config_variable_registry.register
+class ConfigVariableNagiosConfigProcesses(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "nagios_config_processes"
+
+    def valuespec(self):
+        return Integer(
+            title=_("Processes for creating the Nagios configuration"),
+            help=_("The number of processes creating the object definitions of the hosts "
+                   "and services when activating the changes. Using more than one process "
+                   "speeds up the activation in large setups on systems with multiple CPU "
+                   "cores. The resulting configuration is the same. This option is only "
+                   "used by the Nagios core."),
+            minvalue=1,
+            unit=_("processes"),
+        )
+
+
 @config_variable_registry.register
 class ConfigVariableClusterMaxCachefileAge(ConfigVariable):
     def group(self):
@@ -2430,6 +2508,78 @@ class ConfigVariableClusterMaxCachefileAge(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableItemStateStore(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "item_state_store"
+
+    def valuespec(self):
+        return DropdownChoice(
+            title=_("Format of the counter files"),
+            help=_("Checks keep values like counters between two check executions in one file "
+                   "per host. The binary format only appends the values that changed since the "
+                   "last check and only decodes the values the checks ask for. This is much "
+                   "faster for hosts with many services. The text format writes the whole file "
+                   "each time. Both formats can always be read. Existing files are converted "
+                   "the next time they are written or with <tt>cmk --convert-item-states</tt>."),
+            choices=[
+                ("binary", _("Binary (append changes)")),
+                ("repr", _("Text (rewrite the whole file)")),
+            ],
+        )
+
+
+@config_variable_registry.register
+class ConfigVariablePredictionPrecomputeLeadTime(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "prediction_precompute_lead_time"
+
+    def valuespec(self):
+        return Age(
+            title=_("Precompute predictive levels in advance"),
+            help=_("The predictions of the services using predictive levels are computed by a "
+                   "background job before the current predictions are outdated. This way the "
+                   "checks don't need to compute them at the beginning of a time period, e.g. "
+                   "at midnight. This setting defines how long before that the predictions "
+                   "are computed."),
+            minvalue=0,
+        )
+
+
+@config_variable_registry.register
+class ConfigVariablePredictionPrecomputeRate(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "prediction_precompute_rate"
+
+    def valuespec(self):
+        return Float(
+            title=_("Maximum rate of precomputing predictive levels"),
+            help=_("The maximum number of predictions the background job computes per "
+                   "second. Each computation fetches the historic data of a metric via "
+                   "Livestatus."),
+            unit=_("predictions/s"),
+            minvalue=0.1,
+        )
+
+
 @config_variable_registry.register
 class ConfigVariablePiggybackMaxCachefileAge(ConfigVariable):
     def group(self):
@@ -2526,6 +2676,76 @@ class ConfigVariableUseInlineSNMP(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableUseNativeSNMP(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "use_native_snmp"
+
+    def valuespec(self):
+        return Checkbox(
+            title=_("Use native SNMP"),
+            label=_("Enable the native SNMP implementation of Check_MK"),
+            help=_(
+                "Instead of executing the Net-SNMP command line tools for each request, Check_MK "
+                "can talk to the SNMP agents itself. It then keeps one UDP socket per host while "
+                "the host is being processed, walks the columns of SNMP tables concurrently and "
+                "uses GETBULK requests with the configured bulk size for bulk walk hosts. This "
+                "implementation supports SNMP v1 and v2c. Hosts using SNMP v3 and hosts using "
+                "Inline SNMP are not affected by this setting."),
+        )
+
+
+@config_variable_registry.register
+class ConfigVariableSNMPConcurrentHosts(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "snmp_concurrent_hosts"
+
+    def valuespec(self):
+        return Integer(
+            title=_("Number of hosts walked concurrently"),
+            help=_("When the services of several hosts are discovered, the native SNMP "
+                   "implementation can walk this number of hosts concurrently from one process. "
+                   "Each host uses its own SNMP timing settings, so slow or unreachable hosts do "
+                   "not delay the walks of the other hosts. This only affects hosts using the "
+                   "native SNMP implementation."),
+            minvalue=1,
+        )
+
+
+@config_variable_registry.register
+class ConfigVariableAgentConcurrentHosts(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "agent_concurrent_hosts"
+
+    def valuespec(self):
+        return Integer(
+            title=_("Number of agents fetched concurrently"),
+            help=_("When the services of several hosts are discovered, Check_MK can fetch the "
+                   "outputs of this number of Check_MK agents concurrently via TCP from one "
+                   "process. Each host uses its own connect timeout, so unreachable hosts do "
+                   "not delay the other hosts."),
+            minvalue=1,
+        )
+
+
 @config_variable_registry.register
 class ConfigVariableRecordInlineSNMPStats(ConfigVariable):
     def group(self):
@@ -2550,6 +2770,36 @@ class ConfigVariableRecordInlineSNMPStats(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableSNMPTableWalkMinColumns(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "snmp_table_walk_min_columns"
+
+    def valuespec(self):
+        return Optional(
+            Integer(
+                title=_("Minimum number of columns"),
+                minvalue=2,
+                default_value=5,
+            ),
+            title=_("Walk whole SNMP tables"),
+            label=_("Walk the whole table when a check needs many columns of it"),
+            help=_("By default each column of an SNMP table needed by a check is fetched with "
+                   "a separate walk. When a check needs at least the configured number of "
+                   "columns of a table, the whole table is fetched with a single walk instead. "
+                   "This needs far less requests for large tables, e.g. the interface tables of "
+                   "switches, but also fetches the columns of the table not needed by the check. "
+                   "Columns of different tables are always fetched with separate walks."),
+            none_label=_("Walk each column separately"),
+        )
+
+
 @config_variable_registry.register
 class ConfigVariableHTTPProxies(ConfigVariable):
     def group(self):
@@ -32,8 +32,11 @@ import cmk.utils.paths
 
 from cmk.gui.valuespec import (
     Age,
+    TextAscii,
     TextUnicode,
     Integer,
+    Float,
+    Dictionary,
     Tuple,
     ListOf,
     DropdownChoice,
@@ -184,6 +187,119 @@ class ConfigVariableNotificationPluginTimeout(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableNotificationSpoolerWorkers(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupNotifications
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "notification_spooler_workers"
+
+    def valuespec(self):
+        return Integer(
+            title=_("Notification spooler: Concurrent deliveries per plugin"),
+            help=_("The notification spooler (<tt>cmk --notify spooler</tt>) delivers the "
+                   "asynchronously spooled notifications. Each notification plugin has its own "
+                   "pool of worker processes. This is the number of workers of a plugin, i.e. "
+                   "the number of notifications of a plugin that are being delivered at the "
+                   "same time. The spooler is started when the site option "
+                   "<tt>NOTIFICATION_SPOOLER</tt> is enabled (<tt>omd config set "
+                   "NOTIFICATION_SPOOLER on</tt>)."),
+            minvalue=1,
+        )
+
+
+@config_variable_registry.register
+class ConfigVariableNotificationSpoolerPlugins(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupNotifications
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "notification_spooler_plugins"
+
+    def valuespec(self):
+        return Transform(
+            ListOf(
+                Tuple(
+                    elements=[
+                        TextAscii(
+                            title=_("Notification plugin"),
+                            help=_("The name of the notification script, e.g. <tt>mail</tt> "
+                                   "or <tt>sms</tt>"),
+                            allow_empty=False,
+                        ),
+                        Dictionary(
+                            elements=[
+                                ("workers", Integer(
+                                    title=_("Concurrent deliveries"),
+                                    minvalue=1,
+                                )),
+                                ("rate",
+                                 Float(
+                                     title=_("Maximum deliveries per second"),
+                                     minvalue=0.001,
+                                 )),
+                            ],),
+                    ],
+                    orientation="horizontal",
+                ),),
+            forth=lambda settings: sorted(settings.items()),
+            back=dict,
+            title=_("Notification spooler: Plugin specific settings"),
+            help=_("Override the number of concurrent deliveries of the notification spooler "
+                   "for single notification plugins and limit their rate of deliveries, e.g. "
+                   "when a SMS gateway is only able to send a few messages per second. "
+                   "Notifications that exceed the rate are being delayed."),
+        )
+
+
+@config_variable_registry.register
+class ConfigVariableNotificationSpoolerMaxQueue(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupNotifications
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "notification_spooler_max_queue"
+
+    def valuespec(self):
+        return Integer(
+            title=_("Notification spooler: Maximum queue length"),
+            help=_("The maximum number of spooled notifications the notification spooler reads "
+                   "ahead. Further notifications remain in the spool directory until the "
+                   "workers have catched up."),
+            minvalue=1,
+        )
+
+
+@config_variable_registry.register
+class ConfigVariableNotificationSpoolerRetryInterval(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupNotifications
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "notification_spooler_retry_interval"
+
+    def valuespec(self):
+        return Age(
+            title=_("Notification spooler: Retry interval"),
+            help=_("When a notification plugin exits with a temporary error (exit code 1), "
+                   "the notification spooler retries the delivery after this time."),
+            minvalue=1,
+        )
+
+
 @config_variable_registry.register
 class ConfigVariableNotificationLogging(ConfigVariable):
     def group(self):
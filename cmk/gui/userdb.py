@@ -779,6 +779,7 @@ def split_dict(d, keylist, positive):
 
 def save_users(profiles):
     write_contacts_and_users_file(profiles)
+    config.bump_config_generation()
 
     # Execute user connector save hooks
     hook_save(profiles)
@@ -77,6 +77,7 @@ from cmk.gui.plugins.visuals.utils import (
     visual_info_registry,
     visual_type_registry,
     VisualType,
+    Filter,
 )
 from cmk.gui.plugins.views.icons.utils import (
     icon_and_action_registry,
@@ -437,8 +438,11 @@ class GUIViewRenderer(ViewRenderer):
             # Limit exceeded? Show warning
             if display_options.enabled(display_options.W):
                 cmk.gui.view_utils.check_limit(rows, self.view.row_limit, config.user)
-            layout.render(rows, view_spec, group_cells, cells, num_columns, show_checkboxes and
+            page_rows, page, num_pages = _get_page_of_rows(rows)
+            layout.render(page_rows, view_spec, group_cells, cells, num_columns, show_checkboxes and
                           not html.do_actions())
+            if num_pages > 1:
+                _show_page_navigation(page, num_pages, len(rows))
             headinfo = "%d %s" % (row_count, _("row") if row_count == 1 else _("rows"))
             if show_checkboxes:
                 selected = filter_selected_rows(
@@ -1280,6 +1284,12 @@ def show_view(view, view_renderer, only_count=False):
 
     headers = filterheaders + view.spec.get("add_headers", "")
 
+    if only_count:
+        row_count = _count_rows_with_stats(view, headers, all_active_filters)
+        if row_count is not None:
+            _remove_context_vars(view)
+            return row_count
+
     # Sorting - use view sorters and URL supplied sorters
     if only_count:
         sorters = []
@@ -1338,11 +1348,9 @@ def show_view(view, view_renderer, only_count=False):
         cmk.gui.plugins.views.availability.render_bi_availability(view_title(view.spec), rows)
         return
 
-    # TODO: Use livestatus Stats: instead of fetching rows!
+    # Views which can not be counted by Livestatus, see _count_rows_with_stats()
     if only_count:
-        for filter_vars in view.spec["context"].itervalues():
-            for varname in filter_vars.iterkeys():
-                html.request.del_var(varname)
+        _remove_context_vars(view)
         return len(rows)
 
     # The layout of the view: it can be overridden by several specifying
@@ -1384,6 +1392,35 @@ def show_view(view, view_renderer, only_count=False):
                          show_filters)
 
 
+def _count_rows_with_stats(view, headers, all_active_filters):
+    """Count the rows of the view without fetching them
+
+    Returns None in case the rows can not be counted by the data source, e.g.
+    because a filter in use processes the fetched rows."""
+    if any(_filters_fetched_rows(f) for f in all_active_filters):
+        return None
+
+    row_count = view.datasource.table.count(view, headers, view.only_sites, all_active_filters)
+
+    # Be consistent with counting the fetched rows, which are limited
+    if row_count is not None and view.row_limit is not None:
+        return min(row_count, view.row_limit + 1)
+    return row_count
+
+
+def _filters_fetched_rows(filt):
+    """Whether or not the filter is in use and filters the rows after fetching them"""
+    if type(filt).filter_table.__func__ is Filter.filter_table.__func__:
+        return False
+    return any(html.request.var(varname) for varname in filt.htmlvars)
+
+
+def _remove_context_vars(view):
+    for filter_vars in view.spec["context"].itervalues():
+        for varname in filter_vars.iterkeys():
+            html.request.del_var(varname)
+
+
 def _get_all_active_filters(view):
     # Always allow the users to specify all allowed filters using the URL
     use_filters = visuals.filters_allowed_for_infos(view.datasource.infos).values()
@@ -1595,6 +1632,42 @@ def get_only_sites():
     return None
 
 
+def _get_page_of_rows(rows):
+    # type: (List[Dict]) -> tuple
+    """Returns the rows of the page to show, the number of the page and the number of pages
+
+    HTML views having more than config.view_page_size rows are split into
+    pages. The page to show is taken from the HTML variable "view_page"."""
+    page_size = config.view_page_size
+    if not page_size or html.output_format != "html" or len(rows) <= page_size:
+        return rows, 1, 1
+
+    num_pages = (len(rows) + page_size - 1) // page_size
+    try:
+        page = html.get_integer_input("view_page", 1)
+    except MKUserError:
+        page = 1
+    # The number of rows may have shrunk since the page link was rendered
+    page = min(max(page, 1), num_pages)
+
+    return rows[(page - 1) * page_size:page * page_size], page, num_pages
+
+
+def _show_page_navigation(page, num_pages, num_rows):
+    # type: (int, int, int) -> None
+    first_row = (page - 1) * config.view_page_size + 1
+    last_row = min(page * config.view_page_size, num_rows)
+
+    html.open_div(class_="view_paging")
+    if page > 1:
+        html.a(_("Previous page"), href=html.makeuri([("view_page", page - 1)]))
+    html.span(
+        _("Page %d of %d (rows %d to %d of %d)") % (page, num_pages, first_row, last_row, num_rows))
+    if page < num_pages:
+        html.a(_("Next page"), href=html.makeuri([("view_page", page + 1)]))
+    html.close_div()
+
+
 def get_limit():
     """How many data rows may the user query?"""
     limitvar = html.request.var("limit", "soft")
@@ -1859,11 +1932,41 @@ def ajax_count_button():
 # for same objects (e.g. host_name in table services and
 # simply name in table hosts)
 def sort_data(data, sorters):
-    if not sorters:
-        return
+    """Sort the rows in place according to the list of sorters
+
+    The rows are sorted by one sorter after another, beginning with the least
+    significant one. Since sorting is stable, this results in the same order
+    as comparing the rows with all sorters at once. Sorters having a sort key
+    sort by the keys computed once per row, only the others need to compare
+    the rows with cmp()."""
+    for entry in reversed(sorters):
+        sort_key = entry.sorter.sort_key
+        if sort_key is not None:
+            if entry.join_key:
+                sort_key = _join_sort_key(sort_key, entry.join_key)
+            data.sort(key=sort_key, reverse=entry.negate)
+        else:
+            compfunc = entry.sorter.cmp
+            if entry.join_key:
+                compfunc = _join_cmp(compfunc, entry.join_key)
+            data.sort(cmp=compfunc, reverse=entry.negate)
+
 
-    # Handle case where join columns are not present for all rows
-    def safe_compare(compfunc, row1, row2):
+# Handle case where join columns are not present for all rows: These rows
+# are sorted first.
+def _join_sort_key(sort_key, join_key):
+    def key(row):
+        joined_row = row["JOIN"].get(join_key)
+        if joined_row is None:
+            return (0,)
+        return (1, sort_key(joined_row))
+
+    return key
+
+
+def _join_cmp(compfunc, join_key):
+    def compare(e1, e2):
+        row1, row2 = e1["JOIN"].get(join_key), e2["JOIN"].get(join_key)
         if row1 is None and row2 is None:
             return 0
         elif row1 is None:
@@ -1873,21 +1976,7 @@ def sort_data(data, sorters):
 
         return compfunc(row1, row2)
 
-    def multisort(e1, e2):
-        for entry in sorters:
-            neg = -1 if entry.negate else 1
-
-            if entry.join_key:  # Sorter for join column, use JOIN info
-                c = neg * safe_compare(entry.sorter.cmp, e1["JOIN"].get(entry.join_key),
-                                       e2["JOIN"].get(entry.join_key))
-            else:
-                c = neg * entry.sorter.cmp(e1, e2)
-
-            if c != 0:
-                return c
-        return 0  # equal
-
-    data.sort(multisort)
+    return compare
 
 
 def sorters_of_datasource(ds_name):
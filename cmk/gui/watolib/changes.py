@@ -102,6 +102,10 @@ def add_change(action_name,
     log_audit(obj, action_name, text, config.user.id if add_user else '')
     cmk.gui.watolib.sidebar_reload.need_sidebar_reload()
 
+    # Changes to the GUI configuration are in effect immediately. Make the other application
+    # processes load the configuration again.
+    config.bump_config_generation()
+
     # On each change to the Check_MK configuration mark the agents to be rebuild
     # TODO: Really? Why?
     #if has_agent_bakery():
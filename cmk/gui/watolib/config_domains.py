@@ -85,7 +85,7 @@ class ConfigDomainGUI(ConfigDomain):
         return multisite_dir()
 
     def activate(self):
-        pass
+        config.bump_config_generation()
 
     def default_globals(self):
         return config.default_config
@@ -326,6 +326,7 @@ class SiteManagement(object):
         # been edited
         if activate:
             config.load_config()  # make new site configuration active
+            config.bump_config_generation()
             _update_distributed_wato_file(sites)
             Folder.invalidate_caches()
             cmk.gui.watolib.sidebar_reload.need_sidebar_reload()
@@ -26,6 +26,7 @@
 import os
 import json
 import time
+from typing import List, Tuple  # pylint: disable=unused-import
 
 # suppress "Cannot find module" error from mypy
 import livestatus  # type: ignore
@@ -38,6 +39,26 @@ import cmk.utils.paths
 
 logger = cmk.utils.log.get_logger(__name__)
 
+_NOT_IMPORTED = object()
+_numpy = _NOT_IMPORTED
+
+
+def numpy_module():
+    """Returns the NumPy module or None in case it is not available
+
+    The computations of the predictions are vectorized with NumPy, if it is available.
+    It is imported on first use, because importing it takes a considerable amount of
+    time which would otherwise be spent by every process importing this module, e.g.
+    each check helper."""
+    global _numpy
+    if _numpy is _NOT_IMPORTED:
+        try:
+            import numpy  # type: ignore
+            _numpy = numpy
+        except ImportError:
+            _numpy = None
+    return _numpy
+
 
 # Check wether a certain time stamp lies with in daylight saving time (DST)
 def is_dst(timestamp):
@@ -84,19 +105,29 @@ class TimeSeries(object):
         twindow : 3-tuple, (start, end, step)
              description of target time interval
         """
-        upsa = []
-        i = 0
         start, end, step = twindow
+        if start == self.start and end == self.end and step == self.step:
+            return self.values
+
         current_times = rrd_timestamps(self.twindow)
-        if start != self.start or end != self.end or step != self.step:
-            for t in range(start, end, step):
-                if t >= current_times[i] + shift:
-                    i += 1
-                upsa.append(self.values[i])
 
-            return upsa
+        # Each target timestamp takes the value of the first measurement interval ending
+        # after it. Without a finer resolution of the target (or without NumPy) the
+        # timestamps are processed one by one as they advance at most one interval each.
+        numpy = numpy_module()
+        if numpy is not None and step <= self.step:
+            indexes = numpy.searchsorted(
+                numpy.array(current_times) + shift, numpy.arange(start, end, step), side="right")
+            return numpy.array(self.values, dtype=object)[indexes].tolist()
+
+        upsa = []
+        i = 0
+        for t in range(start, end, step):
+            if t >= current_times[i] + shift:
+                i += 1
+            upsa.append(self.values[i])
 
-        return self.values
+        return upsa
 
     def time_data_pairs(self):
         return list(zip(rrd_timestamps(self.twindow), self.values))
@@ -134,39 +165,81 @@ def get_rrd_data(hostname, service_description, varname, cf, fromtime, untiltime
 
     """
 
+    return get_rrd_data_of_time_windows(
+        hostname,
+        service_description,
+        varname,
+        cf, [(fromtime, untiltime)],
+        max_entries=max_entries)[0]
+
+
+def get_rrd_data_of_time_windows(hostname,
+                                 service_description,
+                                 varname,
+                                 cf,
+                                 time_windows,
+                                 max_entries=400):
+    # type: (str, str, str, str, List[Tuple[int, int]], int) -> List[TimeSeries]
+    """Fetch RRD historic metrics data of a specific service for several time ranges
+
+    Works like get_rrd_data(), but fetches all the time ranges with a single
+    Livestatus query. Returns one TimeSeries object per time range."""
     step = 1
     rpn = "%s.%s" % (varname, cf.lower())  # "MAX" -> "max"
 
+    columns = []
+    for index, (fromtime, untiltime) in enumerate(time_windows):
+        columns.append("rrddata:m%d:%s:%s:%s:%s:%s" % ((index + 1,) + tuple(
+            map(livestatus.lqencode, map(str, (rpn, fromtime, untiltime, step, max_entries))))))
+
     lql = "GET services\n" \
-          "Columns: rrddata:m1:%s:%s:%s:%s:%s\n" \
+          "Columns: %s\n" \
           "OutputFormat: python\n" \
           "Filter: host_name = %s\n" \
-          "Filter: description = %s\n" % tuple(map(livestatus.lqencode,
-                                                   map(str, (rpn, fromtime, untiltime, step, max_entries,
-                                                             hostname, service_description))))
+          "Filter: description = %s\n" % (" ".join(columns), livestatus.lqencode(hostname),
+                                           livestatus.lqencode(service_description))
 
     try:
         connection = livestatus.SingleSiteConnection(
             "unix:%s" % cmk.utils.paths.livestatus_unix_socket)
-        response = connection.query_value(lql)
+        response = connection.query_row(lql)
     except MKLivestatusNotFoundError as e:
         if cmk.utils.debug.enabled():
             raise
         raise MKGeneralException("Cannot get historic metrics via Livestatus: %s" % e)
 
-    if response is None:
+    if any(data is None for data in response):
         raise MKGeneralException("Cannot retrieve historic data with Nagios Core")
 
-    return TimeSeries(response)
+    return [TimeSeries(data) for data in response]
 
 
-def rrd_datacolum(hostname, service_description, varname, cf):
-    "Partial helper function to get rrd data"
+class RRDDataColumn(object):
+    """Helper to get the rrd data of a metric for different time ranges
+
+    Call it with fromtime and untiltime to get the data of a single time range
+    or use time_series_of() to fetch several time ranges at once."""
+
+    def __init__(self, hostname, service_description, varname, cf):
+        super(RRDDataColumn, self).__init__()
+        self.hostname = hostname
+        self.service_description = service_description
+        self.varname = varname
+        self.cf = cf
 
-    def time_boundaries(fromtime, untiltime):
-        return get_rrd_data(hostname, service_description, varname, cf, fromtime, untiltime)
+    def __call__(self, fromtime, untiltime):
+        return get_rrd_data(self.hostname, self.service_description, self.varname, self.cf,
+                            fromtime, untiltime)
 
-    return time_boundaries
+    def time_series_of(self, time_windows):
+        # type: (List[Tuple[int, int]]) -> List[TimeSeries]
+        return get_rrd_data_of_time_windows(self.hostname, self.service_description, self.varname,
+                                            self.cf, time_windows)
+
+
+def rrd_datacolum(hostname, service_description, varname, cf):
+    "Partial helper function to get rrd data"
+    return RRDDataColumn(hostname, service_description, varname, cf)
 
 
 def predictions_dir(hostname, service_description, dsname, create=False):
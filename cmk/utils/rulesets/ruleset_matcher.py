@@ -25,7 +25,10 @@
 # Boston, MA 02110-1301 USA.
 """This module provides generic Check_MK ruleset processing functionality"""
 
-from typing import Set, Optional, Generator, Dict, Text, Pattern, Tuple, List  # pylint: disable=unused-import
+import itertools
+import re
+import string
+from typing import Any, FrozenSet, Iterable, Set, Optional, Generator, Dict, Text, Pattern, Tuple, List  # pylint: disable=unused-import
 
 from cmk.utils.rulesets.tuple_rulesets import (
     ALL_HOSTS,
@@ -34,9 +37,13 @@ from cmk.utils.rulesets.tuple_rulesets import (
     PHYSICAL_HOSTS,
     NEGATE,
 )
-from cmk.utils.regex import regex
+from cmk.utils.regex import regex, is_regex
 from cmk.utils.exceptions import MKGeneralException
 
+# Used for converting between host bitmaps and their binary string representation
+_BINARY_ONE = ord("1")
+_BINARY_DIGIT_TO_SELECTOR = string.maketrans("01", "\x00\x01")
+
 
 class RulesetMatchObject(object):
     """Wrapper around dict to ensure the ruleset match objects are correctly created"""
@@ -71,8 +78,15 @@ class RulesetMatcher(object):
     done very often in large setups. Be careful when working here.
     """
 
-    def __init__(self, tag_to_group_map, host_tag_lists, host_paths, all_configured_hosts,
-                 clusters_of, nodes_of):
+    def __init__(self,
+                 tag_to_group_map,
+                 host_tag_lists,
+                 host_paths,
+                 all_configured_hosts,
+                 clusters_of,
+                 nodes_of,
+                 service_match_cache_max_size=100000,
+                 host_index=None):
         super(RulesetMatcher, self).__init__()
 
         self.tuple_transformer = RulesetToDictTransformer(tag_to_group_map=tag_to_group_map)
@@ -83,9 +97,13 @@ class RulesetMatcher(object):
             all_configured_hosts,
             clusters_of,
             nodes_of,
+            host_index=host_index,
         )
 
-        self._service_match_cache = {}
+        # Service description -> indexes of the matching rules of a service ruleset
+        self._service_match_cache = {}  # type: Dict[Tuple[int, Text], Tuple[int, ...]]
+        self._service_match_cache_max_size = service_match_cache_max_size
+        self._service_match_cache_stats = {"hits": 0, "misses": 0, "flushes": 0}
 
     def is_matching_host_ruleset(self, match_object, ruleset):
         # type: (RulesetMatchObject, List[Dict]) -> bool
@@ -162,30 +180,44 @@ class RulesetMatcher(object):
         optimized_ruleset = self.ruleset_optimizer.get_service_ruleset(
             ruleset, with_foreign_hosts, is_binary=is_binary)
 
-        for value, hosts, service_conditions in optimized_ruleset:
-            if match_object.host_name not in hosts:
-                continue
+        if match_object.service_description is None:
+            return
 
-            if match_object.service_description is None:
-                continue
+        for rule_index in self._matching_service_rule_indexes(optimized_ruleset.conditions_matcher,
+                                                              match_object.service_description):
+            value, hosts = optimized_ruleset.rules[rule_index]
+            if match_object.host_name in hosts:
+                yield value
 
-            descr_cache_id = match_object.service_description, service_conditions
-            if descr_cache_id in self._service_match_cache:
-                match = self._service_match_cache[descr_cache_id]
-            else:
-                match = self._matches_service_conditions(service_conditions,
-                                                         match_object.service_description)
-                self._service_match_cache[descr_cache_id] = match
+    def _matching_service_rule_indexes(self, conditions_matcher, service_description):
+        # type: (ServiceConditionsMatcher, Text) -> Tuple[int, ...]
+        cache_id = id(conditions_matcher), service_description
+        try:
+            rule_indexes = self._service_match_cache[cache_id]
+            self._service_match_cache_stats["hits"] += 1
+            return rule_indexes
+        except KeyError:
+            pass
 
-            if match:
-                yield value
+        self._service_match_cache_stats["misses"] += 1
+        rule_indexes = conditions_matcher.matching_rule_indexes(service_description)
 
-    def _matches_service_conditions(self, service_conditions, service_description):
-        # type: (Tuple[bool, Pattern[Text]], Text) -> bool
-        negate, pattern = service_conditions
-        if pattern.match(service_description) is not None:
-            return not negate
-        return negate
+        # Keep the memory usage bounded. The cache is simply dropped once it is
+        # full. The rule indexes of the services are computed again on demand.
+        if len(self._service_match_cache) >= self._service_match_cache_max_size:
+            self._service_match_cache.clear()
+            self._service_match_cache_stats["flushes"] += 1
+
+        self._service_match_cache[cache_id] = rule_indexes
+        return rule_indexes
+
+    def get_service_match_cache_stats(self):
+        # type: () -> Dict[str, int]
+        """Returns the current size and hit/miss counters of the service match cache"""
+        stats = self._service_match_cache_stats.copy()
+        stats["size"] = len(self._service_match_cache)
+        stats["max_size"] = self._service_match_cache_max_size
+        return stats
 
     # TODO: Find a way to use the generic get_values
     def get_values_for_generic_agent_host(self, ruleset):
@@ -220,7 +252,13 @@ class RulesetOptimizer(object):
     """Performs some precalculations on the configured rulesets to improve the
     processing performance"""
 
-    def __init__(self, host_tag_lists, host_paths, all_configured_hosts, clusters_of, nodes_of):
+    def __init__(self,
+                 host_tag_lists,
+                 host_paths,
+                 all_configured_hosts,
+                 clusters_of,
+                 nodes_of,
+                 host_index=None):
         super(RulesetOptimizer, self).__init__()
         self._host_tag_lists = host_tag_lists
         self._host_paths = host_paths
@@ -235,28 +273,19 @@ class RulesetOptimizer(object):
         # may contain a reduced set of hosts, since each process handles a subset
         self._all_processed_hosts = self._all_configured_hosts
 
-        # A factor which indicates how much hosts share the same host tag configuration (excluding folders).
-        # len(all_processed_hosts) / len(different tag combinations)
-        # It is used to determine the best rule evualation method
-        self._all_processed_hosts_similarity = 1
-
         self._service_ruleset_cache = {}
         self._host_ruleset_cache = {}
         self._all_matching_hosts_match_cache = {}
 
         # Reference dirname -> hosts in this dir including subfolders
         self._folder_host_lookup = {}
-        # Provides a list of hosts with the same hosttags, excluding the folder
-        self._hosts_grouped_by_tags = {}
-        # Reference hostname -> tag group reference
-        self._host_grouped_ref = {}
-
-        # TODO: The folder will not be part of new dict tags anymore. This can
-        # be cleaned up then.
-        self._hosttags_without_folder = {}
 
-        # TODO: Clean this one up?
-        self._initialize_host_lookup()
+        # Host condition lookups are evaluated on bitmaps of the configured hosts. An index
+        # built earlier for the same hosts may be handed over (see get_snapshot()).
+        if host_index is None:
+            host_index = HostBitmapIndex(host_tag_lists, host_paths, all_configured_hosts)
+        self._host_index = host_index
+        self._all_processed_hosts_bitmap = self._host_index.all_hosts
 
     def all_processed_hosts(self):
         # type: () -> Set[str]
@@ -275,29 +304,76 @@ class RulesetOptimizer(object):
         nodes_and_clusters.intersection_update(self._all_configured_hosts)
 
         self._all_processed_hosts.update(nodes_and_clusters)
+        self._all_processed_hosts_bitmap = self._host_index.host_names_to_bitmap(
+            self._all_processed_hosts)
 
         # The folder host lookup includes a list of all -processed- hosts within a given
         # folder. Any update with set_all_processed hosts invalidates this cache, because
-        # the scope of relevant hosts has changed. This is -good-, since the values in this
-        # lookup are iterated one by one later on in all_matching_hosts
+        # the scope of relevant hosts has changed.
         self._folder_host_lookup = {}
 
-        self._adjust_processed_hosts_similarity()
+    def processed_rulesets(self):
+        # type: () -> Tuple[List[Tuple[int, bool]], List[Tuple[int, bool]]]
+        """Returns the IDs of the host and service rulesets which have been processed so far
 
-    def _adjust_processed_hosts_similarity(self):
-        """ This function computes the tag similarities between of the processed hosts
-        The result is a similarity factor, which helps finding the most perfomant operation
-        for the current hostset """
-        used_groups = set()
-        for hostname in self._all_processed_hosts:
-            used_groups.add(self._host_grouped_ref[hostname])
+        The rulesets are identified by their object id and the with_foreign_hosts flag."""
+        return self._host_ruleset_cache.keys(), self._service_ruleset_cache.keys()
 
-        if not used_groups:
-            self._all_processed_hosts_similarity = 1
-            return
+    def get_snapshot(self, host_rulesets, service_rulesets):
+        # type: (Dict[Any, Tuple[List[Dict], bool]], Dict[Any, Tuple[List[Dict], bool]]) -> Dict[str, Any]
+        """Returns the precomputed matching state for the given rulesets
+
+        The rulesets are given as dictionaries of an ID that is valid across processes
+        to the ruleset and the with_foreign_hosts flag. The matching hosts of the rule
+        conditions of all these rulesets and the indexes of the matching rules of each
+        host of the host rulesets are computed. The snapshot can be pickled and used with
+        load_snapshot() by an optimizer working on the same hosts.
+        """
+        host_rule_indexes = {}
+        for ruleset_id, (ruleset, with_foreign_hosts) in host_rulesets.iteritems():
+            rule_indexes = {}  # type: Dict[str, List[int]]
+            for index, condition in self._enabled_rule_conditions(ruleset):
+                for hostname in self._all_matching_hosts(condition, with_foreign_hosts):
+                    rule_indexes.setdefault(hostname, []).append(index)
+            host_rule_indexes[ruleset_id] = rule_indexes
+
+        for ruleset, with_foreign_hosts in service_rulesets.itervalues():
+            for _index, condition in self._enabled_rule_conditions(ruleset):
+                self._all_matching_hosts(condition, with_foreign_hosts)
+
+        return {
+            "host_index": self._host_index,
+            "all_matching_hosts": self._all_matching_hosts_match_cache,
+            "host_rule_indexes": host_rule_indexes,
+        }
+
+    def _enabled_rule_conditions(self, ruleset):
+        for index, rule in enumerate(ruleset):
+            if not isinstance(rule, dict):
+                return  # Not transformed yet. Will be processed on demand.
+
+            if "options" in rule and "disabled" in rule["options"]:
+                continue
 
-        self._all_processed_hosts_similarity = (
-            1.0 * len(self._all_processed_hosts) / len(used_groups))
+            yield index, rule["condition"]
+
+    def load_snapshot(self, snapshot, host_rulesets):
+        # type: (Dict[str, Any], Dict[Any, Tuple[List[Dict], bool]]) -> None
+        """Fill the caches with a snapshot created by get_snapshot()
+
+        The optimizer needs to be created with the host index of the snapshot. The host
+        rulesets are given in the same way as to get_snapshot()."""
+        self._all_matching_hosts_match_cache.update(snapshot["all_matching_hosts"])
+
+        for ruleset_id, rule_indexes in snapshot["host_rule_indexes"].iteritems():
+            if ruleset_id not in host_rulesets:
+                continue
+
+            ruleset, with_foreign_hosts = host_rulesets[ruleset_id]
+            self._host_ruleset_cache[id(ruleset), with_foreign_hosts] = {
+                hostname: [ruleset[index]["value"] for index in indexes
+                          ] for hostname, indexes in rule_indexes.iteritems()
+            }
 
     def get_host_ruleset(self, ruleset, with_foreign_hosts, is_binary):
         cache_id = id(ruleset), with_foreign_hosts
@@ -338,30 +414,30 @@ class RulesetOptimizer(object):
 
     def _convert_service_ruleset(self, ruleset, with_foreign_hosts, is_binary):
         new_rules = []
+        service_conditions = []
         for rule in ruleset:
             if "options" in rule and "disabled" in rule["options"]:
                 continue
 
             # Directly compute set of all matching hosts here, this will avoid
             # recomputation later
-            hosts = self._all_matching_hosts(rule["condition"], with_foreign_hosts)
+            new_rules.append((rule["value"],
+                              self._all_matching_hosts(rule["condition"], with_foreign_hosts)))
 
             # And now preprocess the configured patterns in the servlist
-            new_rules.append(
-                (rule["value"], hosts,
-                 self._convert_pattern_list(rule["condition"].get("service_description"))))
+            service_conditions.append(
+                self._convert_pattern_list(rule["condition"].get("service_description")))
 
-        return new_rules
+        return OptimizedServiceRuleset(new_rules, ServiceConditionsMatcher(service_conditions))
 
     def _convert_pattern_list(self, patterns):
-        # type: (List[Text]) -> Tuple[bool, Pattern[Text]]
-        """Compiles a list of service match patterns to a to a single regex
+        # type: (List[Text]) -> Tuple[bool, List[Text]]
+        """Converts a list of service match patterns to a list of regex patterns
 
-        Reducing the number of individual regex matches improves the performance dramatically.
         This function assumes either all or no pattern is negated (like WATO creates the rules).
         """
         if not patterns:
-            return False, regex(u"")  # Match everything
+            return False, [u""]  # Match everything
 
         negate, patterns = parse_negated_condition_list(patterns)
 
@@ -372,7 +448,8 @@ class RulesetOptimizer(object):
             else:
                 pattern_parts.append(p)
 
-        return negate, regex("(?:%s)" % "|".join("(?:%s)" % p for p in pattern_parts))
+        # An empty pattern list is treated as a single empty pattern that matches everything
+        return negate, pattern_parts or [u""]
 
     def _all_matching_hosts(self, condition, with_foreign_hosts):
         """Returns a set containing the names of hosts that match the given
@@ -388,49 +465,34 @@ class RulesetOptimizer(object):
         except KeyError:
             pass
 
+        matching = self._matching_hosts_bitmap(hostlist, tags, rule_path, with_foreign_hosts)
+        result = self._host_index.bitmap_to_host_names(matching)
+
+        self._all_matching_hosts_match_cache[cache_id] = result
+        return result
+
+    def _matching_hosts_bitmap(self, hostlist, tags, rule_path, with_foreign_hosts):
+        # type: (Optional[Any], Dict, str, bool) -> int
+        if hostlist == []:
+            return 0  # Empty host list -> Nothing matches
+
         if with_foreign_hosts:
-            valid_hosts = self._all_configured_hosts
+            matching = self._host_index.all_hosts
         else:
-            valid_hosts = self._all_processed_hosts
+            matching = self._all_processed_hosts_bitmap
 
         # Thin out the valid hosts further. If the rule is located in a folder
         # we only need the intersection of the folders hosts and the previously determined valid_hosts
-        valid_hosts = self.get_hosts_within_folder(rule_path,
-                                                   with_foreign_hosts).intersection(valid_hosts)
-
-        if tags and hostlist is None:
-            result = self._match_hosts_by_tags(cache_id, valid_hosts, tags)
-            if result is not None:
-                return result
+        matching &= self._host_index.folder_bitmap(rule_path)
 
-        matching = set()
-        only_specific_hosts = hostlist is not None \
-            and not isinstance(hostlist, dict) \
-            and all(not isinstance(x, dict) for x in hostlist)
+        # When no tag matching is requested, do not filter by tags. Accept all hosts
+        # and filter only by hostlist
+        if matching and tags:
+            matching &= self._host_index.host_tags_bitmap(tags)
 
-        if hostlist == []:
-            pass  # Empty host list -> Nothing matches
-        elif not tags and not hostlist:
-            # If no tags are specified and the hostlist only include @all (all hosts)
-            matching = valid_hosts
-        elif not tags and only_specific_hosts:
-            # If no tags are specified and there are only specific hosts we already have the matches
-            matching = valid_hosts.intersection(hostlist)
-        else:
-            # If the rule has only exact host restrictions, we can thin out the list of hosts to check
-            if only_specific_hosts:
-                hosts_to_check = valid_hosts.intersection(hostlist)
-            else:
-                hosts_to_check = valid_hosts
+        if matching and hostlist:
+            matching &= self._host_index.host_list_bitmap(hostlist)
 
-            for hostname in hosts_to_check:
-                # When no tag matching is requested, do not filter by tags. Accept all hosts
-                # and filter only by hostlist
-                if (not tags or self._matches_host_tags(self._host_tag_lists[hostname], tags)):
-                    if self._matches_host_name(hostlist, hostname):
-                        matching.add(hostname)
-
-        self._all_matching_hosts_match_cache[cache_id] = matching
         return matching
 
     def _matches_host_name(self, host_entries, hostname):
@@ -532,93 +594,285 @@ class RulesetOptimizer(object):
 
         return tag_spec
 
-    # TODO: Generalize this optimization: Build some kind of key out of the tag conditions
-    # (positive, negative, ...). Make it work with the new tag group based "$or" handling.
-    def _match_hosts_by_tags(self, cache_id, valid_hosts, tags):
-        matching = set()
-        negative_match_tags = set()
-        positive_match_tags = set()
-        for tag in tags.values():
-            if isinstance(tag, dict):
-                if "$ne" in tag:
-                    negative_match_tags.add(tag["$ne"])
-                    continue
+    def get_hosts_within_folder(self, folder_path, with_foreign_hosts):
+        cache_id = with_foreign_hosts, folder_path
+        if cache_id not in self._folder_host_lookup:
+            if with_foreign_hosts:
+                relevant_hosts = self._host_index.all_hosts
+            else:
+                relevant_hosts = self._all_processed_hosts_bitmap
 
-                if "$or" in tag:
-                    return None  # Can not be optimized, makes _all_matching_hosts proceed
+            hosts_in_folder = self._host_index.bitmap_to_host_names(
+                relevant_hosts & self._host_index.folder_bitmap(folder_path))
 
-                if "$nor" in tag:
-                    return None  # Can not be optimized, makes _all_matching_hosts proceed
+            self._folder_host_lookup[cache_id] = hosts_in_folder
+            return hosts_in_folder
 
-                raise NotImplementedError()
+        return self._folder_host_lookup[cache_id]
 
-            positive_match_tags.add(tag)
-
-        # TODO:
-        #if has_specific_folder_tag or self._all_processed_hosts_similarity < 3:
-        if self._all_processed_hosts_similarity < 3:
-            # Without shared folders
-            for hostname in valid_hosts:
-                host_tags = self._host_tag_lists[hostname]
-                if not positive_match_tags - host_tags:
-                    if not negative_match_tags.intersection(host_tags):
-                        matching.add(hostname)
-
-            self._all_matching_hosts_match_cache[cache_id] = matching
-            return matching
-
-        # With shared folders
-        checked_hosts = set()
-        for hostname in valid_hosts:
-            if hostname in checked_hosts:
-                continue
 
-            hosts_with_same_tag = self._filter_hosts_with_same_tags_as_host(hostname, valid_hosts)
-            checked_hosts.update(hosts_with_same_tag)
+class OptimizedServiceRuleset(object):
+    """The preprocessed form of a service ruleset
 
-            tags = self._host_tag_lists[hostname]
-            if not positive_match_tags - tags:
-                if not negative_match_tags.intersection(tags):
-                    matching.update(hosts_with_same_tag)
+    The rules contain the value and the set of matching hosts for each enabled
+    rule. The service conditions of all these rules are handled by a single
+    ServiceConditionsMatcher, the rule indexes are shared."""
+    __slots__ = ["rules", "conditions_matcher"]
 
-        self._all_matching_hosts_match_cache[cache_id] = matching
-        return matching
+    def __init__(self, rules, conditions_matcher):
+        # type: (List[Tuple[Any, Set[str]]], ServiceConditionsMatcher) -> None
+        super(OptimizedServiceRuleset, self).__init__()
+        self.rules = rules
+        self.conditions_matcher = conditions_matcher
 
-    def _filter_hosts_with_same_tags_as_host(self, hostname, hosts):
-        return self._hosts_grouped_by_tags[self._host_grouped_ref[hostname]].intersection(hosts)
 
-    def get_hosts_within_folder(self, folder_path, with_foreign_hosts):
-        cache_id = with_foreign_hosts, folder_path
-        if cache_id not in self._folder_host_lookup:
-            hosts_in_folder = set()
-            relevant_hosts = self._all_configured_hosts if with_foreign_hosts else self._all_processed_hosts
+class ServiceConditionsMatcher(object):
+    """Matches a service description against the service conditions of all rules of a ruleset
 
-            for hostname in relevant_hosts:
-                host_path = self._host_paths.get(hostname, "/")
-                if host_path.startswith(folder_path):
-                    hosts_in_folder.add(hostname)
+    The service patterns are always matched from the beginning of the service
+    description. Patterns without special regex characters (which most of the
+    configured patterns are) are plain prefixes of the service description. They
+    are looked up in a prefix index using the prefixes of the service description.
+    Each distinct regex pattern is evaluated only once per service description and
+    a combined regex of all of them is used to skip them at once in case none of
+    them matches. Patterns which would match differently as part of the combined
+    regex are not combined but always evaluated.
+    """
 
-            self._folder_host_lookup[cache_id] = hosts_in_folder
-            return hosts_in_folder
+    def __init__(self, service_conditions):
+        # type: (List[Tuple[bool, List[Text]]]) -> None
+        super(ServiceConditionsMatcher, self).__init__()
+
+        pattern_ids = {}  # type: Dict[Text, int]
+        self._literal_patterns = {}  # type: Dict[Text, List[int]]
+        self._regex_patterns = []  # type: List[Tuple[int, Pattern[Text]]]
+
+        # Per rule: Whether or not the condition is negated and the ids of the patterns
+        self._rule_conditions = []  # type: List[Tuple[bool, FrozenSet[int]]]
+        for negate, patterns in service_conditions:
+            rule_pattern_ids = set()
+            for pattern in patterns:
+                if pattern not in pattern_ids:
+                    pattern_ids[pattern] = len(pattern_ids)
+                    self._add_pattern(pattern, pattern_ids[pattern])
+                rule_pattern_ids.add(pattern_ids[pattern])
+            self._rule_conditions.append((negate, frozenset(rule_pattern_ids)))
+
+        self._literal_prefix_lengths = sorted(set(len(p) for p in self._literal_patterns))
+
+        self._any_regex_pattern = None
+        self._uncombined_regex_patterns = self._regex_patterns
+        combinable_patterns = [p for _pattern_id, p in self._regex_patterns if _is_combinable(p)]
+        if len(combinable_patterns) > 1:
+            try:
+                self._any_regex_pattern = regex("|".join(
+                    "(?:%s)" % p.pattern for p in combinable_patterns))
+                self._uncombined_regex_patterns = [(pattern_id, p)
+                                                   for pattern_id, p in self._regex_patterns
+                                                   if not _is_combinable(p)]
+            except MKGeneralException:
+                pass  # Not all patterns can be combined, e.g. when using the same group names
+
+    def _add_pattern(self, pattern, pattern_id):
+        # type: (Text, int) -> None
+        if not is_regex(pattern) and _is_ascii(pattern):
+            self._literal_patterns.setdefault(pattern, []).append(pattern_id)
+        else:
+            self._regex_patterns.append((pattern_id, regex(pattern)))
 
-        return self._folder_host_lookup[cache_id]
+    def matching_rule_indexes(self, service_description):
+        # type: (Text) -> Tuple[int, ...]
+        """Returns the indexes of all rules matching the given service in ruleset order"""
+        matched_pattern_ids = set()
 
-    def _initialize_host_lookup(self):
-        # Determine hosttags without folder tag
-        for hostname in self._all_configured_hosts:
-            tags_without_folder = set(self._host_tag_lists[hostname])
-            try:
-                tags_without_folder.remove(self._host_paths.get(hostname, "/"))
-            except (KeyError, ValueError):
-                pass
+        description_length = len(service_description)
+        for prefix_length in self._literal_prefix_lengths:
+            if prefix_length > description_length:
+                break
+            pattern_ids = self._literal_patterns.get(service_description[:prefix_length])
+            if pattern_ids:
+                matched_pattern_ids.update(pattern_ids)
+
+        regex_patterns = self._uncombined_regex_patterns
+        if self._any_regex_pattern is not None \
+           and self._any_regex_pattern.match(service_description):
+            regex_patterns = self._regex_patterns
+
+        for pattern_id, pattern in regex_patterns:
+            if pattern.match(service_description) is not None:
+                matched_pattern_ids.add(pattern_id)
+
+        return tuple(index for index, (negate, pattern_ids) in enumerate(self._rule_conditions)
+                     if matched_pattern_ids.isdisjoint(pattern_ids) == negate)
 
-            self._hosttags_without_folder[hostname] = tags_without_folder
 
-        # Determine hosts with same tag setup (ignoring folder tag)
-        for hostname in self._all_configured_hosts:
-            group_ref = tuple(sorted(self._hosttags_without_folder[hostname]))
-            self._hosts_grouped_by_tags.setdefault(group_ref, set()).add(hostname)
-            self._host_grouped_ref[hostname] = group_ref
+_GROUP_REFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+def _is_combinable(pattern):
+    # type: (Pattern[Text]) -> bool
+    """Whether or not the pattern matches the same when being part of a combined regex
+
+    Inline flags like (?i) or (?x) apply to the whole combined regex and group references
+    would refer to the groups of the other patterns."""
+    return not pattern.flags and not (pattern.groups and _GROUP_REFERENCE.search(pattern.pattern))
+
+
+def _is_ascii(text):
+    # type: (Text) -> bool
+    """Only ASCII patterns can be safely compared with byte and unicode service descriptions"""
+    return all(ord(c) < 128 for c in text)
+
+
+class HostBitmapIndex(object):
+    """Inverted index from host conditions to bitmaps of matching hosts
+
+    Every configured host is assigned a fixed bit position. The hosts matching
+    a tag, folder or host name condition are then represented by a single
+    (long) integer. This way a rule condition is evaluated with a few bitwise
+    operations instead of checking it for every host one by one.
+    """
+
+    def __init__(self, host_tag_lists, host_paths, all_configured_hosts):
+        super(HostBitmapIndex, self).__init__()
+        self._host_names = sorted(all_configured_hosts)
+        self._host_ids = {hostname: host_id for host_id, hostname in enumerate(self._host_names)}
+
+        self.all_hosts = (1 << len(self._host_names)) - 1
+
+        hosts_of_tag = {}  # type: Dict[str, List[int]]
+        hosts_of_path = {}  # type: Dict[str, List[int]]
+        for hostname, host_id in self._host_ids.iteritems():
+            for tag in host_tag_lists.get(hostname, []):
+                hosts_of_tag.setdefault(tag, []).append(host_id)
+            hosts_of_path.setdefault(host_paths.get(hostname, "/"), []).append(host_id)
+
+        self._tag_bitmaps = {
+            tag: self._host_ids_to_bitmap(host_ids) for tag, host_ids in hosts_of_tag.iteritems()
+        }  # type: Dict[str, int]
+        self._path_bitmaps = {
+            path: self._host_ids_to_bitmap(host_ids)
+            for path, host_ids in hosts_of_path.iteritems()
+        }  # type: Dict[str, int]
+
+        self._folder_bitmap_cache = {}  # type: Dict[str, int]
+        self._regex_bitmap_cache = {}  # type: Dict[Text, int]
+
+    def _host_ids_to_bitmap(self, host_ids):
+        # type: (List[int]) -> int
+        # Setting single bits of a long integer copies the whole integer. For
+        # larger host lists it is cheaper to construct the bitmap from a string
+        # of binary digits.
+        if len(host_ids) < 64:
+            bitmap = 0
+            for host_id in host_ids:
+                bitmap |= 1 << host_id
+            return bitmap
+
+        digits = bytearray(b"0" * len(self._host_names))
+        for host_id in host_ids:
+            digits[host_id] = _BINARY_ONE
+        digits.reverse()
+        return int(str(digits), 2)
+
+    def host_names_to_bitmap(self, host_names):
+        # type: (Iterable[str]) -> int
+        """Unknown host names are ignored, they can not match any rule"""
+        host_ids = self._host_ids
+        return self._host_ids_to_bitmap(
+            [host_ids[hostname] for hostname in host_names if hostname in host_ids])
+
+    def bitmap_to_host_names(self, bitmap):
+        # type: (int) -> Set[str]
+        if not bitmap:
+            return set()
+
+        # The binary representation of the bitmap, lowest bit first, is used as
+        # selector for the host names. This keeps the whole loop in C.
+        selectors = bytearray(format(bitmap, "b")[::-1].translate(_BINARY_DIGIT_TO_SELECTOR))
+        return set(itertools.compress(self._host_names, selectors))
+
+    def folder_bitmap(self, folder_path):
+        # type: (str) -> int
+        """Hosts located in the given folder, including it's subfolders"""
+        try:
+            return self._folder_bitmap_cache[folder_path]
+        except KeyError:
+            pass
+
+        bitmap = 0
+        for host_path, path_bitmap in self._path_bitmaps.iteritems():
+            if host_path.startswith(folder_path):
+                bitmap |= path_bitmap
+
+        self._folder_bitmap_cache[folder_path] = bitmap
+        return bitmap
+
+    def host_tags_bitmap(self, required_tags):
+        # type: (Dict[str, Any]) -> int
+        bitmap = self.all_hosts
+        for tag_spec in required_tags.itervalues():
+            bitmap &= self.tag_spec_bitmap(tag_spec)
+            if not bitmap:
+                break
+        return bitmap
+
+    def tag_spec_bitmap(self, tag_spec):
+        # type: (Any) -> int
+        if isinstance(tag_spec, dict):
+            if "$ne" in tag_spec:
+                return self.all_hosts & ~self._tag_bitmaps.get(tag_spec["$ne"], 0)
+
+            if "$or" in tag_spec:
+                return self._any_tag_spec_bitmap(tag_spec["$or"])
+
+            if "$nor" in tag_spec:
+                return self.all_hosts & ~self._any_tag_spec_bitmap(tag_spec["$nor"])
+
+            raise NotImplementedError()
+
+        return self._tag_bitmaps.get(tag_spec, 0)
+
+    def _any_tag_spec_bitmap(self, tag_specs):
+        # type: (List[Any]) -> int
+        bitmap = 0
+        for sub_tag_spec in tag_specs:
+            bitmap |= self.tag_spec_bitmap(sub_tag_spec)
+        return bitmap
+
+    def host_list_bitmap(self, host_entries):
+        # type: (Any) -> int
+        negate, host_entries = parse_negated_condition_list(host_entries)
+
+        host_names = []
+        bitmap = 0
+        for entry in host_entries:
+            if isinstance(entry, dict):
+                bitmap |= self._regex_bitmap(entry["$regex"])
+            else:
+                host_names.append(entry)
+
+        bitmap |= self.host_names_to_bitmap(host_names)
+
+        if negate:
+            return self.all_hosts & ~bitmap
+        return bitmap
+
+    def _regex_bitmap(self, pattern):
+        # type: (Text) -> int
+        try:
+            return self._regex_bitmap_cache[pattern]
+        except KeyError:
+            pass
+
+        compiled = regex(pattern)
+        bitmap = self._host_ids_to_bitmap([
+            host_id for host_id, hostname in enumerate(self._host_names)
+            if compiled.match(hostname) is not None
+        ])
+
+        self._regex_bitmap_cache[pattern] = bitmap
+        return bitmap
 
 
 def parse_negated_condition_list(entries):
@@ -638,6 +892,10 @@ class RulesetToDictTransformer(object):
         super(RulesetToDictTransformer, self).__init__()
         self._tag_groups = tag_to_group_map
 
+    @property
+    def tag_to_group_map(self):
+        return self._tag_groups
+
     def transform_in_place(self, ruleset, is_service, is_binary):
         for index, rule in enumerate(ruleset):
             if not isinstance(rule, dict):
@@ -60,6 +60,7 @@ import cmk_base.parent_scan
 import cmk_base.notify as notify
 import cmk_base.ip_lookup as ip_lookup
 import cmk_base.data_sources as data_sources
+import cmk_base.piggyback as piggyback
 
 
 class DiscoveryAutomation(Automation):
@@ -350,15 +351,11 @@ class AutomationRenameHosts(Automation):
             if self._rename_host_file(cmk.utils.paths.tmp_dir + "/" + d + "/", oldname, newname):
                 actions.append(d)
 
-        if self._rename_host_dir(cmk.utils.paths.tmp_dir + "/piggyback/", oldname, newname):
-            actions.append("piggyback-load")
-
-        # Rename piggy files *created* by the host
-        piggybase = cmk.utils.paths.tmp_dir + "/piggyback/"
-        if os.path.exists(piggybase):
-            for piggydir in os.listdir(piggybase):
-                if self._rename_host_file(piggybase + piggydir, oldname, newname):
-                    actions.append("piggyback-pig")
+        # Rename the piggyback file *created* by the host. The piggyback data for the host
+        # is stored in the files of its source hosts and appears under the new name once
+        # the source hosts send it the next time.
+        if self._rename_host_file(str(cmk.utils.paths.piggyback_source_dir), oldname, newname):
+            actions.append("piggyback-pig")
 
         # Logwatch
         if self._rename_host_dir(cmk.utils.paths.logwatch_dir, oldname, newname):
@@ -770,7 +767,10 @@ class AutomationDeleteHosts(Automation):
             for folder in os.listdir(baked_agents_dir):
                 self._delete_if_exists("%s/%s" % (folder, hostname))
 
-        # logwatch and piggyback folders
+        # The piggyback data sent by the host
+        piggyback.remove_source_status_file(hostname)
+
+        # logwatch and piggyback folders of the previous layout
         for what_dir in [
                 "%s/%s" % (cmk.utils.paths.logwatch_dir, hostname),
                 "%s/piggyback/%s" % (cmk.utils.paths.tmp_dir, hostname),
@@ -957,7 +957,9 @@ class AutomationGetConfiguration(Automation):
         missing_variables = [v for v in variable_names if not hasattr(config, v)]
 
         if missing_variables:
-            config.load_all_checks(check_api.get_check_api_context)
+            # Only the default values of the check variables are needed here, which are
+            # known without loading the checks in case the plugin index is up to date.
+            config.load_checks_on_demand(check_api.get_check_api_context)
             config.load(with_conf_d=False)
 
         result = {}
@@ -27,6 +27,7 @@
 from collections import OrderedDict
 import ast
 import copy
+import cPickle
 import inspect
 import marshal
 import numbers
@@ -192,12 +193,15 @@ def _initialize_config():
     load_default_config()
 
 
-def _perform_post_config_loading_actions():
+def _perform_post_config_loading_actions(config_cache_snapshot=None):
     """These tasks must be performed after loading the Check_MK base configuration"""
     # First cleanup things (needed for e.g. reloading the config)
     cmk_base.config_cache.clear_all()
 
-    get_config_cache().initialize()
+    if config_cache_snapshot is None:
+        get_config_cache().initialize()
+    else:
+        get_config_cache().load_snapshot(config_cache_snapshot)
 
     # In case the checks are not loaded yet it seems the current mode
     # is not working with the checks. In this case also don't load the
@@ -409,15 +413,31 @@ class PackedConfig(object):
     def __init__(self):
         super(PackedConfig, self).__init__()
         self._path = os.path.join(cmk.utils.paths.var_dir, "base", "precompiled_check_config.mk")
+        self._snapshot_path = os.path.join(cmk.utils.paths.var_dir, "base",
+                                           "precompiled_check_config.snapshot")
 
     def save(self):
-        self._write(self._pack())
+        # Never leave a snapshot of a previous configuration next to the new one
+        if os.path.exists(self._snapshot_path):
+            os.unlink(self._snapshot_path)
+
+        packed_variables = self._packed_variables()
+        self._write(self._pack(packed_variables))
+        self._write_snapshot(packed_variables)
 
-    def _pack(self):
+    def _pack(self, packed_variables):
         helper_config = ("#!/usr/bin/env python\n"
                          "# encoding: utf-8\n"
                          "# Created by Check_MK. Dump of the currently active configuration\n\n")
 
+        for varname, val in packed_variables.iteritems():
+            helper_config += "\n%s = %r\n" % (varname, val)
+
+        return helper_config
+
+    def _packed_variables(self):
+        packed_variables = OrderedDict()
+
         config_cache = get_config_cache()
 
         # These functions purpose is to filter out hosts which are monitored on different sites
@@ -481,7 +501,7 @@ class PackedConfig(object):
             if varname in filter_var_functions:
                 val = filter_var_functions[varname](val)
 
-            helper_config += "\n%s = %r\n" % (varname, val)
+            packed_variables[varname] = val
 
         #
         # Add modified check specific Check_MK base settings
@@ -496,9 +516,9 @@ class PackedConfig(object):
             if not self._packable(varname, val):
                 continue
 
-            helper_config += "\n%s = %r\n" % (varname, val)
+            packed_variables[varname] = val
 
-        return helper_config
+        return packed_variables
 
     def _packable(self, varname, val):
         """Checks whether or not a variable can be written to the config.mk
@@ -523,10 +543,107 @@ class PackedConfig(object):
 
         os.rename(self._path + ".compiled", self._path)
 
+    def _write_snapshot(self, packed_variables):
+        """Write the packed configuration together with the state of the config cache
+
+        Loading this snapshot saves the helpers the execution of the packed configuration
+        and the initialization of the config cache. Matching the rulesets which have been
+        processed in this process is also done in advance for the helpers. The config
+        cache is created for the packed configuration, which only contains the hosts of
+        this site, to get the same state the helpers would compute.
+        """
+        base_variables = set(get_variable_names()).intersection(packed_variables)
+        global_variables = globals()
+        original_values = dict((varname, global_variables[varname]) for varname in base_variables)
+        host_rulesets, service_rulesets = self._processed_rulesets(packed_variables)
+        try:
+            global_variables.update(
+                (varname, packed_variables[varname]) for varname in base_variables)
+
+            config_cache = ConfigCache()
+            config_cache.initialize()
+            snapshot = {
+                "version": cmk.__version__,
+                "variables": packed_variables,
+                "config_cache": config_cache.get_snapshot(host_rulesets, service_rulesets),
+            }
+
+            with open(self._snapshot_path + ".new", "wb") as snapshot_file:
+                cPickle.dump(snapshot, snapshot_file, cPickle.HIGHEST_PROTOCOL)
+            os.rename(self._snapshot_path + ".new", self._snapshot_path)
+
+        except (cPickle.PicklingError, TypeError) as e:
+            if cmk.utils.debug.enabled():
+                raise
+            console.verbose("Cannot create the configuration snapshot: %s\n" % e)
+
+        finally:
+            global_variables.update(original_values)
+
+    def _processed_rulesets(self, packed_variables):
+        """Returns the host and service rulesets of the packed configuration the config cache
+        of this process has processed so far, identified by their variable names"""
+        ruleset_ids = {}
+        for varname, val in packed_variables.iteritems():
+            if isinstance(val, list):
+                ruleset_ids[id(val)] = (varname,)
+            elif isinstance(val, dict):
+                for key, sub_val in val.iteritems():
+                    if isinstance(sub_val, list):
+                        ruleset_ids[id(sub_val)] = (varname, key)
+
+        optimizer = get_config_cache().ruleset_matcher.ruleset_optimizer
+        processed_host_rulesets, processed_service_rulesets = optimizer.processed_rulesets()
+
+        def rulesets_by_id(processed_rulesets):
+            rulesets = {}
+            for object_id, with_foreign_hosts in processed_rulesets:
+                if object_id in ruleset_ids:
+                    ruleset_id = ruleset_ids[object_id]
+                    rulesets[ruleset_id, with_foreign_hosts] = (_packed_ruleset(
+                        packed_variables, ruleset_id), with_foreign_hosts)
+            return rulesets
+
+        return rulesets_by_id(processed_host_rulesets), rulesets_by_id(processed_service_rulesets)
+
     def load(self):
         _initialize_config()
-        exec (marshal.load(open(self._path)), globals())
-        _perform_post_config_loading_actions()
+
+        snapshot = self._load_snapshot()
+        if snapshot is None:
+            exec (marshal.load(open(self._path)), globals())
+            _perform_post_config_loading_actions()
+            return
+
+        globals().update(snapshot["variables"])
+        _perform_post_config_loading_actions(snapshot["config_cache"])
+
+    def _load_snapshot(self):
+        try:
+            with open(self._snapshot_path, "rb") as snapshot_file:
+                snapshot = cPickle.load(snapshot_file)
+        except IOError:
+            return None  # No snapshot available, e.g. created by an older version
+        except (EOFError, cPickle.UnpicklingError, ValueError, TypeError, KeyError, IndexError,
+                AttributeError, ImportError) as e:
+            # A truncated or otherwise broken snapshot. Load the packed configuration instead.
+            if cmk.utils.debug.enabled():
+                raise
+            console.verbose("Cannot load the configuration snapshot: %s\n" % e)
+            return None
+
+        if not isinstance(snapshot, dict) or snapshot.get("version") != cmk.__version__:
+            return None
+
+        return snapshot
+
+
+def _packed_ruleset(variables, ruleset_id):
+    """Returns the ruleset identified by PackedConfig._processed_rulesets()"""
+    ruleset = variables.get(ruleset_id[0])
+    if len(ruleset_id) == 2 and isinstance(ruleset, dict):
+        ruleset = ruleset.get(ruleset_id[1])
+    return ruleset if isinstance(ruleset, list) else None
 
 
 #.
@@ -1135,8 +1252,16 @@ special_agent_info = {
 _check_variables = {}  # type: Dict[str, List[Any]]
 # keeps the default values of all the check variables
 _check_variable_defaults = {}  # type: Dict[str, Any]
+# keeps the configured values of all the check variables, also for checks loaded later
+_check_variable_values = {}  # type: Dict[str, Any]
 _all_checks_loaded = False
 
+# What the loaded plugin files did register, this is written to the plugin index
+_plugin_file_infos = OrderedDict()  # type: Dict[str, Dict[str, Any]]
+# The plugin index while the checks are loaded on demand (see load_checks_on_demand())
+_plugin_index = None  # type: Optional[Dict[str, Any]]
+_get_check_api_context_on_demand = None  # type: Optional[Callable[[], Dict[str, Any]]]
+
 # workaround: set of check-groups that are to be treated as service-checks even if
 #   the item is None
 service_rule_groups = set(["temperature"])
@@ -1167,11 +1292,15 @@ def load_all_checks(get_check_api_context):
 
 def _initialize_data_structures():
     """Initialize some data structures which are populated while loading the checks"""
-    global _all_checks_loaded
+    global _all_checks_loaded, _plugin_index, _get_check_api_context_on_demand
     _all_checks_loaded = False
+    _plugin_index = None
+    _get_check_api_context_on_demand = None
 
     _check_variables.clear()
     _check_variable_defaults.clear()
+    _check_variable_values.clear()
+    _plugin_file_infos.clear()
 
     _check_contexts.clear()
     check_info.clear()
@@ -1268,6 +1397,7 @@ def load_checks(get_check_api_context, filelist):
 
         # Save check variables for e.g. after config loading that the config can
         # be added to the check contexts
+        check_variables = {}
         for varname, value in new_check_vars.items():
             # Do not allow checks to override Check_MK builtin global variables. Silently
             # skip them here. The variables will only be locally available to the checks.
@@ -1281,11 +1411,19 @@ def load_checks(get_check_api_context, filelist):
                 continue
 
             _check_variable_defaults[varname] = value
+            check_variables[varname] = value
 
             # Keep track of which variable needs to be set to which context
             context_ident_list = _check_variables.setdefault(varname, [])
-            context_ident_list += new_checks
-            context_ident_list += new_active_checks
+            for context_ident in itertools.chain(new_checks, new_active_checks):
+                if context_ident not in context_ident_list:
+                    context_ident_list.append(context_ident)
+
+        _plugin_file_infos[f] = {
+            "check_plugin_names": sorted(new_checks),
+            "active_check_names": sorted(new_active_checks),
+            "check_variables": check_variables,
+        }
 
     # Now convert check_info to new format.
     convert_check_info()
@@ -1299,8 +1437,228 @@ def all_checks_loaded():
 
 
 def any_check_loaded():
-    """Whether or not some checks have been loaded into the current process"""
-    return bool(_check_contexts)
+    """Whether or not some checks have been loaded into the current process
+
+    This is also the case when the checks are loaded on demand."""
+    return bool(_check_contexts) or _plugin_index is not None
+
+
+def checks_loaded_on_demand():
+    """Whether or not the checks are loaded on demand and some are not loaded yet"""
+    return _plugin_index is not None and not _all_checks_loaded
+
+
+def _plugin_index_path():
+    return os.path.join(cmk.utils.paths.var_dir, "plugin_index.mk")
+
+
+def save_plugin_index():
+    """Write the index of the plugin files which is used by load_checks_on_demand()
+
+    For each plugin file the index contains the checks, check variables and SNMP
+    sections it registers and the include files it uses. Plugin files which failed to
+    load are loaded each time. The index can only be created while all checks are loaded.
+    """
+    if not all_checks_loaded():
+        raise MKGeneralException("The plugin index can only be created when all checks are loaded")
+
+    entries = []
+    for path in _plugin_file_paths():
+        info = _plugin_file_infos.get(path)
+        failed = info is None
+        if failed:
+            info = {"check_plugin_names": [], "active_check_names": [], "check_variables": {}}
+
+        check_plugin_names = info["check_plugin_names"]
+        section_names = sorted(
+            set(cmk_base.check_utils.section_name_of(n) for n in check_plugin_names))
+        include_paths = [
+            p for p in [check_include_file_path(i) for i in cached_includes_of_plugin(path)]
+            if os.path.exists(p)
+        ]
+
+        # The defaults of the check variables are needed to load the configuration. Helper
+        # objects of the checks, like classes or compiled regexes, are not configurable and
+        # are only registered once the plugin file is loaded.
+        check_variables = dict((varname, value)
+                               for varname, value in info["check_variables"].iteritems()
+                               if _is_literal(value))
+
+        entries.append({
+            "path": path,
+            "mtime": os.stat(path).st_mtime,
+            "includes": [(p, os.stat(p).st_mtime) for p in include_paths],
+            "check_plugin_names": check_plugin_names,
+            "active_check_names": info["active_check_names"],
+            "section_names": section_names,
+            "snmp_sections": [n for n in section_names if n in snmp_info],
+            "check_groups": dict(
+                (n, check_info[n]["group"]) for n in check_plugin_names if check_info[n]["group"]),
+            "check_variables": check_variables,
+            "load_always": failed,
+        })
+
+    store.save_data_to_file(
+        _plugin_index_path(), {
+            "version": cmk.__version__,
+            "files": entries,
+        }, pretty=False)
+
+
+def _is_literal(value):
+    try:
+        return ast.literal_eval(repr(value)) == value
+    except (ValueError, SyntaxError):
+        return False
+
+
+def _load_plugin_index():
+    """Returns the plugin index or None in case it is missing or outdated"""
+    index = store.load_data_from_file(_plugin_index_path())
+    if not index or index["version"] != cmk.__version__:
+        return None
+
+    entries = index["files"]
+    if [entry["path"] for entry in entries] != _plugin_file_paths():
+        return None
+
+    try:
+        for entry in entries:
+            if os.stat(entry["path"]).st_mtime != entry["mtime"]:
+                return None
+
+            for include_path, mtime in entry["includes"]:
+                if check_include_file_path(os.path.basename(include_path)) != include_path \
+                   or os.stat(include_path).st_mtime != mtime:
+                    return None
+    except OSError:
+        return None
+
+    return index
+
+
+def _plugin_file_paths():
+    """Returns the paths of the plugin files load_all_checks() loads"""
+    paths = []
+    file_names = set()
+    for path in get_plugin_paths(cmk.utils.paths.local_checks_dir, cmk.utils.paths.checks_dir):
+        file_name = os.path.basename(path)
+        if path[0] == "." or path[-1] == "~" or file_name in file_names:
+            continue
+        paths.append(path)
+        file_names.add(file_name)
+    return paths
+
+
+def load_checks_on_demand(get_check_api_context):
+    """Prepare loading the check plugins once they are needed
+
+    Instead of loading all plugin files, only the check variables are registered using
+    the plugin index written by save_plugin_index(). This is enough to load the
+    configuration. The plugin files are then loaded with load_checks_of(),
+    load_checks_of_sections(), load_snmp_checks() or load_remaining_checks().
+
+    All checks are loaded in case the plugin index is missing or outdated.
+    """
+    global _plugin_index, _get_check_api_context_on_demand
+
+    index = _load_plugin_index()
+    if index is None:
+        console.verbose("Plugin index is missing or outdated. Loading all checks.\n")
+        load_all_checks(get_check_api_context)
+        return
+
+    _initialize_data_structures()
+    _plugin_index = index
+    _get_check_api_context_on_demand = get_check_api_context
+
+    snmp_cache = cmk_base.runtime_cache.get_set("check_type_snmp")
+    for entry in index["files"]:
+        snmp_cache.update(entry["snmp_sections"])
+
+    tcp_cache = cmk_base.runtime_cache.get_set("check_type_tcp")
+    for entry in index["files"]:
+        tcp_cache.update(n for n in entry["section_names"] if n not in snmp_cache)
+
+        for varname, value in entry["check_variables"].iteritems():
+            _check_variable_defaults[varname] = value
+            _check_variables.setdefault(
+                varname, []).extend(entry["check_plugin_names"] + entry["active_check_names"])
+
+    _load_plugin_files([e["path"] for e in index["files"] if e["load_always"]])
+
+
+def load_checks_of(check_plugin_names):
+    """Load the plugin files of the given checks or active checks when loading on demand"""
+    if _plugin_index is None:
+        return
+
+    names = set(check_plugin_names)
+    section_names = set(cmk_base.check_utils.section_name_of(n) for n in names)
+    _load_plugin_files_on_demand([
+        e for e in _plugin_index["files"]
+        if names.intersection(e["check_plugin_names"] + e["active_check_names"]) or
+        section_names.intersection(e["section_names"])
+    ])
+
+
+def load_checks_of_sections(section_names):
+    """Load the plugin files of the checks of the given sections when loading on demand"""
+    if _plugin_index is None:
+        return
+
+    section_names = set(section_names)
+    _load_plugin_files_on_demand(
+        [e for e in _plugin_index["files"] if section_names.intersection(e["section_names"])])
+
+
+def load_snmp_checks():
+    """Load the plugin files of all SNMP checks when loading on demand"""
+    if _plugin_index is None:
+        return
+
+    _load_plugin_files_on_demand([e for e in _plugin_index["files"] if e["snmp_sections"]])
+
+
+def load_remaining_checks():
+    """Load the plugin files not loaded yet when loading on demand"""
+    if _plugin_index is None:
+        return
+
+    _load_plugin_files_on_demand(_plugin_index["files"])
+
+
+def _load_plugin_files_on_demand(entries):
+    paths = [
+        e["path"] for e in entries if not e["load_always"] and e["path"] not in _plugin_file_infos
+    ]
+    if paths:
+        _load_plugin_files(paths)
+
+
+def _load_plugin_files(paths):
+    global _all_checks_loaded
+    assert _plugin_index is not None and _get_check_api_context_on_demand is not None
+
+    console.vverbose("Loading %d plugin files on demand\n" % len(paths))
+    load_checks(_get_check_api_context_on_demand, paths)
+
+    # The configured values of the check variables are set in case the configuration
+    # has already been loaded
+    for path in paths:
+        info = _plugin_file_infos.get(path)
+        if info is None:
+            continue  # Failed to load the file
+
+        for varname in info["check_variables"]:
+            if varname not in _check_variable_values:
+                continue
+
+            for context_ident in info["check_plugin_names"] + info["active_check_names"]:
+                _check_contexts[context_ident][varname] = _check_variable_values[varname]
+
+    _all_checks_loaded = all(
+        e["path"] in _plugin_file_infos or e["load_always"] for e in _plugin_index["files"])
 
 
 # Constructs a new check context dictionary. It contains the whole check API.
@@ -1509,10 +1867,14 @@ def get_check_variable_defaults():
 
 
 def set_check_variables(check_variables):
-    """Update the check related config variables in the relevant check contexts"""
+    """Update the check related config variables in the relevant check contexts
+
+    Checks which are loaded later on demand get the values when they are loaded."""
+    _check_variable_values.update(check_variables)
     for varname, value in check_variables.items():
         for context_ident in _check_variables[varname]:
-            _check_contexts[context_ident][varname] = value
+            if context_ident in _check_contexts:
+                _check_contexts[context_ident][varname] = value
 
 
 def get_check_variables():
@@ -1524,7 +1886,11 @@ def get_check_variables():
     that it is enough to get the variable from the first context."""
     check_config = {}
     for varname, context_ident_list in _check_variables.iteritems():
-        check_config[varname] = _check_contexts[context_ident_list[0]][varname]
+        if context_ident_list[0] in _check_contexts:
+            check_config[varname] = _check_contexts[context_ident_list[0]][varname]
+        else:
+            check_config[varname] = _check_variable_values.get(varname,
+                                                               _check_variable_defaults[varname])
     return check_config
 
 
@@ -1597,8 +1963,11 @@ def convert_check_info():
 
             # Include files are related to the check file (= the section_name),
             # not to the (sub-)check. So we keep them in check_includes.
-            check_includes.setdefault(section_name, [])
-            check_includes[section_name] += info.get("includes", [])
+            # The checks may be converted several times when they are loaded on demand.
+            section_includes = check_includes.setdefault(section_name, [])
+            for include in info.get("includes", []):
+                if include not in section_includes:
+                    section_includes.append(include)
 
     # Make sure that setting for node_info of check and subcheck matches
     for check_plugin_name, info in check_info.iteritems():
@@ -2637,6 +3006,65 @@ class ConfigCache(object):
 
         self.ruleset_matcher.ruleset_optimizer.set_all_processed_hosts(self._all_active_hosts)
 
+    def get_snapshot(self, host_rulesets, service_rulesets):
+        """Returns the state computed by initialize() for storing it in the packed config
+
+        The matching of the given rulesets is computed in advance. See
+        RulesetOptimizer.get_snapshot() for details."""
+        return {
+            "all_configured_clusters": self._all_configured_clusters,
+            "all_configured_realhosts": self._all_configured_realhosts,
+            "all_configured_hosts": self._all_configured_hosts,
+            "all_active_clusters": self._all_active_clusters,
+            "all_active_realhosts": self._all_active_realhosts,
+            "all_active_hosts": self._all_active_hosts,
+            "host_paths": self._host_paths,
+            "hosttags": self._hosttags,
+            "clusters_of": self._clusters_of_cache,
+            "nodes_of": self._nodes_of_cache,
+            "tag_to_group_map": self.ruleset_matcher.tuple_transformer.tag_to_group_map,
+            "ruleset_optimizer": self.ruleset_matcher.ruleset_optimizer.get_snapshot(
+                host_rulesets, service_rulesets),
+        }
+
+    def load_snapshot(self, snapshot):
+        """Initialize the config cache with a snapshot created by get_snapshot()
+
+        This replaces initialize() for the packed config. The configuration needs
+        to be loaded already."""
+        self._initialize_caches()
+
+        self._all_configured_clusters = snapshot["all_configured_clusters"]
+        self._all_configured_realhosts = snapshot["all_configured_realhosts"]
+        self._all_configured_hosts = snapshot["all_configured_hosts"]
+        self._all_active_clusters = snapshot["all_active_clusters"]
+        self._all_active_realhosts = snapshot["all_active_realhosts"]
+        self._all_active_hosts = snapshot["all_active_hosts"]
+        self._host_paths = snapshot["host_paths"]
+        self._hosttags = snapshot["hosttags"]
+        self._clusters_of_cache = snapshot["clusters_of"]
+        self._nodes_of_cache = snapshot["nodes_of"]
+
+        optimizer_snapshot = snapshot["ruleset_optimizer"]
+        self.ruleset_matcher = ruleset_matcher.RulesetMatcher(
+            tag_to_group_map=snapshot["tag_to_group_map"],
+            host_tag_lists=self._hosttags,
+            host_paths=self._host_paths,
+            clusters_of=self._clusters_of_cache,
+            nodes_of=self._nodes_of_cache,
+            all_configured_hosts=self._all_configured_hosts,
+            host_index=optimizer_snapshot["host_index"],
+        )
+        self.ruleset_matcher.ruleset_optimizer.set_all_processed_hosts(self._all_active_hosts)
+
+        global_variables = globals()
+        host_rulesets = {}
+        for ruleset_id in optimizer_snapshot["host_rule_indexes"]:
+            ruleset = _packed_ruleset(global_variables, ruleset_id[0])
+            if ruleset is not None:
+                host_rulesets[ruleset_id] = ruleset, ruleset_id[1]
+        self.ruleset_matcher.ruleset_optimizer.load_snapshot(optimizer_snapshot, host_rulesets)
+
     def _initialize_caches(self):
         self.check_table_cache = cmk_base.config_cache.get_dict("check_tables")
 
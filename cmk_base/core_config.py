@@ -25,11 +25,13 @@
 # Boston, MA 02110-1301 USA.
 
 import abc
+import hashlib
 import numbers
 import os
 import sys
-from typing import Text, Optional, Any, List, Dict  # pylint: disable=unused-import
+from typing import Text, Optional, Any, List, Dict, Tuple  # pylint: disable=unused-import
 
+import cmk
 import cmk.utils.paths
 import cmk.utils.tty as tty
 import cmk.utils.password_store
@@ -200,6 +202,135 @@ def check_icmp_arguments_of(config_cache, hostname, add_defaults=True, family=No
     return " ".join(args)
 
 
+#.
+#   .--Fingerprints--------------------------------------------------------.
+#   |       _____ _                                  _       _             |
+#   |      |  ___(_)_ __   __ _  ___ _ __ _ __  _ __(_)_ __ | |_ ___       |
+#   |      | |_  | | '_ \ / _` |/ _ \ '__| '_ \| '__| | '_ \| __/ __|      |
+#   |      |  _| | | | | | (_| |  __/ |  | |_) | |  | | | | | |_\__ \      |
+#   |      |_|   |_|_| |_|\__, |\___|_|  | .__/|_|  |_|_| |_|\__|___/      |
+#   |                     |___/          |_|                               |
+#   +----------------------------------------------------------------------+
+#   |  Detect which hosts need their core configuration to be recreated    |
+#   '----------------------------------------------------------------------'
+
+
+class HostConfigFingerprints(object):
+    """Computes fingerprints of the inputs of the core configuration of hosts
+
+    The fingerprint of a host changes whenever something changes that may have
+    an effect on the objects created for this host. It is made of:
+
+    a) The global fingerprint, which covers all configuration variables
+       except the host specific ones listed below. Every changed rule results
+       in a new global fingerprint and invalidates all hosts.
+    b) The host specific entries of the host, its nodes and clusters in the
+       host specific configuration variables
+    c) The computed host attributes (incl. IP addresses) and some derived
+       HostConfig values
+    d) The modification time and size of the autochecks and discovered host
+       labels files of the host, its nodes and clusters
+
+    Values are compared by their repr(). Values with a non reproducible repr()
+    (e.g. functions) result in a new fingerprint on every computation, which
+    only means that the objects are always created again.
+    """
+
+    # Configuration variables mapping host names to host specific values
+    _host_specific_variable_names = [
+        "additional_ipv4addresses",
+        "additional_ipv6addresses",
+        "explicit_snmp_communities",
+        "host_attributes",
+        "host_labels",
+        "host_paths",
+        "host_tags",
+        "ipaddresses",
+        "ipv6addresses",
+        "management_ipmi_credentials",
+        "management_protocol",
+        "management_snmp_credentials",
+    ]
+
+    def __init__(self, config_cache):
+        # type: (config.ConfigCache) -> None
+        super(HostConfigFingerprints, self).__init__()
+        self._config_cache = config_cache
+        self._host_entries = self._get_host_entries()
+        self.global_fingerprint = self._compute_global_fingerprint()
+
+    def _get_host_entries(self):
+        # type: () -> Dict[str, List[str]]
+        """The all_hosts and clusters entries per host name"""
+        host_entries = {}  # type: Dict[str, List[str]]
+        for entry in config.all_hosts:
+            host_entries.setdefault(entry.split("|", 1)[0], []).append(entry)
+        for entry, nodes in config.clusters.iteritems():
+            host_entries.setdefault(entry.split("|", 1)[0], []).append("%s=%r" % (entry, nodes))
+        return host_entries
+
+    def _compute_global_fingerprint(self):
+        # type: () -> str
+        digest = hashlib.md5()
+        digest.update("%s %s\n" % (cmk.__version__, cmk.utils.paths.omd_root))
+
+        variable_names = set(config.get_variable_names()).union(
+            config.get_derived_config_variable_names())
+        variable_names.difference_update(self._host_specific_variable_names)
+        variable_names.difference_update(["all_hosts", "clusters"])
+        for varname in sorted(variable_names):
+            digest.update("%s=%r\n" % (varname, getattr(config, varname, None)))
+
+        for varname, value in sorted(config.get_check_variables().iteritems()):
+            digest.update("%s=%r\n" % (varname, value))
+
+        for check_plugin_name, info in sorted(config.check_info.iteritems()):
+            digest.update("%s=%r,%r\n" % (check_plugin_name, info.get("service_description"),
+                                          info.get("has_perfdata")))
+
+        return digest.hexdigest()
+
+    def host_fingerprint(self, hostname, host_attrs):
+        # type: (str, Dict[str, Any]) -> str
+        host_config = self._config_cache.get_host_config(hostname)
+
+        digest = hashlib.md5(self.global_fingerprint)
+        digest.update(repr(sorted(host_attrs.iteritems())))
+        digest.update(
+            repr((
+                host_config.is_cluster,
+                host_config.is_ping_host,
+                host_config.is_piggyback_host,
+                host_config.is_ipv4v6_host,
+                host_config.is_ipv6_primary,
+            )))
+
+        related_hosts = [hostname] + sorted(host_config.nodes or []) + sorted(
+            host_config.part_of_clusters)
+        for related_hostname in related_hosts:
+            digest.update("\n%s\n" % related_hostname)
+            digest.update(repr(self._host_entries.get(related_hostname)))
+            for varname in self._host_specific_variable_names:
+                digest.update(repr(getattr(config, varname).get(related_hostname)))
+            digest.update(repr(self._file_stats(related_hostname)))
+
+        return digest.hexdigest()
+
+    def _file_stats(self, hostname):
+        # type: (str) -> List[Optional[Tuple[float, int]]]
+        stats = []  # type: List[Optional[Tuple[float, int]]]
+        for path in [
+                os.path.join(cmk.utils.paths.autochecks_dir, hostname + ".mk"),
+                str(cmk.utils.paths.discovered_host_labels_dir / (hostname + ".mk")),
+        ]:
+            try:
+                st = os.stat(path)
+                stats.append((st.st_mtime, st.st_size))
+            except OSError:
+                stats.append(None)
+        return stats
+
+
 #.
 #   .--Core Config---------------------------------------------------------.
 #   |          ____                  ____             __ _                 |
@@ -219,6 +350,11 @@ def do_create_config(core, with_agents):
     create_core_config(core)
     console.output(tty.ok + "\n")
 
+    stats = config.get_config_cache().ruleset_matcher.get_service_match_cache_stats()
+    console.vverbose(
+        "Service ruleset match cache: %d/%d entries, %d hits, %d misses, %d flushes\n" %
+        (stats["size"], stats["max_size"], stats["hits"], stats["misses"], stats["flushes"]))
+
     if with_agents:
         try:
             import cmk_base.cee.agent_bakery
@@ -235,6 +371,11 @@ def create_core_config(core):
     core.create_config()
     cmk.utils.password_store.save(config.stored_passwords)
 
+    # Keep the index of the check plugins in sync with the checks. It is used to
+    # load only the needed checks for some commands.
+    if config.all_checks_loaded():
+        config.save_plugin_index()
+
     return get_configuration_warnings()
 
 
@@ -30,9 +30,13 @@ import sys
 import py_compile
 import tempfile
 import errno
-from typing import Dict  # pylint: disable=unused-import
+import marshal
+import multiprocessing
+from cStringIO import StringIO
+from typing import Dict, Optional, Tuple, FrozenSet  # pylint: disable=unused-import
 
 import cmk.utils.paths
+import cmk.utils.store
 import cmk.utils.tty as tty
 from cmk.utils.exceptions import MKGeneralException
 
@@ -98,6 +102,16 @@ class NagiosCore(core_config.MonitoringCore):
 
 
 class NagiosConfig(object):
+    # The sets of objects to define which are filled while creating the host objects
+    _host_object_defines = [
+        "hostgroups_to_define",
+        "servicegroups_to_define",
+        "contactgroups_to_define",
+        "checknames_to_define",
+        "active_checks_to_define",
+        "custom_commands_to_define",
+    ]
+
     def __init__(self, outfile, hostnames):
         super(NagiosConfig, self).__init__()
         self.outfile = outfile
@@ -111,6 +125,60 @@ class NagiosConfig(object):
         self.custom_commands_to_define = set([])
         self.hostcheck_commands_to_define = []
 
+    def get_host_object_defines(self):
+        # type: () -> Tuple[FrozenSet[str], ...]
+        return tuple(frozenset(getattr(self, attr)) for attr in self._host_object_defines)
+
+    def add_host_object_defines(self, defines):
+        # type: (Tuple[FrozenSet[str], ...]) -> None
+        for attr, values in zip(self._host_object_defines, defines):
+            getattr(self, attr).update(values)
+
+
+class HostObjectsCache(object):
+    """Keeps the object definitions of the hosts created during the last config creation
+
+    This is used by the incremental config creation (nagios_incremental_config).
+    Each entry consists of the fingerprint of the host (see HostConfigFingerprints),
+    the objects created for the host and the names of the objects the host needs to
+    be defined (see NagiosConfig.get_host_object_defines()).
+    """
+
+    def __init__(self):
+        super(HostObjectsCache, self).__init__()
+        self._path = os.path.join(cmk.utils.paths.var_dir, "core", "nagios_host_objects.cache")
+        self._entries = {}  # type: Dict[str, Tuple[str, str, Tuple[FrozenSet[str], ...]]]
+        self._new_entries = {}  # type: Dict[str, Tuple[str, str, Tuple[FrozenSet[str], ...]]]
+
+    def load(self):
+        try:
+            with open(self._path, "rb") as f:
+                self._entries = marshal.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except (EOFError, ValueError, TypeError):
+            pass  # Broken cache file: Simply create all objects again
+
+    def get(self, hostname, fingerprint):
+        # type: (str, str) -> Optional[Tuple[str, Tuple[FrozenSet[str], ...]]]
+        entry = self._entries.get(hostname)
+        if entry is None or entry[0] != fingerprint:
+            return None
+        self._new_entries[hostname] = entry
+        return entry[1], entry[2]
+
+    def add(self, hostname, fingerprint, objects, defines):
+        # type: (str, str, str, Tuple[FrozenSet[str], ...]) -> None
+        self._new_entries[hostname] = fingerprint, objects, defines
+
+    def save(self):
+        """Only the entries used during the current config creation are kept"""
+        cmk.utils.store.makedirs(os.path.dirname(self._path))
+        with open(self._path + ".new", "wb") as f:
+            marshal.dump(self._new_entries, f)
+        os.rename(self._path + ".new", self._path)
+
 
 def create_config(outfile, hostnames):
     if config.host_notification_periods != []:
@@ -134,6 +202,7 @@ def create_config(outfile, hostnames):
 
     config_cache = config.get_config_cache()
 
+    create_all_hosts = hostnames is None
     if hostnames is None:
         hostnames = config_cache.all_active_hosts()
 
@@ -141,8 +210,16 @@ def create_config(outfile, hostnames):
 
     _output_conf_header(cfg)
 
-    for hostname in hostnames:
-        _create_nagios_config_host(cfg, config_cache, hostname)
+    # The incremental mode is only used when creating the config of all hosts.
+    # Otherwise the objects of the other hosts would be dropped from the cache.
+    use_objects_cache = config.nagios_incremental_config and create_all_hosts
+
+    if use_objects_cache or config.nagios_config_processes > 1:
+        _create_nagios_config_hosts(cfg, config_cache, hostnames, use_objects_cache)
+    else:
+        for hostname in hostnames:
+            _create_nagios_config_host(cfg, config_cache, hostname,
+                                       core_config.get_host_attributes(hostname, config_cache))
 
     _create_nagios_config_contacts(cfg, hostnames)
     _create_nagios_config_hostgroups(cfg)
@@ -164,11 +241,140 @@ def _output_conf_header(cfg):
 """)
 
 
-def _create_nagios_config_host(cfg, config_cache, hostname):
+def _create_nagios_config_hosts(cfg, config_cache, hostnames, use_objects_cache):
+    """Create the objects of the hosts one by one in separate buffers
+
+    This makes it possible to reuse the objects of hosts having the same fingerprint
+    as during the last run (nagios_incremental_config) and to create the objects in
+    multiple processes (nagios_config_processes). The objects are always written in
+    the order of the given host names.
+    """
+    fingerprint_of = {}  # type: Dict[str, str]
+    host_attrs_of = {}  # type: Dict[str, Dict]
+    cached_objects = {}  # type: Dict[str, Tuple[str, Tuple[FrozenSet[str], ...]]]
+
+    objects_cache = None
+    if use_objects_cache:
+        fingerprints = core_config.HostConfigFingerprints(config_cache)
+        objects_cache = HostObjectsCache()
+        objects_cache.load()
+
+        for hostname in hostnames:
+            host_attrs = host_attrs_of[hostname] = core_config.get_host_attributes(
+                hostname, config_cache)
+            fingerprint = fingerprint_of[hostname] = fingerprints.host_fingerprint(
+                hostname, host_attrs)
+
+            cached = objects_cache.get(hostname, fingerprint)
+            if cached is not None:
+                cached_objects[hostname] = cached
+
+        console.verbose(
+            "Reusing the objects of %d of %d hosts\n" % (len(cached_objects), len(hostnames)))
+
+    hostnames_to_create = [h for h in hostnames if h not in cached_objects]
+    if config.nagios_config_processes > 1 and len(hostnames_to_create) > 1:
+        created_objects = _create_host_objects_in_processes(hostnames_to_create,
+                                                            config.nagios_config_processes)
+    else:
+        created_objects = {}
+
+    for hostname in hostnames:
+        if hostname in cached_objects:
+            objects, defines = cached_objects[hostname]
+
+        else:
+            if hostname in created_objects:
+                objects, defines = created_objects[hostname]
+                is_independent = True
+            else:
+                objects, defines, is_independent = _create_host_objects(
+                    cfg, config_cache, hostname, host_attrs_of.get(hostname))
+
+            if objects_cache is not None and is_independent:
+                objects_cache.add(hostname, fingerprint_of[hostname], objects, defines)
+
+        cfg.outfile.write(objects)
+        cfg.add_host_object_defines(defines)
+
+    if objects_cache is not None:
+        objects_cache.save()
+
+
+def _create_host_objects(cfg, config_cache, hostname, host_attrs=None):
+    """Create the objects of a single host
+
+    Returns the objects, the names of the objects to define for them and whether or
+    not the objects are independent of the other hosts. Objects of hosts producing
+    warnings (they would not be shown again when reusing the objects) or using the
+    host check commands numbered over all hosts are not independent.
+    """
+    if host_attrs is None:
+        host_attrs = core_config.get_host_attributes(hostname, config_cache)
+
+    host_cfg = NagiosConfig(StringIO(), cfg.hostnames)
+    host_cfg.hostcheck_commands_to_define = cfg.hostcheck_commands_to_define
+    num_hostcheck_commands = len(cfg.hostcheck_commands_to_define)
+    num_warnings = len(core_config.g_configuration_warnings)
+
+    _create_nagios_config_host(host_cfg, config_cache, hostname, host_attrs)
+
+    is_independent = num_hostcheck_commands == len(cfg.hostcheck_commands_to_define) \
+                     and num_warnings == len(core_config.g_configuration_warnings)
+
+    return host_cfg.outfile.getvalue(), host_cfg.get_host_object_defines(), is_independent
+
+
+def _create_host_objects_in_processes(hostnames, num_processes):
+    """Create the objects of the hosts in worker processes
+
+    The workers are forked from this process after the configuration has been loaded.
+    They share the configuration and the ConfigCache copy-on-write. Only the objects
+    of independent hosts are returned. The others are created by the calling process
+    afterwards, which also shows their warnings.
+    """
+    # Use several chunks per process to even out the different costs of the hosts
+    num_chunks = min(len(hostnames), num_processes * 4)
+    chunks = [hostnames[index::num_chunks] for index in range(num_chunks)]
+
+    console.verbose(
+        "Creating the objects of %d hosts in %d processes\n" % (len(hostnames), num_processes))
+
+    pool = multiprocessing.Pool(num_processes, initializer=_initialize_host_objects_worker)
+    try:
+        results = pool.map(_create_host_objects_of_chunk, chunks)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    created_objects = {}  # type: Dict[str, Tuple[str, Tuple[FrozenSet[str], ...]]]
+    for chunk_result in results:
+        created_objects.update(chunk_result)
+    return created_objects
+
+
+def _initialize_host_objects_worker():
+    # The warnings of the hosts are shown by the calling process
+    sys.stdout = open(os.devnull, "w")
+
+
+def _create_host_objects_of_chunk(hostnames):
+    config_cache = config.get_config_cache()
+    cfg = NagiosConfig(None, hostnames)
+
+    result = {}
+    for hostname in hostnames:
+        objects, defines, is_independent = _create_host_objects(cfg, config_cache, hostname)
+        if is_independent:
+            result[hostname] = objects, defines
+    return result
+
+
+def _create_nagios_config_host(cfg, config_cache, hostname, host_attrs):
     cfg.outfile.write("\n# ----------------------------------------------------\n")
     cfg.outfile.write("# %s\n" % hostname)
     cfg.outfile.write("# ----------------------------------------------------\n")
-    host_attrs = core_config.get_host_attributes(hostname, config_cache)
     if config.generate_hostconf:
         host_spec = _create_nagios_host_spec(cfg, config_cache, hostname, host_attrs)
         cfg.outfile.write(_format_nagios_object("host", host_spec).encode("utf-8"))
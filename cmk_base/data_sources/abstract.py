@@ -26,6 +26,7 @@
 
 import errno
 import os
+import re
 import socket
 import time
 import abc
@@ -50,6 +51,13 @@ from cmk_base.check_api_utils import state_markers
 
 from .host_sections import HostSections
 
+# Matches the lines of the agent output which are section headers once stripped, e.g.
+# <<<name:opt1(args)>>> or <<<<piggybacked_host>>>>. Group 1 is the part in between.
+_SECTION_HEADER_RE = re.compile(r"^[ \t\r\x0b\x0c]*<<<(.*)>>>[ \t\r\x0b\x0c]*$", re.MULTILINE)
+_TRAILING_CR_RE = re.compile(r"\r+$", re.MULTILINE)
+# The characters str.strip() removes by default
+_WHITESPACE = u" \t\n\r\x0b\x0c"
+
 
 class DataSource(object):
     """Abstract base class for all data source classes"""
@@ -198,38 +206,46 @@ class DataSource(object):
         raise NotImplementedError()
 
     def _read_cache_file(self):
+        if not self._is_cache_file_usable():
+            return
+
+        cachefile = self._cache_file_path()
+
+        # TODO: Use some generic store file read function to generalize error handling,
+        # but there is currently no function that simply reads data from the file
+        result = open(cachefile).read()
+        if not result:
+            self._logger.debug("Not using cache (Empty)")
+            return
+
+        self._logger.verbose("Using data from cache file %s" % (cachefile))
+        return self._from_cache_file(result)
+
+    def _is_cache_file_usable(self):
         assert self._max_cachefile_age is not None
 
         cachefile = self._cache_file_path()
 
         if not os.path.exists(cachefile):
             self._logger.debug("Not using cache (Does not exist)")
-            return
+            return False
 
         if self.is_agent_cache_disabled():
             self._logger.debug("Not using cache (Cache usage disabled)")
-            return
+            return False
 
         if not self._may_use_cache_file and not config.simulation_mode:
             self._logger.debug("Not using cache (Don't try it)")
-            return
+            return False
 
         may_use_outdated = config.simulation_mode or self._use_outdated_cache_file
         cachefile_age = cmk_base.utils.cachefile_age(cachefile)
         if not may_use_outdated and cachefile_age > self._max_cachefile_age:
             self._logger.debug("Not using cache (Too old. Age is %d sec, allowed is %s sec)" %
                                (cachefile_age, self._max_cachefile_age))
-            return
-
-        # TODO: Use some generic store file read function to generalize error handling,
-        # but there is currently no function that simply reads data from the file
-        result = open(cachefile).read()
-        if not result:
-            self._logger.debug("Not using cache (Empty)")
-            return
+            return False
 
-        self._logger.verbose("Using data from cache file %s" % (cachefile))
-        return self._from_cache_file(result)
+        return True
 
     def _write_cache_file(self, raw_data):
         if self.is_agent_cache_disabled():
@@ -464,7 +480,7 @@ class DataSource(object):
             persisted_from, persisted_until, section_info = entry
 
             # Don't overwrite sections that have been received from the source with this call
-            if section_name in host_sections.sections:
+            if host_sections.has_section(section_name):
                 self._logger.debug(
                     "Skipping persisted section %r, live data available" % (section_name))
             else:
@@ -565,29 +581,57 @@ class CheckMKAgentDataSource(DataSource):
         if config.agent_simulator:
             raw_data = cmk_base.agent_simulator.process(raw_data)
 
-        return self._parse_info(raw_data.split("\n"))
+        return self._parse_info(raw_data)
 
-    def _parse_info(self, lines):
+    def _parse_info(self, raw_data):
         """Split agent output in chunks, splits lines by whitespaces.
 
+        The raw data is not split into lines as a whole. Only the section headers are
+        searched in it. The lines between two headers are processed chunk by chunk and
+        the piggybacked data is kept as raw chunks of lines. The chunks of the sections
+        are decoded once the section is accessed. Only persisted sections are decoded
+        right away.
+
         Returns a HostSections() object.
         """
         sections = {}
+        section_payloads = {}
         # Unparsed info for other hosts. A dictionary, indexed by the piggybacked host name.
-        # The value is a list of lines which were received for this host.
+        # The value is a list of chunks of lines which were received for this host.
         piggybacked_raw_data = {}
         persisted_sections = {}  # handle sections with option persist(...)
         host = None
+        # Either the list of the rows or of the payloads of the current section
         section_content = []
+        is_lazy_section = False
         section_options = {}
         agent_cache_info = {}
         separator = None
         encoding = None
-        for line in lines:
-            line = line.rstrip("\r")
-            stripped_line = line.strip()
-            if stripped_line[:4] == '<<<<' and stripped_line[-4:] == '>>>>':
-                host = stripped_line[4:-4]
+
+        # Position of the first line of the current chunk. Nothing before the first
+        # section header is used.
+        chunk_start = None
+        for match in _SECTION_HEADER_RE.finditer(raw_data):
+            section_header = match.group(1)
+            is_piggyback_header = len(section_header) >= 2 and section_header[0] == "<" \
+                                  and section_header[-1] == ">"
+            if host and not is_piggyback_header:
+                continue  # normal section headers are part of the piggybacked data
+
+            if chunk_start is not None and chunk_start < match.start():
+                chunk = raw_data[chunk_start:match.start() - 1]
+                if host:
+                    _add_piggybacked_chunk(piggybacked_raw_data, host, chunk)
+                elif is_lazy_section:
+                    section_content.append(
+                        _AgentSectionPayload(chunk, section_options, separator, encoding))
+                else:
+                    _add_section_lines(section_content, chunk, section_options, separator, encoding)
+            chunk_start = match.end() + 1
+
+            if is_piggyback_header:
+                host = section_header[1:-1]
                 if not host:
                     host = None
                 else:
@@ -601,66 +645,60 @@ class CheckMKAgentDataSource(DataSource):
                     # a) Replace spaces by underscores
                     if host:
                         host = host.replace(" ", "_")
-
-            elif host:  # processing data for an other host
-                piggybacked_raw_data.setdefault(host, []).append(line)
+                continue
 
             # Found normal section header
             # section header has format <<<name:opt1(args):opt2:opt3(args)>>>
-            elif stripped_line[:3] == '<<<' and stripped_line[-3:] == '>>>':
-                section_header = stripped_line[3:-3]
-                headerparts = section_header.split(":")
-                section_name = headerparts[0]
-                section_options = {}
-                for o in headerparts[1:]:
-                    opt_parts = o.split("(")
-                    opt_name = opt_parts[0]
-                    if len(opt_parts) > 1:
-                        opt_args = opt_parts[1][:-1]
-                    else:
-                        opt_args = None
-                    section_options[opt_name] = opt_args
-
-                section_content = sections.get(section_name, None)
-                if section_content is None:  # section appears in output for the first time
-                    section_content = []
-                    sections[section_name] = section_content
-                try:
-                    separator = chr(int(section_options["sep"]))
-                except:
-                    separator = None
-
-                # Split of persisted section for server-side caching
-                if "persist" in section_options:
-                    until = int(section_options["persist"])
-                    cached_at = int(time.time())  # Estimate age of the data
-                    cache_interval = int(until - cached_at)
-                    agent_cache_info[section_name] = (cached_at, cache_interval)
-                    persisted_sections[section_name] = (cached_at, until, section_content)
-
-                if "cached" in section_options:
-                    agent_cache_info[section_name] = tuple(
-                        map(int, section_options["cached"].split(",")))
-
-                # The section data might have a different encoding
-                encoding = section_options.get("encoding")
-
-            elif stripped_line != '':
-                if "nostrip" not in section_options:
-                    line = stripped_line
-
-                if encoding:
-                    line = config.decode_incoming_string(line, encoding)
-                else:
-                    line = config.decode_incoming_string(line)
+            section_name, section_options = _parse_section_header(section_header)
 
-                section_content.append(line.split(separator))
+            is_lazy_section = "persist" not in section_options \
+                              and section_name not in persisted_sections
+            if is_lazy_section:
+                section_content = section_payloads.setdefault(section_name, [])
+            else:
+                section_content = sections.setdefault(section_name, [])
+                for payload in section_payloads.pop(section_name, []):
+                    section_content += payload.decode()
+            try:
+                separator = chr(int(section_options["sep"]))
+            except:
+                separator = None
+
+            # Split of persisted section for server-side caching
+            if "persist" in section_options:
+                until = int(section_options["persist"])
+                cached_at = int(time.time())  # Estimate age of the data
+                cache_interval = int(until - cached_at)
+                agent_cache_info[section_name] = (cached_at, cache_interval)
+                persisted_sections[section_name] = (cached_at, until, section_content)
+
+            if "cached" in section_options:
+                agent_cache_info[section_name] = tuple(
+                    map(int, section_options["cached"].split(",")))
+
+            # The section data might have a different encoding
+            encoding = section_options.get("encoding")
+
+        if chunk_start is not None and chunk_start <= len(raw_data):
+            chunk = raw_data[chunk_start:]
+            if host:
+                _add_piggybacked_chunk(piggybacked_raw_data, host, chunk)
+            elif is_lazy_section:
+                section_content.append(
+                    _AgentSectionPayload(chunk, section_options, separator, encoding))
+            else:
+                _add_section_lines(section_content, chunk, section_options, separator, encoding)
 
-        return HostSections(sections, agent_cache_info, piggybacked_raw_data, persisted_sections)
+        return HostSections(
+            sections,
+            agent_cache_info,
+            piggybacked_raw_data,
+            persisted_sections,
+            section_payloads=section_payloads)
 
     # TODO: refactor
     def _summary_result(self, for_checking):
-        cmk_section = self._host_sections.sections.get("check_mk")
+        cmk_section = self._host_sections.get_section("check_mk")
         agent_info = self._get_agent_info(cmk_section)
         agent_version = agent_info["version"]
 
@@ -873,3 +911,93 @@ def _normalize_ip_addresses(ip_addresses):
         except:
             raise MKGeneralException("could not expand %r" % word)
     return expanded
+
+
+def _parse_section_header(section_header):
+    """Parse the part of a section header between <<< and >>>
+
+    Returns the section name and a dictionary of the section options. Options without
+    arguments have the value None.
+    """
+    headerparts = section_header.split(":")
+    section_options = {}
+    for o in headerparts[1:]:
+        opt_parts = o.split("(")
+        opt_name = opt_parts[0]
+        if len(opt_parts) > 1:
+            opt_args = opt_parts[1][:-1]
+        else:
+            opt_args = None
+        section_options[opt_name] = opt_args
+    return headerparts[0], section_options
+
+
+class _AgentSectionPayload(object):
+    """A not yet decoded chunk of lines of an agent section"""
+    __slots__ = ["_chunk", "_section_options", "_separator", "_encoding"]
+
+    def __init__(self, chunk, section_options, separator, encoding):
+        super(_AgentSectionPayload, self).__init__()
+        self._chunk = chunk
+        self._section_options = section_options
+        self._separator = separator
+        self._encoding = encoding
+
+    def decode(self):
+        section_content = []
+        _add_section_lines(section_content, self._chunk, self._section_options, self._separator,
+                           self._encoding)
+        return section_content
+
+
+def _add_piggybacked_chunk(piggybacked_raw_data, host, chunk):
+    if "\r" in chunk:
+        chunk = _TRAILING_CR_RE.sub("", chunk)
+    piggybacked_raw_data.setdefault(host, []).append(chunk)
+
+
+def _add_section_lines(section_content, chunk, section_options, separator, encoding):
+    """Decode the lines of a chunk of section data, split them and add them to the section
+
+    Empty lines are skipped. The lines are stripped unless the section has the option
+    "nostrip". Sections without explicit encoding are decoded as a whole, which is only
+    possible when the whole chunk is valid UTF-8. Otherwise each line is decoded on its
+    own, falling back to the fallback_agent_output_encoding.
+    """
+    if "\r" in chunk:
+        chunk = _TRAILING_CR_RE.sub("", chunk)
+
+    if encoding is None:
+        try:
+            lines = chunk.decode("utf-8").split(u"\n")
+        except UnicodeDecodeError:
+            pass
+        else:
+            if "nostrip" in section_options:
+                section_content += [
+                    line.split(separator) for line in lines if line.strip(_WHITESPACE)
+                ]
+            elif separator is None:
+                # Splitting by whitespaces ignores the leading and trailing ones
+                section_content += [line.split() for line in lines if line.strip(_WHITESPACE)]
+            else:
+                for line in lines:
+                    stripped_line = line.strip(_WHITESPACE)
+                    if stripped_line:
+                        section_content.append(stripped_line.split(separator))
+            return
+
+    for line in chunk.split("\n"):
+        stripped_line = line.strip()
+        if stripped_line == '':
+            continue
+
+        if "nostrip" not in section_options:
+            line = stripped_line
+
+        if encoding:
+            line = config.decode_incoming_string(line, encoding)
+        else:
+            line = config.decode_incoming_string(line)
+
+        section_content.append(line.split(separator))
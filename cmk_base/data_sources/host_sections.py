@@ -48,19 +48,54 @@ class HostSections(object):
         3. persisted_sections:      Sections to be persisted for later usage
         4. cache_info:              Agent cache information
                                     (dict section name -> (cached_at, cache_interval))
+        5. section_payloads:        A dictionary from section_name to a list of not yet
+                                    decoded parts of the section content. Each part has a
+                                    decode() method returning its rows. The parts are
+                                    decoded once the section is accessed and then appended
+                                    to the rows of the section in "sections".
+
+    Use get_section(), has_section() and section_names() to access single sections
+    without decoding all of them. Accessing the "sections" attribute decodes all sections.
     """
 
     def __init__(self,
                  sections=None,
                  cache_info=None,
                  piggybacked_raw_data=None,
-                 persisted_sections=None):
+                 persisted_sections=None,
+                 section_payloads=None):
         super(HostSections, self).__init__()
-        self.sections = sections if sections is not None else {}
+        self._sections = sections if sections is not None else {}
+        self._section_payloads = section_payloads if section_payloads is not None else {}
         self.cache_info = cache_info if cache_info is not None else {}
         self.piggybacked_raw_data = piggybacked_raw_data if piggybacked_raw_data is not None else {}
         self.persisted_sections = persisted_sections if persisted_sections is not None else {}
 
+    @property
+    def sections(self):
+        for section_name in self._section_payloads.keys():
+            self._decode_section(section_name)
+        return self._sections
+
+    def _decode_section(self, section_name):
+        payloads = self._section_payloads.pop(section_name, None)
+        if payloads is None:
+            return
+
+        section_content = self._sections.setdefault(section_name, [])
+        for payload in payloads:
+            section_content += payload.decode()
+
+    def get_section(self, section_name, deflt=None):
+        self._decode_section(section_name)
+        return self._sections.get(section_name, deflt)
+
+    def has_section(self, section_name):
+        return section_name in self._sections or section_name in self._section_payloads
+
+    def section_names(self):
+        return list(set(self._sections).union(self._section_payloads))
+
     # TODO: It should be supported that different sources produce equal sections.
     # this is handled for the self.sections data by simply concatenating the lines
     # of the sections, but for the self.cache_info this is not done. Why?
@@ -68,8 +103,13 @@ class HostSections(object):
     #       Would this be correct here?
     def update(self, host_sections):
         """Update this host info object with the contents of another one"""
-        for section_name, lines in host_sections.sections.items():
-            self.sections.setdefault(section_name, []).extend(lines)
+        for section_name, lines in host_sections._sections.items():
+            # Keep the order of the lines: The own payloads come first
+            self._decode_section(section_name)
+            self._sections.setdefault(section_name, []).extend(lines)
+
+        for section_name, payloads in host_sections._section_payloads.items():
+            self._section_payloads.setdefault(section_name, []).extend(payloads)
 
         for hostname, lines in host_sections.piggybacked_raw_data.items():
             self.piggybacked_raw_data.setdefault(hostname, []).extend(lines)
@@ -82,7 +122,8 @@ class HostSections(object):
 
     def add_cached_section(self, section_name, section, persisted_from, persisted_until):
         self.cache_info[section_name] = (persisted_from, persisted_until - persisted_from)
-        self.sections[section_name] = section
+        self._section_payloads.pop(section_name, None)
+        self._sections[section_name] = section
 
 
 class MultiHostSections(object):
@@ -133,7 +174,11 @@ class MultiHostSections(object):
         section_name = cmk_base.check_utils.section_name_of(check_plugin_name)
         nodes_of_clustered_service = self._get_nodes_of_clustered_service(
             hostname, service_description)
-        cache_key = (hostname, ipaddress, section_name, for_discovery,
+        # The section content only differs between discovery and checking when the node
+        # column is added. Share the parsed section content in all other cases.
+        discovery_mode = for_discovery \
+            if self._depends_on_discovery_mode(check_plugin_name, section_name) else None
+        cache_key = (hostname, ipaddress, section_name, discovery_mode,
                      bool(nodes_of_clustered_service))
 
         try:
@@ -145,6 +190,15 @@ class MultiHostSections(object):
             self._section_content_cache[cache_key] = section_content
             return section_content
 
+    def _depends_on_discovery_mode(self, check_plugin_name, section_name):
+        if check_plugin_name in config.check_info \
+           and config.check_info[check_plugin_name]["node_info"]:
+            return True
+
+        # The extra sections are requested with the check plugin names of the extra sections
+        return section_name in config.check_info \
+               and bool(config.check_info[section_name]["extra_sections"])
+
     def _get_nodes_of_clustered_service(self, hostname, service_description):
         """Returns the node names if a service is clustered, otherwise 'None' in order to
         decide whether we collect section content of the host or the nodes.
@@ -187,10 +241,14 @@ class MultiHostSections(object):
                 continue
 
             try:
-                host_section_content = self._multi_host_sections[host_entry].sections[section_name]
+                host_section_content = self._multi_host_sections[host_entry].get_section(
+                    section_name)
             except KeyError:
                 continue
 
+            if host_section_content is None:
+                continue
+
             host_section_content = self._update_with_node_column(
                 host_section_content, check_plugin_name, host_entry[0], for_discovery)
 
@@ -313,7 +371,7 @@ class MultiHostSections(object):
         check_keys = set(config.check_info.keys())
         check_plugin_names = set()
         for v in self._multi_host_sections.values():
-            for k in v.sections.keys():
+            for k in v.section_names():
                 for check_k in check_keys:
                     if check_k.startswith(k):
                         check_plugin_names.add(check_k)
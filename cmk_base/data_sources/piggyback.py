@@ -24,9 +24,7 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
-import os
-
-from cmk.utils.paths import tmp_dir
+import cmk.utils.paths
 
 from cmk_base.config import piggyback_max_cachefile_age
 from cmk_base.piggyback import get_piggyback_raw_data
@@ -47,8 +45,7 @@ class PiggyBackDataSource(CheckMKAgentDataSource):
         return "piggyback"
 
     def describe(self):
-        path = os.path.join(tmp_dir, "piggyback", self._hostname)
-        return "Process piggyback data from %s" % path
+        return "Process piggyback data from %s" % cmk.utils.paths.piggyback_source_dir
 
     def _execute(self):
         entries = _raw_data(self._hostname) + _raw_data(self._ipaddress)
@@ -72,7 +69,7 @@ class PiggyBackDataSource(CheckMKAgentDataSource):
 
         Return only summary information in case there is piggyback data"""
 
-        if self._host_sections and self._host_sections.sections:
+        if self._host_sections and self._host_sections.section_names():
             output = "Processed from: %s" % ", ".join(self._source_hostnames)
         else:
             output = ""
@@ -26,7 +26,9 @@
 
 import ast
 import time
+from typing import List  # pylint: disable=unused-import
 
+import cmk.utils.debug
 from cmk.utils.exceptions import MKGeneralException
 
 import cmk_base.config as config
@@ -152,14 +154,66 @@ class SNMPDataSource(DataSource):
             return check_plugin_names
 
     def _execute(self):
-        import cmk_base.inventory_plugins
-
         self._verify_ipaddress()
 
-        check_plugin_names = self.get_check_plugin_names()
+        snmp_config = self._host_config.snmp_config(self._ipaddress)
+        sections_to_fetch = self._get_sections_to_fetch(self.get_check_plugin_names())
+
+        # The walks of all sections are done using a common cache. This way walks of
+        # the same or contained OID subtrees are only done once.
+        snmp.initialize_subtree_cache(
+            snmp_config,
+            [oid_info for _unused_name, _unused_section, oid_info in sections_to_fetch])
+        try:
+            return self._fetch_sections(snmp_config, sections_to_fetch)
+        finally:
+            snmp.cleanup_subtree_cache()
+
+    @staticmethod
+    def prefetch_walks(sources, max_cachefile_age):
+        # type: (List[SNMPDataSource], int) -> None
+        """Fetch the walks of the SNMP data sources of several hosts concurrently
+
+        The data sources use the fetched walks once they are executed with run(). Errors
+        are reported by run() of the data sources.
+        """
+        host_oid_infos = []
+        for source in sources:
+            source.set_max_cachefile_age(max_cachefile_age)
+            try:
+                snmp_config, oid_infos = source.get_oid_infos_to_fetch()
+            except Exception as e:
+                if cmk.utils.debug.enabled():
+                    raise
+                source._logger.verbose("%s: Not walking in advance: %s" % (source._hostname, e))
+                continue
+
+            if oid_infos:
+                host_oid_infos.append((snmp_config, oid_infos))
+
+        snmp.prefetch_walks(host_oid_infos)
 
+    def get_oid_infos_to_fetch(self):
+        """Returns the SNMP configuration and the OID infos the next run() fetches
+
+        The OID infos are empty when run() uses the data of the cache file.
+        """
         snmp_config = self._host_config.snmp_config(self._ipaddress)
-        info = {}
+        if self._is_cache_file_usable():
+            return snmp_config, []
+
+        self._persisted_sections = self._load_persisted_sections()
+        sections_to_fetch = self._get_sections_to_fetch(self.get_check_plugin_names())
+        return snmp_config, [
+            oid_info for _unused_name, _unused_section, oid_info in sections_to_fetch
+        ]
+
+    def _get_sections_to_fetch(self, check_plugin_names):
+        """Returns the check plugin names, section names and OID infos of the sections to fetch"""
+        import cmk_base.inventory_plugins
+
+        sections_to_fetch = []
+        section_names = set()
         for check_plugin_name in self._sort_check_plugin_names(check_plugin_names):
             # Is this an SNMP table check? Then snmp_info specifies the OID to fetch
             # Please note, that if the check_plugin_name is foo.bar then we lookup the
@@ -189,11 +243,19 @@ class SNMPDataSource(DataSource):
                 continue
 
             # Prevent duplicate data fetching of identical section in case of SNMP sub checks
-            if section_name in info:
+            if section_name in section_names:
                 self._logger.debug(
                     "%s: Skip fetching data (section already fetched)" % (check_plugin_name))
                 continue
 
+            sections_to_fetch.append((check_plugin_name, section_name, oid_info))
+            section_names.add(section_name)
+
+        return sections_to_fetch
+
+    def _fetch_sections(self, snmp_config, sections_to_fetch):
+        info = {}
+        for check_plugin_name, section_name, oid_info in sections_to_fetch:
             self._logger.debug("%s: Fetching data" % (check_plugin_name))
 
             # oid_info can now be a list: Each element  of that list is interpreted as one real oid_info
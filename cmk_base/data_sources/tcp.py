@@ -24,12 +24,19 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import collections
+import errno
+import os
+import select
 import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union  # pylint: disable=unused-import
 
 import cmk.utils.debug
 from cmk.utils.exceptions import MKTerminate
 import cmk.utils.werks
 
+import cmk_base.config as config
 from cmk_base.exceptions import MKAgentError, MKEmptyAgentData
 
 from .abstract import CheckMKAgentDataSource
@@ -54,6 +61,7 @@ class TCPDataSource(CheckMKAgentDataSource):
         super(TCPDataSource, self).__init__(hostname, ipaddress)
         self._port = None
         self._timeout = None
+        self._prefetched_output = None  # type: Union[None, str, socket.error]
 
     def id(self):
         return "agent"
@@ -83,42 +91,53 @@ class TCPDataSource(CheckMKAgentDataSource):
 
         self._verify_ipaddress()
 
-        port = self._get_port()
-
-        encryption_settings = self._host_config.agent_encryption
+        output, self._prefetched_output = self._prefetched_output, None
+        if output is None:
+            self._logger.debug("Connecting via TCP to %s:%d (%ss timeout)" %
+                               (self._ipaddress, self._get_port(), self._get_timeout()))
+            output = fetch_agent_outputs([self._fetch_job()], 1)[0]
 
-        socktype = (socket.AF_INET6 if self._host_config.is_ipv6_primary else socket.AF_INET)
-        s = socket.socket(socktype, socket.SOCK_STREAM)
-
-        timeout = self._get_timeout()
-
-        output = []
-        self._logger.debug(
-            "Connecting via TCP to %s:%d (%ss timeout)" % (self._ipaddress, port, timeout))
-        try:
-            s.settimeout(timeout)
-            s.connect((self._ipaddress, port))
-            s.settimeout(None)
+        if isinstance(output, socket.error):
+            if cmk.utils.debug.enabled():
+                raise output
+            raise MKAgentError("Communication failed: %s" % output)
+
+        return self._process_agent_output(output)
+
+    def _fetch_job(self):
+        # type: () -> Tuple[int, Tuple[str, int], float]
+        family = socket.AF_INET6 if self._host_config.is_ipv6_primary else socket.AF_INET
+        return family, (self._ipaddress, self._get_port()), self._get_timeout()
+
+    @staticmethod
+    def prefetch_outputs(sources, max_cachefile_age):
+        # type: (List[TCPDataSource], int) -> None
+        """Fetch the agent outputs of the TCP data sources of several hosts concurrently
+
+        The data sources use the fetched outputs once they are executed with run(). Errors
+        are reported by run() of the data sources.
+        """
+        sources_to_fetch = []
+        for source in sources:
+            source.set_max_cachefile_age(max_cachefile_age)
+            if source._use_only_cache or source._is_cache_file_usable():
+                continue
 
-            self._logger.debug("Reading data from agent")
+            try:
+                source._verify_ipaddress()
+            except Exception:
+                continue
 
-            while True:
-                data = s.recv(4096, socket.MSG_WAITALL)
+            sources_to_fetch.append(source)
 
-                if data and len(data) > 0:
-                    output.append(data)
-                else:
-                    break
-        except MKTerminate:
-            raise
+        outputs = fetch_agent_outputs([source._fetch_job() for source in sources_to_fetch],
+                                      config.agent_concurrent_hosts)
+        for source, output in zip(sources_to_fetch, outputs):
+            source._prefetched_output = output
 
-        except socket.error as e:
-            if cmk.utils.debug.enabled():
-                raise
-            raise MKAgentError("Communication failed: %s" % e)
-        finally:
-            s.close()
-        output = ''.join(output)
+    def _process_agent_output(self, output):
+        port = self._get_port()
+        encryption_settings = self._host_config.agent_encryption
 
         if len(output) == 0:  # may be caused by xinetd not allowing our address
             raise MKEmptyAgentData("Empty output from agent at TCP port %d" % port)
@@ -178,3 +197,174 @@ class TCPDataSource(CheckMKAgentDataSource):
     @classmethod
     def use_only_cache(cls):
         cls._use_only_cache = True
+
+
+#.
+#   .--Fetcher-------------------------------------------------------------.
+#   |                   _____    _       _                                 |
+#   |                  |  ___|__| |_ ___| |__   ___ _ __                   |
+#   |                  | |_ / _ \ __/ __| '_ \ / _ \ '__|                  |
+#   |                  |  _|  __/ || (__| | | |  __/ |                     |
+#   |                  |_|  \___|\__\___|_| |_|\___|_|                     |
+#   +----------------------------------------------------------------------+
+#   |  Fetches the outputs of many agents concurrently from one process    |
+#   '----------------------------------------------------------------------'
+
+# The receive buffer starts with this size and is doubled whenever it is full
+_INITIAL_BUFFER_SIZE = 65536
+
+
+def fetch_agent_outputs(jobs, max_concurrent_hosts):
+    # type: (List[Tuple[int, Tuple[str, int], float]], int) -> List[Union[str, socket.error]]
+    """Fetch the outputs of many agents concurrently using non-blocking sockets
+
+    Each job consists of the address family, the address and the connect timeout of an
+    agent. Up to max_concurrent_hosts agents are fetched at the same time. Like before,
+    only connecting is limited by the timeout, reading waits until the agent closes the
+    connection.
+
+    Returns the output of each job in the order of the jobs. The output of an agent is
+    replaced by the exception in case it could not be fetched.
+    """
+    results = [None] * len(jobs)  # type: List[Any]
+    queue = collections.deque(enumerate(jobs))
+    active = {}  # type: Dict[int, Tuple[int, _AgentConnection]]
+    poller = select.poll()
+    try:
+        while queue or active:
+            while queue and len(active) < max_concurrent_hosts:
+                index, (family, address, timeout) = queue.popleft()
+                try:
+                    connection = _AgentConnection(family, address, timeout)
+                except socket.error as e:
+                    results[index] = e
+                    continue
+
+                active[connection.fileno()] = (index, connection)
+                poller.register(connection.fileno(), connection.poll_events())
+
+            deadlines = [
+                connection.deadline
+                for _index, connection in active.itervalues()
+                if connection.deadline is not None
+            ]
+            timeout = _poll_timeout(min(deadlines) - time.time()) if deadlines else None
+            try:
+                ready_fds = set(fd for fd, _event in poller.poll(timeout))
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+
+            now = time.time()
+            for fd, (index, connection) in active.items():
+                try:
+                    if fd in ready_fds:
+                        connection.handle_event()
+                    elif connection.deadline is not None and connection.deadline <= now:
+                        raise socket.timeout("timed out")
+
+                    if not connection.is_finished:
+                        poller.modify(fd, connection.poll_events())
+                        continue
+
+                    results[index] = connection.output()
+                except socket.error as e:
+                    results[index] = e
+
+                poller.unregister(fd)
+                del active[fd]
+                connection.close()
+    finally:
+        for _index, connection in active.itervalues():
+            connection.close()
+
+    return results
+
+
+def _poll_timeout(timeout):
+    # type: (float) -> int
+    """Convert the timeout in seconds to the rounded up milliseconds poll() expects"""
+    return max(0, int(timeout * 1000) + 1)
+
+
+class _AgentConnection(object):
+    """A non-blocking connection to an agent receiving its output into a growing buffer"""
+
+    def __init__(self, family, address, timeout):
+        # type: (int, Tuple[str, int], float) -> None
+        super(_AgentConnection, self).__init__()
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.setblocking(False)
+        self._buffer = bytearray(_INITIAL_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._length = 0
+        self.is_connected = False
+        self.is_finished = False
+        self.deadline = time.time() + timeout  # type: Optional[float]
+
+        error = self._socket.connect_ex(address)
+        if error == 0:
+            self._set_connected()
+        elif error not in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+            self.close()
+            raise socket.error(error, os.strerror(error))
+
+    def fileno(self):
+        # type: () -> int
+        return self._socket.fileno()
+
+    def poll_events(self):
+        # type: () -> int
+        return select.POLLIN if self.is_connected else select.POLLOUT
+
+    def _set_connected(self):
+        # type: () -> None
+        self.is_connected = True
+        self.deadline = None
+
+    def handle_event(self):
+        # type: () -> None
+        if self.is_connected:
+            self._receive()
+            return
+
+        error = self._socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            raise socket.error(error, os.strerror(error))
+        self._set_connected()
+
+    def _receive(self):
+        # type: () -> None
+        while True:
+            if self._length == len(self._buffer):
+                self._grow_buffer()
+
+            try:
+                received = self._socket.recv_into(self._view[self._length:])
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            if not received:
+                self.is_finished = True
+                return
+            self._length += received
+
+    def _grow_buffer(self):
+        # type: () -> None
+        buf = bytearray(2 * len(self._buffer))
+        buf[:self._length] = self._view[:self._length]
+        self._buffer = buf
+        self._view = memoryview(buf)
+
+    def output(self):
+        # type: () -> str
+        return self._view[:self._length].tobytes()
+
+    def close(self):
+        # type: () -> None
+        self._socket.close()
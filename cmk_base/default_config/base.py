@@ -43,8 +43,11 @@ agent_encryption = []
 snmp_ports = []  # UDP ports used for SNMP
 tcp_connect_timeout = 5.0
 tcp_connect_timeouts = []
+agent_concurrent_hosts = 1  # Number of agents fetched concurrently during discovery
 use_dns_cache = True  # prevent DNS by using own cache file
 delay_precompile = False  # delay Python compilation to Nagios execution
+nagios_incremental_config = False  # reuse the objects of unchanged hosts in the Nagios config
+nagios_config_processes = 1  # number of processes creating the host objects of the Nagios config
 restart_locking = "abort"  # also possible: "wait", None
 check_submission = "file"  # alternative: "pipe"
 agent_min_version = 0  # warn, if plugin has not at least version
@@ -60,6 +63,9 @@ fake_dns = None  # type: _typing.Optional[str]
 agent_simulator = False
 perfdata_format = "pnp"  # also possible: "standard"
 check_mk_perfdata_with_times = True
+item_state_store = "binary"  # also possible: "repr"
+prediction_precompute_lead_time = 21600  # secs before predictions are outdated to compute them
+prediction_precompute_rate = 5.0  # maximum number of predictions computed per second
 # TODO: Remove these options?
 debug_log = False  # deprecated
 monitoring_host = None  # deprecated
@@ -76,9 +82,12 @@ http_proxies = {}  # Global setting for managing HTTP proxy configs
 use_inline_snmp = True
 non_inline_snmp_hosts = []  # Ruleset to disable Inline-SNMP per host when
 # use_inline_snmp is enabled.
+use_native_snmp = False  # Talk SNMP v1/v2c directly instead of using the Net-SNMP tools
+snmp_concurrent_hosts = 1  # Number of hosts walked concurrently by the native SNMP backend
 
 snmp_limit_oid_range = []  # Ruleset to recduce fetched OIDs of a check, only inline SNMP
 snmp_bulk_size = []  # Ruleset to customize bulk size
+snmp_table_walk_min_columns = 5  # Walk whole SNMP tables when a check needs this many columns
 record_inline_snmp_stats = False
 snmp_default_community = 'public'
 snmp_communities = []
@@ -60,3 +60,14 @@ else:
 # configuration of the spooler. notification_spool_to has
 # the tuple format (remote_host, tcp_port, also_local)
 notification_spool_to = None
+
+# Settings of the local notification spooler (cmk --notify spooler)
+# Set by the OMD hook NOTIFICATION_SPOOLER which also starts the spooler
+notification_spooler_enabled = False
+notification_spooler_workers = 4  # concurrent deliveries per plugin
+# Per plugin settings overriding the number of workers and limiting the
+# deliveries per second, e.g. {"sms": {"workers": 1, "rate": 0.5}}
+notification_spooler_plugins = {}
+notification_spooler_max_queue = 1000  # spool files read ahead into memory
+notification_spooler_retry_interval = 60
+notification_spooler_metrics_interval = 60
@@ -52,6 +52,7 @@ from cmk_base.exceptions import MKParseFunctionError
 import cmk_base.cleanup
 import cmk_base.check_utils
 import cmk_base.decorator
+import cmk_base.snmp as snmp
 import cmk_base.snmp_scan as snmp_scan
 
 # Run the discovery queued by check_discovery() - if any
@@ -80,6 +81,7 @@ def do_discovery(hostnames, check_plugin_names, only_new):
         console.verbose("Discovering services on all hosts\n")
         hostnames = config_cache.all_active_realhosts()
         use_caches = True
+        config.load_remaining_checks()
     else:
         console.verbose("Discovering services on: %s\n" % ", ".join(hostnames))
 
@@ -97,8 +99,19 @@ def do_discovery(hostnames, check_plugin_names, only_new):
     hostnames = list(set([h for h in hostnames if not config_cache.get_host_config(h).is_cluster]))
     hostnames.sort()
 
-    # Now loop through all hosts
-    for hostname in hostnames:
+    # Now loop through all hosts. The SNMP walks and the agent outputs of several hosts
+    # are fetched concurrently in advance, when configured.
+    prefetched_sources = {}  # type: Dict[str, data_sources.DataSources]
+    num_concurrent_hosts = max(config.snmp_concurrent_hosts, config.agent_concurrent_hosts)
+    for index, hostname in enumerate(hostnames):
+        if num_concurrent_hosts > 1 and index % num_concurrent_hosts == 0:
+            prefetch_hostnames = hostnames[index:index + num_concurrent_hosts]
+            _load_checks_for_discovery(prefetch_hostnames, check_plugin_names)
+            prefetched_sources = _prefetch_data_sources(prefetch_hostnames, check_plugin_names,
+                                                        use_caches)
+        else:
+            _load_checks_for_discovery([hostname], check_plugin_names)
+
         console.section_begin(hostname)
 
         try:
@@ -114,9 +127,10 @@ def do_discovery(hostnames, check_plugin_names, only_new):
             # yet (do not have autochecks), we enable SNMP scan.
             do_snmp_scan = not use_caches or not _has_autochecks(hostname)
 
-            sources = _get_sources_for_discovery(hostname, ipaddress, check_plugin_names,
-                                                 do_snmp_scan, on_error)
+            sources = prefetched_sources.pop(hostname, None) or _get_sources_for_discovery(
+                hostname, ipaddress, check_plugin_names, do_snmp_scan, on_error)
             multi_host_sections = _get_host_sections_for_discovery(sources, use_caches=use_caches)
+            _load_checks_of_host_sections(multi_host_sections)
 
             _do_discovery_for(hostname, ipaddress, sources, multi_host_sections, check_plugin_names,
                               only_new, on_error)
@@ -128,6 +142,8 @@ def do_discovery(hostnames, check_plugin_names, only_new):
         finally:
             cmk_base.cleanup.cleanup_globals()
 
+    snmp.cleanup_prefetched_walks()
+
     # Check whether or not the cluster host autocheck files are still
     # existant. Remove them. The autochecks are only stored in the nodes
     # autochecks files these days.
@@ -783,9 +799,80 @@ def _get_sources_for_discovery(hostname, ipaddress, check_plugin_names, do_snmp_
     return sources
 
 
+def _load_checks_for_discovery(hostnames, check_plugin_names):
+    """Load the checks needed to discover the given hosts in case the checks are loaded on demand
+
+    These are the checks of the already discovered services and, unless the checks to discover
+    are given, the SNMP checks for the SNMP scan. The checks of the agent sections are loaded
+    once the sections have been fetched."""
+    if not config.checks_loaded_on_demand():
+        return
+
+    config_cache = config.get_config_cache()
+    needed_check_plugin_names = set(check_plugin_names or [])
+    for hostname in hostnames:
+        needed_check_plugin_names.update(entry[0] for entry in parse_autochecks_file(hostname))
+        if not check_plugin_names and config_cache.get_host_config(hostname).is_snmp_host:
+            config.load_snmp_checks()
+
+    config.load_checks_of(needed_check_plugin_names)
+
+
+def _load_checks_of_host_sections(multi_host_sections):
+    if not config.checks_loaded_on_demand():
+        return
+
+    section_names = set()
+    for host_sections in multi_host_sections.get_host_sections().itervalues():
+        section_names.update(host_sections.section_names())
+    config.load_checks_of_sections(section_names)
+
+
 def _get_host_sections_for_discovery(sources, use_caches):
-    max_cachefile_age = config.inventory_max_cachefile_age if use_caches else 0
-    return sources.get_host_sections(max_cachefile_age)
+    return sources.get_host_sections(_max_cachefile_age_for_discovery(use_caches))
+
+
+def _max_cachefile_age_for_discovery(use_caches):
+    return config.inventory_max_cachefile_age if use_caches else 0
+
+
+def _prefetch_data_sources(hostnames, check_plugin_names, use_caches):
+    """Create the data sources of the hosts and fetch their data concurrently
+
+    The SNMP hosts are walked concurrently when snmp_concurrent_hosts is configured and
+    the agents are fetched concurrently when agent_concurrent_hosts is configured.
+
+    Returns the data sources of the hosts. These data sources need to be used for the
+    discovery of the hosts to use the fetched data. Errors are reported during the discovery.
+    """
+    on_error = "raise" if cmk.utils.debug.enabled() else "warn"
+
+    prefetched_sources = {}
+    for hostname in hostnames:
+        try:
+            ipaddress = ip_lookup.lookup_ip_address(hostname)
+        except Exception:
+            if cmk.utils.debug.enabled():
+                raise
+            continue
+
+        do_snmp_scan = not use_caches or not _has_autochecks(hostname)
+        prefetched_sources[hostname] = _get_sources_for_discovery(
+            hostname, ipaddress, check_plugin_names, do_snmp_scan, on_error)
+
+    all_sources = [
+        source for sources in prefetched_sources.values() for source in sources.get_data_sources()
+    ]
+    max_cachefile_age = _max_cachefile_age_for_discovery(use_caches)
+    if config.snmp_concurrent_hosts > 1:
+        data_sources.SNMPDataSource.prefetch_walks(
+            [source for source in all_sources if isinstance(source, data_sources.SNMPDataSource)],
+            max_cachefile_age)
+    if config.agent_concurrent_hosts > 1:
+        data_sources.TCPDataSource.prefetch_outputs(
+            [source for source in all_sources if isinstance(source, data_sources.TCPDataSource)],
+            max_cachefile_age)
+    return prefetched_sources
 
 
 def _execute_discovery(multi_host_sections, hostname, ipaddress, check_plugin_name, on_error):
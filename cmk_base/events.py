@@ -34,6 +34,7 @@ import socket
 import time
 import traceback
 import urllib
+from typing import Dict, List, Optional, Tuple  # pylint: disable=unused-import
 
 import six
 
@@ -228,34 +229,72 @@ def find_host_service_in_context(context):
     return host
 
 
+# The contacts of a host and all its services are fetched with one query and
+# cached for a short time. During a notification storm, e.g. when a switch
+# goes down, the notifications of a host and its services are completed
+# without querying Livestatus again and again.
+_OBJECT_CONTACTS_CACHE_TTL = 10
+_object_contacts_cache = {
+}  # type: Dict[str, Tuple[float, Optional[List[str]], Dict[str, List[str]]]]
+
+
+def livestatus_connection():
+    """Connection to the local site, kept open for the next notifications in keepalive mode"""
+    return livestatus.LocalConnection(persist=True)
+
+
 # Fetch information about an objects contacts via Livestatus. This is
 # neccessary for notifications from Nagios, which does not send this
 # information in macros.
 def livestatus_fetch_contacts(host, service):
     try:
-        if service:
-            query = "GET services\nFilter: host_name = %s\nFilter: service_description = %s\nColumns: contacts" % (
-                host, service)
-        else:
-            query = "GET hosts\nFilter: host_name = %s\nColumns: contacts" % host
-
-        contact_list = livestatus.LocalConnection().query_value(query)
-        if "check-mk-notify" in contact_list:  # Remove artifical contact used for rule based notifications
-            contact_list.remove("check-mk-notify")
-        return contact_list
-
-    except livestatus.MKLivestatusNotFoundError:
-        if not service:
-            return None
-
-        # Service not found: try again with contacts of host!
-        return livestatus_fetch_contacts(host, None)
-
+        host_contacts, service_contacts = _fetch_object_contacts(host, service)
     except Exception:
         if cmk.utils.debug.enabled():
             raise
         return None  # We must allow notifications without Livestatus access
 
+    if service and service in service_contacts:
+        contact_list = service_contacts[service]
+    else:
+        # Service not found: use the contacts of the host!
+        contact_list = host_contacts
+
+    if contact_list is None:
+        return None
+
+    # Remove artifical contact used for rule based notifications
+    return [contact for contact in contact_list if contact != "check-mk-notify"]
+
+
+def _fetch_object_contacts(host, service):
+    # type: (str, Optional[str]) -> Tuple[Optional[List[str]], Dict[str, List[str]]]
+    now = time.time()
+    cached = _object_contacts_cache.get(host)
+    if cached and cached[0] > now and (not service or service in cached[2]):
+        return cached[1], cached[2]
+
+    for cached_host, (expires, _host_contacts, _service_contacts) \
+            in _object_contacts_cache.items():
+        if expires <= now:
+            del _object_contacts_cache[cached_host]
+
+    connection = livestatus_connection()
+    rows = connection.query(
+        "GET services\nFilter: host_name = %s\n"
+        "Columns: description contacts host_contacts" % livestatus.lqencode(host))
+    if rows:
+        host_contacts = rows[0][2]
+    else:
+        host_rows = connection.query(
+            "GET hosts\nFilter: host_name = %s\nColumns: contacts" % livestatus.lqencode(host))
+        host_contacts = host_rows[0][0] if host_rows else None
+
+    service_contacts = {description: contacts for description, contacts, _host_contacts in rows}
+    _object_contacts_cache[host] = (now + _OBJECT_CONTACTS_CACHE_TTL, host_contacts,
+                                    service_contacts)
+    return host_contacts, service_contacts
+
 
 def add_rulebased_macros(raw_context):
     # For the rule based notifications we need the list of contacts
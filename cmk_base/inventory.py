@@ -281,7 +281,7 @@ def _do_inv_for_realhost(host_config, sources, multi_host_sections, hostname, ip
                 # sections for inventory plugins which were not fetched yet.
                 source.enforce_check_plugin_names(None)
                 host_sections = multi_host_sections.add_or_get_host_sections(hostname, ipaddress)
-                source.set_fetched_check_plugin_names(host_sections.sections.keys())
+                source.set_fetched_check_plugin_names(host_sections.section_names())
                 host_sections_from_source = source.run()
                 host_sections.update(host_sections_from_source)
 
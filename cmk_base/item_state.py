@@ -39,12 +39,19 @@ Do not store long-time things here. Also do not store complex
 structures like log files or stuff.
 """
 
+import abc
+import ast
+import errno
+import marshal
 import os
+import struct
 import traceback
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple  # pylint: disable=unused-import
 
 import cmk.utils.paths
 import cmk.utils.store
 from cmk.utils.exceptions import MKGeneralException
+import cmk_base.config as config
 import cmk_base.cleanup
 
 # Constants for counters
@@ -67,44 +74,328 @@ class MKCounterWrapped(Exception):
         return self.reason
 
 
+#.
+#   .--Stores--------------------------------------------------------------.
+#   |                     ____  _                                          |
+#   |                    / ___|| |_ ___  _ __ ___  ___                     |
+#   |                    \___ \| __/ _ \| '__/ _ \/ __|                    |
+#   |                     ___) | || (_) | | |  __/\__ \                    |
+#   |                    |____/ \__\___/|_|  \___||___/                    |
+#   +----------------------------------------------------------------------+
+#   | The item states of a host are stored in a single file. The file is   |
+#   | either a Python literal of the whole dictionary or a binary log of   |
+#   | the changes. Both formats can be read. The format that is written is |
+#   | configured with "item_state_store".                                  |
+#   '----------------------------------------------------------------------'
+
+# Starts the files of the binary store. The repr store files start with "{" or are empty.
+_BINARY_MAGIC = "\x00CMKITEMSTATES1\n"
+
+# Each record of the binary store consists of this header followed by the marshalled key
+# and, for updates, the marshalled value
+_RECORD_HEADER = struct.Struct(">BII")
+_RECORD_UPDATE = 1
+_RECORD_REMOVE = 2
+
+# The binary store file is rewritten once it contains more than this number of
+# obsolete records and more obsolete than current records.
+_MIN_OBSOLETE_RECORDS = 1000
+
+FORMAT_REPR = "repr"
+FORMAT_BINARY = "binary"
+
+# Describes the state of a file when it was read. The store uses it to detect
+# modifications of the file made by other processes.
+ItemStatesFileInfo = NamedTuple("ItemStatesFileInfo", [
+    ("format", str),
+    ("inode", int),
+    ("size", int),
+    ("mtime", float),
+    ("num_records", int),
+    ("num_current", int),
+])
+
+# Item states which have not been decoded yet
+EncodedItemStates = Dict[Tuple, str]
+
+
+def _item_states_path(hostname):
+    # type: (str) -> str
+    return cmk.utils.paths.counters_dir + "/" + hostname
+
+
+def _read_item_states(path):
+    # type: (str) -> Tuple[Dict[Tuple, Any], EncodedItemStates, ItemStatesFileInfo]
+    """Read the item states file of any format
+
+    Returns the decoded item states, the not yet decoded item states and the file
+    info. The caller needs to hold the lock of the file."""
+    try:
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            content = f.read()
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return {}, {}, ItemStatesFileInfo(FORMAT_REPR, 0, 0, 0.0, 0, 0)
+
+    if content.startswith(_BINARY_MAGIC):
+        encoded, valid_size, num_records = _parse_binary_item_states(content)
+        return {}, encoded, ItemStatesFileInfo(FORMAT_BINARY, stat.st_ino, valid_size,
+                                               stat.st_mtime, num_records, len(encoded))
+
+    content = content.strip()
+    try:
+        item_states = ast.literal_eval(content) if content else {}
+    except Exception as e:
+        raise MKGeneralException("Cannot read file \"%s\": %s" % (path, e))
+    return item_states, {}, ItemStatesFileInfo(FORMAT_REPR, stat.st_ino, stat.st_size,
+                                               stat.st_mtime, 0, len(item_states))
+
+
+def _parse_binary_item_states(content):
+    # type: (str) -> Tuple[EncodedItemStates, int, int]
+    """Apply all records of the binary store
+
+    The values are not decoded here. Only the values of the keys a check asks for
+    need to be decoded. An incomplete record at the end of the file, e.g. from an
+    interrupted write, is ignored. Returns the encoded item states, the size of the
+    valid part of the file and the number of records."""
+    encoded = {}  # type: EncodedItemStates
+    num_records = 0
+    offset = len(_BINARY_MAGIC)
+    end = len(content)
+    header_size = _RECORD_HEADER.size
+    while offset + header_size <= end:
+        record_type, key_length, value_length = _RECORD_HEADER.unpack_from(content, offset)
+        key_offset = offset + header_size
+        value_offset = key_offset + key_length
+        record_end = value_offset + value_length
+        if record_end > end:
+            break
+
+        key = marshal.loads(content[key_offset:value_offset])
+        if record_type == _RECORD_UPDATE:
+            encoded[key] = content[value_offset:record_end]
+        else:
+            encoded.pop(key, None)
+
+        num_records += 1
+        offset = record_end
+
+    return encoded, offset, num_records
+
+
+def _encode_record(record_type, key, value=None):
+    # type: (int, Tuple, Any) -> str
+    encoded_key = marshal.dumps(key)
+    encoded_value = marshal.dumps(value) if record_type == _RECORD_UPDATE else ""
+    return _RECORD_HEADER.pack(record_type, len(encoded_key),
+                               len(encoded_value)) + encoded_key + encoded_value
+
+
+def _decode_value(encoded_value):
+    # type: (str) -> Any
+    return marshal.loads(encoded_value)
+
+
+class ABCItemStateStore(object):
+    """Writes the item states of a host
+
+    The file info of the last reading of the file tells the store whether or not the
+    file has been modified by another process in the meantime. In this case only the
+    given modifications are applied to the current content of the file."""
+    __metaclass__ = abc.ABCMeta
+
+    format = None  # type: str
+
+    @abc.abstractmethod
+    def save(self, path, file_info, get_all_item_states, updated_item_states,
+             removed_item_state_keys):
+        # type: (str, ItemStatesFileInfo, Callable[[], Dict[Tuple, Any]], Dict[Tuple, Any], List[Tuple]) -> None
+        """Write the item states while holding the lock of the file
+
+        get_all_item_states returns all current item states. It is only called when the
+        whole file needs to be written."""
+        raise NotImplementedError()
+
+    def _is_modified(self, path, file_info):
+        # type: (str, ItemStatesFileInfo) -> bool
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return file_info.inode != 0
+
+        return (stat.st_ino, stat.st_size, stat.st_mtime) != \
+            (file_info.inode, file_info.size, file_info.mtime)
+
+    def _current_item_states(self, path, updated_item_states, removed_item_state_keys):
+        # type: (str, Dict[Tuple, Any], List[Tuple]) -> Dict[Tuple, Any]
+        """Returns the item states of the file with the given modifications applied"""
+        item_states, encoded, _file_info = _read_item_states(path)
+        for key, encoded_value in encoded.iteritems():
+            item_states[key] = _decode_value(encoded_value)
+
+        for key in removed_item_state_keys:
+            item_states.pop(key, None)
+
+        item_states.update(updated_item_states)
+        return item_states
+
+
+class ReprItemStateStore(ABCItemStateStore):
+    """Writes the whole item states as Python literal each time"""
+    format = FORMAT_REPR
+
+    def save(self, path, file_info, get_all_item_states, updated_item_states,
+             removed_item_state_keys):
+        if file_info.format == self.format and not self._is_modified(path, file_info):
+            item_states = get_all_item_states()
+        else:
+            item_states = self._current_item_states(path, updated_item_states,
+                                                    removed_item_state_keys)
+
+        cmk.utils.store.save_data_to_file(path, item_states, pretty=False)
+
+
+class BinaryItemStateStore(ABCItemStateStore):
+    """Appends the modified item states to a log of records
+
+    The values are stored marshalled. Once the file contains a lot of obsolete
+    records it is rewritten with only the current item states."""
+    format = FORMAT_BINARY
+
+    def save(self, path, file_info, get_all_item_states, updated_item_states,
+             removed_item_state_keys):
+        if self._is_modified(path, file_info):
+            _item_states, _encoded, file_info = _read_item_states(path)
+
+        records = [_encode_record(_RECORD_REMOVE, key) for key in removed_item_state_keys]
+        records += [
+            _encode_record(_RECORD_UPDATE, key, value)
+            for key, value in updated_item_states.iteritems()
+        ]
+
+        if file_info.format != self.format or self._needs_rewrite(file_info, records):
+            self._write(
+                path, self._current_item_states(path, updated_item_states, removed_item_state_keys))
+            return
+
+        with open(path, "r+b") as f:
+            # Drop an incomplete record at the end of the file
+            f.truncate(file_info.size)
+            f.seek(file_info.size)
+            f.write("".join(records))
+
+    def _needs_rewrite(self, file_info, records):
+        # type: (ItemStatesFileInfo, List[str]) -> bool
+        # Each new record makes at most one existing record obsolete
+        num_obsolete = file_info.num_records - file_info.num_current + len(records)
+        return num_obsolete > _MIN_OBSOLETE_RECORDS and num_obsolete > file_info.num_current
+
+    def _write(self, path, item_states):
+        # type: (str, Dict[Tuple, Any]) -> None
+        cmk.utils.store.save_file(
+            path, _BINARY_MAGIC + "".join(
+                _encode_record(_RECORD_UPDATE, key, value)
+                for key, value in item_states.iteritems()))
+
+
+_item_state_stores = {
+    FORMAT_REPR: ReprItemStateStore,
+    FORMAT_BINARY: BinaryItemStateStore,
+}
+
+
+def _get_item_state_store():
+    # type: () -> ABCItemStateStore
+    try:
+        return _item_state_stores[config.item_state_store]()
+    except KeyError:
+        raise MKGeneralException("Invalid item state store: %r" % config.item_state_store)
+
+
+def get_item_states_hosts():
+    # type: () -> List[str]
+    """Returns the names of all hosts having an item states file"""
+    try:
+        return [f for f in os.listdir(cmk.utils.paths.counters_dir) if not f.startswith(".")]
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return []
+
+
+def convert_item_states(hostname):
+    # type: (str) -> bool
+    """Convert the item states file of the host to the format of the configured store
+
+    Returns True in case the file has been converted."""
+    path = _item_states_path(hostname)
+    item_state_store = _get_item_state_store()
+    cmk.utils.store.aquire_lock(path)
+    try:
+        item_states, encoded, file_info = _read_item_states(path)
+        if file_info.format == item_state_store.format or (not item_states and not encoded):
+            return False
+
+        item_state_store.save(path, file_info, lambda: item_states, item_states, [])
+        return True
+    finally:
+        cmk.utils.store.release_lock(path)
+
+
+#.
+#   .--Item states---------------------------------------------------------.
+#   |          ___ _                       _        _                      |
+#   |         |_ _| |_ ___ _ __ ___    ___| |_ __ _| |_ ___  ___           |
+#   |          | || __/ _ \ '_ ` _ \  / __| __/ _` | __/ _ \/ __|          |
+#   |          | || ||  __/ | | | | | \__ \ || (_| | ||  __/\__ \          |
+#   |         |___|\__\___|_| |_| |_| |___/\__\__,_|\__\___||___/          |
+#   +----------------------------------------------------------------------+
+#   |                                                                      |
+#   '----------------------------------------------------------------------'
+
+
 class CachedItemStates(object):
     def __init__(self):
         super(CachedItemStates, self).__init__()
         self.reset()
 
     def clear_all_item_states(self):
-        removed_item_state_keys = self._item_states.keys()
+        removed_item_state_keys = self._item_states.keys() + self._encoded_item_states.keys()
         self.reset()
         self._removed_item_state_keys = removed_item_state_keys
 
     def reset(self):
-        # The actual cached data
+        # The actual cached data. The values read from the binary store are decoded
+        # when they are requested for the first time.
         self._item_states = {}
+        self._encoded_item_states = {}  # type: EncodedItemStates
         self._item_state_prefix = ()
-        self._last_mtime = None  # timestamp of last modification
+        self._file_info = None  # type: Optional[ItemStatesFileInfo]
         self._removed_item_state_keys = []
         self._updated_item_states = {}
 
     def load(self, hostname):
-        filename = cmk.utils.paths.counters_dir + "/" + hostname
+        filename = _item_states_path(hostname)
         try:
-            # TODO: refactoring. put these two values into a named tuple
-            self._item_states = cmk.utils.store.load_data_from_file(filename, default={}, lock=True)
-            self._last_mtime = os.stat(filename).st_mtime
+            cmk.utils.store.aquire_lock(filename)
+            self._item_states, self._encoded_item_states, self._file_info = \
+                _read_item_states(filename)
         finally:
             cmk.utils.store.release_lock(filename)
 
-    # TODO: self._last_mtime needs be updated accordingly after the save_data_to_file operation
-    #       right now, the current mechanism is sufficient enough, since the save() function is only
-    #       called as the final operation, just before the lifecycle of the CachedItemState ends
     def save(self, hostname):
         """ The job of the save function is to update the item state on disk.
         It simply returns, if it detects that the data wasn't changed at all since the last loading
         If the data on disk has been changed in the meantime, the cached data is updated from disk.
         Afterwards only the actual modifications (update/remove) are applied to the updated cached
-        data before it is written back to disk.
+        data before it is written back to disk. How this is done depends on the configured store.
         """
-        filename = cmk.utils.paths.counters_dir + "/" + hostname
+        filename = _item_states_path(hostname)
         if not self._removed_item_state_keys and not self._updated_item_states:
             return
 
@@ -113,21 +404,9 @@ class CachedItemStates(object):
                 os.makedirs(cmk.utils.paths.counters_dir)
 
             cmk.utils.store.aquire_lock(filename)
-            last_mtime = os.stat(filename).st_mtime
-            if last_mtime != self._last_mtime:
-                self._item_states = cmk.utils.store.load_data_from_file(filename, default={})
-
-                # Remove obsolete keys
-                for key in self._removed_item_state_keys:
-                    try:
-                        del self._item_states[key]
-                    except KeyError:
-                        pass
-
-                # Add updated keys
-                self._item_states.update(self._updated_item_states)
-
-            cmk.utils.store.save_data_to_file(filename, self._item_states, pretty=False)
+            file_info = self._file_info or ItemStatesFileInfo(FORMAT_REPR, 0, 0, 0.0, 0, 0)
+            _get_item_state_store().save(filename, file_info, self.get_all_item_states,
+                                         self._updated_item_states, self._removed_item_state_keys)
         except Exception:
             raise MKGeneralException("Cannot write to %s: %s" % (filename, traceback.format_exc()))
         finally:
@@ -142,22 +421,36 @@ class CachedItemStates(object):
             self.remove_full_key(key)
 
     def remove_full_key(self, full_key):
+        self._removed_item_state_keys.append(full_key)
+        self._updated_item_states.pop(full_key, None)
+        self._item_states.pop(full_key, None)
+        self._encoded_item_states.pop(full_key, None)
+
+    def get_item_state(self, user_key, default=None):
+        key = self.get_unique_item_state_key(user_key)
         try:
-            self._removed_item_state_keys.append(full_key)
-            del self._item_states[full_key]
+            return self._item_states[key]
         except KeyError:
             pass
 
-    def get_item_state(self, user_key, default=None):
-        key = self.get_unique_item_state_key(user_key)
-        return self._item_states.get(key, default)
+        try:
+            encoded_value = self._encoded_item_states.pop(key)
+        except KeyError:
+            return default
+
+        value = self._item_states[key] = _decode_value(encoded_value)
+        return value
 
     def set_item_state(self, user_key, state):
         key = self.get_unique_item_state_key(user_key)
         self._item_states[key] = state
+        self._encoded_item_states.pop(key, None)
         self._updated_item_states[key] = state
 
     def get_all_item_states(self):
+        for key, encoded_value in self._encoded_item_states.iteritems():
+            self._item_states[key] = _decode_value(encoded_value)
+        self._encoded_item_states.clear()
         return self._item_states
 
     def get_item_state_prefix(self):
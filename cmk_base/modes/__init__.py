@@ -132,6 +132,13 @@ class Modes(object):
                 options += mode.options()
         return options
 
+    def on_demand_checks_options(self):
+        options = []
+        for mode in self._modes:
+            if mode.needs_checks and mode.loads_checks_on_demand:
+                options += mode.options()
+        return options
+
     def parse_hostname_list(self, args, with_clusters=True, with_foreign_hosts=False):
         config_cache = config.get_config_cache()
         if with_foreign_hosts:
@@ -292,6 +299,7 @@ class Mode(Option):
                  long_help=None,
                  needs_config=True,
                  needs_checks=True,
+                 loads_checks_on_demand=False,
                  sub_options=None):
         # TODO: This disable is needed because of a pylint bug. Remove one day.
         # pylint: disable=bad-super-call
@@ -307,6 +315,7 @@ class Mode(Option):
         self.long_help = long_help
         self.needs_config = needs_config
         self.needs_checks = needs_checks
+        self.loads_checks_on_demand = loads_checks_on_demand
         self.sub_options = sub_options or []
 
     def short_getopt_specs(self):
@@ -24,6 +24,7 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import errno
 import os
 import sys
 from typing import List  # pylint: disable=unused-import
@@ -32,6 +33,7 @@ import cmk
 import cmk.utils.tty as tty
 import cmk.utils.paths
 import cmk.utils.log
+import cmk.utils.store
 import cmk.utils.debug
 from cmk.utils.exceptions import MKBailOut
 
@@ -45,6 +47,7 @@ import cmk_base.check_api as check_api
 import cmk_base.piggyback as piggyback
 import cmk_base.snmp as snmp
 import cmk_base.ip_lookup as ip_lookup
+import cmk_base.item_state as item_state
 import cmk_base.profiling as profiling
 import cmk_base.core
 import cmk_base.data_sources.abstract
@@ -423,7 +426,9 @@ modes.register(
             "Shows the raw information received from the given host. For regular "
             "hosts it shows the agent output plus possible piggyback information. "
             "Does not work on clusters but only on real hosts. "
-        ]))
+        ],
+        loads_checks_on_demand=True,
+    ))
 
 #.
 #   .--dump----------------------------------------------------------------.
@@ -740,6 +745,50 @@ modes.register(
         short_help="Cleanup outdated piggyback files",
     ))
 
+#.
+#   .--predictions---------------------------------------------------------.
+#   |                             _ _      _   _                           |
+#   |          _ __  _ __ ___  __| (_) ___| |_(_) ___  _ __  ___           |
+#   |         | '_ \| '__/ _ \/ _` | |/ __| __| |/ _ \| '_ \/ __|          |
+#   |         | |_) | | |  __/ (_| | | (__| |_| | (_) | | | \__ \          |
+#   |         | .__/|_|  \___|\__,_|_|\___|\__|_|\___/|_| |_|___/          |
+#   |         |_|                                                          |
+#   '----------------------------------------------------------------------'
+
+
+def mode_precompute_predictions():
+    import cmk_base.prediction as prediction
+
+    lock_path = cmk.utils.paths.tmp_dir + "/precompute_predictions.lock"
+    try:
+        cmk.utils.store.aquire_lock(lock_path, blocking=False)
+    except IOError as e:
+        if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+            raise
+        console.verbose("Predictions are already being computed. Terminating.\n")
+        return
+
+    try:
+        num_computed = prediction.precompute_predictions(config.prediction_precompute_lead_time,
+                                                         config.prediction_precompute_rate)
+        console.verbose("Computed %d predictions\n" % num_computed)
+    finally:
+        cmk.utils.store.release_lock(lock_path)
+
+
+modes.register(
+    Mode(
+        long_option="precompute-predictions",
+        handler_function=mode_precompute_predictions,
+        needs_checks=False,
+        short_help="Compute predictive levels in advance",
+        long_help=[
+            "Computes the predictions of the services using predictive levels "
+            "before their current predictions are outdated. The checks then only need "
+            "to read the predictions. This is executed regularly by a cron job.",
+        ],
+    ))
+
 #.
 #   .--scan-parents--------------------------------------------------------.
 #   |                                                         _            |
@@ -1007,6 +1056,38 @@ modes.register(
         ],
     ))
 
+
+def mode_convert_item_states(hosts):
+    if not hosts:
+        hosts = sorted(item_state.get_item_states_hosts())
+
+    num_converted = 0
+    for host in hosts:
+        if item_state.convert_item_states(host):
+            console.verbose("%s: converted\n" % host)
+            num_converted += 1
+
+    console.output("Converted the counters of %d of %d hosts to the format \"%s\"\n" %
+                   (num_converted, len(hosts), config.item_state_store))
+
+
+modes.register(
+    Mode(
+        long_option="convert-item-states",
+        handler_function=mode_convert_item_states,
+        argument=True,
+        argument_descr="HOST1 HOST2...",
+        argument_optional=True,
+        needs_checks=False,
+        short_help="Convert the counter files to the configured format",
+        long_help=[
+            "Rewrites the files holding the state of the performance counters "
+            "of the given or all hosts in the format configured with "
+            "item_state_store. The files are converted anyway when they are "
+            "written the next time. Use this mode to convert all files at once.",
+        ],
+    ))
+
 #.
 #   .--nagios-config-------------------------------------------------------.
 #   |                     _                                  __ _          |
@@ -1500,6 +1581,13 @@ def mode_discover(options, args):
     discovery.do_discovery(hostnames, options.get("checks"), options["discover"] == 1)
 
 
+def _convert_check_plugin_names(arg):
+    if arg == "@all":
+        config.load_remaining_checks()
+        return config.check_info.keys()
+    return arg.split(",")
+
+
 modes.register(
     Mode(
         long_option="discover",
@@ -1521,6 +1609,7 @@ modes.register(
             "-II does the same as -I but deletes all existing checks of the "
             "specified types and hosts."
         ],
+        loads_checks_on_demand=True,
         sub_options=[
             Option(
                 long_option="discover",
@@ -1533,7 +1622,7 @@ modes.register(
                 short_help="Restrict discovery to certain check types",
                 argument=True,
                 argument_descr="C",
-                argument_conv=lambda x: config.check_info.keys() if x == "@all" else x.split(","),
+                argument_conv=_convert_check_plugin_names,
             ),
         ]))
 
@@ -0,0 +1,720 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""SNMP backend speaking SNMP v1 and v2c itself
+
+In contrast to the classic backend no snmpget or snmpwalk processes are executed.
+The backend keeps one UDP socket per host which is used for all requests until
+cleanup_sessions() is called at the end of the processing of the host. Walks are
+done with GETBULK requests for bulkwalk hosts, using the configured bulk size as
+max-repetitions, and with GETNEXT requests otherwise. The requests of several walks
+are sent concurrently. walk_hosts() walks the OIDs of many hosts concurrently.
+
+SNMP v3 is not supported by this backend.
+"""
+
+import collections
+import errno
+import itertools
+import random
+import select
+import socket
+import struct
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple, Union  # pylint: disable=unused-import
+
+import cmk_base.classic_snmp as classic_snmp
+import cmk_base.console as console
+import cmk_base.snmp_utils as snmp_utils
+from cmk_base.exceptions import MKSNMPError
+
+# The timing defaults of the Net-SNMP tools
+_DEFAULT_TIMEOUT = 1.0
+_DEFAULT_RETRIES = 5
+
+_VERSION_1 = 0
+_VERSION_2C = 1
+
+_TAG_INTEGER = 0x02
+_TAG_OCTET_STRING = 0x04
+_TAG_NULL = 0x05
+_TAG_OID = 0x06
+_TAG_SEQUENCE = 0x30
+_TAG_IP_ADDRESS = 0x40
+_TAG_COUNTER32 = 0x41
+_TAG_GAUGE32 = 0x42
+_TAG_TIMETICKS = 0x43
+_TAG_OPAQUE = 0x44
+_TAG_COUNTER64 = 0x46
+_TAG_NO_SUCH_OBJECT = 0x80
+_TAG_NO_SUCH_INSTANCE = 0x81
+_TAG_END_OF_MIB_VIEW = 0x82
+
+# Opaque values wrapping the types of draft-perkins-opaque-01
+_OPAQUE_TAG_EXTENSION = 0x9f
+_OPAQUE_COUNTER64 = 0x76
+_OPAQUE_FLOAT = 0x78
+_OPAQUE_DOUBLE = 0x79
+_OPAQUE_INTEGER64 = 0x7a
+_OPAQUE_UNSIGNED64 = 0x7b
+
+# Octet strings consisting of these characters are printed as text by the Net-SNMP tools
+_PRINTABLE_CHARS = "".join(chr(c) for c in range(0x20, 0x7f)) + "\t\n\v\f\r"
+
+_PDU_GET_REQUEST = 0xa0
+_PDU_GET_NEXT_REQUEST = 0xa1
+_PDU_RESPONSE = 0xa2
+_PDU_GET_BULK_REQUEST = 0xa5
+
+_ERROR_NO_SUCH_NAME = 2
+
+# Varbinds as sent in SNMP messages: The OID, the tag and the encoded value
+VarBinds = List[Tuple[str, int, str]]
+# The fields of an SNMP message: version, community, PDU type, request ID, error status
+# (non repeaters), error index (max repetitions) and varbinds
+SNMPMessage = Tuple[int, str, int, int, int, int, VarBinds]
+
+_sessions = {}  # type: Dict[Tuple, SNMPSession]
+
+
+class NativeSNMPBackend(snmp_utils.ABCSNMPBackend):
+    def get(self, snmp_config, oid, context_name=None):
+        if oid.endswith(".*"):
+            oid_prefix = oid[:-2]
+            pdu_type = _PDU_GET_NEXT_REQUEST
+        else:
+            oid_prefix = oid
+            pdu_type = _PDU_GET_REQUEST
+
+        session = _get_session(snmp_config)
+        try:
+            response = session.request_many([(pdu_type, [_normalize_oid(oid_prefix)], 0, 0)])[0]
+        except MKSNMPError as e:
+            console.verbose("SNMP error: %s\n" % e)
+            return None
+
+        error_status, varbinds = response[4], response[6]
+        if error_status or not varbinds:
+            return None
+
+        item, tag, value = varbinds[0]
+        # In case of .*, check if prefix is the one we are looking for
+        if pdu_type == _PDU_GET_NEXT_REQUEST \
+           and not item.startswith(_normalize_oid(oid_prefix) + "."):
+            return None
+
+        value = _decode_value(tag, value)
+        console.vverbose("SNMP answer: ==> [%s]\n" % value)
+        return value
+
+    def walk(self, snmp_config, oid, check_plugin_name=None, table_base_oid=None,
+             context_name=None):
+        return self.walk_many(snmp_config, [oid], check_plugin_name, table_base_oid,
+                              context_name)[oid]
+
+    def walk_many(self,
+                  snmp_config,
+                  oids,
+                  check_plugin_name=None,
+                  table_base_oid=None,
+                  context_name=None):
+        session = _get_session(snmp_config)
+        host_walks = _HostWalks(session, oids)
+        requests = host_walks.next_requests()
+        while requests:
+            host_walks.add_responses(session.request_many(requests))
+            requests = host_walks.next_requests()
+        return host_walks.result()
+
+
+def walk_hosts(jobs, max_concurrent_hosts):
+    # type: (List[Tuple[snmp_utils.SNMPHostConfig, List[str]]], int) -> List[Union[Dict[str, snmp_utils.SNMPRowInfo], MKSNMPError]]
+    """Walk the OIDs of many hosts concurrently from this process
+
+    Each job consists of the SNMP configuration of a host and the OIDs to walk. The walks
+    of up to max_concurrent_hosts hosts are in progress at the same time, each host
+    using its own socket and the timeout and retries of its SNMP timing settings. A slow
+    or dead host does not delay the walks of the other hosts.
+
+    Returns the walks of each job in the order of the jobs. The walks of a host are
+    replaced by the exception in case the host could not be walked.
+    """
+    results = [None] * len(jobs)  # type: List[Any]
+    queue = collections.deque(enumerate(jobs))
+    active = {}  # type: Dict[int, Tuple[int, SNMPSession, _HostWalks]]
+    poller = select.poll()
+    while queue or active:
+        while queue and len(active) < max_concurrent_hosts:
+            index, (snmp_config, oids) = queue.popleft()
+            try:
+                session = SNMPSession(snmp_config)
+                host_walks = _HostWalks(session, oids)
+                requests = host_walks.next_requests()
+                if not requests:
+                    session.close()
+                    results[index] = host_walks.result()
+                    continue
+                session.send_requests(requests)
+            except MKSNMPError as e:
+                results[index] = e
+                continue
+
+            active[session.fileno()] = (index, session, host_walks)
+            poller.register(session.fileno(), select.POLLIN)
+
+        if not active:
+            break
+
+        timeout = min(session.deadline for _index, session, _walks in active.values()) - time.time()
+        ready_fds = set(fd for fd, _event in poller.poll(_poll_timeout(timeout)))
+        now = time.time()
+        for fd, (index, session, host_walks) in active.items():
+            try:
+                if fd in ready_fds:
+                    session.receive_responses()
+
+                if session.is_waiting:
+                    session.handle_timeout(now)
+                    continue
+
+                host_walks.add_responses(session.responses)
+                requests = host_walks.next_requests()
+                if requests:
+                    session.send_requests(requests)
+                    continue
+
+                results[index] = host_walks.result()
+            except MKSNMPError as e:
+                results[index] = e
+
+            poller.unregister(fd)
+            del active[fd]
+            session.close()
+
+    return results
+
+
+def _poll_timeout(timeout):
+    # type: (float) -> int
+    """Convert the timeout in seconds to the rounded up milliseconds poll() expects"""
+    return max(0, int(timeout * 1000) + 1)
+
+
+class _HostWalks(object):
+    """The walks of several OIDs of one host, done in rounds of concurrent requests"""
+
+    def __init__(self, session, oids):
+        # type: (SNMPSession, List[str]) -> None
+        super(_HostWalks, self).__init__()
+        self._session = session
+        self._oids = oids
+        self._walks = [_Walk(session.hostname, oid) for oid in oids]
+        self._active_walks = self._walks
+        self._empty_walks = None  # type: Optional[List[_Walk]]
+
+    def next_requests(self):
+        # type: () -> List[Tuple[int, List[str], int, int]]
+        """Returns the requests of the next round, nothing when all walks are finished"""
+        if self._active_walks:
+            console.vverbose(
+                "Walking %s (%d requests)\n" % (self._session.hostname, len(self._active_walks)))
+            return [self._session.walk_request(walk.next_oid) for walk in self._active_walks]
+
+        if self._empty_walks is None:
+            # Just like snmpwalk: Try to get the walked OID itself when the walk has no result
+            self._empty_walks = [walk for walk in self._walks if not walk.rows]
+            return [(_PDU_GET_REQUEST, [walk.oid], 0, 0) for walk in self._empty_walks]
+
+        return []
+
+    def add_responses(self, responses):
+        # type: (List[SNMPMessage]) -> None
+        if self._active_walks:
+            for walk, response in zip(self._active_walks, responses):
+                walk.add_response(response)
+            self._active_walks = [walk for walk in self._active_walks if not walk.is_done]
+            return
+
+        for walk, response in zip(self._empty_walks or [], responses):
+            walk.add_get_response(response)
+
+    def result(self):
+        # type: () -> Dict[str, snmp_utils.SNMPRowInfo]
+        return dict((oid, walk.rows) for oid, walk in zip(self._oids, self._walks))
+
+
+class _Walk(object):
+    """The state of the walk of a single OID"""
+
+    def __init__(self, hostname, oid):
+        # type: (str, str) -> None
+        super(_Walk, self).__init__()
+        self._hostname = hostname
+        self.oid = _normalize_oid(oid)
+        self._prefix = self.oid + "."
+        self.next_oid = self.oid
+        self.rows = []  # type: snmp_utils.SNMPRowInfo
+        self.is_done = False
+        self._seen_oids = set()  # type: Set[str]
+
+    def add_response(self, response):
+        # type: (SNMPMessage) -> None
+        error_status, varbinds = response[4], response[6]
+        if error_status == _ERROR_NO_SUCH_NAME:
+            self.is_done = True  # SNMP v1 signals the end of the MIB this way
+            return
+
+        if error_status:
+            raise MKSNMPError("SNMP Error on %s: Error status %d in response to the walk of %s" %
+                              (self._hostname, error_status, self.oid))
+
+        if not varbinds:
+            self.is_done = True
+            return
+
+        for oid, tag, value in varbinds:
+            # Stop at the end of the subtree. Also stop when the agent returns an OID
+            # twice to prevent endless walks of broken agents.
+            if tag == _TAG_END_OF_MIB_VIEW or not oid.startswith(self._prefix) \
+               or oid in self._seen_oids:
+                self.is_done = True
+                return
+
+            self._seen_oids.add(oid)
+            self.next_oid = oid
+            value = _decode_value(tag, value)
+            if value is not None:
+                self.rows.append((oid, value))
+
+    def add_get_response(self, response):
+        # type: (SNMPMessage) -> None
+        error_status, varbinds = response[4], response[6]
+        if error_status or not varbinds:
+            return
+
+        oid, tag, value = varbinds[0]
+        value = _decode_value(tag, value)
+        if value is not None:
+            self.rows.append((oid, value))
+
+
+#.
+#   .--Sessions------------------------------------------------------------.
+#   |                ____                _                                 |
+#   |               / ___|  ___  ___ ___(_) ___  _ __  ___                 |
+#   |               \___ \ / _ \/ __/ __| |/ _ \| '_ \/ __|                |
+#   |                ___) |  __/\__ \__ \ | (_) | | | \__ \                |
+#   |               |____/ \___||___/___/_|\___/|_| |_|___/                |
+#   +----------------------------------------------------------------------+
+#   |  The UDP sockets used to talk to the hosts                           |
+#   '----------------------------------------------------------------------'
+
+
+def _get_session(snmp_config):
+    # type: (snmp_utils.SNMPHostConfig) -> SNMPSession
+    if snmp_utils.is_snmpv3_host(snmp_config):
+        raise MKSNMPError("SNMP v3 is not supported by the native SNMP backend")
+
+    key = (snmp_config.hostname, snmp_config.ipaddress, snmp_config.port, snmp_config.credentials)
+    try:
+        return _sessions[key]
+    except KeyError:
+        session = _sessions[key] = SNMPSession(snmp_config)
+        return session
+
+
+def cleanup_sessions():
+    # type: () -> None
+    """Close the sockets of all hosts"""
+    for session in _sessions.values():
+        session.close()
+    _sessions.clear()
+
+
+class SNMPSession(object):
+    """The UDP socket used to send requests to one host and receive the responses
+
+    The requests are sent at once with send_requests(). The responses are matched to
+    the requests by their request ID. The requests without response are sent again
+    after the timeout.
+    """
+
+    def __init__(self, snmp_config):
+        # type: (snmp_utils.SNMPHostConfig) -> None
+        super(SNMPSession, self).__init__()
+        self.hostname = snmp_config.hostname
+        self._community = snmp_config.credentials
+
+        if snmp_config.is_bulkwalk_host or snmp_config.is_snmpv2or3_without_bulkwalk_host:
+            self._version = _VERSION_2C
+        else:
+            self._version = _VERSION_1
+        self._use_bulk = snmp_config.is_bulkwalk_host
+        self._max_repetitions = snmp_config.bulk_walk_size_of
+
+        self._timeout = snmp_config.timing.get("timeout", _DEFAULT_TIMEOUT)
+        self._retries = snmp_config.timing.get("retries", _DEFAULT_RETRIES)
+
+        self._request_ids = itertools.count(random.randint(1, 2**30))
+        self._messages = {}  # type: Dict[int, str]
+        self._pending = {}  # type: Dict[int, int]
+        self.responses = []  # type: List[SNMPMessage]
+        self._attempt = 0
+        self.deadline = 0.0
+
+        family = socket.AF_INET6 if snmp_config.is_ipv6_primary else socket.AF_INET
+        self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            self._socket.connect((snmp_config.ipaddress, snmp_config.port))
+        except socket.error as e:
+            self._socket.close()
+            raise MKSNMPError("SNMP Error on %s: %s" % (self.hostname, e))
+        self._socket.setblocking(False)
+
+    def close(self):
+        # type: () -> None
+        self._socket.close()
+
+    def fileno(self):
+        # type: () -> int
+        return self._socket.fileno()
+
+    def walk_request(self, oid):
+        # type: (str) -> Tuple[int, List[str], int, int]
+        if self._use_bulk:
+            return _PDU_GET_BULK_REQUEST, [oid], 0, self._max_repetitions
+        return _PDU_GET_NEXT_REQUEST, [oid], 0, 0
+
+    @property
+    def is_waiting(self):
+        # type: () -> bool
+        """Whether or not responses to the last requests are missing"""
+        return bool(self._pending)
+
+    def request_many(self, requests):
+        # type: (List[Tuple[int, List[str], int, int]]) -> List[SNMPMessage]
+        """Send the requests at once and wait for all responses
+
+        Returns the responses in the order of the requests.
+        """
+        self.send_requests(requests)
+        poller = select.poll()
+        poller.register(self._socket, select.POLLIN)
+        while self._pending:
+            if poller.poll(_poll_timeout(self.deadline - time.time())):
+                self.receive_responses()
+            else:
+                self.handle_timeout(time.time())
+        return self.responses
+
+    def send_requests(self, requests):
+        # type: (List[Tuple[int, List[str], int, int]]) -> None
+        """Send the requests without waiting for the responses
+
+        Each request consists of the PDU type, the OIDs, the non repeaters and the max
+        repetitions. The responses are available in the order of the requests in
+        self.responses as soon as is_waiting is False.
+        """
+        self._messages.clear()
+        self._pending.clear()
+        for index, (pdu_type, oids, non_repeaters, max_repetitions) in enumerate(requests):
+            request_id = next(self._request_ids)
+            self._pending[request_id] = index
+            self._messages[request_id] = encode_message(
+                (self._version, self._community, pdu_type, request_id, non_repeaters,
+                 max_repetitions, [(oid, _TAG_NULL, "") for oid in oids]))
+
+        self.responses = [None] * len(requests)  # type: ignore
+        self._attempt = 0
+        self._send_pending()
+
+    def handle_timeout(self, now):
+        # type: (float) -> None
+        """Send the requests without response again or fail when the retries are used up"""
+        if now < self.deadline:
+            return
+
+        if self._attempt >= self._retries:
+            raise MKSNMPError("SNMP Error on %s: Timeout: No Response" % self.hostname)
+
+        self._attempt += 1
+        self._send_pending()
+
+    def receive_responses(self):
+        # type: () -> None
+        """Process the responses which have been received, without blocking"""
+        while self._pending:
+            try:
+                data = self._socket.recv(65535)
+            except socket.error as e:
+                if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                    return
+                raise MKSNMPError("SNMP Error on %s: %s" % (self.hostname, e))
+
+            try:
+                response = decode_message(data)
+            except (IndexError, ValueError):
+                console.vverbose("Ignoring invalid SNMP message from %s\n" % self.hostname)
+                continue
+
+            if response[2] != _PDU_RESPONSE:
+                continue
+
+            # Ignore late responses to requests which have already been answered
+            index = self._pending.pop(response[3], None)
+            if index is not None:
+                self.responses[index] = response
+
+    def _send_pending(self):
+        # type: () -> None
+        for request_id in self._pending:
+            try:
+                self._socket.send(self._messages[request_id])
+            except socket.error as e:
+                raise MKSNMPError("SNMP Error on %s: %s" % (self.hostname, e))
+        self.deadline = time.time() + self._timeout
+
+
+#.
+#   .--BER-----------------------------------------------------------------.
+#   |                          ____  _____ ____                            |
+#   |                         | __ )| ____|  _ \                           |
+#   |                         |  _ \|  _| | |_) |                          |
+#   |                         | |_) | |___|  _ <                           |
+#   |                         |____/|_____|_| \_\                          |
+#   +----------------------------------------------------------------------+
+#   |  Encoding and decoding of the SNMP messages                          |
+#   '----------------------------------------------------------------------'
+
+
+def encode_message(message):
+    # type: (SNMPMessage) -> str
+    version, community, pdu_type, request_id, error_status, error_index, varbinds = message
+    encoded_varbinds = "".join(
+        _encode_tlv(_TAG_SEQUENCE,
+                    _encode_oid(oid) + _encode_tlv(tag, value)) for oid, tag, value in varbinds)
+    pdu = _encode_tlv(
+        pdu_type,
+        _encode_integer(request_id) + _encode_integer(error_status) + _encode_integer(error_index) +
+        _encode_tlv(_TAG_SEQUENCE, encoded_varbinds))
+    return _encode_tlv(_TAG_SEQUENCE,
+                       _encode_integer(version) + _encode_tlv(_TAG_OCTET_STRING, community) + pdu)
+
+
+def decode_message(data):
+    # type: (str) -> SNMPMessage
+    """Decode an SNMP message, raises ValueError or IndexError on invalid data"""
+    _tag, message, _end = _decode_tlv(data, 0)
+    _tag, version, offset = _decode_tlv(message, 0)
+    _tag, community, offset = _decode_tlv(message, offset)
+    pdu_type, pdu, _end = _decode_tlv(message, offset)
+
+    _tag, request_id, offset = _decode_tlv(pdu, 0)
+    _tag, error_status, offset = _decode_tlv(pdu, offset)
+    _tag, error_index, offset = _decode_tlv(pdu, offset)
+    _tag, encoded_varbinds, _end = _decode_tlv(pdu, offset)
+
+    varbinds = []  # type: VarBinds
+    offset = 0
+    while offset < len(encoded_varbinds):
+        _tag, varbind, offset = _decode_tlv(encoded_varbinds, offset)
+        _tag, oid, value_offset = _decode_tlv(varbind, 0)
+        tag, value, _end = _decode_tlv(varbind, value_offset)
+        varbinds.append((_decode_oid(oid), tag, value))
+
+    return (_decode_integer(version), community, pdu_type, _decode_integer(request_id),
+            _decode_integer(error_status), _decode_integer(error_index), varbinds)
+
+
+def encode_value(tag, value):
+    # type: (int, str) -> str
+    """Encode the value of a varbind given in the format the backend returns the values"""
+    if tag == _TAG_INTEGER:
+        return _encode_integer(int(value))[2:]
+    if tag in [_TAG_COUNTER32, _TAG_GAUGE32, _TAG_TIMETICKS, _TAG_COUNTER64]:
+        return _encode_integer(int(value))[2:]
+    if tag == _TAG_IP_ADDRESS:
+        return "".join(chr(int(part)) for part in value.split("."))
+    if tag == _TAG_OID:
+        return _encode_oid(value)[2:]
+    return value
+
+
+def _decode_value(tag, value):
+    # type: (int, str) -> Optional[str]
+    """Convert the value of a varbind to the format of the other backends
+
+    Returns None for values signaling missing objects."""
+    if tag == _TAG_OCTET_STRING:
+        return _decode_octet_string(value)
+    if tag == _TAG_OPAQUE:
+        return _decode_opaque(value)
+    if tag == _TAG_INTEGER:
+        return str(_decode_integer(value))
+    if tag in [_TAG_COUNTER32, _TAG_GAUGE32, _TAG_TIMETICKS, _TAG_COUNTER64]:
+        return str(_decode_unsigned(value))
+    if tag == _TAG_IP_ADDRESS:
+        return ".".join(str(ord(c)) for c in value)
+    if tag == _TAG_OID:
+        return _decode_oid(value)
+    return None  # NULL, noSuchObject, noSuchInstance and endOfMibView
+
+
+def _decode_octet_string(value):
+    # type: (str) -> str
+    """Convert the string like the classic backend does
+
+    The Net-SNMP tools print strings of printable characters as quoted text and all other
+    strings as hex dump. The classic backend joins the lines of the text and strips it.
+    It converts the hex dump back to the original string."""
+    if value.translate(None, _PRINTABLE_CHARS):
+        return value
+
+    lines = value.replace("\\", "\\\\").replace('"', '\\"').split("\n")
+    if len(lines) > 1:
+        lines = [lines[0].rstrip()] + [line.strip() for line in lines[1:-1]] \
+                + [lines[-1].lstrip()]
+    return classic_snmp.strip_snmp_value('"%s"' % " ".join(lines))
+
+
+def _decode_opaque(value):
+    # type: (str) -> str
+    """Convert the opaque value like the classic backend does
+
+    The Net-SNMP tools print the numbers wrapped into opaque values and a hex dump of
+    all other opaque values."""
+    if len(value) > 3 and ord(value[0]) == _OPAQUE_TAG_EXTENSION \
+       and ord(value[2]) == len(value) - 3:
+        opaque_type, data = ord(value[1]), value[3:]
+        if opaque_type == _OPAQUE_FLOAT and len(data) == 4:
+            return "%f" % struct.unpack(">f", data)[0]
+        if opaque_type == _OPAQUE_DOUBLE and len(data) == 8:
+            return "%f" % struct.unpack(">d", data)[0]
+        if opaque_type in [_OPAQUE_COUNTER64, _OPAQUE_UNSIGNED64]:
+            return str(_decode_unsigned(data))
+        if opaque_type == _OPAQUE_INTEGER64:
+            return str(_decode_integer(data))
+
+    return " ".join("%02X" % ord(c) for c in value)
+
+
+def _normalize_oid(oid):
+    # type: (str) -> str
+    return oid if oid.startswith(".") else "." + oid
+
+
+def _encode_length(length):
+    # type: (int) -> str
+    if length < 0x80:
+        return chr(length)
+
+    encoded = ""
+    while length:
+        encoded = chr(length & 0xff) + encoded
+        length >>= 8
+    return chr(0x80 | len(encoded)) + encoded
+
+
+def _encode_tlv(tag, value):
+    # type: (int, str) -> str
+    return chr(tag) + _encode_length(len(value)) + value
+
+
+def _encode_integer(value):
+    # type: (int) -> str
+    encoded = ""
+    while True:
+        encoded = chr(value & 0xff) + encoded
+        value >>= 8
+        is_negative = ord(encoded[0]) & 0x80
+        if (value == 0 and not is_negative) or (value == -1 and is_negative):
+            return _encode_tlv(_TAG_INTEGER, encoded)
+
+
+def _encode_oid(oid):
+    # type: (str) -> str
+    parts = [int(part) for part in oid.strip(".").split(".")]
+    if len(parts) < 2:
+        parts.append(0)
+
+    subidentifiers = [parts[0] * 40 + parts[1]] + parts[2:]
+    encoded = []
+    for subidentifier in subidentifiers:
+        encoded_subidentifier = chr(subidentifier & 0x7f)
+        subidentifier >>= 7
+        while subidentifier:
+            encoded_subidentifier = chr(0x80 | (subidentifier & 0x7f)) + encoded_subidentifier
+            subidentifier >>= 7
+        encoded.append(encoded_subidentifier)
+    return _encode_tlv(_TAG_OID, "".join(encoded))
+
+
+def _decode_tlv(data, offset):
+    # type: (str, int) -> Tuple[int, str, int]
+    """Returns the tag and the value at the offset and the offset behind the value"""
+    tag = ord(data[offset])
+    length = ord(data[offset + 1])
+    offset += 2
+    if length & 0x80:
+        num_length_bytes = length & 0x7f
+        length = _decode_unsigned(data[offset:offset + num_length_bytes])
+        offset += num_length_bytes
+
+    end = offset + length
+    if end > len(data):
+        raise ValueError("Truncated value")
+    return tag, data[offset:end], end
+
+
+def _decode_unsigned(value):
+    # type: (str) -> int
+    result = 0
+    for c in value:
+        result = (result << 8) | ord(c)
+    return result
+
+
+def _decode_integer(value):
+    # type: (str) -> int
+    result = _decode_unsigned(value)
+    if value and ord(value[0]) & 0x80:
+        result -= 1 << (8 * len(value))
+    return result
+
+
+def _decode_oid(value):
+    # type: (str) -> str
+    subidentifiers = []
+    subidentifier = 0
+    for c in value:
+        subidentifier = (subidentifier << 7) | (ord(c) & 0x7f)
+        if not ord(c) & 0x80:
+            subidentifiers.append(subidentifier)
+            subidentifier = 0
+
+    # The first subidentifier encodes the first two parts of the OID
+    first = min(subidentifiers[0] // 40, 2)
+    parts = [first, subidentifiers[0] - first * 40] + subidentifiers[1:]
+    return "." + ".".join(map(str, parts))
@@ -36,17 +36,24 @@
 #    => These already bear all information about the contact, the plugin
 #       to call and its parameters.
 
+import collections
+import errno
+import math
 import os
 import pprint
 import re
+import select
 import signal
 import subprocess
 import sys
 import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple  # pylint: disable=unused-import
 
 # suppress "Cannot find module" error from mypy
 import livestatus  # type: ignore
+import cmk.utils.daemon
 import cmk.utils.debug
+import cmk.utils.store as store
 from cmk.utils.notify import notification_message
 from cmk.utils.regex import regex
 import cmk.utils.paths
@@ -83,6 +90,8 @@ notification_spooldir = cmk.utils.paths.var_dir + "/notify/spool"
 notification_bulkdir = cmk.utils.paths.var_dir + "/notify/bulk"
 notification_core_log = cmk.utils.paths.var_dir + "/notify/nagios.log"  # Fallback for history if no CMC running
 notification_log = cmk.utils.paths.log_dir + "/notify.log"
+notification_spooler_metrics = cmk.utils.paths.var_dir + "/notify/spooler_metrics.mk"
+notification_spooler_claimdir = cmk.utils.paths.var_dir + "/notify/spooler"
 
 notification_log_template = \
     u"$CONTACTNAME$ - $NOTIFICATIONTYPE$ - " \
@@ -159,6 +168,9 @@ Available commands:
     replay N                Uses the N'th recent notification from the backlog
                             and sends it again, counting from 0.
     send-bulks              Send out ripe bulk notifications
+    spooler                 Run as notification spooler: Deliver locally spooled
+                            notifications with concurrent worker processes per
+                            plugin until terminated
 """)
 
 
@@ -173,6 +185,7 @@ def do_notify(options, args):
         keepalive.enable()
 
     convert_legacy_configuration()
+    _spool_for_notification_spooler()
 
     try:
         if not os.path.exists(notification_logdir):
@@ -183,12 +196,12 @@ def do_notify(options, args):
         notify_mode = 'notify'
         if args:
             notify_mode = args[0]
-            if notify_mode not in ['stdin', 'spoolfile', 'replay', 'send-bulks']:
+            if notify_mode not in ['stdin', 'spoolfile', 'replay', 'send-bulks', 'spooler']:
                 console.error("ERROR: Invalid call to check_mk --notify.\n\n")
                 notify_usage()
                 sys.exit(1)
 
-            if len(args) != 2 and notify_mode not in ["stdin", "replay", "send-bulks"]:
+            if len(args) != 2 and notify_mode not in ["stdin", "replay", "send-bulks", "spooler"]:
                 console.error("ERROR: need an argument to --notify %s.\n\n" % notify_mode)
                 sys.exit(1)
 
@@ -222,6 +235,9 @@ def do_notify(options, args):
         elif notify_mode == "send-bulks":
             send_ripe_bulks()
 
+        elif notify_mode == "spooler":
+            notification_spooler()
+
         else:
             notify_notify(raw_context_from_env())
 
@@ -256,6 +272,13 @@ def convert_legacy_configuration():
         config.notification_logging = 10
 
 
+def _spool_for_notification_spooler():
+    # Notifications delivered synchronously are spooled for the notification spooler when
+    # it has been enabled. This is the only way to make the raw edition spool notifications.
+    if config.notification_spooler_enabled and config.notification_spooling == "off":
+        config.notification_spooling = "local"
+
+
 # This function processes one raw notification and decides wether it
 # should be spooled or not. In the latter cased a local delivery
 # is being done.
@@ -427,7 +450,18 @@ def notify_rulebased(raw_context, analyse=False):
     num_rule_matches = 0
     rule_info = []
 
-    for rule in config.notification_rules + user_notification_rules():
+    if analyse:
+        # The analysis shows the reasons of all rules which do not match
+        rules = config.notification_rules + user_notification_rules()
+        groups_contacts = rbn_groups_contacts
+    else:
+        compiled_rules = compiled_notification_rules()
+        rules = compiled_rules.candidates(raw_context)
+        groups_contacts = compiled_rules.groups_contacts
+        notify_log_verbose("%d of %d rules are candidates for this notification" %
+                           (len(rules), len(compiled_rules.rules)))
+
+    for rule in rules:
         if "contact" in rule:
             contact_info = "User %s's rule '%s'..." % (rule["contact"], rule["description"])
         else:
@@ -442,7 +476,7 @@ def notify_rulebased(raw_context, analyse=False):
             notify_log(contact_info)
             notify_log(" -> matches!")
             num_rule_matches += 1
-            contacts = rbn_rule_contacts(rule, raw_context)
+            contacts = rbn_rule_contacts(rule, raw_context, groups_contacts)
             contactstxt = ", ".join(contacts)
 
             # Handle old-style and new-style rules
@@ -570,6 +604,145 @@ def notify_rulebased(raw_context, analyse=False):
     return analysis_info
 
 
+class CompiledNotificationRules(object):
+    """The notification rules together with indexes for finding the candidate rules
+
+    The indexes are built from the host, service group, contact group and event
+    type conditions of the rules. They only sort out the rules which can not
+    match a notification for sure. The remaining candidates are then checked
+    with rbn_match_rule() in their original order, as before.
+
+    The contact group memberships looked up for the rules are cached as well.
+    This is valid as long as the configuration has not changed: the keepalive
+    mode restarts itself when the configuration timestamp changes."""
+
+    def __init__(self, rules):
+        # type: (List[Dict[str, Any]]) -> None
+        super(CompiledNotificationRules, self).__init__()
+        self.rules = rules
+        self._group_members = {}  # type: Dict[Tuple[str, ...], Set[str]]
+
+        self._event_types = {"HOST": set(), "SERVICE": set()}  # type: Dict[str, Set[int]]
+        self._hosts = _NotificationRuleIndex()
+        self._excluded_hosts = {}  # type: Dict[str, Set[int]]
+        self._servicegroups = _NotificationRuleIndex()
+        self._contactgroups = _NotificationRuleIndex()
+
+        for nr, rule in enumerate(rules):
+            if rule.get("disabled"):
+                continue
+
+            for what in self._event_types_of(rule):
+                self._event_types[what].add(nr)
+
+            self._hosts.add(nr, rule.get("match_hosts"))
+            for hostname in rule.get("match_exclude_hosts", []):
+                self._excluded_hosts.setdefault(hostname, set()).add(nr)
+
+            # Empty lists of groups are left to rbn_match_rule()
+            self._servicegroups.add(nr, rule.get("match_servicegroups") or None)
+            self._contactgroups.add(nr, rule.get("match_contactgroups") or None)
+
+    def _event_types_of(self, rule):
+        # type: (Dict[str, Any]) -> List[str]
+        """Are host and / or service notifications able to match the rule?"""
+        if "match_host_event" in rule and "match_service_event" not in rule:
+            return ["HOST"]
+
+        if "match_services" in rule or "match_checktype" in rule \
+           or "match_service_event" in rule and "match_host_event" not in rule \
+           or rule.get("match_servicegroups") \
+           or rule.get("match_servicegroups_regex", (None, None))[1]:
+            return ["SERVICE"]
+
+        return ["HOST", "SERVICE"]
+
+    def candidates(self, context):
+        # type: (Dict[str, Any]) -> List[Dict[str, Any]]
+        what = context.get("WHAT")
+        if what not in self._event_types:
+            return [rule for rule in self.rules if not rule.get("disabled")]
+
+        hostname = context.get("HOSTNAME")
+        nrs = self._event_types[what] & self._hosts.candidates([hostname])
+        nrs -= self._excluded_hosts.get(hostname, set())
+
+        if what == "SERVICE":
+            nrs &= self._servicegroups.candidates(
+                _split_group_names(context.get("SERVICEGROUPNAMES")))
+
+        contactgroup_names = context.get(what + "CONTACTGROUPNAMES")
+        if contactgroup_names is not None:
+            # Without information about the contact groups all rules may match
+            nrs &= self._contactgroups.candidates(_split_group_names(contactgroup_names))
+
+        return [self.rules[nr] for nr in sorted(nrs)]
+
+    def groups_contacts(self, groups):
+        # type: (List[str]) -> Set[str]
+        key = tuple(groups)
+        try:
+            return self._group_members[key]
+        except KeyError:
+            pass
+
+        members = rbn_groups_contacts(groups)
+        if members:  # Don't remember failed lookups
+            self._group_members[key] = members
+        return members
+
+
+class _NotificationRuleIndex(object):
+    """Maps the values of a context variable to the numbers of the rules requiring them"""
+
+    def __init__(self):
+        # type: () -> None
+        super(_NotificationRuleIndex, self).__init__()
+        self._unconditional = set()  # type: Set[int]
+        self._by_value = {}  # type: Dict[str, Set[int]]
+
+    def add(self, nr, required_values):
+        # type: (int, Optional[List[str]]) -> None
+        """Add a rule requiring one of the given values. None means no requirement."""
+        if required_values is None:
+            self._unconditional.add(nr)
+            return
+
+        for value in required_values:
+            self._by_value.setdefault(value, set()).add(nr)
+
+    def candidates(self, values):
+        # type: (List[str]) -> Set[int]
+        nrs = set(self._unconditional)
+        for value in values:
+            nrs.update(self._by_value.get(value, ()))
+        return nrs
+
+
+def _split_group_names(group_names):
+    # type: (Optional[str]) -> List[str]
+    return group_names.split(",") if group_names else []
+
+
+_compiled_notification_rules = None  # type: Optional[CompiledNotificationRules]
+_compiled_notification_rules_source = None  # type: Any
+
+
+def compiled_notification_rules():
+    # type: () -> CompiledNotificationRules
+    """Compile the global and user notification rules once for the loaded configuration"""
+    global _compiled_notification_rules, _compiled_notification_rules_source
+    source = (config.notification_rules, config.contacts)
+    if _compiled_notification_rules is None \
+       or _compiled_notification_rules_source is None \
+       or any(a is not b for a, b in zip(source, _compiled_notification_rules_source)):
+        _compiled_notification_rules = CompiledNotificationRules(config.notification_rules +
+                                                                 user_notification_rules())
+        # Keep the references to compare the identity of the configuration objects
+        _compiled_notification_rules_source = source
+    return _compiled_notification_rules
+
+
 def rbn_fallback_contacts():
     fallback_contacts = []
     if config.notification_fallback_email:
@@ -819,7 +992,10 @@ def rbn_match_event(context, state, last_state, event_map, allowed_events):
                                                                           ", ".join(allowed_events))
 
 
-def rbn_rule_contacts(rule, context):
+def rbn_rule_contacts(rule, context, groups_contacts=None):
+    if groups_contacts is None:
+        groups_contacts = rbn_groups_contacts
+
     the_contacts = set([])
     if rule.get("contact_object"):
         the_contacts.update(rbn_object_contact_names(context))
@@ -830,7 +1006,7 @@ def rbn_rule_contacts(rule, context):
     if "contact_users" in rule:
         the_contacts.update(rule["contact_users"])
     if "contact_groups" in rule:
-        the_contacts.update(rbn_groups_contacts(rule["contact_groups"]))
+        the_contacts.update(groups_contacts(rule["contact_groups"]))
     if "contact_emails" in rule:
         the_contacts.update(rbn_emails_contacts(rule["contact_emails"]))
 
@@ -978,7 +1154,7 @@ def rbn_groups_contacts(groups):
 
     try:
         contacts = set([])
-        for contact_list in livestatus.LocalConnection().query_column(query):
+        for contact_list in events.livestatus_connection().query_column(query):
             contacts.update(contact_list)
         return contacts
 
@@ -1461,6 +1637,565 @@ def handle_spoolfile(spoolfile):
         return 2
 
 
+#.
+#   .--Spooler-------------------------------------------------------------.
+#   |                 ____                    _                            |
+#   |                / ___| _ __   ___   ___ | | ___ _ __                  |
+#   |                \___ \| '_ \ / _ \ / _ \| |/ _ \ '__|                 |
+#   |                 ___) | |_) | (_) | (_) | |  __/ |                    |
+#   |                |____/| .__/ \___/ \___/|_|\___|_|                    |
+#   |                      |_|                                             |
+#   +----------------------------------------------------------------------+
+#   |  Implementation of cmk --notify spooler: Delivers locally spooled    |
+#   |  notifications using pools of persistent worker processes.           |
+#   '----------------------------------------------------------------------'
+
+# Spool files of plugin notifications are queued by their plugin name. The following
+# keys are used for the other spool files which can be delivered locally.
+_SPOOLER_PLAIN_EMAIL = "plain email"
+_SPOOLER_RECEIVED = "received"
+
+# Check this often (in seconds) for new spool files and for configuration changes
+_SPOOLER_SCAN_INTERVAL = 1.0
+_SPOOLER_CONFIG_CHECK_INTERVAL = 10
+
+
+def notification_spooler():
+    lock_path = notification_logdir + "/spooler.lock"
+    try:
+        store.aquire_lock(lock_path, blocking=False)
+    except IOError as e:
+        if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+            raise
+        notify_log("Notification spooler is already running. Terminating.")
+        return
+
+    stop = []
+
+    def handle_signal(signum, frame):
+        stop.append(signum)
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    if not os.path.exists(notification_spooler_claimdir):
+        os.makedirs(notification_spooler_claimdir)
+
+    notify_log("Starting notification spooler with PID %d" % os.getpid())
+    spooler = NotificationSpooler(
+        notification_spooldir,
+        notification_spooler_claimdir,
+        handle_spoolfile,
+        default_workers=config.notification_spooler_workers,
+        plugin_settings=config.notification_spooler_plugins,
+        max_queue=config.notification_spooler_max_queue,
+        retry_interval=config.notification_spooler_retry_interval,
+    )
+
+    last_config_timestamp = events.config_timestamp()
+    next_config_check = next_metrics = 0
+    restart = False
+    try:
+        while not stop:
+            now = time.time()
+            if now >= next_config_check:
+                next_config_check = now + _SPOOLER_CONFIG_CHECK_INTERVAL
+                if last_config_timestamp != events.config_timestamp():
+                    notify_log("Configuration has changed. Restarting myself.")
+                    restart = True
+                    break
+
+            if now >= next_metrics:
+                next_metrics = now + config.notification_spooler_metrics_interval
+                spooler.save_metrics(notification_spooler_metrics)
+
+            spooler.scan(now)
+            spooler.dispatch(now)
+            spooler.wait(spooler.next_timeout(time.time()))
+    finally:
+        spooler.shutdown()
+        spooler.save_metrics(notification_spooler_metrics)
+        store.release_lock(lock_path)
+
+    if restart:
+        # Close all unexpected file descriptors before invoking execvp() to
+        # prevent inheritance of them (see events.event_keepalive())
+        cmk.utils.daemon.closefrom(3)
+        os.execvp("cmk", sys.argv)
+
+    notify_log("Notification spooler stopped")
+
+
+_SpoolJob = NamedTuple("_SpoolJob", [
+    ("path", str),
+    ("plugin", str),
+    ("spooled_at", float),
+])
+
+
+class NotificationSpooler(object):
+    """Delivers the spool files of a spool directory with concurrent workers
+
+    Every plugin has its own queue and its own pool of worker processes which
+    call the given handler for a spool file. The queues are bounded: When they
+    are full, no more spool files are read from the spool directory until the
+    workers have catched up. This way a notification storm is buffered on disk
+    instead of in memory. Optionally the number of deliveries of a plugin per
+    second can be limited, e.g. for SMS gateways with a fixed capacity.
+
+    The mknotifyd delivers the spool files of the spool directory too. To prevent
+    both from delivering the same spool file, the spooler claims every spool file
+    by atomically moving it to its own claim directory before queueing it.
+
+    The handler is expected to return the exit codes of handle_spoolfile():
+    0 (delivered) and 2 (permanent failure) remove the spool file, 1 (temporary
+    failure) retries the delivery after retry_interval seconds.
+    """
+
+    def __init__(self,
+                 spooldir,
+                 claimdir,
+                 handler,
+                 default_workers=4,
+                 plugin_settings=None,
+                 max_queue=1000,
+                 retry_interval=60):
+        # type: (str, str, Callable[[str], int], int, Optional[Dict[str, Dict[str, Any]]], int, int) -> None
+        super(NotificationSpooler, self).__init__()
+        self._spooldir = spooldir
+        self._claimdir = claimdir
+        self._handler = handler
+        self._default_workers = default_workers
+        self._plugin_settings = plugin_settings or {}
+        self._max_queue = max_queue
+        self._retry_interval = retry_interval
+
+        self._queues = {}  # type: Dict[str, collections.deque]
+        self._workers = {}  # type: Dict[str, List[_SpoolerWorker]]
+        self._rate_limiters = {}  # type: Dict[str, Optional[_RateLimiter]]
+        self._known = set()  # type: Set[str]
+        self._deferred = {}  # type: Dict[str, float]
+        self._forwarded = set()  # type: Set[str]
+        self.metrics = SpoolerMetrics()
+
+    def num_queued(self):
+        # type: () -> int
+        return sum(len(queue) for queue in self._queues.itervalues())
+
+    def num_running(self):
+        # type: () -> int
+        return len(self._busy_workers())
+
+    def scan(self, now):
+        # type: (float) -> None
+        """Queue the spool files not known yet, oldest first, as long as there is room
+
+        The spool files in the claim directory have been claimed before: They are
+        deferred or have been left behind by a spooler which has not been shut down
+        cleanly."""
+        room = self._max_queue - self.num_queued()
+        if room <= 0:
+            return
+
+        claimed = self._spool_files(self._claimdir)
+        for path in list(self._deferred):
+            if path not in claimed:
+                del self._deferred[path]
+
+        unclaimed = self._spool_files(self._spooldir)
+        self._forwarded &= unclaimed
+
+        candidates = []
+        for path in (claimed - self._known) | (unclaimed - self._forwarded):
+            if self._deferred.get(path, 0) > now:
+                continue
+            try:
+                candidates.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue  # Has just been removed
+
+        candidates.sort()
+        for spooled_at, path in candidates:
+            if room <= 0:
+                break
+
+            plugin = self._plugin_of(path)
+            if plugin is None:
+                self._forwarded.add(path)  # Is handled by the mknotifyd
+                continue
+
+            if path in unclaimed:
+                path = self._claim(path)
+                if path is None:
+                    continue
+
+            self._deferred.pop(path, None)
+            self._known.add(path)
+            self._queues.setdefault(plugin, collections.deque()).append(
+                _SpoolJob(path, plugin, spooled_at))
+            room -= 1
+
+    def _spool_files(self, directory):
+        # type: (str) -> Set[str]
+        try:
+            names = os.listdir(directory)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return set()
+
+        return set(directory + "/" + name
+                   for name in names
+                   if not name.startswith(".") and not name.endswith(".new"))
+
+    def _claim(self, path):
+        # type: (str) -> Optional[str]
+        claimed_path = self._claimdir + "/" + os.path.basename(path)
+        try:
+            os.rename(path, claimed_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None  # Has just been taken by the mknotifyd
+        return claimed_path
+
+    def _plugin_of(self, path):
+        # type: (str) -> Optional[str]
+        try:
+            data = eval(file(path).read())
+        except Exception:
+            # Let the handler deal with the broken file
+            return _SPOOLER_RECEIVED
+
+        if "forward" in data:
+            return None
+        if "plugin" in data:
+            return data["plugin"] or _SPOOLER_PLAIN_EMAIL
+        return _SPOOLER_RECEIVED
+
+    def dispatch(self, now):
+        # type: (float) -> None
+        """Hand over the queued spool files to idle workers"""
+        for plugin, queue in self._queues.iteritems():
+            while queue:
+                worker = self._idle_worker(plugin)
+                if worker is None:
+                    break
+
+                rate_limiter = self._rate_limiter(plugin, now)
+                if rate_limiter and not rate_limiter.acquire(now):
+                    break
+
+                worker.submit(queue.popleft())
+
+    def next_timeout(self, now):
+        # type: (float) -> float
+        """Seconds until there is something to do even when no worker finishes"""
+        timeout = _SPOOLER_SCAN_INTERVAL
+        for plugin, queue in self._queues.iteritems():
+            rate_limiter = self._rate_limiters.get(plugin)
+            if queue and rate_limiter and self._idle_worker(plugin, spawn=False):
+                timeout = min(timeout, rate_limiter.wait_time(now))
+        return timeout
+
+    def wait(self, timeout):
+        # type: (float) -> None
+        """Wait up to timeout seconds for workers to finish and process their results"""
+        busy = {worker.fileno(): worker for worker in self._busy_workers()}
+        if not busy:
+            time.sleep(timeout)
+            return
+
+        try:
+            readable = select.select(busy.keys(), [], [], timeout)[0]
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+
+        for fd in readable:
+            self._finish(busy[fd], time.time())
+
+    def _finish(self, worker, now):
+        # type: (_SpoolerWorker, float) -> None
+        job = worker.job
+        exitcode = worker.read_result()
+        if exitcode is None:
+            notify_log("Worker %d for %s terminated unexpectedly while delivering %s" %
+                       (worker.pid, job.plugin, job.path))
+            self._workers[job.plugin].remove(worker)
+            worker.stop()
+            exitcode = 1
+
+        self.complete(job, exitcode, now)
+
+    def complete(self, job, exitcode, now):
+        # type: (_SpoolJob, int, float) -> None
+        self._known.discard(job.path)
+        self.metrics.record(job.plugin, now - job.spooled_at, exitcode)
+
+        if exitcode == 1:
+            self._deferred[job.path] = now + self._retry_interval
+            return
+
+        try:
+            os.remove(job.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _idle_worker(self, plugin, spawn=True):
+        # type: (str, bool) -> Optional[_SpoolerWorker]
+        workers = self._workers.setdefault(plugin, [])
+        for worker in workers:
+            if worker.job is None:
+                return worker
+
+        if not spawn or len(workers) >= self._num_workers(plugin):
+            return None
+
+        # The new worker must not keep the pipes of the other workers open. Otherwise
+        # they would not notice when the spooler closes them during shutdown.
+        worker = _SpoolerWorker(self._handler, self._worker_fds())
+        workers.append(worker)
+        return worker
+
+    def _num_workers(self, plugin):
+        # type: (str) -> int
+        return max(1, self._plugin_settings.get(plugin, {}).get("workers", self._default_workers))
+
+    def _rate_limiter(self, plugin, now):
+        # type: (str, float) -> Optional[_RateLimiter]
+        try:
+            return self._rate_limiters[plugin]
+        except KeyError:
+            pass
+
+        rate = self._plugin_settings.get(plugin, {}).get("rate")
+        rate_limiter = self._rate_limiters[plugin] = _RateLimiter(rate, now) if rate else None
+        return rate_limiter
+
+    def _all_workers(self):
+        # type: () -> List[_SpoolerWorker]
+        return [worker for workers in self._workers.itervalues() for worker in workers]
+
+    def _busy_workers(self):
+        # type: () -> List[_SpoolerWorker]
+        return [worker for worker in self._all_workers() if worker.job is not None]
+
+    def _worker_fds(self):
+        # type: () -> List[int]
+        return [fd for worker in self._all_workers() for fd in worker.fds()]
+
+    def shutdown(self):
+        # type: () -> None
+        """Wait for the running deliveries and stop all workers
+
+        The claimed spool files which have not been delivered yet are moved back to
+        the spool directory. This way the mknotifyd can deliver them in case the
+        spooler is not started again."""
+        while self.num_running():
+            self.wait(_SPOOLER_SCAN_INTERVAL)
+
+        for worker in self._all_workers():
+            worker.stop()
+        self._workers.clear()
+        self._queues.clear()
+        self._known.clear()
+        self._deferred.clear()
+
+        for path in self._spool_files(self._claimdir):
+            try:
+                os.rename(path, self._spooldir + "/" + os.path.basename(path))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def save_metrics(self, path):
+        # type: (str) -> None
+        running = {}  # type: Dict[str, int]
+        for worker in self._busy_workers():
+            running[worker.job.plugin] = running.get(worker.job.plugin, 0) + 1
+
+        queue_lengths = {plugin: len(queue) for plugin, queue in self._queues.iteritems()}
+        store.save_data_to_file(path, self.metrics.snapshot(queue_lengths, running))
+
+
+class _SpoolerWorker(object):
+    """A forked process calling the handler for the spool files it gets via a pipe
+
+    The process is reused for many spool files. The exit code of the handler is
+    sent back via a second pipe."""
+
+    def __init__(self, handler, inherited_fds):
+        # type: (Callable[[str], int], List[int]) -> None
+        super(_SpoolerWorker, self).__init__()
+        self.job = None  # type: Optional[_SpoolJob]
+
+        job_in, self._job_out = os.pipe()
+        self._result_in, result_out = os.pipe()
+
+        self.pid = os.fork()
+        if self.pid == 0:
+            for fd in inherited_fds + [self._job_out, self._result_in]:
+                os.close(fd)
+            self._serve(handler, job_in, result_out)
+
+        os.close(job_in)
+        os.close(result_out)
+
+    def _serve(self, handler, job_in, result_out):
+        # type: (Callable[[str], int], int, int) -> None
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        exitcode = 0
+        try:
+            # Don't iterate over the file object: Its read ahead buffer would block
+            jobs = os.fdopen(job_in)
+            for line in iter(jobs.readline, ""):
+                try:
+                    result = handler(line.rstrip("\n"))
+                except Exception:
+                    notify_log("ERROR in notification worker:\n%s" % format_exception())
+                    result = 2
+                os.write(result_out, "%d\n" % result)
+        except Exception:
+            exitcode = 1
+        finally:
+            os._exit(exitcode)  # pylint: disable=protected-access
+
+    def fds(self):
+        # type: () -> List[int]
+        return [self._job_out, self._result_in]
+
+    def fileno(self):
+        # type: () -> int
+        return self._result_in
+
+    def submit(self, job):
+        # type: (_SpoolJob) -> None
+        self.job = job
+        os.write(self._job_out, job.path + "\n")
+
+    def read_result(self):
+        # type: () -> Optional[int]
+        """Returns the exit code of the current job or None when the worker has died"""
+        data = os.read(self._result_in, 64)
+        self.job = None
+        if not data:
+            return None
+        return int(data)
+
+    def stop(self):
+        # type: () -> None
+        for fd in self.fds():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+        # Closing the job pipe makes the worker terminate after the current job
+        try:
+            os.waitpid(self.pid, 0)
+        except OSError as e:
+            if e.errno != errno.ECHILD:
+                raise
+
+
+class _RateLimiter(object):
+    """Token bucket allowing rate deliveries per second with bursts of up to one second"""
+
+    def __init__(self, rate, now):
+        # type: (float, float) -> None
+        super(_RateLimiter, self).__init__()
+        self._rate = float(rate)
+        self._capacity = max(1.0, self._rate)
+        self._tokens = self._capacity
+        self._last_refill = now
+
+    def _refill(self, now):
+        # type: (float) -> None
+        self._tokens = min(self._capacity,
+                           self._tokens + max(0.0, now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    def acquire(self, now):
+        # type: (float) -> bool
+        self._refill(now)
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def wait_time(self, now):
+        # type: (float) -> float
+        self._refill(now)
+        return max(0.0, (1 - self._tokens) / self._rate)
+
+
+class SpoolerMetrics(object):
+    """Counts the deliveries per plugin and keeps their latest latencies
+
+    The latency is the time from the creation of the spool file until the
+    end of the delivery."""
+
+    def __init__(self, window=1000):
+        # type: (int) -> None
+        super(SpoolerMetrics, self).__init__()
+        self._window = window
+        self._latencies = {}  # type: Dict[str, collections.deque]
+        self._counters = {}  # type: Dict[str, Dict[str, int]]
+
+    def record(self, plugin, latency, exitcode):
+        # type: (str, float, int) -> None
+        self._latencies.setdefault(plugin, collections.deque(maxlen=self._window)).append(latency)
+        counters = self._counters.setdefault(plugin, {"delivered": 0, "deferred": 0, "failed": 0})
+        if exitcode == 0:
+            counters["delivered"] += 1
+        elif exitcode == 1:
+            counters["deferred"] += 1
+        else:
+            counters["failed"] += 1
+
+    def latency_percentiles(self, plugin, percentiles=(50, 90, 99)):
+        # type: (str, Tuple[int, ...]) -> Dict[str, float]
+        latencies = sorted(self._latencies.get(plugin, []))
+        if not latencies:
+            return {}
+
+        # Nearest-rank method
+        return {
+            "p%d" % percentile: latencies[max(
+                0,
+                int(math.ceil(len(latencies) * percentile / 100.0)) - 1)]
+            for percentile in percentiles
+        }
+
+    def snapshot(self, queue_lengths, running):
+        # type: (Dict[str, int], Dict[str, int]) -> Dict[str, Any]
+        plugins = {}
+        for plugin in set(self._counters) | set(queue_lengths) | set(running):
+            plugin_metrics = {
+                "queue_length": queue_lengths.get(plugin, 0),
+                "running": running.get(plugin, 0),
+                "latency": self.latency_percentiles(plugin),
+            }
+            plugin_metrics.update(
+                self._counters.get(plugin, {
+                    "delivered": 0,
+                    "deferred": 0,
+                    "failed": 0
+                }))
+            plugins[plugin] = plugin_metrics
+
+        return {
+            "time": time.time(),
+            "pid": os.getpid(),
+            "plugins": plugins,
+        }
+
+
 #.
 #   .--Bulk-Notifications--------------------------------------------------.
 #   |                         ____        _ _                              |
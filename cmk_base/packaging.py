@@ -451,6 +451,7 @@ def remove_package(package):
                     raise Exception("Cannot remove %s: %s\n" % (path, e))
 
     os.remove(pac_dir + package["name"])
+    _invalidate_gui_plugins(package)
 
 
 def create_package(pkg_info):
@@ -607,9 +608,27 @@ def install_package(file_name=None, file_object=None):
 
     # Last but not least install package file
     write_package_info(package)
+    _invalidate_gui_plugins(package, old_package)
     return package
 
 
+def _invalidate_gui_plugins(*packages):
+    """Make the GUI load its plugins again in case one of the packages contains some
+
+    The GUI keeps the loaded plugins until its configuration generation changes."""
+    if not any(package and package["files"].get("web") for package in packages):
+        return
+
+    # Only load the GUI when it is really needed
+    import cmk.gui.config as gui_config
+
+    if not os.path.exists(gui_config.config_dir):
+        return  # The GUI has not been used yet. Nothing is loaded.
+
+    logger.verbose("Making the GUI load its plugins again")
+    gui_config.bump_config_generation()
+
+
 # Checks whether or not the minimum required Check_MK version is older than the
 # current Check_MK version. Raises an exception if not. When the Check_MK version
 # can not be parsed or is a daily build, the check is simply passing without error.
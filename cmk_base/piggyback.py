@@ -25,8 +25,11 @@
 # Boston, MA 02110-1301 USA.
 
 import errno
+import marshal
 import os
-import tempfile
+import struct
+import time
+from typing import Dict, List, Optional, Tuple  # pylint: disable=unused-import
 
 import cmk.utils.paths
 import cmk.utils.translations
@@ -36,6 +39,24 @@ from cmk.utils.exceptions import MKGeneralException
 import cmk_base.utils
 import cmk_base.console as console
 
+# Each source host stores the piggyback data of all its piggybacked hosts in a single
+# file below piggyback_sources. The file starts with a manifest which maps the names of
+# the piggybacked hosts to the offset and length of their data in the rest of the file.
+# The mtime of the file is the time the source host has last sent piggyback data.
+#
+# The file is replaced atomically, so a reader can rely on the manifest and the data
+# of the file it opened. Files not starting with the magic contain no data, e.g. the
+# empty files created by locking.
+_PIGGYBACK_FILE_MAGIC = "CMKPIGGYBACK1\n"
+_MANIFEST_HEADER = struct.Struct(">I")
+
+# (offset, length) of the data of each piggybacked host, relative to the end of the manifest
+PiggybackManifest = Dict[str, Tuple[int, int]]
+
+# The manifests which have already been read by this process. Processes checking many
+# piggybacked hosts only need to read the manifest again after the source has updated it.
+_manifest_cache = {}  # type: Dict[str, Tuple[Tuple[int, int, float], PiggybackManifest, int]]
+
 
 def get_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
     """Returns the usable piggyback data for the given host
@@ -48,14 +69,8 @@ def get_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
         return []
 
     piggyback_data = []
-    for source_host, piggyback_file_path in get_piggyback_files(piggyback_max_cachefile_age,
-                                                                hostname):
-        try:
-            raw_data = file(piggyback_file_path).read()
-        except IOError as e:
-            console.verbose("Cannot read piggyback raw data from host %s: %s\n" % (source_host, e))
-            continue
-
+    for source_host, raw_data in _get_piggyback_entries(
+            piggyback_max_cachefile_age, hostname, read_data=True):
         console.verbose("Using piggyback raw data from host %s.\n" % source_host)
         piggyback_data.append((source_host, raw_data))
 
@@ -63,78 +78,119 @@ def get_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
 
 
 def has_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
-    return get_piggyback_files(piggyback_max_cachefile_age, hostname) != []
+    return _get_piggyback_entries(piggyback_max_cachefile_age, hostname, read_data=False) != []
+
 
+def _get_piggyback_entries(piggyback_max_cachefile_age, hostname, read_data):
+    # type: (int, str, bool) -> List[Tuple[str, Optional[str]]]
+    """Gather the piggyback data of all source hosts sending data for the given host
 
-def get_piggyback_files(piggyback_max_cachefile_age, hostname):
-    """Gather a list of piggyback files to read for further processing.
+    Only the manifest of each source file is needed to find the data of the host.
+    The data itself is only read when read_data is set.
 
     Please note that there may be multiple parallel calls executing the
-    get_piggyback_files(), store_piggyback_raw_data() or cleanup_piggyback_files()
+    _get_piggyback_entries(), store_piggyback_raw_data() or cleanup_piggyback_files()
     functions. Therefor all these functions needs to deal with suddenly vanishing or
-    updated files/directories.
+    updated files.
     """
-    files = []
-    host_piggyback_dir = cmk.utils.paths.piggyback_dir / hostname
-
-    # cleanup_piggyback_files() may remove stale piggyback files of one source
-    # host and also the directory "hostname" when the last piggyback file for the
-    # current host was removed. This may cause the os.listdir() to fail. We treat
-    # this as regular case: No piggyback files for the current host.
-    try:
-        source_host_names = [e.name for e in host_piggyback_dir.iterdir()]
-    except OSError as e:
-        if e.errno == errno.ENOENT:
-            return files
-        else:
+    entries = []  # type: List[Tuple[str, Optional[str]]]
+    for source_host in _get_source_host_names():
+        source_file_path = _piggyback_source_status_path(source_host)
+        try:
+            source_file = open(source_file_path, "rb")
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                continue  # File might've been deleted. That's ok.
             raise
 
-    for source_host in source_host_names:
-        if source_host.startswith("."):
-            continue
+        with source_file:
+            stat = os.fstat(source_file.fileno())
 
-        piggyback_file_path = host_piggyback_dir / source_host
+            # Skip piggyback data that is outdated at all
+            file_age = time.time() - stat.st_mtime
+            if file_age > piggyback_max_cachefile_age:
+                console.verbose(
+                    "Piggyback data of source %s is outdated (%d seconds too old). "
+                    "Skip processing.\n" % (source_host, file_age - piggyback_max_cachefile_age))
+                continue
 
-        try:
-            file_age = cmk_base.utils.cachefile_age(str(piggyback_file_path))
-        except MKGeneralException:
-            continue  # File might've been deleted. That's ok.
+            manifest, data_offset = _read_manifest(source_file_path, source_file, stat)
+            try:
+                offset, length = manifest[hostname]
+            except KeyError:
+                continue
 
-        # Skip piggyback files that are outdated at all
-        if file_age > piggyback_max_cachefile_age:
-            console.verbose("Piggyback file %s is outdated (%d seconds too old). Skip processing.\n"
-                            % (piggyback_file_path, file_age - piggyback_max_cachefile_age))
-            continue
+            raw_data = None
+            if read_data:
+                source_file.seek(data_offset + offset)
+                raw_data = source_file.read(length)
+                if len(raw_data) != length:
+                    console.verbose("Cannot read piggyback raw data from host %s: "
+                                    "File is truncated\n" % source_host)
+                    continue
 
-        status_file_path = _piggyback_source_status_path(source_host)
-        if not os.path.exists(status_file_path):
-            console.verbose(
-                "Piggyback file %s is outdated (Source not sending piggyback). Skip processing.\n" %
-                piggyback_file_path)
-            continue
+        entries.append((source_host, raw_data))
 
-        if _is_piggyback_file_outdated(status_file_path, str(piggyback_file_path)):
-            console.verbose(
-                "Piggyback file %s is outdated (Not updated by source). Skip processing.\n" %
-                piggyback_file_path)
-            continue
+    return entries
 
-        files.append((source_host, str(piggyback_file_path)))
 
-    return files
+def get_piggybacked_host_names():
+    # type: () -> List[str]
+    """Returns the names of all hosts piggyback data is stored for, regardless of its age"""
+    host_names = set()
+    for source_host in _get_source_host_names():
+        source_file_path = _piggyback_source_status_path(source_host)
+        try:
+            source_file = open(source_file_path, "rb")
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                continue  # File might've been deleted. That's ok.
+            raise
 
+        with source_file:
+            manifest = _read_manifest(source_file_path, source_file,
+                                      os.fstat(source_file.fileno()))[0]
+        host_names.update(manifest)
+    return sorted(host_names)
 
-def _is_piggyback_file_outdated(status_file_path, piggyback_file_path):
+
+def _get_source_host_names():
+    # type: () -> List[str]
     try:
-        # On POSIX platforms Python reads atime and mtime at nanosecond resolution
-        # but only writes them at microsecond resolution.
-        # (We're using os.utime() in _store_status_file_of())
-        return os.stat(status_file_path)[8] > os.stat(piggyback_file_path)[8]
+        return [
+            e for e in os.listdir(str(cmk.utils.paths.piggyback_source_dir))
+            if not e.startswith(".")
+        ]
     except OSError as e:
         if e.errno == errno.ENOENT:
-            return True
-        else:
-            raise
+            return []
+        raise
+
+
+def _read_manifest(source_file_path, source_file, stat):
+    # type: (str, file, os.stat_result) -> Tuple[PiggybackManifest, int]
+    """Returns the manifest of the opened source file and the offset of its data"""
+    file_id = (stat.st_ino, stat.st_size, stat.st_mtime)
+    try:
+        cached_file_id, manifest, data_offset = _manifest_cache[source_file_path]
+        if cached_file_id == file_id:
+            return manifest, data_offset
+    except KeyError:
+        pass
+
+    manifest, data_offset = {}, 0
+    header = source_file.read(len(_PIGGYBACK_FILE_MAGIC) + _MANIFEST_HEADER.size)
+    if header.startswith(_PIGGYBACK_FILE_MAGIC) and len(header) == len(_PIGGYBACK_FILE_MAGIC) \
+            + _MANIFEST_HEADER.size:
+        manifest_length = _MANIFEST_HEADER.unpack_from(header, len(_PIGGYBACK_FILE_MAGIC))[0]
+        try:
+            manifest = marshal.loads(source_file.read(manifest_length))
+            data_offset = len(header) + manifest_length
+        except (EOFError, ValueError, TypeError):
+            manifest = {}
+
+    _manifest_cache[source_file_path] = (file_id, manifest, data_offset)
+    return manifest, data_offset
 
 
 def _piggyback_source_status_path(source_host):
@@ -154,82 +210,63 @@ def _remove_piggyback_file(piggyback_file_path):
 
 def remove_source_status_file(source_host):
     # type: (str) -> bool
-    """Remove the source_status_file of this piggyback host which will
-    mark the piggyback data from this source as outdated."""
+    """Remove the source file of this piggyback host which removes all
+    the piggyback data from this source."""
     source_status_path = _piggyback_source_status_path(source_host)
     return _remove_piggyback_file(source_status_path)
 
 
 def store_piggyback_raw_data(source_host, piggybacked_raw_data):
-    piggyback_file_paths = []
+    # Remove the source file when no piggyback data was sent this turn. This removes the
+    # data of the previous turns.
+    if not piggybacked_raw_data:
+        remove_source_status_file(source_host)
+        return
+
+    manifest = {}  # type: PiggybackManifest
+    chunks = []
+    offset = 0
     for piggybacked_host, lines in piggybacked_raw_data.items():
-        piggyback_file_path = str(cmk.utils.paths.piggyback_dir / piggybacked_host / source_host)
         console.verbose("Storing piggyback data for: %s\n" % piggybacked_host)
         content = "\n".join(lines) + "\n"
-        store.save_file(piggyback_file_path, content)
-        piggyback_file_paths.append(piggyback_file_path)
-
-    # Store the last contact with this piggyback source to be able to filter outdated data later
-    # We use the mtime of this file later for comparison.
-    # Only do this for hosts that sent piggyback data this turn, cleanup the status file when no
-    # piggyback data was sent this turn.
-    if piggybacked_raw_data:
-        status_file_path = _piggyback_source_status_path(source_host)
-        _store_status_file_of(status_file_path, piggyback_file_paths)
-    else:
-        remove_source_status_file(source_host)
-
-
-def _store_status_file_of(status_file_path, piggyback_file_paths):
-    with tempfile.NamedTemporaryFile(
-            "w",
-            dir=os.path.dirname(status_file_path),
-            prefix=".%s.new" % os.path.basename(status_file_path),
-            delete=False) as tmp:
-        tmp_path = tmp.name
-        os.chmod(tmp_path, 0660)
-        tmp.write("")
-
-        tmp_stats = os.stat(tmp_path)
-        status_file_times = (tmp_stats.st_atime, tmp_stats.st_mtime)
-        for piggyback_file_path in piggyback_file_paths:
-            try:
-                os.utime(piggyback_file_path, status_file_times)
-            except OSError as e:
-                if e.errno == errno.ENOENT:
-                    continue
-                else:
-                    raise
-    os.rename(tmp_path, status_file_path)
+        if isinstance(content, unicode):
+            content = content.encode("utf-8")
+        manifest[piggybacked_host] = (offset, len(content))
+        chunks.append(content)
+        offset += len(content)
+
+    encoded_manifest = marshal.dumps(manifest)
+    source_file_path = _piggyback_source_status_path(source_host)
+    try:
+        store.save_file(
+            source_file_path, _PIGGYBACK_FILE_MAGIC + _MANIFEST_HEADER.pack(len(encoded_manifest)) +
+            encoded_manifest + "".join(chunks))
+    finally:
+        store.release_lock(source_file_path)
 
 
 def cleanup_piggyback_files(piggyback_max_cachefile_age):
     """This is a housekeeping job to clean up different old files from the
     piggyback directories.
 
-    # Cleanup piggyback data of hosts that are not sending piggyback data anymore
-    # a) hosts that have a file below piggyback_sources:
-    #    -> check age of the file and remove it once it reached piggyback_max_cachefile_age
-    # b) hosts that don't have a file below piggyback_sources (old version or removed by step "a)"):
-    #    -> remove all piggyback_raw_data files created by this source
+    # Cleanup piggyback data of hosts that are not sending piggyback data anymore:
+    # Remove the files below piggyback_sources once they reached piggyback_max_cachefile_age
 
-    # Cleanup empty backed host directories below "piggyback"
+    # Cleanup the files of the previous layout having one file per piggybacked and
+    # source host below "piggyback"
 
     Please note that there may be multiple parallel calls executing the
-    get_piggyback_files(), store_piggyback_raw_data() or cleanup_piggyback_files()
+    _get_piggyback_entries(), store_piggyback_raw_data() or cleanup_piggyback_files()
     functions. Therefor all these functions needs to deal with suddenly vanishing or
     updated files/directories.
     """
     _cleanup_old_source_status_files(piggyback_max_cachefile_age)
-    _cleanup_old_piggybacked_files(piggyback_max_cachefile_age)
+    _cleanup_legacy_piggybacked_files()
 
 
 def _cleanup_old_source_status_files(piggyback_max_cachefile_age):
     base_dir = str(cmk.utils.paths.piggyback_source_dir)
-    for entry in os.listdir(base_dir):
-        if entry[0] == ".":
-            continue
-
+    for entry in _get_source_host_names():
         piggyback_file_path = os.path.join(base_dir, entry)
 
         try:
@@ -243,67 +280,43 @@ def _cleanup_old_source_status_files(piggyback_max_cachefile_age):
             _remove_piggyback_file(piggyback_file_path)
 
 
-def _cleanup_old_piggybacked_files(piggyback_max_cachefile_age):
-    """Remove piggyback data that is not needed anymore
-
-    The monitoring (get_piggyback_files()) is already skipping these files,
-    but we need some cleanup mechanism.
+def _cleanup_legacy_piggybacked_files():
+    """Remove the piggyback files written by previous versions
 
-    - Remove all piggyback files created by sources without status file
-    - Remove all piggyback files that are older that the current status file of the source host
-    - Cleanup empty backed host directories below "piggyback"
+    These files are not used anymore. Remove them together with the then empty
+    backed host directories below "piggyback".
     """
-    keep_sources = set(os.listdir(str(cmk.utils.paths.piggyback_source_dir)))
+    base_dir = str(cmk.utils.paths.piggyback_dir)
+    try:
+        backed_host_names = os.listdir(base_dir)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
 
-    base_dir = os.path.join(cmk.utils.paths.tmp_dir, "piggyback")
-    for backed_host_name in os.listdir(base_dir):
+    for backed_host_name in backed_host_names:
         if backed_host_name[0] == ".":
             continue
 
-        # Cleanup piggyback files from sources that we have no status file for
         backed_host_dir_path = os.path.join(base_dir, backed_host_name)
-        for source_host_name in os.listdir(backed_host_dir_path):
-            if source_host_name[0] == ".":
+        try:
+            source_host_names = os.listdir(backed_host_dir_path)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
                 continue
+            raise
 
+        for source_host_name in source_host_names:
             piggyback_file_path = os.path.join(backed_host_dir_path, source_host_name)
-
-            delete_reason = _shall_cleanup_piggyback_file(
-                piggyback_max_cachefile_age, piggyback_file_path, source_host_name, keep_sources)
-            if delete_reason:
-                console.verbose("Removing outdated piggyback file (%s) %s\n" %
-                                (delete_reason, piggyback_file_path))
-                _remove_piggyback_file(piggyback_file_path)
+            console.verbose(
+                "Removing piggyback file of previous version %s\n" % piggyback_file_path)
+            _remove_piggyback_file(piggyback_file_path)
 
         # Remove empty backed host directory
         try:
             os.rmdir(backed_host_dir_path)
         except OSError as e:
-            if e.errno == errno.ENOTEMPTY:
+            if e.errno in [errno.ENOTEMPTY, errno.ENOENT]:
                 pass
             else:
                 raise
-
-
-def _shall_cleanup_piggyback_file(piggyback_max_cachefile_age, piggyback_file_path,
-                                  source_host_name, keep_sources):
-    if source_host_name not in keep_sources:
-        return "Source not sending piggyback data"
-
-    try:
-        file_age = cmk_base.utils.cachefile_age(piggyback_file_path)
-    except MKGeneralException:
-        return None  # File might've been deleted. That's ok.
-
-    # Skip piggyback files that are outdated at all
-    if file_age > piggyback_max_cachefile_age:
-        return "%d seconds too old" % (file_age - piggyback_max_cachefile_age)
-
-    status_file_path = _piggyback_source_status_path(source_host_name)
-    if not os.path.exists(status_file_path):
-        return "Source not sending piggyback"
-
-    if _is_piggyback_file_outdated(status_file_path, piggyback_file_path):
-        return "Not updated by source"
-
-    return None
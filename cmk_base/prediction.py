@@ -25,16 +25,21 @@
 # Boston, MA 02110-1301 USA.
 """Code for predictive monitoring / anomaly detection"""
 
+import errno
 import json
 import math
 import os
 import time
+import warnings
+from typing import Dict, List, Optional, Tuple  # pylint: disable=unused-import
 
 import cmk.utils.debug
 import cmk.utils
 import cmk.utils.log
 import cmk.utils.defines as defines
+import cmk.utils.paths
 import cmk.utils.prediction
+from cmk.utils.prediction import numpy_module, TimeSeries  # pylint: disable=unused-import
 
 logger = cmk.utils.log.get_logger(__name__)
 
@@ -127,11 +132,22 @@ def time_slices(timestamp, horizon, period_info, timegroup):
     return slices
 
 
-def retrieve_grouped_data_from_rrd(rrd_column, time_windows):
-    "Collect all time slices and up-sample them to same resolution"
+# Slices ending at least this number of seconds ago are complete and are kept
+# for the next computation of the prediction
+SLICE_CACHE_MIN_AGE = 3600
+
+TimeWindow = Tuple[int, int]
+
+
+def retrieve_grouped_data_from_rrd(rrd_column, time_windows, slices_file=None):
+    """Collect all time slices and up-sample them to same resolution
+
+    All slices not already in the slices file are fetched with a single query. The
+    slices which are complete are stored in the slices file for the next computation."""
     from_time = time_windows[0][0]
 
-    slices = [(rrd_column(start, end), from_time - start) for start, end in time_windows]
+    time_series = _get_time_series(rrd_column, time_windows, slices_file)
+    slices = [(ts, from_time - start) for ts, (start, _end) in zip(time_series, time_windows)]
 
     # The resolutions of the different time ranges differ. We upsample
     # to the best resolution. We assume that the youngest slice has the
@@ -140,8 +156,60 @@ def retrieve_grouped_data_from_rrd(rrd_column, time_windows):
     return twindow, [ts.bfill_upsample(twindow, shift) for ts, shift in slices]
 
 
+def _get_time_series(rrd_column, time_windows, slices_file):
+    cached = _load_cached_slices(slices_file, rrd_column.cf) if slices_file else {}
+
+    missing = [time_window for time_window in time_windows if time_window not in cached]
+    fetched = dict(zip(missing, rrd_column.time_series_of(missing))) if missing else {}
+
+    if slices_file and fetched:
+        complete_until = time.time() - SLICE_CACHE_MIN_AGE
+        cached.update((time_window, ts)
+                      for time_window, ts in fetched.iteritems()
+                      if time_window[1] <= complete_until)
+        _save_cached_slices(slices_file, rrd_column.cf, {
+            time_window: cached[time_window]
+            for time_window in time_windows
+            if time_window in cached
+        })
+
+    return [cached.get(time_window) or fetched[time_window] for time_window in time_windows]
+
+
+def _load_cached_slices(slices_file, cf):
+    # type: (str, str) -> Dict[TimeWindow, TimeSeries]
+    try:
+        with open(slices_file) as f:
+            cache = json.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return {}
+    except ValueError:
+        logger.verbose("Invalid slices file %s", slices_file)
+        return {}
+
+    if cache.get("cf") != cf:
+        return {}
+
+    return {(start, end): TimeSeries(data) for start, end, data in cache["slices"]}
+
+
+def _save_cached_slices(slices_file, cf, slices):
+    # type: (str, str, Dict[TimeWindow, TimeSeries]) -> None
+    with open(slices_file, "w") as f:
+        json.dump({
+            u"cf": cf,
+            u"slices": [[start, end, list(ts.twindow) + list(ts.values)]
+                        for (start, end), ts in sorted(slices.iteritems())],
+        }, f)
+
+
 def data_stats(slices):
     "Statistically summarize all the upsampled RRD data"
+    numpy = numpy_module()
+    if numpy is not None:
+        return _data_stats_vectorized(numpy, slices)
 
     descriptors = []
 
@@ -161,8 +229,35 @@ def data_stats(slices):
     return descriptors
 
 
-def calculate_data_for_prediction(time_windows, rrd_datacolumn):
-    twindow, slices = retrieve_grouped_data_from_rrd(rrd_datacolumn, time_windows)
+def _data_stats_vectorized(numpy, slices):
+    num_points = min(len(s) for s in slices) if slices else 0
+    # None values become NaN and are left out of the statistics
+    data = numpy.array([s[:num_points] for s in slices], dtype=float).reshape(-1, num_points)
+    valid = ~numpy.isnan(data)
+    samples = valid.sum(axis=0)
+    values = numpy.where(valid, data, 0.0)
+
+    with warnings.catch_warnings(), numpy.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        average = values.sum(axis=0) / samples
+        minimum = numpy.nanmin(data, axis=0)
+        maximum = numpy.nanmax(data, axis=0)
+        # In the case of a single data-point an unbiased standard deviation is
+        # undefined. In this case we take the magnitude of the measured value
+        # itself as a measure of the dispersion.
+        deviation = numpy.where(
+            samples == 1, numpy.abs(average),
+            numpy.sqrt(numpy.abs((values**2).sum(axis=0) - average**2 * samples) / (samples - 1)))
+
+    return [
+        [avg, low, high, dev] if count else [None, None, None, None]
+        for count, avg, low, high, dev in zip(samples.tolist(), average.tolist(), minimum.tolist(),
+                                              maximum.tolist(), deviation.tolist())
+    ]
+
+
+def calculate_data_for_prediction(time_windows, rrd_datacolumn, slices_file=None):
+    twindow, slices = retrieve_grouped_data_from_rrd(rrd_datacolumn, time_windows, slices_file)
 
     descriptors = data_stats(slices)
 
@@ -203,8 +298,11 @@ def is_prediction_up2date(pred_file, timegroup, params):
     if last_info is None:
         return False
 
+    return _is_info_up2date(last_info, timegroup, params, time.time())
+
+
+def _is_info_up2date(last_info, timegroup, params, now):
     period_info = prediction_periods[params["period"]]
-    now = time.time()
     if last_info["time"] + period_info["valid"] * period_info["slice"] < now:
         logger.verbose("Prediction of %s outdated", timegroup)
         return False
@@ -217,6 +315,71 @@ def is_prediction_up2date(pred_file, timegroup, params):
     return True
 
 
+def compute_prediction(hostname, service_description, dsname, params, cf, pred_file, timegroup,
+                       timestamp):
+    """Compute the prediction of the time group for the slice containing the timestamp
+
+    Returns the info and the data of the prediction."""
+    period_info = prediction_periods[params["period"]]
+    time_windows = time_slices(timestamp, int(params["horizon"] * 86400), period_info, timegroup)
+
+    rrd_datacolumn = cmk.utils.prediction.rrd_datacolum(hostname, service_description, dsname, cf)
+
+    data_for_pred = calculate_data_for_prediction(time_windows, rrd_datacolumn,
+                                                  pred_file + ".slices")
+
+    info = {
+        u"time": timestamp,
+        u"range": time_windows[0],
+        u"cf": cf,
+        u"dsname": dsname,
+        u"slice": period_info["slice"],
+        u"params": params,
+        u"hostname": hostname,
+        u"service_description": service_description,
+    }
+    return info, data_for_pred
+
+
+def _load_precomputed_prediction(pred_file, timegroup, params, now):
+    """Use the prediction computed in advance by precompute_predictions()
+
+    It is moved in place once the slice it has been computed for has begun."""
+    precomputed = _read_json(pred_file + ".next")
+    if precomputed is None:
+        return None
+
+    info, data_for_pred = precomputed["info"], precomputed["data"]
+    if not info["range"][0] <= now < info["range"][1] \
+            or not _is_info_up2date(info, timegroup, params, now):
+        return None
+
+    logger.verbose("Using precomputed prediction data for time group %s", timegroup)
+    save_predictions(pred_file, info, data_for_pred)
+    _remove_file(pred_file + ".next")
+    return data_for_pred
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    except ValueError:
+        logger.verbose("Invalid prediction file %s", path)
+    return None
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
 # cf: consilidation function (MAX, MIN, AVERAGE)
 # levels_factor: this multiplies all absolute levels. Usage for example
 # in the cpu.loads check the multiplies the levels by the number of CPU
@@ -228,36 +391,128 @@ def get_levels(hostname, service_description, dsname, params, cf, levels_factor=
 
     timegroup, rel_time = period_info["groupby"](now)
 
-    pred_dir = cmk.utils.prediction.predictions_dir(
-        hostname, service_description, dsname, create=True)
+    data_for_pred = _get_up2date_prediction(hostname, service_description, dsname, params,
+                                            timegroup, now)
+    if data_for_pred is None:
+        pred_dir = cmk.utils.prediction.predictions_dir(
+            hostname, service_description, dsname, create=True)
+        pred_file = os.path.join(pred_dir, timegroup)
+        cmk.utils.prediction.clean_prediction_files(pred_file)
+
+        data_for_pred = _load_precomputed_prediction(pred_file, timegroup, params, now)
+        if data_for_pred is None:
+            logger.verbose("Calculating prediction data for time group %s", timegroup)
+            cmk.utils.prediction.clean_prediction_files(pred_file, force=True)
+            info, data_for_pred = compute_prediction(hostname, service_description, dsname, params,
+                                                     cf, pred_file, timegroup, now)
+            save_predictions(pred_file, info, data_for_pred)
 
-    pred_file = os.path.join(pred_dir, timegroup)
-    cmk.utils.prediction.clean_prediction_files(pred_file)
+    # Find reference value in data_for_pred
+    index = int(rel_time / data_for_pred["step"])
+    reference = dict(zip(data_for_pred["columns"], data_for_pred["points"][index]))
+    return cmk.utils.prediction.estimate_levels(reference, params, levels_factor)
 
-    if is_prediction_up2date(pred_file, timegroup, params):
-        data_for_pred = cmk.utils.prediction.retrieve_data_for_prediction(pred_file, timegroup)
-    else:
-        logger.verbose("Calculating prediction data for time group %s", timegroup)
-        cmk.utils.prediction.clean_prediction_files(pred_file, force=True)
 
-        time_windows = time_slices(now, int(params["horizon"] * 86400), period_info, timegroup)
+def _get_up2date_prediction(hostname, service_description, dsname, params, timegroup, now):
+    """The fast path of get_levels(): Only read the prediction files
 
-        rrd_datacolumn = cmk.utils.prediction.rrd_datacolum(hostname, service_description, dsname,
-                                                            cf)
+    This is the regular case when the predictions are computed in the background
+    by precompute_predictions()."""
+    pred_dir = cmk.utils.prediction.predictions_dir(hostname, service_description, dsname)
+    if pred_dir is None:
+        return None
 
-        data_for_pred = calculate_data_for_prediction(time_windows, rrd_datacolumn)
+    pred_file = os.path.join(pred_dir, timegroup)
+    info = _read_json(pred_file + ".info")
+    if info is None or not _is_info_up2date(info, timegroup, params, now):
+        return None
 
-        info = {
-            u"time": now,
-            u"range": time_windows[0],
-            u"cf": cf,
-            u"dsname": dsname,
-            u"slice": period_info["slice"],
-            u"params": params,
-        }
-        save_predictions(pred_file, info, data_for_pred)
+    return _read_json(pred_file)
 
-    # Find reference value in data_for_pred
-    index = int(rel_time / data_for_pred["step"])
-    reference = dict(zip(data_for_pred["columns"], data_for_pred["points"][index]))
-    return cmk.utils.prediction.estimate_levels(reference, params, levels_factor)
+
+def precompute_predictions(lead_time, max_rate):
+    """Compute the predictions before their validity ends
+
+    Each prediction is computed for the first slice of its time group starting when
+    the current prediction is outdated. It is stored next to the current prediction
+    and used by get_levels() once that slice has begun. This way the checks don't
+    need to compute the predictions themselves, which would happen for all services
+    at the beginning of a time group.
+
+    The predictions which were computed before by get_levels() tell which predictions
+    are needed and with which parameters. At most max_rate predictions are computed
+    per second. Returns the number of computed predictions."""
+    now = time.time()
+    due = []
+    for pred_file in _prediction_files():
+        info = _read_json(pred_file + ".info")
+        if info is None or "hostname" not in info:
+            continue  # Computed by previous versions. The check updates the file.
+
+        timegroup = os.path.basename(pred_file)
+        period_info = prediction_periods[info["params"]["period"]]
+        valid_until = info["time"] + period_info["valid"] * period_info["slice"]
+        target_time = _next_slice_start(timegroup, period_info, valid_until)
+        if target_time is None or target_time > now + lead_time:
+            continue
+
+        if target_time > now and _is_precomputed(pred_file, info, target_time):
+            continue
+
+        due.append((target_time, pred_file, timegroup, info))
+
+    num_computed = 0
+    for target_time, pred_file, timegroup, info in sorted(due):
+        started = time.time()
+        try:
+            _precompute_prediction(pred_file, timegroup, info, max(target_time, started))
+            num_computed += 1
+        except Exception as e:
+            if cmk.utils.debug.enabled():
+                raise
+            logger.error("Cannot compute prediction %s: %s", pred_file, e)
+
+        time.sleep(max(0.0, 1.0 / max_rate - (time.time() - started)))
+
+    return num_computed
+
+
+def _precompute_prediction(pred_file, timegroup, info, timestamp):
+    logger.verbose("Computing prediction %s for %s", pred_file, time.ctime(timestamp))
+    new_info, data_for_pred = compute_prediction(
+        info["hostname"].encode("utf-8"), info["service_description"].encode("utf-8"),
+        info["dsname"].encode("utf-8"), info["params"], info["cf"].encode("utf-8"), pred_file,
+        timegroup, timestamp)
+
+    # The current prediction is outdated anyway
+    if new_info["range"][0] <= time.time():
+        save_predictions(pred_file, new_info, data_for_pred)
+        return
+
+    with open(pred_file + ".next", "w") as f:
+        json.dump({u"info": new_info, u"data": data_for_pred}, f)
+
+
+def _is_precomputed(pred_file, info, target_time):
+    precomputed = _read_json(pred_file + ".next")
+    return precomputed is not None and \
+        precomputed["info"]["range"][0] == target_time and \
+        precomputed["info"]["params"] == info["params"]
+
+
+def _next_slice_start(timegroup, period_info, timestamp):
+    """Returns the start of the slice of the time group containing or following the timestamp"""
+    for index in range(period_info["valid"] * 3):
+        slice_timegroup, from_time = get_prediction_timegroup(
+            timestamp + index * period_info["slice"], period_info)[:2]
+        if slice_timegroup == timegroup:
+            return int(from_time)
+    return None
+
+
+def _prediction_files():
+    base_dir = os.path.join(cmk.utils.paths.var_dir, "prediction")
+    for dirpath, _dirnames, filenames in os.walk(base_dir):
+        for filename in filenames:
+            if filename.endswith(".info") and not filename.startswith("."):
+                yield os.path.join(dirpath, filename[:-5])
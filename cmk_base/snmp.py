@@ -26,7 +26,7 @@
 
 import os
 import subprocess
-from typing import Tuple, Optional, Any, Dict, List  # pylint: disable=unused-import
+from typing import Tuple, Optional, Any, Dict, List, Set  # pylint: disable=unused-import
 
 import cmk.utils.debug
 import cmk.utils.tty as tty
@@ -37,6 +37,7 @@ import cmk_base.utils
 import cmk_base.config as config
 import cmk_base.console as console
 import cmk_base.classic_snmp as classic_snmp
+import cmk_base.native_snmp as native_snmp
 import cmk_base.ip_lookup as ip_lookup
 import cmk_base.agent_simulator
 from cmk_base.exceptions import MKSNMPError
@@ -56,6 +57,10 @@ _g_single_oid_ipaddress = None
 _g_single_oid_cache = None
 # TODO: Move to StoredWalkSNMPBackend?
 _g_walk_cache = {}  # type: Dict[str, List[str]]
+# The walks done during the current fetch of one host, see initialize_subtree_cache()
+_g_subtree_cache = None  # type: Optional[SNMPSubtreeCache]
+# Walks of hosts fetched in advance by prefetch_walks()
+_g_prefetched_walks = {}  # type: Dict[Tuple[str, str], Dict[str, snmp_utils.SNMPRowInfo]]
 
 #.
 #   .--caching-------------------------------------------------------------.
@@ -116,11 +121,156 @@ def _load_single_oid_cache(snmp_config):
     return store.load_data_from_file(cache_path, {})
 
 
+class SNMPSubtreeCache(object):
+    """Keeps the rows of the walks of one host in memory
+
+    Walks of already walked OIDs are answered from the rows of the previous walk. The
+    table entries walked by the sections to fetch are known in advance. A walk of a
+    column of such a table entry performs the walk of the table entry instead. This way
+    the rows of the table walk can be used for both.
+
+    A walk is never answered from the walk of any other subtree containing the walked
+    OID. This way the cache never widens what is fetched from the device.
+    """
+
+    def __init__(self, snmp_config, planned_table_oids):
+        # type: (snmp_utils.SNMPHostConfig, Set[str]) -> None
+        super(SNMPSubtreeCache, self).__init__()
+        self.hostname = snmp_config.hostname
+        self.ipaddress = snmp_config.ipaddress
+        self._planned_table_oids = planned_table_oids
+        self._walks = {
+        }  # type: Dict[Tuple[Tuple[Optional[str], ...], str], snmp_utils.SNMPRowInfo]
+        self.hits = 0
+
+    def get(self, contexts, oid):
+        # type: (Tuple[Optional[str], ...], str) -> Optional[snmp_utils.SNMPRowInfo]
+        for walk_oid in (oid, self.oid_to_walk(oid)):
+            rows = self._walks.get((contexts, walk_oid))
+            if rows is not None:
+                self.hits += 1
+                return _rows_of_subtree(rows, walk_oid, oid)
+        return None
+
+    def oid_to_walk(self, oid):
+        # type: (str) -> str
+        """Returns the planned walk of the table entry the given OID is a column of or the OID"""
+        entry_oid = oid.rsplit(".", 1)[0]
+        if entry_oid in self._planned_table_oids:
+            return entry_oid
+        return oid
+
+    def add(self, contexts, oid, rows):
+        # type: (Tuple[Optional[str], ...], str, snmp_utils.SNMPRowInfo) -> None
+        self._walks[(contexts, oid)] = rows
+
+
+def initialize_subtree_cache(snmp_config, oid_infos):
+    # type: (snmp_utils.SNMPHostConfig, List[Any]) -> None
+    """Use a common cache for the walks of the given OID infos
+
+    The cache is used until cleanup_subtree_cache() is called. It is not used for
+    hosts having OID range limits, because these are specific to a check plugin.
+    """
+    global _g_subtree_cache
+    if snmp_config.oid_range_limits:
+        _g_subtree_cache = None
+        return
+
+    _g_subtree_cache = SNMPSubtreeCache(snmp_config, _planned_walk_oids(oid_infos)[1])
+
+    prefetched_walks = _g_prefetched_walks.pop((snmp_config.hostname, snmp_config.ipaddress), {})
+    for walk_oid, rows in prefetched_walks.iteritems():
+        _g_subtree_cache.add((None,), walk_oid, rows)
+
+
+def _planned_walk_oids(oid_infos):
+    # type: (List[Any]) -> Tuple[Set[str], Set[str]]
+    """Returns the OIDs of the columns and of the table entries walked for the OID infos"""
+    column_oids = set()  # type: Set[str]
+    table_oids = set()  # type: Set[str]
+    for oid_info in oid_infos:
+        for entry in (oid_info if isinstance(oid_info, list) else [oid_info]):
+            entry_column_oids, entry_table_oids = _walk_oids_of(entry)
+            column_oids.update(entry_column_oids)
+            table_oids.update(entry_table_oids)
+    return column_oids, table_oids
+
+
+def prefetch_walks(host_oid_infos):
+    # type: (List[Tuple[snmp_utils.SNMPHostConfig, List[Any]]]) -> None
+    """Walk the OIDs of the given OID infos of many hosts concurrently
+
+    The rows are used by the subtree cache of the hosts once they are processed. This is
+    only done for hosts using the native SNMP backend. The walks of the other hosts and
+    of the hosts which could not be walked are done when the hosts are processed. The
+    walks of the previous call which have not been used are dropped.
+    """
+    cleanup_prefetched_walks()
+
+    jobs = []
+    for snmp_config, oid_infos in host_oid_infos:
+        if snmp_config.oid_range_limits or not isinstance(
+                SNMPBackendFactory.factory(snmp_config, enforce_stored_walks=_enforce_stored_walks),
+                native_snmp.NativeSNMPBackend):
+            continue
+
+        column_oids, table_oids = _planned_walk_oids(oid_infos)
+        walk_oids = sorted(column_oids | table_oids)
+        if walk_oids:
+            jobs.append((snmp_config, walk_oids))
+
+    if not jobs:
+        return
+
+    console.vverbose("Walking %d hosts concurrently\n" % len(jobs))
+    results = native_snmp.walk_hosts(jobs, config.snmp_concurrent_hosts)
+    for (snmp_config, walk_oids), walks in zip(jobs, results):
+        if isinstance(walks, MKSNMPError):
+            console.vverbose("Failed to walk %s in advance: %s\n" % (snmp_config.hostname, walks))
+            continue
+
+        _g_prefetched_walks[(snmp_config.hostname, snmp_config.ipaddress)] = dict(
+            (walk_oid, _remove_duplicate_rows(rows, set())) for walk_oid, rows in walks.items())
+
+
+def cleanup_prefetched_walks():
+    # type: () -> None
+    _g_prefetched_walks.clear()
+
+
+def cleanup_subtree_cache():
+    # type: () -> None
+    global _g_subtree_cache
+    if _g_subtree_cache is not None and _g_subtree_cache.hits:
+        console.vverbose("Answered %d walks from the walks of other OIDs\n" % _g_subtree_cache.hits)
+    _g_subtree_cache = None
+
+
+def _get_subtree_cache(snmp_config):
+    # type: (snmp_utils.SNMPHostConfig) -> Optional[SNMPSubtreeCache]
+    if _g_subtree_cache is None or _g_subtree_cache.hostname != snmp_config.hostname \
+       or _g_subtree_cache.ipaddress != snmp_config.ipaddress:
+        return None
+    return _g_subtree_cache
+
+
+def _rows_of_subtree(rows, walk_oid, oid):
+    # type: (snmp_utils.SNMPRowInfo, str, str) -> snmp_utils.SNMPRowInfo
+    if walk_oid == oid:
+        return list(rows)
+
+    prefix = oid + "."
+    return [row for row in rows if row[0] == oid or row[0].startswith(prefix)]
+
+
 def cleanup_host_caches():
     # type: () -> None
     global _g_walk_cache
     _g_walk_cache = {}
     _clear_other_hosts_oid_cache(None)
+    cleanup_subtree_cache()
+    native_snmp.cleanup_sessions()
     if inline_snmp:
         inline_snmp.cleanup_inline_snmp_globals()
 
@@ -160,6 +310,16 @@ def create_snmp_host_config(hostname):
     return host_config.snmp_config(address)
 
 
+# The columns which are not fetched from the device but computed from the OIDs of the rows
+_INDEX_COLUMNS = [
+    snmp_utils.OID_END,
+    snmp_utils.OID_STRING,
+    snmp_utils.OID_BIN,
+    snmp_utils.OID_END_BIN,
+    snmp_utils.OID_END_OCTET_STRING,
+]
+
+
 # TODO: OID_END_OCTET_STRING is not used at all. Drop it.
 def get_snmp_table(snmp_config, check_plugin_name, oid_info, use_snmpwalk_cache):
     # oid_info is either ( oid, columns ) or
@@ -186,6 +346,9 @@ def get_snmp_table(snmp_config, check_plugin_name, oid_info, use_snmpwalk_cache)
         max_len = 0
         max_len_col = -1
 
+        walked_columns = _walk_snmp_columns(snmp_config, check_plugin_name, oid, suboid,
+                                            targetcolumns)
+
         for colno, column in enumerate(targetcolumns):
             fetchoid, value_encoding = _compute_fetch_oid(oid, suboid, column)
 
@@ -196,10 +359,7 @@ def get_snmp_table(snmp_config, check_plugin_name, oid_info, use_snmpwalk_cache)
             # in later. If the column is OID_STRING or OID_BIN we do something
             # similar: we fill in the complete OID of the entry, either as
             # string or as binary UTF-8 encoded number string
-            if column in [
-                    snmp_utils.OID_END, snmp_utils.OID_STRING, snmp_utils.OID_BIN,
-                    snmp_utils.OID_END_BIN, snmp_utils.OID_END_OCTET_STRING
-            ]:
+            if column in _INDEX_COLUMNS:
                 if index_column >= 0 and index_column != colno:
                     raise MKGeneralException(
                         "Invalid SNMP OID specification in implementation of check. "
@@ -210,8 +370,11 @@ def get_snmp_table(snmp_config, check_plugin_name, oid_info, use_snmpwalk_cache)
                 index_format = column
                 continue
 
-            rowinfo = _get_snmpwalk(snmp_config, check_plugin_name, oid, fetchoid, column,
-                                    use_snmpwalk_cache)
+            if fetchoid in walked_columns and not _is_snmpwalk_cachable(column):
+                rowinfo = list(walked_columns[fetchoid])
+            else:
+                rowinfo = _get_snmpwalk(snmp_config, check_plugin_name, oid, fetchoid, column,
+                                        use_snmpwalk_cache)
 
             columns.append((fetchoid, rowinfo, value_encoding))
             number_of_rows = len(rowinfo)
@@ -323,6 +486,9 @@ class SNMPBackendFactory(object):
         if snmp_config.is_inline_snmp_host:
             return inline_snmp.InlineSNMPBackend()
 
+        if config.use_native_snmp and not snmp_utils.is_snmpv3_host(snmp_config):
+            return native_snmp.NativeSNMPBackend()
+
         return classic_snmp.ClassicSNMPBackend()
 
 
@@ -543,42 +709,196 @@ def _get_snmpwalk(snmp_config, check_plugin_name, oid, fetchoid, column, use_snm
     return rowinfo
 
 
+def _walk_snmp_columns(snmp_config, check_plugin_name, oid, suboid, targetcolumns):
+    """Walk the columns of the table which do not use the walk cache at once
+
+    The table entry is walked once instead of walking each column when at least
+    snmp_table_walk_min_columns columns of the entry are needed. Then the single walk of
+    the entry needs far less requests than the walks of the columns, even if it also
+    fetches some columns which are not needed. Otherwise the columns are walked
+    concurrently, as far as the SNMP backend supports this. The columns using the walk
+    cache are walked on their own.
+
+    Returns a dictionary from the fetch OIDs of the columns to their rows.
+    """
+    fetchoids = _walked_column_oids(oid, suboid, targetcolumns)
+    if not fetchoids:
+        return {}
+
+    table_oid = _table_walk_oid(fetchoids)
+    if table_oid is None:
+        return _perform_snmpwalks(snmp_config, check_plugin_name, oid, fetchoids)
+
+    console.vverbose("Walking %s once for %d columns\n" % (table_oid, len(fetchoids)))
+    rows = _perform_snmpwalk(snmp_config, check_plugin_name, oid, table_oid)
+    return _split_table_walk(table_oid, rows, fetchoids)
+
+
+def _walked_column_oids(oid, suboid, targetcolumns):
+    # type: (str, Any, List[Any]) -> List[str]
+    """Returns the fetch OIDs of the columns which are fetched by walks not using the walk cache"""
+    fetchoids = []  # type: List[str]
+    for column in targetcolumns:
+        if column in _INDEX_COLUMNS or _is_snmpwalk_cachable(column):
+            continue
+        fetchoid = _compute_fetch_oid(oid, suboid, column)[0]
+        if fetchoid not in fetchoids:
+            fetchoids.append(fetchoid)
+    return fetchoids
+
+
+def _table_walk_oid(fetchoids):
+    # type: (List[str]) -> Optional[str]
+    """Returns the OID of the table entry to walk instead of the given columns
+
+    This is the common parent OID of all the columns. Returns None in case the columns
+    should be walked one by one: When too few columns are needed or when they are not in
+    the same table entry. The latter happens for checks fetching the columns of several
+    tables relative to a base OID like .1.3.6.1.2.1. Walking the common prefix of these
+    columns would fetch far more than the tables.
+    """
+    min_columns = config.snmp_table_walk_min_columns
+    if min_columns is None or len(fetchoids) < max(2, min_columns):
+        return None
+
+    entry_oids = set(fetchoid.rsplit(".", 1)[0] for fetchoid in fetchoids)
+    if len(entry_oids) != 1:
+        return None
+    return entry_oids.pop()
+
+
+def _walk_oids_of(oid_info):
+    # type: (Any) -> Tuple[Set[str], Set[str]]
+    """Returns the OIDs of the columns and of the table entries get_snmp_table() walks for
+    the given OID info, except the walk cache"""
+    if len(oid_info) == 2:
+        oid, targetcolumns = oid_info
+        suboids = [None]
+    else:
+        oid, suboids, targetcolumns = oid_info
+
+    column_oids = set()  # type: Set[str]
+    table_oids = set()  # type: Set[str]
+    for suboid in suboids:
+        fetchoids = _walked_column_oids(oid, suboid, targetcolumns)
+        table_oid = _table_walk_oid(fetchoids)
+        if table_oid is None:
+            column_oids.update(fetchoids)
+        else:
+            table_oids.add(table_oid)
+    return column_oids, table_oids
+
+
+def _split_table_walk(table_oid, rows, fetchoids):
+    """Distribute the rows of the walk of a table to the columns with the given fetch OIDs
+
+    A row belongs to each column having a fetch OID the OID of the row starts with,
+    just like the row would have been received when walking this column.
+    """
+    columns = dict((fetchoid, []) for fetchoid in fetchoids)
+    max_depth = max(fetchoid[len(table_oid):].count(".") for fetchoid in fetchoids)
+
+    for row in rows:
+        row_oid = row[0]
+        prefix_end = len(table_oid)
+        for _unused_depth in range(max_depth + 1):
+            column = columns.get(row_oid[:prefix_end])
+            if column is not None:
+                column.append(row)
+
+            if prefix_end >= len(row_oid):
+                break
+
+            prefix_end = row_oid.find(".", prefix_end + 1)
+            if prefix_end == -1:
+                prefix_end = len(row_oid)
+
+    return columns
+
+
 def _perform_snmpwalk(snmp_config, check_plugin_name, base_oid, fetchoid):
-    added_oids = set([])
-    rowinfo = []
+    return _perform_snmpwalks(snmp_config, check_plugin_name, base_oid, [fetchoid])[fetchoid]
+
+
+def _perform_snmpwalks(snmp_config, check_plugin_name, base_oid, fetchoids):
+    # type: (snmp_utils.SNMPHostConfig, str, str, List[str]) -> Dict[str, snmp_utils.SNMPRowInfo]
     if snmp_utils.is_snmpv3_host(snmp_config):
         snmp_contexts = _snmpv3_contexts_of(snmp_config, check_plugin_name)
     else:
         snmp_contexts = [None]
 
-    for context_name in snmp_contexts:
-        snmp_backend = SNMPBackendFactory().factory(
-            snmp_config, enforce_stored_walks=_enforce_stored_walks)
+    subtree_cache = _get_subtree_cache(snmp_config)
+    if subtree_cache is None:
+        return _perform_snmpwalks_in_contexts(snmp_config, check_plugin_name, base_oid, fetchoids,
+                                              snmp_contexts)
+
+    contexts = tuple(snmp_contexts)
+    rowinfos = {}  # type: Dict[str, snmp_utils.SNMPRowInfo]
+    walk_oid_of = {}  # type: Dict[str, str]
+    walk_oids = []  # type: List[str]
+    for fetchoid in fetchoids:
+        rowinfo = subtree_cache.get(contexts, fetchoid)
+        if rowinfo is not None:
+            console.vverbose("  Using rows of %s from previous walk\n" % fetchoid)
+            rowinfos[fetchoid] = rowinfo
+            continue
+
+        walk_oid = walk_oid_of[fetchoid] = subtree_cache.oid_to_walk(fetchoid)
+        if walk_oid not in walk_oids:
+            walk_oids.append(walk_oid)
+
+    if walk_oids:
+        walked = _perform_snmpwalks_in_contexts(snmp_config, check_plugin_name, base_oid, walk_oids,
+                                                snmp_contexts)
+        for walk_oid, rowinfo in walked.items():
+            subtree_cache.add(contexts, walk_oid, rowinfo)
+
+        for fetchoid, walk_oid in walk_oid_of.items():
+            rowinfos[fetchoid] = _rows_of_subtree(walked[walk_oid], walk_oid, fetchoid)
+
+    return rowinfos
+
 
-        rows = snmp_backend.walk(
+def _perform_snmpwalks_in_contexts(snmp_config, check_plugin_name, base_oid, fetchoids,
+                                   snmp_contexts):
+    snmp_backend = SNMPBackendFactory().factory(
+        snmp_config, enforce_stored_walks=_enforce_stored_walks)
+
+    rowinfos = dict((fetchoid, []) for fetchoid in fetchoids)
+    added_oids = dict((fetchoid, set([])) for fetchoid in fetchoids)
+    for context_name in snmp_contexts:
+        walks = snmp_backend.walk_many(
             snmp_config,
-            fetchoid,
+            fetchoids,
             check_plugin_name=check_plugin_name,
             table_base_oid=base_oid,
             context_name=context_name)
 
-        # I've seen a broken device (Mikrotik Router), that broke after an
-        # update to RouterOS v6.22. It would return 9 time the same OID when
-        # .1.3.6.1.2.1.1.1.0 was being walked. We try to detect these situations
-        # by removing any duplicate OID information
-        if len(rows) > 1 and rows[0][0] == rows[1][0]:
-            console.vverbose(
-                "Detected broken SNMP agent. Ignoring duplicate OID %s.\n" % rows[0][0])
-            rows = rows[:1]
-
-        for row_oid, val in rows:
-            if row_oid in added_oids:
-                console.vverbose("Duplicate OID found: %s (%s)\n" % (row_oid, val))
-            else:
-                rowinfo.append((row_oid, val))
-                added_oids.add(row_oid)
+        for fetchoid in fetchoids:
+            rowinfos[fetchoid] += _remove_duplicate_rows(walks[fetchoid], added_oids[fetchoid])
 
-    return rowinfo
+    return rowinfos
+
+
+def _remove_duplicate_rows(rows, added_oids):
+    # type: (snmp_utils.SNMPRowInfo, Set[str]) -> snmp_utils.SNMPRowInfo
+    """Returns the rows having OIDs which are not in added_oids and adds their OIDs"""
+    # I've seen a broken device (Mikrotik Router), that broke after an
+    # update to RouterOS v6.22. It would return 9 time the same OID when
+    # .1.3.6.1.2.1.1.1.0 was being walked. We try to detect these situations
+    # by removing any duplicate OID information
+    if len(rows) > 1 and rows[0][0] == rows[1][0]:
+        console.vverbose("Detected broken SNMP agent. Ignoring duplicate OID %s.\n" % rows[0][0])
+        rows = rows[:1]
+
+    new_rows = []
+    for row_oid, val in rows:
+        if row_oid in added_oids:
+            console.vverbose("Duplicate OID found: %s (%s)\n" % (row_oid, val))
+        else:
+            new_rows.append((row_oid, val))
+            added_oids.add(row_oid)
+    return new_rows
 
 
 def _compute_fetch_oid(oid, suboid, column):
@@ -26,7 +26,7 @@
 
 import abc
 import functools
-from typing import List, NamedTuple, Union, Tuple, Optional  # pylint: disable=unused-import
+from typing import Dict, List, NamedTuple, Union, Tuple, Optional  # pylint: disable=unused-import
 
 OID_END = 0  # Suffix-part of OID that was not specified
 OID_STRING = -1  # Complete OID as string ".1.3.6.1.4.1.343...."
@@ -126,6 +126,21 @@ class ABCSNMPBackend(object):
         # type: (SNMPHostConfig, str, Optional[str], Optional[str], Optional[str]) -> SNMPRowInfo
         return []
 
+    def walk_many(self,
+                  snmp_config,
+                  oids,
+                  check_plugin_name=None,
+                  table_base_oid=None,
+                  context_name=None):
+        # type: (SNMPHostConfig, List[str], Optional[str], Optional[str], Optional[str]) -> Dict[str, SNMPRowInfo]
+        """Walk several OIDs of the given host
+
+        Backends which are able to perform the walks concurrently override this."""
+        return {
+            oid: self.walk(snmp_config, oid, check_plugin_name, table_base_oid, context_name)
+            for oid in oids
+        }
+
 
 class MutexScanRegistry(object):
     """Register scan functions that are checked before a fallback is used
@@ -0,0 +1,106 @@
+#!/usr/bin/env python2
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark of fetching the outputs of many Check_MK agents
+
+Starts a local fake agent which answers every connection after a delay, like an
+agent executing its plugins, with an output of the given size. Then fetches the
+output of the given number of hosts one after another with blocking sockets, like
+cmk did before, and concurrently with the agent fetcher of the TCP data source.
+Pass the number of hosts, the delay of the agent in milliseconds and the size of
+the output in kB as arguments, otherwise 200 hosts, 50 ms and 100 kB are used.
+
+Execute it as site user from the root of the git repository:
+
+    PYTHONPATH=. python doc/benchmark/agent_fetcher.py [NUM_HOSTS [DELAY [SIZE]]]
+"""
+
+import SocketServer
+import socket
+import sys
+import threading
+import time
+
+from cmk_base.data_sources.tcp import fetch_agent_outputs
+
+
+def _start_fake_agent(delay, output):
+    class FakeAgentHandler(SocketServer.BaseRequestHandler):
+        def handle(self):
+            time.sleep(delay)
+            self.request.sendall(output)
+
+    SocketServer.ThreadingTCPServer.allow_reuse_address = True
+    SocketServer.ThreadingTCPServer.request_queue_size = 1024
+    server = SocketServer.ThreadingTCPServer(("127.0.0.1", 0), FakeAgentHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server.server_address
+
+
+def _fetch_blocking(address):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.settimeout(5.0)
+        s.connect(address)
+        s.settimeout(None)
+        output = []
+        while True:
+            data = s.recv(4096, socket.MSG_WAITALL)
+            if not data:
+                break
+            output.append(data)
+    finally:
+        s.close()
+    return "".join(output)
+
+
+def main(args):
+    num_hosts = int(args[0]) if args else 200
+    delay = (int(args[1]) if len(args) > 1 else 50) / 1000.0
+    size = (int(args[2]) if len(args) > 2 else 100) * 1024
+
+    output = "<<<check_mk>>>\nVersion: 1.6.0\n" + "x" * size
+    address = _start_fake_agent(delay, output)
+    print("%d hosts, %.0f ms agent runtime, %d kB output" % (num_hosts, delay * 1000, size / 1024))
+
+    start = time.time()
+    for _unused in range(num_hosts):
+        assert _fetch_blocking(address) == output
+    print("One after another:      %6.2f s" % (time.time() - start))
+
+    for concurrent_hosts in [10, 50, 200]:
+        start = time.time()
+        results = fetch_agent_outputs([(socket.AF_INET, address, 5.0)] * num_hosts,
+                                      concurrent_hosts)
+        duration = time.time() - start
+        assert results == [output] * num_hosts
+        print("%3d hosts concurrently: %6.2f s" % (concurrent_hosts, duration))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,185 @@
+#!/usr/bin/env python2
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark of the agent output parser of the CheckMKAgentDataSource
+
+Compares the parser working on the raw agent output with the previous approach
+of splitting the whole output into lines and processing them one by one. The
+parser decodes the sections on demand, so it is measured with and without
+decoding all sections. Pass
+recorded agent outputs, e.g. the files in tmp/check_mk/cache of a site, as
+arguments. Without arguments a synthetic agent output with large ps and
+logwatch sections and piggybacked data of some hundred hosts is used.
+
+Execute it as site user from the root of the git repository:
+
+    PYTHONPATH=. python doc/benchmark/agent_output_parser.py [AGENT_OUTPUT_FILE...]
+"""
+
+import sys
+import time
+
+import cmk_base.config as config
+from cmk_base.data_sources.abstract import CheckMKAgentDataSource
+
+
+class BenchmarkDataSource(CheckMKAgentDataSource):
+    _execute = describe = id = None
+
+    def __init__(self):  # pylint: disable=super-init-not-called
+        self._hostname = "benchmark"
+
+
+def _legacy_parse_info(source, lines):
+    sections = {}
+    piggybacked_raw_data = {}
+    host = None
+    section_content = []
+    section_options = {}
+    separator = None
+    encoding = None
+    for line in lines:
+        line = line.rstrip("\r")
+        stripped_line = line.strip()
+        if stripped_line[:4] == '<<<<' and stripped_line[-4:] == '>>>>':
+            host = stripped_line[4:-4]
+            if not host:
+                host = None
+            else:
+                host = config.translate_piggyback_host(source._hostname, host)
+                if host == source._hostname:
+                    host = None
+                if host:
+                    host = host.replace(" ", "_")
+
+        elif host:
+            piggybacked_raw_data.setdefault(host, []).append(line)
+
+        elif stripped_line[:3] == '<<<' and stripped_line[-3:] == '>>>':
+            section_header = stripped_line[3:-3]
+            headerparts = section_header.split(":")
+            section_name = headerparts[0]
+            section_options = {}
+            for o in headerparts[1:]:
+                opt_parts = o.split("(")
+                opt_name = opt_parts[0]
+                if len(opt_parts) > 1:
+                    opt_args = opt_parts[1][:-1]
+                else:
+                    opt_args = None
+                section_options[opt_name] = opt_args
+
+            section_content = sections.get(section_name, None)
+            if section_content is None:
+                section_content = []
+                sections[section_name] = section_content
+            try:
+                separator = chr(int(section_options["sep"]))
+            except:
+                separator = None
+            encoding = section_options.get("encoding")
+
+        elif stripped_line != '':
+            if "nostrip" not in section_options:
+                line = stripped_line
+
+            if encoding:
+                line = config.decode_incoming_string(line, encoding)
+            else:
+                line = config.decode_incoming_string(line)
+
+            section_content.append(line.split(separator))
+
+    return sections, piggybacked_raw_data
+
+
+def _synthetic_agent_output():
+    output = ["<<<check_mk>>>", "Version: 1.7.0i1", "AgentOS: linux"]
+
+    output.append("<<<ps>>>")
+    for pid in range(100000):
+        output.append("(root,%d,%d,00:00:%02d/05:%02d:00,%d) /usr/sbin/daemon --option=%d" %
+                      (pid * 7, pid * 3, pid % 60, pid % 60, pid, pid))
+
+    output.append("<<<logwatch>>>")
+    for index in range(50):
+        output.append("[[[/var/log/file%d.log]]]" % index)
+        for line in range(4000):
+            output.append("W Jan %2d 12:00:%02d host daemon[%d]: Message number %d with text" %
+                          (line % 28 + 1, line % 60, line, line))
+
+    output.append("<<<df:sep(59)>>>")
+    for index in range(1000):
+        output.append("/dev/sd%d;ext4;1000000;500000;500000;50%%;/mnt/disk%d" % (index, index))
+
+    for host in range(500):
+        output.append("<<<<vm%03d>>>>" % host)
+        output.append("<<<esx_vsphere_vm>>>")
+        for line in range(200):
+            output.append("config.hardware.device.%d value %d" % (line, line * host))
+    output.append("<<<<>>>>")
+
+    return "\n".join(output) + "\n"
+
+
+def _measure(func, repeat=3):
+    durations = []
+    for _unused in range(repeat):
+        start = time.time()
+        func()
+        durations.append(time.time() - start)
+    return min(durations)
+
+
+def main(args):
+    # Don't depend on a loaded configuration of the site
+    config.translate_piggyback_host = lambda sourcehost, backedhost: backedhost
+
+    if args:
+        agent_outputs = [(path, open(path).read()) for path in args]
+    else:
+        agent_outputs = [("synthetic", _synthetic_agent_output())]
+
+    source = BenchmarkDataSource()
+    for name, raw_data in agent_outputs:
+        legacy = _measure(lambda: _legacy_parse_info(source, raw_data.split("\n")))
+        streaming = _measure(lambda: source._parse_info(raw_data))
+        decoded = _measure(lambda: source._parse_info(raw_data).sections)
+
+        host_sections = source._parse_info(raw_data)
+        legacy_sections, legacy_piggybacked_raw_data = _legacy_parse_info(
+            source, raw_data.split("\n"))
+        assert host_sections.sections == legacy_sections
+        assert {h: "\n".join(c) for h, c in host_sections.piggybacked_raw_data.items()} \
+            == {h: "\n".join(l) for h, l in legacy_piggybacked_raw_data.items()}
+
+        print("%s (%.1f MB): legacy %.3f s, streaming %.3f s (%.1fx), "
+              "streaming and decoding all sections %.3f s (%.1fx)" %
+              (name, len(raw_data) / 1024.0 / 1024.0, legacy, streaming, legacy / streaming,
+               decoded, legacy / decoded))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
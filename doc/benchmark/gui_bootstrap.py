@@ -0,0 +1,85 @@
+#!/usr/bin/env python2
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark of setting up the GUI for a request
+
+Loads the GUI configuration of the site and the plugins for the given number of
+requests, once reading all configuration files for each request, like it was done
+before, and once reusing the configuration loaded by the previous request as long
+as the configuration generation does not change. Pass the number of requests as
+argument, otherwise 100 requests are made.
+
+Execute it as site user from the root of the git repository:
+
+    PYTHONPATH=. python doc/benchmark/gui_bootstrap.py [NUM_REQUESTS]
+"""
+
+import sys
+import time
+
+from werkzeug.test import create_environ
+
+import cmk.gui.config as config
+import cmk.gui.htmllib as htmllib
+import cmk.gui.modules as modules
+from cmk.gui.globals import current_app, html
+from cmk.gui.http import Request, Response
+
+
+class _FakeApplication(object):
+    def __init__(self):
+        self.g = {}
+
+
+def _request_setup(num_requests, use_cache):
+    start = time.time()
+    for _ in range(num_requests):
+        current_app.set_current(_FakeApplication())
+        if not use_cache:
+            config._config_cache.pop("key", None)
+        config.initialize()
+        modules.load_all_plugins()
+    return time.time() - start
+
+
+def main(args):
+    num_requests = int(args[0]) if args else 100
+
+    environ = dict(create_environ(), REQUEST_URI='')
+    current_app.set_current(_FakeApplication())
+    html.set_current(htmllib.html(Request(environ), Response(is_secure=False)))
+    modules.init_modules()
+    config.initialize()
+    modules.load_all_plugins()
+
+    print("%d requests" % num_requests)
+    duration = _request_setup(num_requests, use_cache=False)
+    print("Loading the configuration:  %6.2f ms per request" % (duration * 1000 / num_requests))
+    duration = _request_setup(num_requests, use_cache=True)
+    print("Reusing the configuration:  %6.2f ms per request" % (duration * 1000 / num_requests))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python2
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark of the item state stores
+
+Measures loading and saving the item states of a host with many services using
+the repr and the binary store: once when every check asks for and updates its
+values and once when only a tenth of the values are updated. The number of bytes
+written per save is also reported. Pass the number of item states as argument,
+otherwise 50000 item states are used.
+
+Execute it as site user from the root of the git repository:
+
+    PYTHONPATH=. python doc/benchmark/item_state_store.py [NUM_ITEM_STATES]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cmk.utils.paths
+import cmk_base.config as config
+import cmk_base.item_state as item_state
+
+
+def _item_states(num_item_states, value):
+    return {("if", u"%d" % index, "in"): (1562000000.0 + value, index * 1000 + value)
+            for index in range(num_item_states)}
+
+
+def _check_cycle(item_states, fraction):
+    """Load the item states, ask for all of them and update the given fraction"""
+    cached_item_states = item_state.CachedItemStates()
+    cached_item_states.load("benchmark")
+    step = int(1 / fraction)
+    for index, key in enumerate(sorted(item_states)):
+        cached_item_states.set_item_state_prefix(key[:-1])
+        cached_item_states.get_item_state(key[-1])
+        if index % step == 0:
+            cached_item_states.set_item_state(key[-1], item_states[key])
+    cached_item_states.save("benchmark")
+
+
+def _measure(func, repeat=5):
+    durations = []
+    for _unused in range(repeat):
+        start = time.time()
+        func()
+        durations.append(time.time() - start)
+    return min(durations)
+
+
+def main(args):
+    num_item_states = int(args[0]) if args else 50000
+    cmk.utils.paths.counters_dir = tempfile.mkdtemp()
+    path = os.path.join(cmk.utils.paths.counters_dir, "benchmark")
+    try:
+        for store in ["repr", "binary"]:
+            config.item_state_store = store
+            if os.path.exists(path):
+                os.unlink(path)
+
+            _check_cycle(_item_states(num_item_states, 0), 1.0)
+            for fraction in [1.0, 0.1]:
+                item_states = _item_states(num_item_states, 1)
+                size_before = os.path.getsize(path)
+                duration = _measure(lambda: _check_cycle(item_states, fraction), repeat=1)
+                written = os.path.getsize(path) if store == "repr" else \
+                    os.path.getsize(path) - size_before
+                duration = min(duration, _measure(lambda: _check_cycle(item_states, fraction)))
+                print("%-6s %6d item states, %3d%% updated: %.3f s per check cycle, "
+                      "%.1f kB written" % (store, num_item_states, fraction * 100, duration,
+                                           written / 1024.0))
+    finally:
+        shutil.rmtree(cmk.utils.paths.counters_dir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,125 @@
+#!/usr/bin/env python2
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark of querying many Livestatus sites in parallel
+
+Starts the given number of local fake Livestatus sites. Site N answers every
+query after N * 10 ms with a service table of the given number of rows. Then
+sends the query to all sites and receives the answers one site after another,
+like it was done before, and with the select based receive of the multisite
+connection. Pass the number of sites and rows as arguments, otherwise 40 sites
+with 2000 rows each are used.
+
+Execute it as site user from the root of the git repository:
+
+    PYTHONPATH=.:livestatus/api/python python doc/benchmark/livestatus_multisite.py [NUM_SITES [NUM_ROWS]]
+"""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import livestatus
+
+
+def _start_fake_site(path, delay, body):
+    server = socket.socket(socket.AF_UNIX)
+    server.bind(path)
+    server.listen(5)
+
+    def handle(conn):
+        while True:
+            query = ""
+            while not query.endswith("\n\n"):
+                data = conn.recv(4096)
+                if not data:
+                    conn.close()
+                    return
+                query += data
+            time.sleep(delay)
+            conn.sendall("200 %11d\n%s" % (len(body), body))
+
+    def serve():
+        while True:
+            conn = server.accept()[0]
+            thread = threading.Thread(target=handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+
+
+def _query_sequential_receive(live, query):
+    for _sitename, _site, connection in live.connections:
+        connection.send_query(query)
+    result = []
+    for _sitename, _site, connection in live.connections:
+        result += connection.recv_response(query)
+    return result
+
+
+def main(args):
+    num_sites = int(args[0]) if args else 40
+    num_rows = int(args[1]) if len(args) > 1 else 2000
+    query = "GET services\nColumns: host_name description state plugin_output\n"
+    body = "[" + ",\n".join(
+        repr(["host%d" %
+              (i / 20), "Service %d" % i, i % 4, "OK - Everything is fine"])
+        for i in range(num_rows)) + "]\n"
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sites = {}
+        for index in range(num_sites):
+            path = os.path.join(tmp_dir, "site%d" % index)
+            _start_fake_site(path, index * 0.01, body)
+            sites["site%d" % index] = {"socket": "unix:%s" % path}
+
+        live = livestatus.MultiSiteConnection(sites)
+        print("%d sites, %d rows each" % (num_sites, num_rows))
+
+        start = time.time()
+        assert len(_query_sequential_receive(live, query)) == num_sites * num_rows
+        print("Receive one after another: %6.2f s" % (time.time() - start))
+
+        start = time.time()
+        assert len(live.query(query)) == num_sites * num_rows
+        print("Receive as data arrives:   %6.2f s" % (time.time() - start))
+
+        stats = live.query_stats().values()
+        print("Summed decode time:        %6.2f s" % sum(s["decode_time"] for s in stats))
+        print("Slowest response:          %6.2f s" % max(s["response_time"] for s in stats))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
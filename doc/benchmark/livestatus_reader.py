@@ -0,0 +1,140 @@
+#!/usr/bin/env python2
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark of receiving and decoding large Livestatus responses
+
+Starts a local fake Livestatus which answers every query with a service table of
+the given number of rows in the requested output format. Then queries the table
+with the former per packet receive loop, with the current receive loop in the
+Python and JSON output formats and row by row with the streaming iterator API.
+Pass the number of rows as argument, otherwise 100000 rows are used.
+
+Execute it as site user from the root of the git repository:
+
+    PYTHONPATH=.:livestatus/api/python python doc/benchmark/livestatus_reader.py [NUM_ROWS]
+"""
+
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import livestatus
+
+
+def _make_responses(num_rows):
+    rows = [[
+        "host%d" % (i / 20),
+        "Service %d" % i,
+        i % 4,
+        "OK - Everything is fine, temperature is 23 \xc2\xb0C",
+        [1.5, 2.0],
+    ] for i in range(num_rows)]
+    return {
+        "python": "[" + ",\n".join(repr(row) for row in rows) + "]\n",
+        "json": "[" + ",\n".join(json.dumps(row) for row in rows) + "]\n",
+    }
+
+
+def _start_fake_livestatus(path, responses):
+    server = socket.socket(socket.AF_UNIX)
+    server.bind(path)
+    server.listen(5)
+
+    def handle(conn):
+        while True:
+            query = ""
+            while not query.endswith("\n\n"):
+                data = conn.recv(4096)
+                if not data:
+                    conn.close()
+                    return
+                query += data
+            output_format = query.split("OutputFormat: ", 1)[1].split("\n", 1)[0]
+            body = responses[output_format]
+            conn.sendall("200 %11d\n%s" % (len(body), body))
+
+    def serve():
+        while True:
+            conn = server.accept()[0]
+            thread = threading.Thread(target=handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+
+
+class LegacyConnection(livestatus.SingleSiteConnection):
+    """Receives the response like it was done before"""
+
+    def receive_data(self, size):
+        result = u""
+        self.socket.settimeout(None)
+        while size > 0:
+            packet = self.socket.recv(size)
+            if not packet:
+                raise livestatus.MKLivestatusSocketClosed("Read zero data from socket")
+            size -= len(packet)
+            result += packet.decode("utf-8")
+        return result
+
+
+def _measure(title, func):
+    start = time.time()
+    num_rows = func()
+    print("%-28s %6.2f s (%d rows)" % (title + ":", time.time() - start, num_rows))
+
+
+def main(args):
+    num_rows = int(args[0]) if args else 100000
+    query = "GET services\nColumns: host_name description state plugin_output perf\n"
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        url = "unix:%s" % os.path.join(tmp_dir, "live")
+        _start_fake_livestatus(url[5:], _make_responses(num_rows))
+
+        _measure("Per packet receive, Python", lambda: len(
+            LegacyConnection(url, persist=True).query(query)))
+        _measure("Buffered receive, Python", lambda: len(
+            livestatus.SingleSiteConnection(url, persist=True).query(query)))
+        _measure(
+            "Buffered receive, JSON", lambda: len(
+                livestatus.SingleSiteConnection(url, persist=True, output_format="json").query(query
+                                                                                              )))
+        _measure("Row iterator, JSON", lambda: sum(
+            1 for _row in livestatus.SingleSiteConnection(url).iter_query(query)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,166 @@
+#!/usr/bin/env python2
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark of the rule based notification matching
+
+Replays the notification contexts recorded in the notification backlog (see
+store_notification_backlog(), the last notification_backlog notifications are
+kept in var/check_mk/notify/backlog.mk) against a generated set of notification
+rules. The rules restrict to hosts, host events, service groups and contact
+groups of the replayed contexts and of many other, not existing objects, like
+the rules of a large organization with many teams.
+
+It compares the evaluation of all rules with the evaluation of the candidates
+found by the compiled notification rules and checks that both find the same
+matching rules. Pass the number of rules and optionally the path of a backlog
+file as arguments, otherwise 1000 rules and the backlog of the site are used.
+
+Execute it as site user from the root of the git repository:
+
+    PYTHONPATH=. python doc/benchmark/notification_rules.py [NUM_RULES [BACKLOG]]
+"""
+
+import sys
+import time
+
+import cmk_base.notify as notify
+
+
+def _load_backlog(path):
+    try:
+        return eval(file(path).read())
+    except IOError:
+        return []
+
+
+def _generate_rules(num_rules, contexts):
+    hostnames = sorted(set(context["HOSTNAME"] for context in contexts))
+    servicegroups = sorted(
+        set(
+            group for context in contexts
+            for group in context.get("SERVICEGROUPNAMES", "").split(",") if group))
+    contactgroups = sorted(
+        set(group for context in contexts for what in ["HOST", "SERVICE"]
+            for group in context.get(what + "CONTACTGROUPNAMES", "").split(",")
+            if group))
+
+    rules = []
+    for nr in range(num_rules):
+        rule = {"description": "Rule %d" % nr, "contact_users": ["team%d" % (nr % 50)]}
+        kind = nr % 5
+        real = nr % 25 == 0  # Some rules are for the objects of the backlog
+        if kind == 0:
+            rule["match_hosts"] = hostnames[:1 + nr % 3] if real and hostnames else \
+                ["host%d" % nr, "host%d" % (nr + 1)]
+        elif kind == 1:
+            rule["match_servicegroups"] = servicegroups[:1] if real and servicegroups else \
+                ["servicegroup%d" % nr]
+        elif kind == 2:
+            rule["match_contactgroups"] = contactgroups[:1] if real and contactgroups else \
+                ["contactgroup%d" % nr]
+        elif kind == 3:
+            rule["match_host_event"] = ["?d", "?r"]
+            rule["match_hosts"] = ["host%d" % nr]
+        else:
+            rule["match_services"] = ["Interface %d$" % nr]
+            rule["match_exclude_hosts"] = hostnames[:1]
+        rules.append(rule)
+    return rules
+
+
+def _generate_contexts():
+    contexts = []
+    for nr in range(10):
+        context = {
+            "WHAT": "SERVICE" if nr % 2 else "HOST",
+            "HOSTNAME": "host%d" % (nr * 7),
+            "NOTIFICATIONTYPE": "PROBLEM",
+            "HOSTSTATE": "DOWN",
+            "PREVIOUSHOSTHARDSTATE": "UP",
+            "HOSTOUTPUT": "Connection refused",
+            "HOSTCONTACTGROUPNAMES": "contactgroup%d" % (nr * 5 + 2),
+        }
+        if nr % 2:
+            context.update({
+                "SERVICEDESC": "Interface %d" % nr,
+                "SERVICESTATE": "CRITICAL",
+                "PREVIOUSSERVICEHARDSTATE": "OK",
+                "SERVICEOUTPUT": "Link down",
+                "SERVICEGROUPNAMES": "servicegroup%d" % (nr * 5 + 1),
+                "SERVICECONTACTGROUPNAMES": "contactgroup%d" % (nr * 5 + 2),
+            })
+        contexts.append(context)
+    return contexts
+
+
+def _matching(rules, context):
+    return [rule["description"] for rule in rules if not notify.rbn_match_rule(rule, context)]
+
+
+def _measure(func, contexts, repeat=5):
+    durations = []
+    for _unused in range(repeat):
+        start = time.time()
+        for context in contexts:
+            func(context)
+        durations.append(time.time() - start)
+    return min(durations) / len(contexts)
+
+
+def main(args):
+    num_rules = int(args[0]) if args else 1000
+    backlog_path = args[1] if len(args) > 1 else notify.notification_logdir + "/backlog.mk"
+
+    contexts = _load_backlog(backlog_path)
+    if contexts:
+        print("Replaying %d notification contexts from %s" % (len(contexts), backlog_path))
+    else:
+        print("No notification backlog found in %s, using generated contexts" % backlog_path)
+        contexts = _generate_contexts()
+
+    rules = _generate_rules(num_rules, contexts)
+
+    start = time.time()
+    compiled_rules = notify.CompiledNotificationRules(rules)
+    print("Compiling %d rules: %.1f ms" % (len(rules), (time.time() - start) * 1000))
+
+    num_candidates = 0
+    for context in contexts:
+        candidates = compiled_rules.candidates(context)
+        num_candidates += len(candidates)
+        if _matching(candidates, context) != _matching(rules, context):
+            raise Exception("Different rules match %r" % context)
+    print("Candidates per notification: %.1f" % (float(num_candidates) / len(contexts)))
+
+    all_rules = _measure(lambda context: _matching(rules, context), contexts)
+    candidates = _measure(lambda context: _matching(compiled_rules.candidates(context), context),
+                          contexts)
+    print("All rules:        %8.3f ms per notification" % (all_rules * 1000))
+    print("Compiled rules:   %8.3f ms per notification (%.1fx)" % (candidates * 1000,
+                                                                   all_rules / candidates))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,183 @@
+#!/usr/bin/env python2
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Benchmark of the host condition matching of the RulesetOptimizer
+
+Compares the bitmap based host matching of the RulesetOptimizer with the
+previous approach of checking the conditions host by host. The configuration is
+synthetic: hosts spread over some folders, each with one tag of several tag
+groups, and rules using plain, negated, $or and $nor tag conditions, host
+lists and folder conditions.
+
+Execute it from the root of the git repository:
+
+    PYTHONPATH=. python doc/benchmark/ruleset_optimizer.py [NUM_HOSTS] [NUM_RULES]
+"""
+
+import random
+import sys
+import time
+
+from cmk.utils.rulesets.ruleset_matcher import RulesetOptimizer, parse_negated_condition_list
+from cmk.utils.regex import regex
+
+TAG_GROUPS = {
+    "criticality": ["prod", "critical", "test", "offline"],
+    "networking": ["lan", "wan", "dmz"],
+    "agent": ["cmk-agent", "snmp-only", "no-agent"],
+    "os": ["linux", "windows", "aix", "solaris", "other"],
+}
+
+FOLDERS = ["/wato/dc%d/rack%d/" % (dc, rack) for dc in range(4) for rack in range(10)]
+
+
+def _legacy_matches_tag_spec(tag_spec, hosttags):
+    if isinstance(tag_spec, dict):
+        if "$ne" in tag_spec:
+            return tag_spec["$ne"] not in hosttags
+        if "$or" in tag_spec:
+            return any(_legacy_matches_tag_spec(s, hosttags) for s in tag_spec["$or"])
+        if "$nor" in tag_spec:
+            return not any(_legacy_matches_tag_spec(s, hosttags) for s in tag_spec["$nor"])
+        raise NotImplementedError()
+    return tag_spec in hosttags
+
+
+def _legacy_matches_host_name(host_entries, hostname):
+    if not host_entries:
+        return True
+
+    negate, host_entries = parse_negated_condition_list(host_entries)
+    for entry in host_entries:
+        if isinstance(entry, dict):
+            if regex(entry["$regex"]).match(hostname) is not None:
+                return not negate
+        elif hostname == entry:
+            return not negate
+    return negate
+
+
+def legacy_all_matching_hosts(host_tag_lists, host_paths, valid_hosts, condition):
+    """The host by host evaluation used before the bitmap index was introduced"""
+    hostlist = condition.get("host_name")
+    tags = condition.get("host_tags", {})
+    rule_path = condition.get("host_folder", "/")
+
+    if hostlist == []:
+        return set()
+
+    matching = set()
+    for hostname in valid_hosts:
+        if not host_paths.get(hostname, "/").startswith(rule_path):
+            continue
+        host_tags = host_tag_lists[hostname]
+        if tags and not all(_legacy_matches_tag_spec(s, host_tags) for s in tags.values()):
+            continue
+        if _legacy_matches_host_name(hostlist, hostname):
+            matching.add(hostname)
+    return matching
+
+
+def create_config(num_hosts):
+    host_tag_lists, host_paths = {}, {}
+    for index in range(num_hosts):
+        hostname = "host%06d" % index
+        host_paths[hostname] = random.choice(FOLDERS)
+        host_tag_lists[hostname] = set(random.choice(tags) for tags in TAG_GROUPS.values())
+        host_tag_lists[hostname].add(host_paths[hostname])
+    return host_tag_lists, host_paths
+
+
+def create_conditions(hostnames, num_rules):
+    conditions = []
+    for _index in range(num_rules):
+        condition = {}
+        group_ids = random.sample(TAG_GROUPS.keys(), random.randint(0, 3))
+        if group_ids:
+            condition["host_tags"] = {}
+        for group_id in group_ids:
+            choices = TAG_GROUPS[group_id]
+            condition["host_tags"][group_id] = random.choice([
+                random.choice(choices),
+                {
+                    "$ne": random.choice(choices)
+                },
+                {
+                    "$or": random.sample(choices, 2)
+                },
+                {
+                    "$nor": random.sample(choices, 2)
+                },
+            ])
+
+        kind = random.random()
+        if kind < 0.2:
+            condition["host_name"] = random.sample(hostnames, random.randint(1, 20))
+        elif kind < 0.25:
+            condition["host_name"] = [{"$regex": "host0%d" % random.randint(0, 9)}]
+        elif kind < 0.3:
+            condition["host_name"] = {"$nor": random.sample(hostnames, 5)}
+
+        if random.random() < 0.3:
+            condition["host_folder"] = random.choice(FOLDERS)[:random.choice([9, 10, 17])]
+
+        conditions.append(condition)
+    return conditions
+
+
+def main(num_hosts, num_rules):
+    random.seed(42)
+    host_tag_lists, host_paths = create_config(num_hosts)
+    hostnames = sorted(host_tag_lists)
+    conditions = create_conditions(hostnames, num_rules)
+    all_hosts = set(hostnames)
+
+    sys.stdout.write("%d hosts, %d rule conditions\n" % (num_hosts, num_rules))
+
+    start = time.time()
+    legacy = [
+        legacy_all_matching_hosts(host_tag_lists, host_paths, all_hosts, c) for c in conditions
+    ]
+    legacy_duration = time.time() - start
+    sys.stdout.write("host by host: %8.3f sec\n" % legacy_duration)
+
+    start = time.time()
+    optimizer = RulesetOptimizer(host_tag_lists, host_paths, all_hosts, {}, {})
+    init_duration = time.time() - start
+    bitmap = [optimizer._all_matching_hosts(c, with_foreign_hosts=False) for c in conditions]
+    bitmap_duration = time.time() - start
+    sys.stdout.write("bitmap index: %8.3f sec (%.3f sec index creation)\n" %
+                     (bitmap_duration, init_duration))
+
+    if legacy != bitmap:
+        sys.stdout.write("ERROR: The results differ\n")
+        return 1
+
+    sys.stdout.write("speedup:      %8.1fx\n" % (legacy_duration / bitmap_duration))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*[int(a) for a in sys.argv[1:3]] or [40000, 2000]))
@@ -31,7 +31,11 @@ import re
 import os
 import ast
 import ssl
-from typing import Tuple, Union, Dict, Pattern, Optional  # pylint: disable=unused-import
+import json
+import codecs
+import errno
+import select
+from typing import Tuple, Union, Dict, Pattern, Optional, List, Iterator, Any  # pylint: disable=unused-import
 
 #   .--Globals-------------------------------------------------------------.
 #   |                    ____ _       _           _                        |
@@ -51,6 +55,12 @@ persistent_connections = {}  # type: Dict[str, socket.socket]
 # Regular expression for removing Cache: headers if caching is not allowed
 remove_cache_regex = re.compile("\nCache:[^\n]*")  # type: Pattern
 
+# Output formats the responses can be requested and decoded in
+output_formats = ("python", "json", "csv")
+
+# Number of bytes read from the socket at once while streaming a response
+_STREAM_CHUNK_SIZE = 65536
+
 
 def ensure_unicode(text):
     if hasattr(text, "decode"):
@@ -293,10 +303,20 @@ class SingleSiteConnection(Helpers):
                  allow_cache=False,
                  tls=False,
                  verify=True,
-                 ca_file_path=None):
-        # type: (str, bool, bool, bool, bool, Optional[str]) -> None
-        """Create a new connection to a MK Livestatus socket"""
+                 ca_file_path=None,
+                 output_format="python"):
+        # type: (str, bool, bool, bool, bool, Optional[str], str) -> None
+        """Create a new connection to a MK Livestatus socket
+
+        The output format is one of "python", "json" or "csv". Responses in
+        JSON format are decoded a lot faster than the default Python format,
+        but all strings are returned as unicode objects. CSV responses are
+        returned as rows of unicode strings without any type conversion."""
         super(SingleSiteConnection, self).__init__()
+        if output_format not in output_formats:
+            raise MKLivestatusConfigError("Invalid output format '%s'. Must be one of: %s" %
+                                          (output_format, ", ".join(output_formats)))
+        self.output_format = output_format
         self.prepend_site = False
         self.auth_users = {}  # type: Dict[str, str]
         # never filled, just to have the same API as MultiSiteConnection (TODO: Cleanup)
@@ -422,24 +442,56 @@ class SingleSiteConnection(Helpers):
                 pass
 
     def receive_data(self, size):
-        result = u""
+        # type: (int) -> unicode
+        """Receive exactly size bytes and return them decoded
+
+        The data is read into a single buffer of the already known size and
+        decoded once at the end. Growing a string per packet would make
+        receiving large responses quadratic."""
+        buf = bytearray(size)
+        view = memoryview(buf)
         # Timeout is only honored when connecting
         self.socket.settimeout(None)
-        while size > 0:
-            packet = self.socket.recv(size)
-            if not packet:
+        received = 0
+        while received < size:
+            num_bytes = self.socket.recv_into(view[received:], size - received)
+            if not num_bytes:
                 raise MKLivestatusSocketClosed(
                     "Read zero data from socket, nagios server closed connection")
-            size -= len(packet)
-            result += packet.decode("utf-8")
-        return result
+            received += num_bytes
+        return buf.decode("utf-8")
+
+    def _receive_chunk(self, size):
+        # type: (int) -> bytes
+        """Receive at most size bytes, at least one"""
+        self.socket.settimeout(None)
+        packet = self.socket.recv(size)
+        if not packet:
+            raise MKLivestatusSocketClosed(
+                "Read zero data from socket, nagios server closed connection")
+        return packet
+
+    def _receive_response_header(self):
+        # type: () -> Tuple[unicode, int]
+        resp = self.receive_data(16)
+        code = resp[0:3]
+        try:
+            length = int(resp[4:15].lstrip())
+        except:
+            self.disconnect()
+            raise MKLivestatusSocketError(
+                "Malformed output. Livestatus TCP socket might be unreachable or wrong"
+                "encryption settings are used.")
+        return code, length
 
     def do_query(self, query, add_headers=""):
         self.send_query(query, add_headers)
         return self.recv_response(query, add_headers)
 
-    def send_query(self, query_obj, add_headers="", do_reconnect=True):
+    def send_query(self, query_obj, add_headers="", do_reconnect=True, output_format=None):
         orig_query = query_obj
+        if output_format is None:
+            output_format = self.output_format
 
         query = "%s" % query_obj
         if not self.allow_cache:
@@ -451,8 +503,8 @@ class SingleSiteConnection(Helpers):
         if not query.endswith("\n"):
             query += "\n"
         query += self.auth_header + self.add_headers
-        query += "Localtime: %d\nOutputFormat: python\nKeepAlive: on\nResponseHeader: fixed16\n" % int(
-            time.time())
+        query += "Localtime: %d\nOutputFormat: %s\nKeepAlive: on\nResponseHeader: fixed16\n" % (int(
+            time.time()), output_format)
         query += add_headers
 
         if not query.endswith("\n"):
@@ -473,7 +525,7 @@ class SingleSiteConnection(Helpers):
                 # Automatically try to reconnect in case of an error, but
                 # only once.
                 self.connect()
-                self.send_query(orig_query, add_headers, False)
+                self.send_query(orig_query, add_headers, False, output_format)
                 return
 
             raise MKLivestatusSocketError("RC1:" + str(e))
@@ -483,30 +535,8 @@ class SingleSiteConnection(Helpers):
     # the query again (once). This is due to timeouts during keepalive.
     def recv_response(self, query=None, add_headers="", timeout_at=None):
         try:
-            resp = self.receive_data(16)
-            code = resp[0:3]
-            try:
-                length = int(resp[4:15].lstrip())
-            except:
-                self.disconnect()
-                raise MKLivestatusSocketError(
-                    "Malformed output. Livestatus TCP socket might be unreachable or wrong"
-                    "encryption settings are used.")
-
-            data = self.receive_data(length)
-
-            if code == "200":
-                try:
-                    return ast.literal_eval(data)
-                except:
-                    self.disconnect()
-                    raise MKLivestatusSocketError("Malformed output")
-
-            elif code == "404":
-                raise MKLivestatusTableNotFoundError("Not Found (%s): %s" % (code, data.strip()))
-
-            else:
-                raise MKLivestatusQueryError("%s: %s" % (code, data.strip()))
+            code, length = self._receive_response_header()
+            return self._process_response(code, self.receive_data(length))
 
         except (MKLivestatusSocketClosed, IOError) as e:
             # In case of an IO error or the other side having
@@ -540,6 +570,92 @@ class SingleSiteConnection(Helpers):
             # FIXME: ? self.disconnect()
             raise MKLivestatusSocketError("Unhandled exception: %s" % e)
 
+    def _process_response(self, code, data):
+        # type: (unicode, unicode) -> List[List[Any]]
+        if code == "200":
+            try:
+                return self._decode_response(data)
+            except:
+                self.disconnect()
+                raise MKLivestatusSocketError("Malformed output")
+
+        elif code == "404":
+            raise MKLivestatusTableNotFoundError("Not Found (%s): %s" % (code, data.strip()))
+
+        raise MKLivestatusQueryError("%s: %s" % (code, data.strip()))
+
+    def _decode_response(self, data):
+        # type: (unicode) -> List[List[Any]]
+        if self.output_format == "json":
+            return json.loads(data)
+        if self.output_format == "csv":
+            return _decode_csv_response(data)
+        return ast.literal_eval(data)
+
+    def iter_query(self, query, add_headers=""):
+        # type: (Union[str, unicode, Query], str) -> Iterator[List[Any]]
+        """Issues a query and yields the rows of the response one by one
+
+        The response is requested in JSON format and the rows are decoded
+        while the response is being received. Large tables are thus never
+        held completely in memory, neither as text nor as decoded rows. All
+        strings are returned as unicode objects.
+
+        Stopping the iteration early closes the connection, because the rest
+        of the response is not read from the socket anymore."""
+        if self.limit is not None:
+            query += "Limit: %d\n" % self.limit
+
+        self.send_query(query, add_headers, output_format="json")
+        try:
+            code, length = self._receive_response_header()
+        except (MKLivestatusSocketClosed, IOError):
+            # The server may have closed a kept alive connection in the
+            # meantime. Reconnect and send the query again, but only once.
+            self.disconnect()
+            self.connect()
+            self.send_query(query, add_headers, output_format="json")
+            try:
+                code, length = self._receive_response_header()
+            except (MKLivestatusSocketClosed, IOError) as e:
+                self.disconnect()
+                raise MKLivestatusSocketError(str(e))
+
+        if code != "200":
+            try:
+                data = self.receive_data(length).strip()
+            except (MKLivestatusSocketClosed, IOError) as e:
+                self.disconnect()
+                raise MKLivestatusSocketError(str(e))
+            if code == "404":
+                raise MKLivestatusTableNotFoundError("Not Found (%s): %s" % (code, data))
+            raise MKLivestatusQueryError("%s: %s" % (code, data))
+
+        decoder = _IncrementalRowDecoder()
+        completed = False
+        try:
+            remaining = length
+            while remaining:
+                chunk = self._receive_chunk(min(remaining, _STREAM_CHUNK_SIZE))
+                remaining -= len(chunk)
+                try:
+                    rows = decoder.feed(chunk, final=not remaining)
+                except ValueError:
+                    raise MKLivestatusSocketError("Malformed output")
+
+                for row in rows:
+                    if self.prepend_site:
+                        row.insert(0, u"")
+                    yield row
+            completed = True
+
+        except (MKLivestatusSocketClosed, IOError) as e:
+            raise MKLivestatusSocketError(str(e))
+
+        finally:
+            if not completed:
+                self.disconnect()
+
     def set_prepend_site(self, p):
         self.prepend_site = p
 
@@ -589,6 +705,160 @@ class SingleSiteConnection(Helpers):
             self.auth_header = ""
 
 
+def _decode_csv_response(data):
+    # type: (unicode) -> List[List[unicode]]
+    """Split a CSV response using the default Livestatus separators"""
+    lines = data.split(u"\n")
+    if lines[-1] == u"":
+        del lines[-1]
+    return [line.split(u";") for line in lines]
+
+
+class _IncrementalRowDecoder(object):
+    """Decodes the rows of a JSON response while it is being received
+
+    The response is a JSON list of rows. Each row is decoded on its own as
+    soon as it is complete, the text of already decoded rows is dropped."""
+
+    _whitespace = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self):
+        super(_IncrementalRowDecoder, self).__init__()
+        self._utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._raw_decode = json.JSONDecoder().raw_decode
+        self._text = u""
+        self._started = False
+        self._finished = False
+        self._need_separator = False
+
+    def feed(self, data, final=False):
+        # type: (bytes, bool) -> List[List[Any]]
+        """Add the next chunk of the response and return the rows completed by it
+
+        Raises ValueError in case the response is malformed."""
+        text = self._text + self._utf8_decoder.decode(data, final)
+        skip_whitespace = self._whitespace.match
+        pos = skip_whitespace(text).end()
+
+        if not self._started and pos < len(text):
+            if text[pos] != u"[":
+                raise ValueError("Response is not a list")
+            self._started = True
+            pos += 1
+
+        rows = []
+        while self._started and not self._finished:
+            pos = skip_whitespace(text, pos).end()
+            if pos == len(text):
+                break
+
+            char = text[pos]
+            if char == u"]":
+                self._finished = True
+                pos += 1
+            elif self._need_separator:
+                if char != u",":
+                    raise ValueError("Missing separator at %d" % pos)
+                self._need_separator = False
+                pos += 1
+            else:
+                try:
+                    row, pos = self._raw_decode(text, pos)
+                except ValueError:
+                    if final:
+                        raise
+                    break  # Row is not complete yet, wait for more data
+                rows.append(row)
+                self._need_separator = True
+
+        pos = skip_whitespace(text, pos).end()
+        if self._finished and pos < len(text):
+            raise ValueError("Extra data after the response")
+        if final and not self._finished:
+            raise ValueError("Response is incomplete")
+
+        self._text = text[pos:]
+        return rows
+
+
+class _ResponseReceiver(object):
+    """Receives the response to a query sent on a connection without blocking
+
+    MultiSiteConnection.query_parallel() uses one of these per site to read
+    the responses of all sites while they arrive. The socket of the
+    connection has to be in non-blocking mode."""
+
+    def __init__(self, connection, reconnected=False):
+        # type: (SingleSiteConnection, bool) -> None
+        super(_ResponseReceiver, self).__init__()
+        self.connection = connection
+        self.reconnected = reconnected
+        self._header = bytearray(16)
+        self._data = None  # type: Optional[bytearray]
+        self._code = None  # type: Optional[unicode]
+        self._received = 0
+
+    def fileno(self):
+        # type: () -> int
+        return self.connection.socket.fileno()
+
+    @property
+    def num_bytes(self):
+        # type: () -> int
+        return 0 if self._data is None else len(self._data)
+
+    def receive(self):
+        # type: () -> bool
+        """Read all data currently available and tell whether the response is complete
+
+        Reading until the socket would block is needed for TLS connections:
+        Decrypted data may already be buffered while the socket itself does
+        not become readable again."""
+        while True:
+            buf = self._header if self._data is None else self._data
+            if self._received == len(buf):
+                if self._data is not None:
+                    return True
+                self._start_data()
+                continue
+
+            try:
+                num_bytes = self.connection.socket.recv_into(
+                    memoryview(buf)[self._received:],
+                    len(buf) - self._received)
+            except ssl.SSLWantReadError:
+                return False
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return False
+                raise
+
+            if not num_bytes:
+                raise MKLivestatusSocketClosed(
+                    "Read zero data from socket, nagios server closed connection")
+            self._received += num_bytes
+
+    def _start_data(self):
+        # type: () -> None
+        header = self._header.decode("utf-8")
+        try:
+            length = int(header[4:15].lstrip())
+        except ValueError:
+            self.connection.disconnect()
+            raise MKLivestatusSocketError(
+                "Malformed output. Livestatus TCP socket might be unreachable or wrong"
+                "encryption settings are used.")
+        self._code = header[0:3]
+        self._data = bytearray(length)
+        self._received = 0
+
+    def response(self):
+        # type: () -> List[List[Any]]
+        """Decode the complete response or raise the error reported by Livestatus"""
+        assert self._data is not None and self._code is not None
+        return self.connection._process_response(self._code, self._data.decode("utf-8"))
+
+
 #.
 #   .--MultiSiteConn-------------------------------------------------------.
 #   |     __  __       _ _   _ ____  _ _        ____                       |
@@ -622,6 +892,8 @@ class MultiSiteConnection(Helpers):
         self.only_sites = None
         self.limit = None
         self.parallelize = True
+        self.query_timeout = None  # type: Optional[float]
+        self._query_stats = {}  # type: Dict[str, Dict[str, float]]
 
         # Status host: A status host helps to prevent trying to connect
         # to a remote site which is unreachable. This is done by looking
@@ -784,6 +1056,25 @@ class MultiSiteConnection(Helpers):
     def set_limit(self, limit=None):
         self.limit = limit
 
+    def set_query_timeout(self, timeout=None):
+        # type: (Optional[float]) -> None
+        """Set the number of seconds parallel queries wait for the response of a site
+
+        Sites not having answered completely in time are marked as dead. The
+        "query_timeout" of a site configuration overrides this value. In case
+        None is given, the queries wait as long as it takes."""
+        self.query_timeout = timeout
+
+    def query_stats(self):
+        # type: () -> Dict[str, Dict[str, float]]
+        """Statistics about the sites answering the last parallel query
+
+        Maps the site IDs to a dictionary with the seconds from sending the
+        query until the response was completely received ("response_time"),
+        the seconds needed for decoding it ("decode_time") and the size of
+        the response in bytes ("bytes")."""
+        return self._query_stats
+
     def dead_sites(self):
         return self.deadsites
 
@@ -809,6 +1100,50 @@ class MultiSiteConnection(Helpers):
             return self.query_parallel(query, add_headers)
         return self.query_non_parallel(query, add_headers)
 
+    def iter_query(self, query, add_headers=""):
+        # type: (Union[str, unicode, Query], str) -> Iterator[List[Any]]
+        """Issues a query to the sites one after another and yields the rows
+
+        See SingleSiteConnection.iter_query() for details. The Limit: is
+        distributed among the sites like in query_non_parallel(). Sites that
+        fail while their rows are read are marked as dead, the rows of the
+        remaining sites are yielded nevertheless."""
+        if isinstance(query, Query):
+            suppress_exceptions = tuple(query.suppress_exceptions)
+        else:
+            suppress_exceptions = tuple(Query.default_suppressed_exceptions)
+
+        limit = self.limit
+        for sitename, site, connection in self.connections[:]:
+            if self.only_sites is not None and sitename not in self.only_sites:
+                continue
+
+            if limit is not None:
+                if limit <= 0:
+                    break
+                limit_header = "Limit: %d\n" % limit
+            else:
+                limit_header = ""
+
+            try:
+                for row in connection.iter_query(query, add_headers + limit_header):
+                    if limit is not None:
+                        limit -= 1
+                    if self.prepend_site:
+                        row.insert(0, sitename)
+                    yield row
+
+            except suppress_exceptions:  # pylint: disable=catching-non-exception
+                continue
+
+            except Exception as e:
+                connection.disconnect()
+                self.connections.remove((sitename, site, connection))
+                self.deadsites[sitename] = {
+                    "exception": e,
+                    "site": site,
+                }
+
     def query_non_parallel(self, query, add_headers=""):
         result = []
         stillalive = []
@@ -857,9 +1192,11 @@ class MultiSiteConnection(Helpers):
             limit_header = ""
 
         # First send all queries
+        queried_sites = []
         for sitename, site, connection in connect_to_sites:
             try:
                 connection.send_query(query, add_headers + limit_header)
+                queried_sites.append((sitename, site, connection))
             except Exception as e:
                 self.deadsites[sitename] = {
                     "exception": e,
@@ -873,28 +1210,126 @@ class MultiSiteConnection(Helpers):
 
         # Then retrieve all answers. We will be as slow as the slowest of all
         # connections.
+        responses = self._receive_responses(queried_sites, query, add_headers + limit_header)
+
         result = []
-        for sitename, site, connection in connect_to_sites:
-            try:
-                r = connection.recv_response(query, add_headers + limit_header)
-                stillalive.append((sitename, site, connection))
-                if self.prepend_site:
-                    r = [[sitename] + l for l in r]
-                result += r
-            except suppress_exceptions:  # pylint: disable=catching-non-exception
+        for sitename, site, connection in queried_sites:
+            r = responses[sitename]
+            if isinstance(r, suppress_exceptions):
                 stillalive.append((sitename, site, connection))
                 continue
 
-            except Exception as e:
+            if isinstance(r, Exception):
                 connection.disconnect()
                 self.deadsites[sitename] = {
-                    "exception": e,
+                    "exception": r,
                     "site": site,
                 }
+                continue
+
+            stillalive.append((sitename, site, connection))
+            if self.prepend_site:
+                r = [[sitename] + l for l in r]
+            result += r
 
         self.connections = stillalive
         return result
 
+    def _receive_responses(self, queried_sites, query, add_headers):
+        """Receive the responses of all sites at the same time
+
+        The sockets are read as soon as data arrives and each response is
+        decoded as soon as it is complete, so a slow site does not delay
+        receiving the answers of the others. Returns a dictionary from the
+        site IDs to either the rows or the exception that occured.
+
+        Sites that closed a kept alive connection are reconnected and asked
+        again, but only once. Sites exceeding their query timeout are
+        disconnected."""
+        start = time.time()
+        self._query_stats = {}
+        responses = {}  # type: Dict[str, Any]
+        active = {}  # type: Dict[int, Tuple[str, float, _ResponseReceiver]]
+        poller = select.poll()
+
+        def add(sitename, deadline, receiver):
+            receiver.connection.socket.settimeout(0.0)
+            active[receiver.fileno()] = (sitename, deadline, receiver)
+            poller.register(receiver.fileno(), select.POLLIN)
+
+        def remove(fd):
+            poller.unregister(fd)
+            receiver = active.pop(fd)[2]
+            if receiver.connection.socket is not None:
+                receiver.connection.socket.settimeout(None)
+
+        for sitename, site, connection in queried_sites:
+            timeout = site.get("query_timeout", self.query_timeout)
+            add(sitename, start + timeout if timeout else None, _ResponseReceiver(connection))
+
+        try:
+            while active:
+                deadlines = [deadline for _s, deadline, _r in active.values() if deadline]
+                timeout = _poll_timeout(min(deadlines) - time.time()) if deadlines else None
+                try:
+                    ready_fds = [fd for fd, _event in poller.poll(timeout)]
+                except select.error as e:
+                    if e.args[0] != errno.EINTR:
+                        raise
+                    continue
+
+                for fd in ready_fds:
+                    sitename, deadline, receiver = active[fd]
+                    connection = receiver.connection
+                    try:
+                        if not receiver.receive():
+                            continue
+                    except (MKLivestatusSocketClosed, IOError) as e:
+                        # In case of an IO error or the other side having
+                        # closed the socket do a reconnect and try again
+                        remove(fd)
+                        connection.disconnect()
+                        if receiver.reconnected:
+                            responses[sitename] = MKLivestatusSocketError(str(e))
+                            continue
+                        try:
+                            connection.connect()
+                            connection.send_query(query, add_headers)
+                        except Exception as e:
+                            responses[sitename] = e
+                            continue
+                        add(sitename, deadline, _ResponseReceiver(connection, reconnected=True))
+                        continue
+                    except Exception as e:
+                        remove(fd)
+                        responses[sitename] = e
+                        continue
+
+                    remove(fd)
+                    received_at = time.time()
+                    try:
+                        responses[sitename] = receiver.response()
+                    except Exception as e:
+                        responses[sitename] = e
+                    self._query_stats[sitename] = {
+                        "response_time": received_at - start,
+                        "decode_time": time.time() - received_at,
+                        "bytes": receiver.num_bytes,
+                    }
+
+                now = time.time()
+                for fd, (sitename, deadline, receiver) in active.items():
+                    if deadline and now >= deadline:
+                        remove(fd)
+                        receiver.connection.disconnect()
+                        responses[sitename] = MKLivestatusSocketError(
+                            "Timeout while waiting for the response (%.1f seconds)" % (now - start))
+        finally:
+            for fd in active.keys():
+                remove(fd)
+
+        return responses
+
     def command(self, command, sitename="local"):
         if sitename in self.deadsites:
             raise MKLivestatusSocketError("Connection to site %s is dead: %s" % \
@@ -920,6 +1355,12 @@ class MultiSiteConnection(Helpers):
         raise KeyError("Connection does not exist")
 
 
+def _poll_timeout(timeout):
+    # type: (float) -> int
+    """Convert the timeout in seconds to the rounded up milliseconds poll() expects"""
+    return max(0, int(timeout * 1000) + 1)
+
+
 #.
 #   .--LocalConn-----------------------------------------------------------.
 #   |            _                    _  ____                              |
@@ -7,10 +7,12 @@ import pytest  # type: ignore
 from pathlib2 import Path
 
 import cmk.utils.paths
+import cmk.utils.tags
+import cmk.gui.i18n
 import cmk.gui.modules as modules
 import cmk.gui.config as config
 import cmk.gui.permissions as permissions
-from cmk.gui.globals import html
+from cmk.gui.globals import html, current_app
 from cmk.gui.permissions import (
     permission_section_registry,
     permission_registry,
@@ -851,3 +853,111 @@ def test_default_aux_tags():
         'snmp',
         'tcp',
     ])
+
+
+@pytest.fixture()
+def gui_config_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmk.utils.paths, "default_config_dir", str(tmp_path))
+    monkeypatch.setattr(config, "_config_cache", {})
+    monkeypatch.setattr(config, "sidebar_update_interval", config.sidebar_update_interval)
+    monkeypatch.setattr(config, "sites", config.sites)
+    conf_dir = tmp_path / "multisite.d"
+    conf_dir.mkdir()
+    return conf_dir
+
+
+def _write_sidebar_update_interval(conf_dir, interval):
+    with conf_dir.joinpath("sidebar.mk").open("w", encoding="utf-8") as f:
+        f.write(u"sidebar_update_interval = %r\n" % interval)
+
+
+def test_load_cached_config(gui_config_dir):
+    _write_sidebar_update_interval(gui_config_dir, 10.0)
+    config.initialize()
+    assert config.sidebar_update_interval == 10.0
+
+    # Not reading the files again until the generation has been changed
+    _write_sidebar_update_interval(gui_config_dir, 20.0)
+    config.initialize()
+    assert config.sidebar_update_interval == 10.0
+
+    config.bump_config_generation()
+    config.initialize()
+    assert config.sidebar_update_interval == 20.0
+
+
+def test_load_cached_config_independent_of_language(monkeypatch, gui_config_dir):
+    _write_sidebar_update_interval(gui_config_dir, 10.0)
+    config.initialize()
+
+    monkeypatch.setattr(cmk.gui.i18n, "get_current_language", lambda: "de")
+    _write_sidebar_update_interval(gui_config_dir, 20.0)
+    config.initialize()
+    assert config.sidebar_update_interval == 10.0
+
+
+def test_load_cached_config_resets_modified_values(gui_config_dir):
+    config.initialize()
+    config.sites["remote"] = {}
+    config.tags.tag_groups.append(cmk.utils.tags.TagGroup())
+
+    config.initialize()
+    assert "remote" not in config.sites
+    assert all(tag_group.id for tag_group in config.tags.tag_groups)
+
+
+def test_config_generation(gui_config_dir):
+    generation = config.config_generation()
+    assert config.config_generation() == generation
+
+    config.bump_config_generation()
+    bumped_generation = config.config_generation()
+    assert bumped_generation != generation
+
+    config.bump_config_generation()
+    assert config.config_generation() != bumped_generation
+
+
+def test_local_web_plugins_have_changed(monkeypatch, gui_config_dir):
+    monkeypatch.setattr(modules, "_last_plugins_generation", config.config_generation())
+    current_app.g.clear()
+    assert modules._local_web_plugins_have_changed() is False
+
+    config.bump_config_generation()
+    assert modules._local_web_plugins_have_changed() is False  # cached for this request
+
+    current_app.g.clear()
+    assert modules._local_web_plugins_have_changed() is True
+
+
+@pytest.mark.parametrize("value", [
+    1,
+    u"Ümlaut",
+    {
+        "user": {
+            "roles": ["admin"]
+        }
+    },
+    [config.FOREACH_HOST, config.ALL_HOSTS],
+    [lambda: None],
+    (1, [2]),
+    set([1]),
+])
+def test_freeze_config_value(value):
+    frozen = config._freeze_config_value(value)
+    thawed = config._thaw_config_value(*frozen)
+    assert thawed == value
+    if isinstance(value, (dict, list, tuple, set)):
+        assert thawed is not value
+
+
+def test_freeze_config_value_objects():
+    tag_config = cmk.utils.tags.TagConfig()
+    frozen = config._freeze_config_value(tag_config)
+
+    thawed = config._thaw_config_value(*frozen)
+    assert isinstance(thawed, cmk.utils.tags.TagConfig)
+    assert thawed is not tag_config
+
+    thawed.tag_groups.append(cmk.utils.tags.TagGroup())
+    assert config._thaw_config_value(*frozen).tag_groups == []
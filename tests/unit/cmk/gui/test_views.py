@@ -11,6 +11,8 @@ import cmk.gui.default_permissions
 from cmk.gui.globals import html
 from cmk.gui.valuespec import ValueSpec
 import cmk.gui.plugins.views
+import cmk.gui.plugins.visuals.utils
+import cmk.gui.sites
 
 @pytest.fixture()
 def view(register_builtin_html, load_plugins):
@@ -6199,3 +6201,144 @@ def test_registered_display_hints(load_plugins):
 def test_get_inventory_display_hint(load_plugins):
     hint = cmk.gui.plugins.views.inventory_displayhints.get(".software.packages:*.summary")
     assert isinstance(hint, dict)
+
+def _sort_rows_with_cmp(rows, sorters):
+    def compare(r1, r2):
+        for entry in sorters:
+            neg = -1 if entry.negate else 1
+            if entry.join_key:
+                j1, j2 = r1["JOIN"].get(entry.join_key), r2["JOIN"].get(entry.join_key)
+                if j1 is None or j2 is None:
+                    c = neg * cmp(j1 is not None, j2 is not None)
+                else:
+                    c = neg * entry.sorter.cmp(j1, j2)
+            else:
+                c = neg * entry.sorter.cmp(r1, r2)
+            if c != 0:
+                return c
+        return 0
+
+    return sorted(rows, cmp=compare)
+
+
+class SorterWithoutKey(cmk.gui.plugins.views.Sorter):
+    ident = "without_key"
+    title = "Without key"
+    columns = ["service_plugin_output"]
+
+    def cmp(self, r1, r2):
+        return cmp(len(r1["service_plugin_output"]), len(r2["service_plugin_output"]))
+
+
+@pytest.mark.usefixtures("load_plugins")
+@pytest.mark.parametrize("sorter_specs", [
+    [("site_host", False), ("svcdescr", False)],
+    [("svcstate", True), ("svcoutput", False), ("stateage", True)],
+    [("without_key", False), ("svcdescr", True)],
+    [("svcdescr", False, "CPU load"), ("site_host", True)],
+])
+def test_sort_data(sorter_specs):
+    sorter_classes = dict(cmk.gui.plugins.views.sorter_registry.items(),
+                          without_key=SorterWithoutKey)
+    sorters = [
+        cmk.gui.plugins.views.utils.SorterEntry(sorter_classes[spec[0]](), *spec[1:])
+        for spec in sorter_specs
+    ]
+
+    rows = []
+    for index in range(60):
+        row = {
+            "site": ["heute", "gestern"][index % 2],
+            "host_name": "host%d" % (index % 12),
+            "service_description":
+                ["Check_MK", "CPU load", "Disk 10", "disk 9", "Disk 9"][index % 5],
+            "service_state": index % 4,
+            "service_has_been_checked": index % 7 != 0,
+            "service_plugin_output": ["OK", "ok - all", "WARN", "CRIT - 90%"][index % 3],
+            "service_last_state_change": index % 9,
+        }
+        row["JOIN"] = {} if index % 4 == 0 else {"CPU load": dict(row, host_name="x%d" % index)}
+        rows.append(row)
+
+    expected = _sort_rows_with_cmp(rows, sorters)
+    cmk.gui.views.sort_data(rows, sorters)
+    assert rows == expected
+
+
+@pytest.mark.parametrize("page_size,page_var,expected_rows,expected_page,expected_num_pages", [
+    (None, None, range(25), 1, 1),
+    (30, None, range(25), 1, 1),
+    (10, None, range(10), 1, 3),
+    (10, "2", range(10, 20), 2, 3),
+    (10, "3", range(20, 25), 3, 3),
+    (10, "7", range(20, 25), 3, 3),
+    (10, "abc", range(10), 1, 3),
+])
+def test_get_page_of_rows(register_builtin_html, monkeypatch, page_size, page_var, expected_rows,
+                          expected_page, expected_num_pages):
+    monkeypatch.setattr(config, "view_page_size", page_size)
+    if page_var is not None:
+        monkeypatch.setitem(html.request._vars, "view_page", page_var)
+
+    rows, page, num_pages = cmk.gui.views._get_page_of_rows(range(25))
+    assert rows == expected_rows
+    assert page == expected_page
+    assert num_pages == expected_num_pages
+
+
+class FakeLivestatusConnection(object):
+    def __init__(self, result):
+        self.queries = []
+        self._result = result
+
+    def set_only_sites(self, sites=None):
+        pass
+
+    def set_auth_domain(self, domain):
+        pass
+
+    def query_column(self, query):
+        self.queries.append(query)
+        return self._result
+
+
+def test_count_rows_with_stats(view, monkeypatch):
+    live = FakeLivestatusConnection([3, 4])
+    monkeypatch.setattr(cmk.gui.sites, "live", lambda: live)
+
+    assert cmk.gui.views._count_rows_with_stats(view, "Filter: state = 1\n", []) == 7
+    assert live.queries == [
+        "GET hosts\n"
+        "Filter: state = 1\n"
+        "Stats: host_name = \n"
+        "Stats: host_name != \n"
+        "StatsOr: 2\n"
+    ]
+
+    view.row_limit = 5
+    assert cmk.gui.views._count_rows_with_stats(view, "", []) == 6
+
+
+def test_count_rows_with_stats_filter_table(view, monkeypatch):
+    live = FakeLivestatusConnection([3])
+    monkeypatch.setattr(cmk.gui.sites, "live", lambda: live)
+
+    class FilterRowsAfterFetching(cmk.gui.plugins.visuals.utils.Filter):
+        ident = "after_fetching"
+        title = "After fetching"
+        sort_index = 100
+
+        def __init__(self):
+            super(FilterRowsAfterFetching, self).__init__("host", ["after_fetching"], [])
+
+        def display(self):
+            pass
+
+        def filter_table(self, rows):
+            return rows[:1]
+
+    filters = [FilterRowsAfterFetching()]
+    assert cmk.gui.views._count_rows_with_stats(view, "", filters) == 3
+
+    monkeypatch.setitem(html.request._vars, "after_fetching", "x")
+    assert cmk.gui.views._count_rows_with_stats(view, "", filters) is None
@@ -55,6 +55,7 @@ def test_registered_configvars():
     assert registered == sorted([
         'actions',
         'adhoc_downtime',
+        'agent_concurrent_hosts',
         'agent_deployment_enabled',
         'agent_deployment_host_selection',
         'agent_simulator',
@@ -117,6 +118,7 @@ def test_registered_configvars():
         'failed_notification_horizon',
         'graph_timeranges',
         'hard_query_limit',
+        'view_page_size',
         'history_lifetime',
         'history_rotation',
         'hostname_translation',
@@ -126,6 +128,7 @@ def test_registered_configvars():
         'inventory_check_do_scan',
         'inventory_check_interval',
         'inventory_check_severity',
+        'item_state_store',
         'liveproxyd_default_connection_params',
         'liveproxyd_log_levels',
         'lock_on_logon_failures',
@@ -142,16 +145,24 @@ def test_registered_configvars():
         'mkeventd_service_levels',
         'mknotifyd_insecure_message_format',
         'multisite_draw_ruleicon',
+        'nagios_config_processes',
+        'nagios_incremental_config',
         'notification_backlog',
         'notification_bulk_interval',
         'notification_fallback_email',
         'notification_logging',
         'notification_plugin_timeout',
+        'notification_spooler_max_queue',
+        'notification_spooler_plugins',
+        'notification_spooler_retry_interval',
+        'notification_spooler_workers',
         'notification_spooling',
         'page_heading',
         'pagetitle_date_format',
         'password_policy',
         'piggyback_max_cachefile_age',
+        'prediction_precompute_lead_time',
+        'prediction_precompute_rate',
         'profile',
         'quicksearch_dropdown_limit',
         'quicksearch_search_order',
@@ -193,7 +204,9 @@ def test_registered_configvars():
         'site_livestatus_tcp',
         'site_mkeventd',
         'site_nsca',
+        'snmp_concurrent_hosts',
         'snmp_credentials',
+        'snmp_table_walk_min_columns',
         'socket_queue_len',
         'soft_query_limit',
         'staleness_threshold',
@@ -207,6 +220,7 @@ def test_registered_configvars():
         'ui_theme',
         'use_dns_cache',
         'use_inline_snmp',
+        'use_native_snmp',
         'use_new_descriptions_for',
         'user_downtime_timeranges',
         'user_icons_and_actions',
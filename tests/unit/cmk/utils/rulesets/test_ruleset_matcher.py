@@ -2,7 +2,11 @@
 # pylint: disable=redefined-outer-name
 import pytest  # type: ignore
 from testlib.base import Scenario
-from cmk.utils.rulesets.ruleset_matcher import RulesetMatchObject
+from cmk.utils.rulesets.ruleset_matcher import (
+    RulesetMatchObject,
+    HostBitmapIndex,
+    ServiceConditionsMatcher,
+)
 
 
 def test_ruleset_match_object_invalid_attribute_in_init():
@@ -364,3 +368,147 @@ def test_ruleset_matcher_get_host_ruleset_values_tags(monkeypatch, hostname, exp
             RulesetMatchObject(host_name=hostname, service_description=None),
             ruleset=tag_ruleset,
             is_binary=False)) == expected_result
+
+
+@pytest.fixture()
+def host_index():
+    return HostBitmapIndex(
+        host_tag_lists={
+            "host1": {"prod", "lan", "/wato/"},
+            "host2": {"test", "wan", "/wato/sub/"},
+            "host3": {"test", "dmz", "/wato/sub/"},
+        },
+        host_paths={
+            "host2": "/wato/sub/",
+            "host3": "/wato/sub/",
+        },
+        all_configured_hosts={"host1", "host2", "host3"},
+    )
+
+
+def test_host_bitmap_index_round_trip(host_index):
+    assert host_index.bitmap_to_host_names(0) == set()
+    assert host_index.bitmap_to_host_names(host_index.all_hosts) == {"host1", "host2", "host3"}
+    bitmap = host_index.host_names_to_bitmap(["host3", "host1", "unknown"])
+    assert host_index.bitmap_to_host_names(bitmap) == {"host1", "host3"}
+
+
+@pytest.mark.parametrize("tag_spec,expected_result", [
+    ("lan", {"host1"}),
+    ("unknown", set()),
+    ({
+        "$ne": "lan"
+    }, {"host2", "host3"}),
+    ({
+        "$or": ["lan", "wan"]
+    }, {"host1", "host2"}),
+    ({
+        "$nor": ["lan", "wan"]
+    }, {"host3"}),
+    ({
+        "$or": ["dmz", {
+            "$ne": "test"
+        }]
+    }, {"host1", "host3"}),
+])
+def test_host_bitmap_index_tag_spec(host_index, tag_spec, expected_result):
+    assert host_index.bitmap_to_host_names(host_index.tag_spec_bitmap(tag_spec)) == expected_result
+
+
+@pytest.mark.parametrize("host_entries,expected_result", [
+    (["host1", "unknown"], {"host1"}),
+    ([{
+        "$regex": "host[12]"
+    }], {"host1", "host2"}),
+    ({
+        "$nor": ["host1"]
+    }, {"host2", "host3"}),
+    ({
+        "$nor": [{
+            "$regex": ".*3$"
+        }, "host2"]
+    }, {"host1"}),
+])
+def test_host_bitmap_index_host_list(host_index, host_entries, expected_result):
+    assert host_index.bitmap_to_host_names(
+        host_index.host_list_bitmap(host_entries)) == expected_result
+
+
+@pytest.mark.parametrize("folder_path,expected_result", [
+    ("/", {"host1", "host2", "host3"}),
+    ("/wato/sub/", {"host2", "host3"}),
+    ("/wato/other/", set()),
+])
+def test_host_bitmap_index_folder(host_index, folder_path, expected_result):
+    assert host_index.bitmap_to_host_names(host_index.folder_bitmap(folder_path)) == expected_result
+
+
+def test_host_bitmap_index_many_hosts():
+    hosts = set("host%05d" % i for i in range(1000))
+    even_hosts = set(h for h in hosts if int(h[4:]) % 2 == 0)
+    index = HostBitmapIndex(
+        host_tag_lists={h: {"even"} if h in even_hosts else {"odd"} for h in hosts},
+        host_paths={},
+        all_configured_hosts=hosts,
+    )
+    assert index.bitmap_to_host_names(index.tag_spec_bitmap("even")) == even_hosts
+    assert index.bitmap_to_host_names(index.tag_spec_bitmap({"$ne": "even"})) == hosts - even_hosts
+    assert index.bitmap_to_host_names(index.host_names_to_bitmap(even_hosts)) == even_hosts
+
+
+@pytest.mark.parametrize("service_description,expected_result", [
+    (u"CPU load", (0, 2, 3)),
+    (u"CPU utilization", (0, 3)),
+    (u"Interface 1", (1, 3, 4)),
+    (u"Interface 10", (1, 3)),
+    (u"Filesystem /", (3, 4)),
+    (u"Ümlaut", (3, 4)),
+])
+def test_service_conditions_matcher(service_description, expected_result):
+    matcher = ServiceConditionsMatcher([
+        (False, [u"CPU"]),
+        (False, [u"Interface [0-9]+$", u"Interface 1$"]),
+        (False, [u"CPU load$"]),
+        (False, [u""]),
+        (True, [u"CPU", u"Interface 10"]),
+        (True, [u""]),
+    ])
+    assert matcher.matching_rule_indexes(service_description) == expected_result
+
+
+@pytest.mark.parametrize("service_description,expected_result", [
+    (u"CPU load", (0,)),
+    (u"Interface 1", (1,)),
+    (u"bb", (2,)),
+    (u"ab", ()),
+])
+def test_service_conditions_matcher_uncombinable_patterns(service_description, expected_result):
+    matcher = ServiceConditionsMatcher([
+        (False, [u"(?x) C P U"]),
+        (False, [u"Interface 1$"]),
+        (False, [u"(a)\\1", u"(b)\\1"]),
+    ])
+    assert matcher.matching_rule_indexes(service_description) == expected_result
+
+
+def test_service_match_cache_is_bounded(monkeypatch):
+    ts = Scenario().add_host("host1")
+    config_cache = ts.apply(monkeypatch)
+    matcher = config_cache.ruleset_matcher
+    monkeypatch.setattr(matcher, "_service_match_cache_max_size", 2)
+
+    service_ruleset = [{"value": "CPU", "condition": {"service_description": [{"$regex": "CPU"}]}}]
+    for description in [u"CPU load", u"CPU load", u"CPU utilization", u"Memory"]:
+        list(
+            matcher.get_service_ruleset_values(
+                RulesetMatchObject(host_name="host1", service_description=description),
+                ruleset=service_ruleset,
+                is_binary=False))
+
+    assert matcher.get_service_match_cache_stats() == {
+        "hits": 1,
+        "misses": 3,
+        "flushes": 1,
+        "size": 1,
+        "max_size": 2,
+    }
@@ -3,6 +3,14 @@ import pytest
 import cmk.utils.prediction as prediction
 
 
+@pytest.fixture(params=["numpy", "python"])
+def upsampling_implementation(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(prediction, "_numpy", None)
+
+
 @pytest.mark.parametrize("twindow, result", [((0, 0, 0), []),
                                              ((100, 200, 25), [125, 150, 175, 200])])
 def test_rrdtimestamps(twindow, result):
@@ -18,7 +26,7 @@ def test_rrdtimestamps(twindow, result):
      (300, 400, 10), 300, [25, 25, 25, 25, None, None, None, None, 105, 105]),
     ([0, 120, 40, 25, 65, 105], (330, 410, 10), 300, [25, 65, 65, 65, 65, 105, 105, 105]),
 ])
-def test_time_series_upsampling(rrddata, twindow, shift, upsampled):
+def test_time_series_upsampling(upsampling_implementation, rrddata, twindow, shift, upsampled):
     ts = prediction.TimeSeries(rrddata)
     assert ts.bfill_upsample(twindow, shift) == upsampled
 
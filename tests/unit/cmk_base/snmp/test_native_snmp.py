@@ -0,0 +1,368 @@
+# encoding: utf-8
+
+import select
+import socket
+import struct
+import threading
+
+import pytest  # type: ignore
+
+import cmk.utils.paths
+
+import cmk_base.classic_snmp as classic_snmp
+import cmk_base.config as config
+import cmk_base.native_snmp as native_snmp
+import cmk_base.snmp as snmp
+import cmk_base.snmp_utils as snmp_utils
+from cmk_base.exceptions import MKSNMPError
+
+
+def _oid_key(oid):
+    return tuple(int(part) for part in oid.strip(".").split("."))
+
+
+class _SNMPAgent(threading.Thread):
+    """Answers SNMP v1/v2c requests from the given rows of OID, tag and value"""
+
+    def __init__(self, rows, answer=True):
+        super(_SNMPAgent, self).__init__()
+        self.daemon = True
+        self._rows = sorted(rows, key=lambda row: _oid_key(row[0]))
+        self._answer = answer
+        self._stopped = threading.Event()
+        self.requests = []
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.port = self.socket.getsockname()[1]
+
+    def run(self):
+        while not self._stopped.is_set():
+            if not select.select([self.socket], [], [], 0.05)[0]:
+                continue
+
+            data, source = self.socket.recvfrom(65535)
+            message = native_snmp.decode_message(data)
+            self.requests.append((message[2], source))
+            if self._answer:
+                self.socket.sendto(native_snmp.encode_message(self._respond(message)), source)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.socket.close()
+
+    def _respond(self, message):
+        version, community, pdu_type, request_id, _unused_status, max_repetitions, varbinds = message
+        if pdu_type == native_snmp._PDU_GET_REQUEST:
+            answer = [self._get(oid) for oid, _tag, _value in varbinds]
+        elif pdu_type == native_snmp._PDU_GET_NEXT_REQUEST:
+            answer = [self._next(oid) for oid, _tag, _value in varbinds]
+        else:
+            answer = []
+            oid = varbinds[0][0]
+            for _unused_repetition in range(max_repetitions):
+                answer.append(self._next(oid))
+                oid, tag, _value = answer[-1]
+                if tag == native_snmp._TAG_END_OF_MIB_VIEW:
+                    break
+
+        if version == native_snmp._VERSION_1 and any(
+                tag == native_snmp._TAG_END_OF_MIB_VIEW for _oid, tag, _value in answer):
+            return (version, community, native_snmp._PDU_RESPONSE, request_id,
+                    native_snmp._ERROR_NO_SUCH_NAME, 1, varbinds)
+        return (version, community, native_snmp._PDU_RESPONSE, request_id, 0, 0, answer)
+
+    def _get(self, oid):
+        for row_oid, tag, value in self._rows:
+            if row_oid == oid:
+                return row_oid, tag, native_snmp.encode_value(tag, value)
+        return oid, native_snmp._TAG_NO_SUCH_INSTANCE, ""
+
+    def _next(self, oid):
+        key = _oid_key(oid)
+        for row_oid, tag, value in self._rows:
+            if _oid_key(row_oid) > key:
+                return row_oid, tag, native_snmp.encode_value(tag, value)
+        return oid, native_snmp._TAG_END_OF_MIB_VIEW, ""
+
+
+_ROWS = [
+    (".1.3.6.1.2.1.1.1.0", native_snmp._TAG_OCTET_STRING, "Linux \xc3\xbc"),
+    (".1.3.6.1.2.1.1.2.0", native_snmp._TAG_OID, ".1.3.6.1.4.1.8072.3.2.10"),
+    (".1.3.6.1.2.1.2.2.1.1.1", native_snmp._TAG_INTEGER, "1"),
+    (".1.3.6.1.2.1.2.2.1.1.2", native_snmp._TAG_INTEGER, "2"),
+    (".1.3.6.1.2.1.2.2.1.1.3", native_snmp._TAG_INTEGER, "-3"),
+    (".1.3.6.1.2.1.2.2.1.2.1", native_snmp._TAG_OCTET_STRING, "lo"),
+    (".1.3.6.1.2.1.2.2.1.2.2", native_snmp._TAG_OCTET_STRING, "eth0"),
+    (".1.3.6.1.2.1.2.2.1.2.3", native_snmp._TAG_OCTET_STRING, ""),
+    (".1.3.6.1.2.1.2.2.1.10.1", native_snmp._TAG_COUNTER32, "4294967295"),
+    (".1.3.6.1.2.1.2.2.1.10.2", native_snmp._TAG_COUNTER32, "128"),
+    (".1.3.6.1.2.1.4.20.1.1.127.0.0.1", native_snmp._TAG_IP_ADDRESS, "127.0.0.1"),
+    (".1.3.6.1.2.1.31.1.1.1.6.2", native_snmp._TAG_COUNTER64, "18446744073709551615"),
+]
+
+
+@pytest.fixture()
+def agent():
+    snmp_agent = _SNMPAgent(_ROWS)
+    snmp_agent.start()
+    yield snmp_agent
+    snmp_agent.stop()
+    native_snmp.cleanup_sessions()
+
+
+def _snmp_config(port, is_bulkwalk_host=True, is_snmpv2=True, bulk_walk_size_of=10):
+    return snmp_utils.SNMPHostConfig(
+        is_ipv6_primary=False,
+        hostname="localhost",
+        ipaddress="127.0.0.1",
+        credentials="public",
+        port=port,
+        is_bulkwalk_host=is_bulkwalk_host,
+        is_snmpv2or3_without_bulkwalk_host=is_snmpv2,
+        bulk_walk_size_of=bulk_walk_size_of,
+        timing={
+            "timeout": 0.2,
+            "retries": 1
+        },
+        oid_range_limits=[],
+        snmpv3_contexts=[],
+        character_encoding=None,
+        is_usewalk_host=False,
+        is_inline_snmp_host=False,
+    )
+
+
+@pytest.mark.parametrize("is_bulkwalk_host,is_snmpv2,expected_pdu_type,expected_requests", [
+    (True, False, native_snmp._PDU_GET_BULK_REQUEST, 3),
+    (False, True, native_snmp._PDU_GET_NEXT_REQUEST, 9),
+    (False, False, native_snmp._PDU_GET_NEXT_REQUEST, 9),
+])
+def test_walk(agent, is_bulkwalk_host, is_snmpv2, expected_pdu_type, expected_requests):
+    snmp_config = _snmp_config(
+        agent.port,
+        is_bulkwalk_host=is_bulkwalk_host,
+        is_snmpv2=is_snmpv2,
+        bulk_walk_size_of=4,
+    )
+    rows = native_snmp.NativeSNMPBackend().walk(snmp_config, ".1.3.6.1.2.1.2.2.1")
+    assert rows == [
+        (".1.3.6.1.2.1.2.2.1.1.1", "1"),
+        (".1.3.6.1.2.1.2.2.1.1.2", "2"),
+        (".1.3.6.1.2.1.2.2.1.1.3", "-3"),
+        (".1.3.6.1.2.1.2.2.1.2.1", "lo"),
+        (".1.3.6.1.2.1.2.2.1.2.2", "eth0"),
+        (".1.3.6.1.2.1.2.2.1.2.3", ""),
+        (".1.3.6.1.2.1.2.2.1.10.1", "4294967295"),
+        (".1.3.6.1.2.1.2.2.1.10.2", "128"),
+    ]
+    assert [pdu_type for pdu_type, _source in agent.requests] == \
+        [expected_pdu_type] * expected_requests
+
+
+@pytest.mark.parametrize("oid,expected", [
+    (".1.3.6.1.2.1.1", [
+        (".1.3.6.1.2.1.1.1.0", "Linux \xc3\xbc"),
+        (".1.3.6.1.2.1.1.2.0", ".1.3.6.1.4.1.8072.3.2.10"),
+    ]),
+    (".1.3.6.1.2.1.4.20.1.1", [(".1.3.6.1.2.1.4.20.1.1.127.0.0.1", "127.0.0.1")]),
+    (".1.3.6.1.2.1.31.1.1.1.6", [(".1.3.6.1.2.1.31.1.1.1.6.2", "18446744073709551615")]),
+    (".1.3.6.1.2.1.1.1.0", [(".1.3.6.1.2.1.1.1.0", "Linux \xc3\xbc")]),
+    (".1.3.6.1.2.1.99", []),
+    (".1.3.6.1.2.1.31.1.1.1.6.2", [(".1.3.6.1.2.1.31.1.1.1.6.2", "18446744073709551615")]),
+])
+def test_walk_values(agent, oid, expected):
+    assert native_snmp.NativeSNMPBackend().walk(_snmp_config(agent.port), oid) == expected
+
+
+def test_walk_many_uses_one_session(agent):
+    snmp_config = _snmp_config(agent.port, bulk_walk_size_of=2)
+    backend = native_snmp.NativeSNMPBackend()
+    oids = [".1.3.6.1.2.1.2.2.1.1", ".1.3.6.1.2.1.2.2.1.2", ".1.3.6.1.2.1.2.2.1.10"]
+    walks = backend.walk_many(snmp_config, oids)
+    # Two rounds of concurrent requests, one for each walk
+    assert len(agent.requests) == 2 * len(oids)
+
+    assert backend.get(snmp_config, ".1.3.6.1.2.1.1.1.0") == "Linux \xc3\xbc"
+    assert walks == dict((oid, backend.walk(snmp_config, oid)) for oid in oids)
+    assert len(set(source for _pdu_type, source in agent.requests)) == 1
+
+    native_snmp.cleanup_sessions()
+    backend.get(snmp_config, ".1.3.6.1.2.1.1.1.0")
+    assert len(set(source for _pdu_type, source in agent.requests)) == 2
+
+
+@pytest.mark.parametrize("oid,expected", [
+    (".1.3.6.1.2.1.1.2.0", ".1.3.6.1.4.1.8072.3.2.10"),
+    (".1.3.6.1.2.1.1.3.0", None),
+    (".1.3.6.1.2.1.2.2.1.2.*", "lo"),
+    (".1.3.6.1.2.1.2.2.1.5.*", None),
+])
+def test_get(agent, oid, expected):
+    assert native_snmp.NativeSNMPBackend().get(_snmp_config(agent.port), oid) == expected
+
+
+def test_timeout():
+    snmp_agent = _SNMPAgent(_ROWS, answer=False)
+    snmp_agent.start()
+    try:
+        with pytest.raises(MKSNMPError, match="Timeout"):
+            native_snmp.NativeSNMPBackend().walk(_snmp_config(snmp_agent.port), ".1.3.6.1")
+        assert len(snmp_agent.requests) == 2
+    finally:
+        snmp_agent.stop()
+        native_snmp.cleanup_sessions()
+
+
+def test_walk_like_stored_walk(monkeypatch, tmp_path):
+    (tmp_path / "localhost").write_bytes(b"\n".join([
+        b".1.2.3.1.1 1",
+        b".1.2.3.1.2 2",
+        b".1.2.3.2.1 eth0",
+        b".1.2.3.2.2 eth1",
+        b".1.2.3.3.2 up",
+        b".1.2.30.1 other table",
+        b"",
+    ]))
+    monkeypatch.setattr(cmk.utils.paths, "snmpwalks_dir", str(tmp_path))
+    monkeypatch.setattr(snmp, "_g_walk_cache", {})
+    stored_walk_backend = snmp.StoredWalkSNMPBackend()
+    snmp_config = _snmp_config(0)
+
+    rows = stored_walk_backend.walk(snmp_config, ".1")
+    snmp_agent = _SNMPAgent([(oid, native_snmp._TAG_OCTET_STRING, value) for oid, value in rows])
+    snmp_agent.start()
+    try:
+        snmp_config = _snmp_config(snmp_agent.port, bulk_walk_size_of=3)
+        for oid in [".1.2.3", ".1.2.3.1", ".1.2.3.3", ".1.2.30", ".1.2.3.4"]:
+            assert native_snmp.NativeSNMPBackend().walk(snmp_config, oid) == \
+                stored_walk_backend.walk(snmp_config, oid)
+    finally:
+        snmp_agent.stop()
+        native_snmp.cleanup_sessions()
+
+
+class _NetSNMPProcess(object):
+    def __init__(self, stdout):
+        super(_NetSNMPProcess, self).__init__()
+        self.stdout = stdout
+
+
+# The varbind values and their output by snmpwalk -OQ -OU -On -Ot
+@pytest.mark.parametrize("tag,value,output", [
+    (native_snmp._TAG_OCTET_STRING, "  eth0 ", '"  eth0 "'),
+    (native_snmp._TAG_OCTET_STRING, "", '""'),
+    (native_snmp._TAG_OCTET_STRING, "c:\\", '"c:\\\\"'),
+    (native_snmp._TAG_OCTET_STRING, 'say "hi"', '"say \\"hi\\""'),
+    (native_snmp._TAG_OCTET_STRING, "first \n  second", '"first \n  second"'),
+    (native_snmp._TAG_OCTET_STRING, "01 02 ", '"01 02 "'),
+    (native_snmp._TAG_OCTET_STRING, "Linux \xc3\xbc", '"4C 69 6E 75 78 20 C3 BC "'),
+    (native_snmp._TAG_OCTET_STRING, "\x00\x01\xff", '"00 01 FF "'),
+    (native_snmp._TAG_OPAQUE, "\x9f\x78\x04" + struct.pack(">f", 1.5), "1.500000"),
+    (native_snmp._TAG_OPAQUE, "\x9f\x79\x08" + struct.pack(">d", -0.25), "-0.250000"),
+    (native_snmp._TAG_OPAQUE, "\x9f\x76\x02\x01\x00", "256"),
+    (native_snmp._TAG_OPAQUE, "\x9f\x7a\x01\xff", "-1"),
+    (native_snmp._TAG_OPAQUE, "\x01\x02\xab", "01 02 AB "),
+    (native_snmp._TAG_INTEGER, "\xfd", "-3"),
+    (native_snmp._TAG_COUNTER32, "\x00\xff", "255"),
+])
+def test_decode_value_like_classic_backend(tmp_path, tag, value, output):
+    output_path = tmp_path / "snmpwalk"
+    output_path.write_bytes(b".1.3.6.1.2.1.1.1.0 = %s\n" % output)  # pylint: disable=no-member
+    with open(str(output_path), "rb") as stdout:
+        rows = classic_snmp.ClassicSNMPBackend()._get_rowinfo_from_snmp_process(
+            _NetSNMPProcess(stdout))
+
+    assert rows == [(".1.3.6.1.2.1.1.1.0", native_snmp._decode_value(tag, value))]
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 255, 256, -1, -128, -129, 2**31 - 1, -2**31])
+def test_encode_integer(value):
+    tag, encoded, _end = native_snmp._decode_tlv(native_snmp._encode_integer(value), 0)
+    assert tag == native_snmp._TAG_INTEGER
+    assert native_snmp._decode_integer(encoded) == value
+
+
+@pytest.mark.parametrize("oid", [".1.3", ".1.3.6.1.4.1.8072.3.2.10", ".2.999.128.16384", ".0.0"])
+def test_encode_oid(oid):
+    tag, encoded, _end = native_snmp._decode_tlv(native_snmp._encode_oid(oid), 0)
+    assert tag == native_snmp._TAG_OID
+    assert native_snmp._decode_oid(encoded) == oid
+
+
+def test_encode_long_value():
+    value = "x" * 300
+    assert native_snmp._decode_tlv(
+        native_snmp._encode_tlv(native_snmp._TAG_OCTET_STRING, value),
+        0) == (native_snmp._TAG_OCTET_STRING, value, 304)
+
+
+@pytest.mark.parametrize("use_native_snmp,credentials,expected", [
+    (False, "public", "ClassicSNMPBackend"),
+    (True, "public", "NativeSNMPBackend"),
+    (True, ("noAuthNoPriv", "user"), "ClassicSNMPBackend"),
+])
+def test_backend_factory(monkeypatch, use_native_snmp, credentials, expected):
+    monkeypatch.setattr(config, "use_native_snmp", use_native_snmp)
+    snmp_config = _snmp_config(161)._replace(credentials=credentials)
+    backend = snmp.SNMPBackendFactory.factory(snmp_config, enforce_stored_walks=False)
+    assert type(backend).__name__ == expected
+
+
+def test_walk_hosts():
+    agents = [_SNMPAgent(_ROWS), _SNMPAgent(_ROWS, answer=False), _SNMPAgent(_ROWS[:2])]
+    for snmp_agent in agents:
+        snmp_agent.start()
+    try:
+        oids = [".1.3.6.1.2.1.1", ".1.3.6.1.2.1.2.2.1.2"]
+        jobs = [(_snmp_config(snmp_agent.port)._replace(hostname="host%d" % index), oids)
+                for index, snmp_agent in enumerate(agents)]
+        results = native_snmp.walk_hosts(jobs, max_concurrent_hosts=2)
+    finally:
+        for snmp_agent in agents:
+            snmp_agent.stop()
+
+    assert len(results) == 3
+    assert results[0] == {
+        ".1.3.6.1.2.1.1": [
+            (".1.3.6.1.2.1.1.1.0", "Linux \xc3\xbc"),
+            (".1.3.6.1.2.1.1.2.0", ".1.3.6.1.4.1.8072.3.2.10"),
+        ],
+        ".1.3.6.1.2.1.2.2.1.2": [
+            (".1.3.6.1.2.1.2.2.1.2.1", "lo"),
+            (".1.3.6.1.2.1.2.2.1.2.2", "eth0"),
+            (".1.3.6.1.2.1.2.2.1.2.3", ""),
+        ],
+    }
+    assert isinstance(results[1], MKSNMPError)
+    assert "host1" in str(results[1])
+    assert results[2] == {
+        ".1.3.6.1.2.1.1": [
+            (".1.3.6.1.2.1.1.1.0", "Linux \xc3\xbc"),
+            (".1.3.6.1.2.1.1.2.0", ".1.3.6.1.4.1.8072.3.2.10"),
+        ],
+        ".1.3.6.1.2.1.2.2.1.2": [],
+    }
+
+
+def test_prefetch_walks(monkeypatch, agent):
+    monkeypatch.setattr(config, "use_native_snmp", True)
+    monkeypatch.setattr(config, "snmp_concurrent_hosts", 10)
+    monkeypatch.setattr(config, "snmp_table_walk_min_columns", None)
+    snmp_config = _snmp_config(agent.port)
+    oid_info = (".1.3.6.1.2.1.2.2.1", [snmp_utils.OID_END, "2", "10"])
+
+    snmp.prefetch_walks([(snmp_config, [oid_info])])
+    num_requests = len(agent.requests)
+    assert num_requests > 0
+
+    snmp.initialize_subtree_cache(snmp_config, [oid_info])
+    try:
+        table = snmp.get_snmp_table(snmp_config, "if", oid_info, use_snmpwalk_cache=False)
+    finally:
+        snmp.cleanup_subtree_cache()
+    assert len(agent.requests) == num_requests
+
+    assert table == snmp.get_snmp_table(snmp_config, "if", oid_info, use_snmpwalk_cache=False)
+    assert table == [[u"1", u"lo", u"4294967295"], [u"2", u"eth0", u"128"], [u"3", u"", u""]]
+    assert len(agent.requests) > num_requests
@@ -3,8 +3,11 @@
 import pytest  # type: ignore
 from testlib.base import Scenario
 
+import cmk.utils.paths
+
 import cmk_base.config as config
 import cmk_base.snmp as snmp
+import cmk_base.snmp_utils as snmp_utils
 
 
 @pytest.mark.parametrize(
@@ -38,3 +41,121 @@ def test_is_bulkwalk_host(monkeypatch):
     config_cache = ts.apply(monkeypatch)
     assert config_cache.get_host_config("abc").snmp_config("").is_bulkwalk_host is False
     assert config_cache.get_host_config("localhost").snmp_config("").is_bulkwalk_host is True
+
+
+@pytest.fixture()
+def stored_walk(monkeypatch, tmp_path):
+    (tmp_path / "localhost").write_bytes(b"\n".join([
+        b".1.2.3.1.1 1",
+        b".1.2.3.1.2 2",
+        b".1.2.3.2.1 eth0",
+        b".1.2.3.2.2 eth1",
+        b".1.2.3.3.2 up",
+        b".1.2.3.4.1 not needed",
+        b".1.2.30.1 other table",
+        b"",
+    ]))
+    monkeypatch.setattr(cmk.utils.paths, "snmpwalks_dir", str(tmp_path))
+    monkeypatch.setattr(snmp, "_g_walk_cache", {})
+
+    walks = []
+    orig_walk = snmp.StoredWalkSNMPBackend.walk
+
+    def walk(self, snmp_config, oid, *args, **kwargs):
+        walks.append(oid)
+        return orig_walk(self, snmp_config, oid, *args, **kwargs)
+
+    monkeypatch.setattr(snmp.StoredWalkSNMPBackend, "walk", walk)
+    return walks
+
+
+def _stored_walk_snmp_config(monkeypatch, min_columns):
+    ts = Scenario().add_host("localhost")
+    ts.set_ruleset("usewalk_hosts", [
+        (["localhost"], {}),
+    ])
+    ts.set_option("snmp_table_walk_min_columns", min_columns)
+    config_cache = ts.apply(monkeypatch)
+    return config_cache.get_host_config("localhost").snmp_config("")
+
+
+@pytest.mark.parametrize("min_columns,expected_walks", [
+    (None, [".1.2.3.1", ".1.2.3.2", ".1.2.3.3", ".1.2.3.2"]),
+    (3, [".1.2.3", ".1.2.3.2"]),
+    (4, [".1.2.3.1", ".1.2.3.2", ".1.2.3.3", ".1.2.3.2"]),
+])
+def test_get_snmp_table_walks_table(monkeypatch, stored_walk, min_columns, expected_walks):
+    snmp_config = _stored_walk_snmp_config(monkeypatch, min_columns)
+
+    table = snmp.get_snmp_table(
+        snmp_config,
+        "check_plugin_name", (".1.2.3", [snmp_utils.OID_END, "1", "2", "3", ("cached", "2")]),
+        use_snmpwalk_cache=False)
+    assert table == [
+        [u"1", u"1", u"eth0", u"", u"eth0"],
+        [u"2", u"2", u"eth1", u"up", u"eth1"],
+    ]
+    assert stored_walk == expected_walks
+
+
+@pytest.mark.parametrize(
+    "oid_info,expected_walks",
+    [
+        ((".1.2", ["3.1", "3.2"]), [".1.2.3"]),
+        # The columns are not in the same table entry: Never walk their common prefix
+        ((".1.2", ["3.1", "3.2", "30"]), [".1.2.3.1", ".1.2.3.2", ".1.2.30"]),
+    ])
+def test_get_snmp_table_walks_table_entry_only(monkeypatch, stored_walk, oid_info, expected_walks):
+    snmp_config = _stored_walk_snmp_config(monkeypatch, 2)
+    snmp.get_snmp_table(snmp_config, "check_plugin_name", oid_info, use_snmpwalk_cache=False)
+    assert stored_walk == expected_walks
+
+
+def test_split_table_walk():
+    rows = [
+        (".1.2.1.1", "a"),
+        (".1.2.1.2.1", "b"),
+        (".1.2.10.1", "c"),
+        (".1.2.3", "d"),
+    ]
+    assert snmp._split_table_walk(".1.2", rows, [".1.2.1", ".1.2.1.2", ".1.2.3", ".1.2.4"]) == {
+        ".1.2.1": [(".1.2.1.1", "a"), (".1.2.1.2.1", "b")],
+        ".1.2.1.2": [(".1.2.1.2.1", "b")],
+        ".1.2.3": [(".1.2.3", "d")],
+        ".1.2.4": [],
+    }
+
+
+def test_subtree_cache(monkeypatch, stored_walk):
+    snmp_config = _stored_walk_snmp_config(monkeypatch, 3)
+
+    tree_info = (".1", ["2"])
+    table_info = (".1.2.3", [snmp_utils.OID_END, "1", "2", "3"])
+    column_info = (".1.2.3", [snmp_utils.OID_END, "2"])
+    entry_info = (".1.2", ["3"])
+
+    snmp.initialize_subtree_cache(snmp_config, [tree_info, table_info, column_info, [entry_info]])
+    try:
+        assert len(snmp.get_snmp_table(snmp_config, "tree", tree_info, False)) == 7
+        assert snmp.get_snmp_table(snmp_config, "table", table_info, False) == [
+            [u"1", u"1", u"eth0", u""],
+            [u"2", u"2", u"eth1", u"up"],
+        ]
+        assert snmp.get_snmp_table(snmp_config, "column", column_info, False) == [
+            [u"1", u"eth0"],
+            [u"2", u"eth1"],
+        ]
+        assert snmp.get_snmp_table(snmp_config, "entry", entry_info, False) == [
+            [u"1"],
+            [u"2"],
+            [u"eth0"],
+            [u"eth1"],
+            [u"up"],
+            [u"not needed"],
+        ]
+    finally:
+        snmp.cleanup_subtree_cache()
+
+    # The tables are not answered from the walk of the wider subtree .1.2, but the column
+    # and the entry are answered from the walk of the table entry .1.2.3
+    assert stored_walk == [".1.2", ".1.2.3"]
@@ -3,6 +3,8 @@
 import pytest  # type: ignore
 from testlib.base import Scenario
 
+import cmk.utils.paths
+import cmk.utils.store as store
 import cmk_base.config as config
 import cmk_base.check_utils
 import cmk_base.check_api as check_api
@@ -258,3 +260,61 @@ def test_filter_by_management_board_dual_host_with_SNMP_mgmt_board(monkeypatch,
     assert config.filter_by_management_board(
         "this_host", found_check_plugins, True,
         for_discovery=for_discovery) == set(mgmt_board_result)
+
+
+############ Loading checks on demand
+
+
+@pytest.fixture()
+def plugin_index(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    config.load_all_checks(check_api.get_check_api_context)
+    config.save_plugin_index()
+    return tmp_path / "plugin_index.mk"
+
+
+def test_load_checks_on_demand(plugin_index):
+    porttypes = config.get_check_variables()["if_inventory_porttypes"]
+
+    config.load_checks_on_demand(check_api.get_check_api_context)
+    assert config.any_check_loaded()
+    assert config.checks_loaded_on_demand()
+    assert "uptime" not in config.check_info
+    assert config.get_check_variables()["if_inventory_porttypes"] == porttypes
+
+    assert cmk_base.check_utils.is_tcp_check("uptime")
+    assert cmk_base.check_utils.is_snmp_check("snmp_uptime")
+
+
+def test_load_checks_of(plugin_index):
+    config.load_checks_on_demand(check_api.get_check_api_context)
+    config.set_check_variables({"if_inventory_porttypes": ["6"]})
+
+    config.load_checks_of(["uptime", "if64"])
+    assert "uptime" in config.check_info
+    assert "if64" in config.check_info
+    assert "snmp_uptime" not in config.check_info
+    assert config.get_check_context("if64")["if_inventory_porttypes"] == ["6"]
+
+    config.load_checks_of_sections(["snmp_uptime"])
+    assert "snmp_uptime" in config.check_info
+
+    config.load_remaining_checks()
+    assert config.all_checks_loaded()
+    assert not config.checks_loaded_on_demand()
+
+
+def test_load_checks_on_demand_outdated_index(plugin_index):
+    index = store.load_data_from_file(str(plugin_index))
+    index["files"][0]["mtime"] -= 1
+    store.save_data_to_file(str(plugin_index), index)
+
+    config.load_checks_on_demand(check_api.get_check_api_context)
+    assert config.all_checks_loaded()
+    assert "uptime" in config.check_info
+
+
+def test_load_checks_on_demand_without_index(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    config.load_checks_on_demand(check_api.get_check_api_context)
+    assert config.all_checks_loaded()
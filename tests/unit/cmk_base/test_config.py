@@ -1626,3 +1626,74 @@ def test_host_config_service_level(monkeypatch, hostname, result):
     )
     config_cache = ts.apply(monkeypatch)
     assert config_cache.get_host_config(hostname).service_level == result
+
+
+def _packed_config_scenario(monkeypatch):
+    ts = Scenario().add_host("testhost1").add_host("testhost2")
+    ts.add_host("remotehost", tags={"site": "remote"})
+    ts.add_cluster("cluster", nodes=["testhost1", "testhost2"])
+    ts.set_ruleset("agent_ports", [
+        (1337, [], ["testhost2", "remotehost"], {}),
+    ])
+    config_cache = ts.apply(monkeypatch)
+    assert config_cache.get_host_config("testhost1").agent_port == 6556
+    return config_cache
+
+
+def test_packed_config_snapshot(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    _packed_config_scenario(monkeypatch)
+
+    config.PackedConfig().save()
+    assert (tmp_path / "base" / "precompiled_check_config.mk").exists()
+    assert (tmp_path / "base" / "precompiled_check_config.snapshot").exists()
+
+    monkeypatch.setattr(config, "all_hosts", [])
+    config.PackedConfig().load()
+
+    config_cache = config.get_config_cache()
+    assert config_cache.all_active_hosts() == set(["testhost1", "testhost2", "cluster"])
+    assert config_cache.all_configured_hosts() == set(["testhost1", "testhost2", "cluster"])
+    assert config_cache.nodes_of("cluster") == ["testhost1", "testhost2"]
+
+    # The host ruleset has already been processed for the hosts of this site
+    optimizer = config_cache.ruleset_matcher.ruleset_optimizer
+    assert (id(config.agent_ports), False) in optimizer.processed_rulesets()[0]
+    assert config_cache.get_host_config("testhost2").agent_port == 1337
+    assert config_cache.get_host_config("testhost1").agent_port == 6556
+
+
+def test_packed_config_without_snapshot(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    _packed_config_scenario(monkeypatch)
+
+    config.PackedConfig().save()
+    (tmp_path / "base" / "precompiled_check_config.snapshot").unlink()
+
+    monkeypatch.setattr(config, "all_hosts", [])
+    config.PackedConfig().load()
+
+    config_cache = config.get_config_cache()
+    assert config_cache.all_active_hosts() == set(["testhost1", "testhost2", "cluster"])
+    assert config_cache.get_host_config("testhost2").agent_port == 1337
+
+
+@pytest.mark.parametrize("broken_content", [
+    b"",
+    b"\x80\x02}q\x01(U\x07version",
+    b"no pickle at all",
+])
+def test_packed_config_broken_snapshot(monkeypatch, tmp_path, broken_content):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    _packed_config_scenario(monkeypatch)
+
+    config.PackedConfig().save()
+    with (tmp_path / "base" / "precompiled_check_config.snapshot").open("wb") as f:
+        f.write(broken_content)
+
+    monkeypatch.setattr(config, "all_hosts", [])
+    config.PackedConfig().load()
+
+    config_cache = config.get_config_cache()
+    assert config_cache.all_active_hosts() == set(["testhost1", "testhost2", "cluster"])
+    assert config_cache.get_host_config("testhost2").agent_port == 1337
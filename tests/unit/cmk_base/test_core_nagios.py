@@ -6,6 +6,8 @@ from StringIO import StringIO
 import pytest  # type: ignore
 from testlib.base import Scenario
 
+import cmk.utils.paths
+import cmk_base.config as config
 import cmk_base.core_config as core_config
 import cmk_base.core_nagios as core_nagios
 
@@ -187,3 +189,66 @@ def test_create_nagios_host_spec(hostname, result, monkeypatch):
 
     host_spec = core_nagios._create_nagios_host_spec(cfg, config_cache, hostname, host_attrs)
     assert host_spec == result
+
+
+def test_create_config_incremental(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    monkeypatch.setattr(cmk.utils.paths, "autochecks_dir", str(tmp_path / "autochecks"))
+
+    ts = Scenario().add_host("host1")
+    ts.add_host("host2")
+    ts.set_option("ipaddresses", {"host1": "127.0.0.1", "host2": "127.0.0.2"})
+    ts.set_option("nagios_incremental_config", True)
+    ts.apply(monkeypatch)
+
+    created = []
+    orig_create_nagios_config_host = core_nagios._create_nagios_config_host
+
+    def _create_nagios_config_host(cfg, config_cache, hostname, host_attrs):
+        created.append(hostname)
+        orig_create_nagios_config_host(cfg, config_cache, hostname, host_attrs)
+
+    monkeypatch.setattr(core_nagios, "_create_nagios_config_host", _create_nagios_config_host)
+
+    def create_config():
+        outfile = StringIO()
+        core_nagios.create_config(outfile, hostnames=None)
+        return outfile.getvalue()
+
+    initial_config = create_config()
+    assert "127.0.0.2" in initial_config
+    assert sorted(created) == ["host1", "host2"]
+
+    del created[:]
+    assert create_config() == initial_config
+    assert created == []
+
+    ts.set_option("ipaddresses", {"host1": "127.0.0.1", "host2": "127.0.0.3"})
+    ts.apply(monkeypatch)
+    changed_config = create_config()
+    assert created == ["host2"]
+    assert changed_config == initial_config.replace("127.0.0.2", "127.0.0.3")
+
+    monkeypatch.setattr(config, "nagios_incremental_config", False)
+    assert create_config() == changed_config
+
+
+def test_create_config_processes(monkeypatch):
+    ts = Scenario()
+    ipaddresses = {}
+    for index in range(10):
+        hostname = "host%d" % index
+        ts.add_host(hostname)
+        ipaddresses[hostname] = "127.0.0.%d" % (index + 1)
+    ts.set_option("ipaddresses", ipaddresses)
+    ts.apply(monkeypatch)
+
+    def create_config():
+        outfile = StringIO()
+        core_nagios.create_config(outfile, hostnames=None)
+        return outfile.getvalue()
+
+    sequential_config = create_config()
+
+    monkeypatch.setattr(config, "nagios_config_processes", 3)
+    assert create_config() == sequential_config
@@ -1,5 +1,8 @@
 # pylint: disable=redefined-outer-name
 
+import socket
+import threading
+
 import pytest  # type: ignore
 from testlib.base import Scenario
 
@@ -225,3 +228,106 @@ def test_data_sources_of_hosts(monkeypatch, hostname, settings):
     sources = cmk_base.data_sources.DataSources(hostname, "127.0.0.1")
     source_names = [s.__class__.__name__ for s in sources.get_data_sources()]
     assert settings["sources"] == source_names, "Wrong sources for %s" % hostname
+
+
+def test_tcpdatasource_parse_info(monkeypatch):
+    Scenario().add_host("hostname").apply(monkeypatch)
+    source = cmk_base.data_sources.tcp.TCPDataSource("hostname", "ipaddress")
+
+    raw_data = "\r\n".join([
+        "ignored",
+        "<<<section_a>>>",
+        "  a  1 ",
+        "",
+        "<<<section_b:sep(59):cached(1000,300)>>>",
+        " b;2 ",
+        "<<<<piggy host>>>>",
+        "<<<section_p>>>",
+        " p 1",
+        "<<<<>>>>",
+        "<<<section_a:nostrip>>>",
+        " \xe4 2",
+        "<<<<hostname>>>>",
+        " a 3",
+        "",
+    ])
+    host_sections = source._parse_info(raw_data)
+
+    assert host_sections.sections == {
+        "section_a": [[u"a", u"1"], [u"\xe4", u"2"], [u"a", u"3"]],
+        "section_b": [[u"b", u"2"]],
+    }
+    assert host_sections.cache_info == {"section_b": (1000, 300)}
+    assert "\n".join(host_sections.piggybacked_raw_data["piggy_host"]) \
+        == "<<<section_p>>>\n p 1"
+
+
+def _fake_agent(output):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def serve():
+        connection = server.accept()[0]
+        connection.sendall(output)
+        connection.close()
+        server.close()
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return ("127.0.0.1", server.getsockname()[1])
+
+
+def _unused_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_fetch_agent_outputs():
+    outputs = ["<<<check_mk>>>\nVersion: 1.6.0\n", "<<<df>>>\n" + "x" * 500000, ""]
+    jobs = [(socket.AF_INET, _fake_agent(output), 5.0) for output in outputs]
+    jobs.insert(1, (socket.AF_INET, ("127.0.0.1", _unused_port()), 5.0))
+
+    results = cmk_base.data_sources.tcp.fetch_agent_outputs(jobs, 2)
+
+    assert results[0] == outputs[0]
+    assert isinstance(results[1], socket.error)
+    assert results[2:] == outputs[1:]
+
+
+def _encrypt(data, passphrase):
+    from Cryptodome.Cipher import AES
+    from hashlib import md5
+
+    d = d_i = ''
+    while len(d) < 32 + AES.block_size:
+        d_i = md5(d_i + passphrase).digest()
+        d += d_i
+    key, iv = d[:32], d[32:32 + AES.block_size]
+
+    padding = AES.block_size - len(data) % AES.block_size
+    return AES.new(key, AES.MODE_CBC, iv).encrypt(data + chr(padding) * padding)
+
+
+def test_tcpdatasource_prefetch_encrypted_output(monkeypatch):
+    ts = Scenario().add_host("hostname")
+    ts.set_ruleset("agent_encryption", [
+        ({
+            "use_regular": "enforce",
+            "passphrase": "secret"
+        }, [], ["hostname"], {}),
+    ])
+    ts.apply(monkeypatch)
+
+    output = "<<<check_mk>>>\nVersion: 1.6.0\n"
+    address, port = _fake_agent("00" + _encrypt(output, "secret"))
+
+    source = cmk_base.data_sources.tcp.TCPDataSource("hostname", address)
+    source.set_port(port)
+    cmk_base.data_sources.tcp.TCPDataSource.prefetch_outputs([source], 0)
+    assert source._prefetched_output is not None
+    assert source._execute() == output
@@ -0,0 +1,67 @@
+# encoding: utf-8
+
+import pytest  # type: ignore
+
+from cmk_base import events
+
+
+class FakeLivestatusConnection(object):
+    def __init__(self, services, hosts):
+        self._services = services
+        self._hosts = hosts
+        self.queries = []
+
+    def query(self, query):
+        self.queries.append(query)
+        host_name = query.split("\n")[1].split(" = ")[1]
+        if query.startswith("GET services"):
+            return [[description, contacts, self._hosts[host_name]]
+                    for (host, description), contacts in sorted(self._services.items())
+                    if host == host_name]
+        if host_name in self._hosts:
+            return [[self._hosts[host_name]]]
+        return []
+
+
+@pytest.fixture()
+def connection(monkeypatch):
+    connection = FakeLivestatusConnection(
+        {
+            ("switch", "Interface 1"): ["netadmin", "check-mk-notify"],
+            ("switch", "Interface 2"): ["netadmin", "harry"],
+        },
+        {
+            "switch": ["netadmin"],
+            "server": ["admin"],
+        },
+    )
+    monkeypatch.setattr(events, "livestatus_connection", lambda: connection)
+    monkeypatch.setattr(events, "_object_contacts_cache", {})
+    return connection
+
+
+def test_livestatus_fetch_contacts(connection):
+    assert events.livestatus_fetch_contacts("switch", "Interface 1") == ["netadmin"]
+    assert events.livestatus_fetch_contacts("switch", "Interface 2") == ["netadmin", "harry"]
+    assert events.livestatus_fetch_contacts("switch", None) == ["netadmin"]
+    # The contacts of all objects of the host have been fetched with one query
+    assert len(connection.queries) == 1
+
+    # Fallback to the contacts of the host
+    assert events.livestatus_fetch_contacts("server", "CPU load") == ["admin"]
+    assert events.livestatus_fetch_contacts("unknown", None) is None
+
+
+def test_livestatus_fetch_contacts_cache(monkeypatch, connection):
+    monkeypatch.setattr(events.time, "time", lambda: 1000.0)
+    events.livestatus_fetch_contacts("switch", "Interface 1")
+    events.livestatus_fetch_contacts("switch", "Interface 1")
+    assert len(connection.queries) == 1
+
+    # Services which are not cached yet are fetched again
+    events.livestatus_fetch_contacts("switch", "Interface 3")
+    assert len(connection.queries) == 2
+
+    monkeypatch.setattr(events.time, "time", lambda: 1010.0)
+    events.livestatus_fetch_contacts("switch", "Interface 1")
+    assert len(connection.queries) == 3
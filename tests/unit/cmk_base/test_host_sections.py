@@ -1,5 +1,6 @@
 import pytest  # type: ignore
 from testlib.base import Scenario
+import cmk_base.config as config
 import cmk_base.ip_lookup as ip_lookup
 import cmk_base.data_sources.host_sections as host_sections
 
@@ -91,3 +92,69 @@ def test_get_section_content(monkeypatch, hostname, nodes, host_entries, cluster
         hostname, "127.0.0.1", "check_plugin_name", False, service_description=service_descr)
     assert expected_result == section_content,\
            "Section content: Expected '%s' but got '%s'" % (expected_result, section_content)
+
+
+class _Payload(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.decoded = 0
+
+    def decode(self):
+        self.decoded += 1
+        return self.rows
+
+
+def test_host_sections_decode_on_access():
+    payload_a = _Payload([["a1"]])
+    payload_b = _Payload([["b1"]])
+    sections = host_sections.HostSections(
+        sections={"a": [["a0"]]}, section_payloads={
+            "a": [payload_a],
+            "b": [payload_b],
+        })
+
+    assert sorted(sections.section_names()) == ["a", "b"]
+    assert sections.has_section("b")
+    assert not sections.has_section("c")
+
+    assert sections.get_section("a") == [["a0"], ["a1"]]
+    assert sections.get_section("a") == [["a0"], ["a1"]]
+    assert sections.get_section("c") is None
+    assert payload_a.decoded == 1
+    assert payload_b.decoded == 0
+
+    assert sections.sections == {"a": [["a0"], ["a1"]], "b": [["b1"]]}
+    assert payload_b.decoded == 1
+
+
+def test_host_sections_update_keeps_order():
+    sections = host_sections.HostSections(section_payloads={"a": [_Payload([["1"]])]})
+    sections.update(
+        host_sections.HostSections(
+            sections={"a": [["2"]]}, section_payloads={"a": [_Payload([["3"]])]}))
+    assert sections.get_section("a") == [["1"], ["2"], ["3"]]
+
+
+def test_get_section_content_parses_once(monkeypatch):
+    Scenario().add_host("heute").apply(monkeypatch)
+
+    parsed = []
+
+    def parse_function(info):
+        parsed.append(info)
+        return info
+
+    monkeypatch.setitem(config.check_info, "check_plugin_name", {
+        "node_info": False,
+        "extra_sections": [],
+        "parse_function": parse_function,
+    })
+
+    multi_host_sections = host_sections.MultiHostSections()
+    multi_host_sections.add_or_get_host_sections(
+        "heute", "127.0.0.1", host_sections.HostSections(sections={"check_plugin_name": node1}))
+
+    for for_discovery in [True, False, True]:
+        assert multi_host_sections.get_section_content("heute", "127.0.0.1", "check_plugin_name",
+                                                       for_discovery) == node1
+    assert parsed == [node1]
@@ -0,0 +1,146 @@
+# encoding: utf-8
+# pylint: disable=redefined-outer-name
+
+import os
+import pytest  # type: ignore
+
+import cmk.utils.paths
+import cmk_base.config as config
+import cmk_base.item_state as item_state
+
+
+@pytest.fixture(autouse=True)
+def counters_dir(monkeypatch, tmpdir):
+    monkeypatch.setattr(cmk.utils.paths, "counters_dir", str(tmpdir))
+    yield str(tmpdir)
+
+
+@pytest.fixture(params=["repr", "binary"])
+def item_state_store(request, monkeypatch):
+    monkeypatch.setattr(config, "item_state_store", request.param)
+    yield request.param
+
+
+def _update(hostname, updates, removes=None):
+    item_states = item_state.CachedItemStates()
+    item_states.load(hostname)
+    for user_key in removes or []:
+        item_states.clear_item_state(user_key)
+    for user_key, value in updates.items():
+        item_states.set_item_state(user_key, value)
+    item_states.save(hostname)
+
+
+def _load(hostname):
+    item_states = item_state.CachedItemStates()
+    item_states.load(hostname)
+    return item_states.get_all_item_states()
+
+
+@pytest.mark.usefixtures("item_state_store")
+def test_item_states_roundtrip():
+    _update("host", {"ticks": (1234.5, 10), "in": [1, 2.0, u"x"]})
+    _update("host", {"out": {"a": None}}, removes=["ticks"])
+
+    assert _load("host") == {("in",): [1, 2.0, u"x"], ("out",): {"a": None}}
+
+
+@pytest.mark.usefixtures("item_state_store")
+def test_item_states_merge_concurrent_modifications():
+    _update("host", {"a": 1, "b": 2})
+
+    first = item_state.CachedItemStates()
+    first.load("host")
+    second = item_state.CachedItemStates()
+    second.load("host")
+
+    first.set_item_state("a", 10)
+    second.set_item_state("c", 3)
+    second.clear_item_state("b")
+    first.save("host")
+    second.save("host")
+
+    assert _load("host") == {("a",): 10, ("c",): 3}
+
+
+@pytest.mark.usefixtures("item_state_store")
+def test_item_states_set_and_cleared_in_one_cycle():
+    _update("host", {"a": 1, "b": 2})
+
+    item_states = item_state.CachedItemStates()
+    item_states.load("host")
+    item_states.set_item_state("a", 5)
+    item_states.clear_item_state("a")
+    item_states.save("host")
+
+    assert _load("host") == {("b",): 2}
+
+
+def test_binary_store_decodes_on_demand(monkeypatch):
+    monkeypatch.setattr(config, "item_state_store", "binary")
+    _update("host", {"a": 1, "b": 2})
+
+    item_states = item_state.CachedItemStates()
+    item_states.load("host")
+    assert item_states._item_states == {}
+    assert item_states.get_item_state("a") == 1
+    assert item_states.get_item_state("x", "default") == "default"
+    assert item_states._item_states == {("a",): 1}
+    assert sorted(item_states._encoded_item_states) == [("b",)]
+    assert item_states.get_all_item_states() == {("a",): 1, ("b",): 2}
+
+
+def test_binary_store_appends_changes(monkeypatch, counters_dir):
+    monkeypatch.setattr(config, "item_state_store", "binary")
+    _update("host", {str(i): i for i in range(100)})
+    path = os.path.join(counters_dir, "host")
+    inode, size = os.stat(path).st_ino, os.path.getsize(path)
+
+    _update("host", {"1": 1000})
+
+    assert os.stat(path).st_ino == inode
+    assert size < os.path.getsize(path) < size + 30
+    assert _load("host")[("1",)] == 1000
+
+
+def test_binary_store_compacts_file(monkeypatch, counters_dir):
+    monkeypatch.setattr(config, "item_state_store", "binary")
+    monkeypatch.setattr(item_state, "_MIN_OBSOLETE_RECORDS", 10)
+    path = os.path.join(counters_dir, "host")
+    for value in range(30):
+        _update("host", {"a": value, "b": value})
+
+    assert os.path.getsize(path) < 20 * 30
+    assert _load("host") == {("a",): 29, ("b",): 29}
+
+
+def test_binary_store_ignores_incomplete_record(monkeypatch, counters_dir):
+    monkeypatch.setattr(config, "item_state_store", "binary")
+    _update("host", {"a": 1})
+    _update("host", {"b": 2})
+    path = os.path.join(counters_dir, "host")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 1)
+
+    assert _load("host") == {("a",): 1}
+
+    _update("host", {"c": 3})
+    assert _load("host") == {("a",): 1, ("c",): 3}
+
+
+@pytest.mark.parametrize("source_format,target_format", [
+    ("repr", "binary"),
+    ("binary", "repr"),
+])
+def test_convert_item_states(monkeypatch, counters_dir, source_format, target_format):
+    monkeypatch.setattr(config, "item_state_store", source_format)
+    _update("host", {"a": 1.5, "b": u"ä"})
+
+    monkeypatch.setattr(config, "item_state_store", target_format)
+    assert item_state.get_item_states_hosts() == ["host"]
+    assert item_state.convert_item_states("host") is True
+    assert item_state.convert_item_states("host") is False
+
+    with open(os.path.join(counters_dir, "host"), "rb") as f:
+        assert f.read(1) == ("{" if target_format == "repr" else "\x00")
+    assert _load("host") == {("a",): 1.5, ("b",): u"ä"}
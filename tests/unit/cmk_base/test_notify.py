@@ -1,6 +1,7 @@
 # encoding: utf-8
 
 import os
+import pytest  # type: ignore
 from cmk_base import notify
 
 
@@ -9,3 +10,357 @@ def test_os_environment_does_not_override_notification_script_env(monkeypatch):
     monkeypatch.setattr(os, 'environ', {'NOTIFY_CONTACTEMAIL': ''})
     script_env = notify.notification_script_env({'CONTACTEMAIL': 'ab@test.de'})
     assert script_env == {'NOTIFY_CONTACTEMAIL': 'ab@test.de'}
+
+
+@pytest.mark.parametrize("spooler_enabled, spooling, result", [
+    (False, "off", "off"),
+    (True, "off", "local"),
+    (True, "remote", "remote"),
+    (True, "both", "both"),
+])
+def test_spool_for_notification_spooler(monkeypatch, spooler_enabled, spooling, result):
+    monkeypatch.setattr(notify.config, "notification_spooler_enabled", spooler_enabled)
+    monkeypatch.setattr(notify.config, "notification_spooling", spooling)
+    notify._spool_for_notification_spooler()
+    assert notify.config.notification_spooling == result
+
+
+def _spool(spooldir, name, data, mtime):
+    path = "%s/%s" % (spooldir, name)
+    with open(path, "w") as f:
+        f.write(repr(data))
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def _spool_dirs(tmpdir):
+    return "%s" % tmpdir.mkdir("spool"), "%s" % tmpdir.mkdir("spooler")
+
+
+def _queued(spooler):
+    return {plugin: [job.path for job in queue] for plugin, queue in spooler._queues.items()}
+
+
+def test_notification_spooler_scan(tmpdir):
+    spooldir, claimdir = _spool_dirs(tmpdir)
+    _spool(spooldir, "a", {"context": {}, "plugin": "mail"}, 1000)
+    _spool(spooldir, "b", {"context": {}, "plugin": "mail"}, 900)
+    _spool(spooldir, "c", {"context": {}, "plugin": None}, 1000)
+    _spool(spooldir, "d", {"context": {}}, 1000)
+    _spool(spooldir, "e", {"context": {}, "forward": True}, 1000)
+    _spool(spooldir, "f.new", {"context": {}, "plugin": "mail"}, 1000)
+    # Left behind by a previous spooler
+    _spool(claimdir, "g", {"context": {}, "plugin": "mail"}, 950)
+
+    spooler = notify.NotificationSpooler(spooldir, claimdir, lambda path: 0)
+    spooler.scan(2000)
+    assert _queued(spooler) == {
+        "mail": [claimdir + "/b", claimdir + "/g", claimdir + "/a"],
+        "plain email": [claimdir + "/c"],
+        "received": [claimdir + "/d"],
+    }
+
+    # The queued spool files have been claimed, the forwarded ones are left for the mknotifyd
+    assert sorted(os.listdir(spooldir)) == ["e", "f.new"]
+
+    # Known files are not queued again
+    spooler.scan(2000)
+    assert spooler.num_queued() == 5
+
+
+def test_notification_spooler_claim_race(tmpdir, monkeypatch):
+    spooldir, claimdir = _spool_dirs(tmpdir)
+    _spool(spooldir, "taken", {"context": {}, "plugin": "mail"}, 1000)
+    _spool(spooldir, "claimed", {"context": {}, "plugin": "mail"}, 1000)
+
+    # The mknotifyd takes the first spool file right before the spooler claims it
+    rename = os.rename
+
+    def mknotifyd_first(old, new):
+        if old.endswith("/taken"):
+            os.remove(old)
+        rename(old, new)
+
+    monkeypatch.setattr(os, "rename", mknotifyd_first)
+
+    spooler = notify.NotificationSpooler(spooldir, claimdir, lambda path: 0)
+    spooler.scan(2000)
+    assert _queued(spooler) == {"mail": [claimdir + "/claimed"]}
+
+
+def test_notification_spooler_shutdown_releases_spool_files(tmpdir):
+    spooldir, claimdir = _spool_dirs(tmpdir)
+    for name in ["queued", "deferred"]:
+        _spool(spooldir, name, {"context": {}, "plugin": name}, 1000)
+
+    spooler = notify.NotificationSpooler(spooldir, claimdir, lambda path: 0)
+    spooler.scan(2000)
+    spooler.complete(spooler._queues["deferred"].popleft(), 1, 2000)
+    assert os.listdir(spooldir) == []
+
+    spooler.shutdown()
+    assert sorted(os.listdir(spooldir)) == ["deferred", "queued"]
+    assert os.listdir(claimdir) == []
+
+
+def test_notification_spooler_backpressure(tmpdir):
+    spooldir, claimdir = _spool_dirs(tmpdir)
+    for nr in range(5):
+        _spool(spooldir, "%d" % nr, {"context": {}, "plugin": "sms"}, 1000 + nr)
+    paths = ["%s/%d" % (claimdir, nr) for nr in range(5)]
+
+    spooler = notify.NotificationSpooler(spooldir, claimdir, lambda path: 0, max_queue=3)
+    spooler.scan(2000)
+    assert _queued(spooler) == {"sms": paths[:3]}
+
+    job = spooler._queues["sms"].popleft()
+    spooler.complete(job, 0, 2000)
+    spooler.scan(2000)
+    assert _queued(spooler) == {"sms": paths[1:4]}
+
+
+def test_notification_spooler_complete(tmpdir):
+    spooldir, claimdir = _spool_dirs(tmpdir)
+    for name in ["delivered", "deferred", "failed"]:
+        _spool(spooldir, name, {"context": {}, "plugin": name}, 1000)
+
+    spooler = notify.NotificationSpooler(spooldir, claimdir, lambda path: 0, retry_interval=60)
+    spooler.scan(2000)
+    for exitcode, plugin in enumerate(["delivered", "deferred", "failed"]):
+        spooler.complete(spooler._queues[plugin].popleft(), exitcode, 2000)
+
+    assert os.listdir(spooldir) == []
+    assert os.listdir(claimdir) == ["deferred"]
+
+    spooler.scan(2059)
+    assert spooler.num_queued() == 0
+    spooler.scan(2060)
+    assert _queued(spooler)["deferred"] == [claimdir + "/deferred"]
+
+    snapshot = spooler.metrics.snapshot({}, {})
+    assert snapshot["plugins"]["delivered"]["delivered"] == 1
+    assert snapshot["plugins"]["deferred"]["deferred"] == 1
+    assert snapshot["plugins"]["failed"]["failed"] == 1
+    assert snapshot["plugins"]["failed"]["latency"] == {"p50": 1000, "p90": 1000, "p99": 1000}
+
+
+def test_notification_spooler_rate_limiter():
+    rate_limiter = notify._RateLimiter(2, 100.0)
+    assert rate_limiter.acquire(100.0)
+    assert rate_limiter.acquire(100.0)
+    assert not rate_limiter.acquire(100.0)
+    assert rate_limiter.wait_time(100.0) == 0.5
+    assert rate_limiter.acquire(100.5)
+    assert not rate_limiter.acquire(100.5)
+
+    # The bucket does not fill up beyond one second of deliveries
+    assert rate_limiter.acquire(200.0)
+    assert rate_limiter.acquire(200.0)
+    assert not rate_limiter.acquire(200.0)
+
+
+def test_notification_spooler_metrics_percentiles():
+    metrics = notify.SpoolerMetrics(window=100)
+    for latency in range(1, 201):
+        metrics.record("mail", float(latency), 0)
+
+    # Only the latest 100 latencies are considered
+    assert metrics.latency_percentiles("mail") == {"p50": 150.0, "p90": 190.0, "p99": 199.0}
+    assert metrics.latency_percentiles("sms") == {}
+
+    snapshot = metrics.snapshot({"mail": 3, "sms": 1}, {"mail": 2})
+    assert snapshot["plugins"]["mail"]["queue_length"] == 3
+    assert snapshot["plugins"]["mail"]["running"] == 2
+    assert snapshot["plugins"]["mail"]["delivered"] == 200
+    assert snapshot["plugins"]["sms"] == {
+        "queue_length": 1,
+        "running": 0,
+        "latency": {},
+        "delivered": 0,
+        "deferred": 0,
+        "failed": 0,
+    }
+
+
+def test_notification_spooler_workers(tmpdir):
+    spooldir, claimdir = _spool_dirs(tmpdir)
+    delivered_dir = "%s" % tmpdir.mkdir("delivered")
+    for nr in range(6):
+        _spool(spooldir, "%d" % nr, {"context": {}, "plugin": "mail"}, 1000 + nr)
+    _spool(spooldir, "sms", {"context": {}, "plugin": "sms"}, 1000)
+
+    def handler(path):
+        open(delivered_dir + "/" + os.path.basename(path), "w").write("%d" % os.getpid())
+        return 0
+
+    spooler = notify.NotificationSpooler(
+        spooldir, claimdir, handler, default_workers=2, plugin_settings={"sms": {
+            "rate": 0.001
+        }})
+    spooler.scan(2000)
+    try:
+        for _nr in range(100):
+            spooler.dispatch(2000)
+            assert spooler.num_running() <= 3
+            spooler.wait(1.0)
+            if not spooler.num_queued() and not spooler.num_running():
+                break
+    finally:
+        spooler.shutdown()
+
+    assert os.listdir(spooldir) == []
+    assert os.listdir(claimdir) == []
+    assert sorted(os.listdir(delivered_dir)) == ["0", "1", "2", "3", "4", "5", "sms"]
+
+    # Two persistent worker processes delivered the mails
+    mail_pids = set(open(delivered_dir + "/%d" % nr).read() for nr in range(6))
+    assert len(mail_pids) == 2
+    assert str(os.getpid()) not in mail_pids
+
+
+def _notification_rules():
+    return [
+        {
+            "description": "all",
+        },
+        {
+            "description": "disabled",
+            "disabled": True,
+        },
+        {
+            "description": "hosts",
+            "match_hosts": ["host1", "host2"],
+        },
+        {
+            "description": "no hosts",
+            "match_hosts": [],
+        },
+        {
+            "description": "excluded hosts",
+            "match_exclude_hosts": ["host1"],
+        },
+        {
+            "description": "host events",
+            "match_host_event": ["?d"],
+        },
+        {
+            "description": "service events",
+            "match_service_event": ["?c"],
+        },
+        {
+            "description": "host and service events",
+            "match_host_event": ["?d"],
+            "match_service_event": ["?c"],
+        },
+        {
+            "description": "services",
+            "match_services": ["CPU"],
+        },
+        {
+            "description": "service groups",
+            "match_servicegroups": ["sg1"],
+        },
+        {
+            "description": "no service groups",
+            "match_servicegroups": [],
+        },
+        {
+            "description": "contact groups",
+            "match_contactgroups": ["cg1", "cg2"],
+        },
+        {
+            "description": "host and contact groups",
+            "match_hosts": ["host2"],
+            "match_contactgroups": ["cg2"],
+        },
+    ]
+
+
+def _notification_contexts():
+    for what in ["HOST", "SERVICE"]:
+        for hostname in ["host1", "host2", "host3"]:
+            for servicegroups in [None, "", "sg1", "sg2,sg1", "sg2"]:
+                for contactgroups in [None, "", "cg1", "cg2", "cg3"]:
+                    context = {
+                        "WHAT": what,
+                        "HOSTNAME": hostname,
+                        "NOTIFICATIONTYPE": "PROBLEM",
+                        "HOSTSTATE": "DOWN",
+                        "PREVIOUSHOSTHARDSTATE": "UP",
+                        "HOSTOUTPUT": "",
+                    }
+                    if what == "SERVICE":
+                        context.update({
+                            "SERVICEDESC": "CPU",
+                            "SERVICESTATE": "CRITICAL",
+                            "PREVIOUSSERVICEHARDSTATE": "OK",
+                            "SERVICEOUTPUT": "",
+                        })
+                        if servicegroups is not None:
+                            context["SERVICEGROUPNAMES"] = servicegroups
+                    if contactgroups is not None:
+                        context[what + "CONTACTGROUPNAMES"] = contactgroups
+                    yield context
+
+
+def test_compiled_notification_rules_candidates():
+    rules = _notification_rules()
+    compiled_rules = notify.CompiledNotificationRules(rules)
+
+    for context in _notification_contexts():
+        matching = [rule for rule in rules if not notify.rbn_match_rule(rule, context)]
+        candidates = compiled_rules.candidates(context)
+        assert [rule for rule in candidates if not notify.rbn_match_rule(rule, context)] == matching
+        assert all(rule in candidates for rule in matching)
+
+
+def test_compiled_notification_rules_index():
+    compiled_rules = notify.CompiledNotificationRules(_notification_rules())
+
+    def candidates(**context):
+        return [rule["description"] for rule in compiled_rules.candidates(context)]
+
+    assert candidates(
+        WHAT="HOST", HOSTNAME="host1", HOSTCONTACTGROUPNAMES="cg1") == [
+            "all",
+            "hosts",
+            "host events",
+            "host and service events",
+            "no service groups",
+            "contact groups",
+        ]
+    assert candidates(
+        WHAT="SERVICE", HOSTNAME="host2", SERVICEGROUPNAMES="sg1",
+        SERVICECONTACTGROUPNAMES="cg2") == [
+            "all",
+            "hosts",
+            "excluded hosts",
+            "service events",
+            "host and service events",
+            "services",
+            "service groups",
+            "no service groups",
+            "contact groups",
+            "host and contact groups",
+        ]
+
+
+def test_compiled_notification_rules_cache(monkeypatch):
+    monkeypatch.setattr(notify.config, "notification_rules", [{"description": "global"}])
+    monkeypatch.setattr(notify.config, "contacts", {
+        "harry": {
+            "notification_rules": [{
+                "description": "personal"
+            }]
+        },
+    })
+    monkeypatch.setattr(notify, "_compiled_notification_rules", None)
+
+    compiled_rules = notify.compiled_notification_rules()
+    assert [rule["description"] for rule in compiled_rules.rules] == ["global", "personal"]
+    assert notify.compiled_notification_rules() is compiled_rules
+
+    monkeypatch.setattr(notify.config, "notification_rules", [])
+    assert [rule["description"] for rule in notify.compiled_notification_rules().rules] == [
+        "personal"
+    ]
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+import pytest  # type: ignore
+
 import cmk.utils.paths
 import cmk_base.packaging as packaging
 
@@ -30,3 +32,27 @@ def test_config_parts():
         packaging.PackagePart("ec_rule_packs", "Event Console rule packs",
                               "%s/mkeventd.d/mkp/rule_packs" % cmk.utils.paths.default_config_dir)
     ]
+
+
+_CHECK_PACKAGE = {"files": {"checks": ["my_check"]}}
+_WEB_PACKAGE = {"files": {"web": ["plugins/views/my_painter.py"]}}
+
+
+@pytest.mark.parametrize("packages, invalidated", [
+    ([_CHECK_PACKAGE], False),
+    ([_WEB_PACKAGE], True),
+    ([_CHECK_PACKAGE, None], False),
+    ([_CHECK_PACKAGE, _WEB_PACKAGE], True),
+])
+def test_invalidate_gui_plugins(monkeypatch, tmp_path, packages, invalidated):
+    monkeypatch.setattr("cmk.gui.config.config_dir", str(tmp_path / "web"))
+    generation_file = tmp_path / "web" / ".config_generation"
+    generation_file.parent.mkdir()  # pylint: disable=no-member
+
+    packaging._invalidate_gui_plugins(*packages)
+    assert generation_file.exists() is invalidated
+
+    if invalidated:
+        inode = generation_file.stat().st_ino
+        packaging._invalidate_gui_plugins(*packages)
+        assert generation_file.stat().st_ino != inode
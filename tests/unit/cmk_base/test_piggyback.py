@@ -17,26 +17,16 @@ def verbose_logging():
 
 
 @pytest.fixture(autouse=True)
-def test_config():
-    piggyback_dir = cmk.utils.paths.piggyback_dir
-    host_dir = piggyback_dir / "test-host"
-    host_dir.mkdir(parents=True, exist_ok=True)  # pylint: disable=no-member
+def test_config(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "piggyback_dir", tmp_path / "piggyback")
+    monkeypatch.setattr(cmk.utils.paths, "piggyback_source_dir", tmp_path / "piggyback_sources")
+    cmk.utils.paths.piggyback_source_dir.mkdir(parents=True)  # pylint: disable=no-member
 
-    for f in piggyback_dir.glob("*/*"):
+    piggyback.store_piggyback_raw_data("source1", {"test-host": [u"<<<check_mk>>>", u"lala"]})
+    yield
+    for f in cmk.utils.paths.piggyback_source_dir.glob("*"):  # pylint: disable=no-member
         f.unlink()
 
-    source_file = piggyback_dir / "test-host" / "source1"
-    with source_file.open(mode="w", encoding="utf-8") as f:  # pylint: disable=no-member
-        f.write(u"<<<check_mk>>>\nlala\n")
-
-    cmk.utils.paths.piggyback_source_dir.mkdir(parents=True, exist_ok=True)  # pylint: disable=no-member
-    source_status_file = cmk.utils.paths.piggyback_source_dir / "source1"
-    with source_status_file.open("w", encoding="utf-8") as f:  # pylint: disable=no-member
-        f.write(u"")
-    source_stat = source_status_file.stat()  # pylint: disable=no-member
-
-    os.utime(str(source_file), (source_stat.st_atime, source_stat.st_mtime))
-
 
 def test_get_piggyback_raw_data_no_data():
     assert piggyback.get_piggyback_raw_data(piggyback_max_cachefile_age, "nohost") == []
@@ -53,8 +43,7 @@ def test_get_piggyback_raw_data_outdate_old_pigs():
 
     # Fake age the test-host piggyback file
     os.utime(
-        str(cmk.utils.paths.piggyback_dir / "test-host" / "source1"),
-        (time.time() - 10, time.time() - 10))
+        str(cmk.utils.paths.piggyback_source_dir / "source1"), (time.time() - 10, time.time() - 10))
 
     piggyback.store_piggyback_raw_data("source1", {"test-host2": [
         u"<<<check_mk>>>",
@@ -79,6 +68,14 @@ def test_has_piggyback_raw_data():
     assert piggyback.has_piggyback_raw_data(piggyback_max_cachefile_age, "test-host") is True
 
 
+def test_get_piggybacked_host_names():
+    piggyback.store_piggyback_raw_data("source2", {
+        "test-host": [u"<<<check_mk>>>"],
+        "pig": [u"<<<check_mk>>>"],
+    })
+    assert piggyback.get_piggybacked_host_names() == ["pig", "test-host"]
+
+
 def test_remove_source_status_file_not_existing():
     assert piggyback.remove_source_status_file("nosource") is False
 
@@ -109,3 +106,48 @@ def test_store_piggyback_raw_data_second_source():
                                                        ('source1', '<<<check_mk>>>\nlala\n'),
                                                        ('source2', '<<<check_mk>>>\nlulu\n'),
                                                    ],)
+
+
+def test_get_piggyback_raw_data_too_old():
+    os.utime(
+        str(cmk.utils.paths.piggyback_source_dir / "source1"),
+        (time.time() - piggyback_max_cachefile_age - 10,
+         time.time() - piggyback_max_cachefile_age - 10))
+
+    assert piggyback.get_piggyback_raw_data(piggyback_max_cachefile_age, "test-host") == []
+    assert piggyback.has_piggyback_raw_data(piggyback_max_cachefile_age, "test-host") is False
+
+
+def test_get_piggyback_raw_data_updated_by_source():
+    assert piggyback.get_piggyback_raw_data(piggyback_max_cachefile_age,
+                                            "test-host") == [('source1', '<<<check_mk>>>\nlala\n')]
+
+    piggyback.store_piggyback_raw_data("source1", {
+        "test-host2": [u"<<<check_mk>>>", u"lulu"],
+        "test-host": [u"<<<check_mk>>>", u"lala", u"lili"],
+    })
+
+    assert piggyback.get_piggyback_raw_data(
+        piggyback_max_cachefile_age, "test-host") == [('source1', '<<<check_mk>>>\nlala\nlili\n')]
+    assert piggyback.get_piggyback_raw_data(piggyback_max_cachefile_age,
+                                            "test-host2") == [('source1', '<<<check_mk>>>\nlulu\n')]
+
+
+def test_cleanup_piggyback_files():
+    legacy_file = cmk.utils.paths.piggyback_dir / "test-host" / "source1"
+    legacy_file.parent.mkdir(parents=True, exist_ok=True)  # pylint: disable=no-member
+    with legacy_file.open("w", encoding="utf-8") as f:  # pylint: disable=no-member
+        f.write(u"<<<check_mk>>>\nlala\n")
+
+    piggyback.store_piggyback_raw_data("source2", {"test-host": [u"<<<check_mk>>>", u"lulu"]})
+    os.utime(
+        str(cmk.utils.paths.piggyback_source_dir / "source2"),
+        (time.time() - piggyback_max_cachefile_age - 10,
+         time.time() - piggyback_max_cachefile_age - 10))
+
+    piggyback.cleanup_piggyback_files(piggyback_max_cachefile_age)
+
+    assert not legacy_file.parent.exists()
+    assert [f.name for f in cmk.utils.paths.piggyback_source_dir.glob("*")] == ["source1"]
+    assert piggyback.get_piggyback_raw_data(piggyback_max_cachefile_age,
+                                            "test-host") == [('source1', '<<<check_mk>>>\nlala\n')]
@@ -3,10 +3,20 @@ import time
 from pprint import pprint
 import pytest
 
+import cmk.utils.prediction
 from cmk_base import prediction
+from cmk.utils.prediction import TimeSeries
 from testlib import on_time
 
 
+@pytest.fixture(params=["numpy", "python"])
+def stats_implementation(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(cmk.utils.prediction, "_numpy", None)
+
+
 @pytest.mark.parametrize("group_by, timestamp, result", [
     (prediction.group_by_wday, 1543402800, ('wednesday', 43200)),
     (prediction.group_by_day, 1543402800, ('everyday', 43200)),
@@ -103,5 +113,73 @@ def test_time_slices(utcdate, timezone, horizon, period_info, timegroup, result)
         pytest.approx([2.0, 2, 2, 2.0]),
     ]),
 ])
-def test_data_stats(slices, result):
+def test_data_stats(stats_implementation, slices, result):
     assert prediction.data_stats(slices) == result
+
+
+class FakeRRDDataColumn(object):
+    cf = "MAX"
+
+    def __init__(self):
+        self.queries = []
+
+    def time_series_of(self, time_windows):
+        self.queries.append(time_windows)
+        return [
+            TimeSeries([start, end, 3600] + [float(start % 7)] * ((end - start) // 3600))
+            for start, end in time_windows
+        ]
+
+
+def test_retrieve_grouped_data_from_rrd_reuses_slices(tmpdir):
+    now = int(time.time())
+    today = now - now % 86400
+    time_windows = [(today - 86400 * i, today - 86400 * (i - 1)) for i in range(4)]
+    slices_file = str(tmpdir.join("everyday.slices"))
+    rrd_column = FakeRRDDataColumn()
+
+    result = prediction.retrieve_grouped_data_from_rrd(rrd_column, time_windows, slices_file)
+    assert rrd_column.queries == [time_windows]
+    assert result[0] == (today, today + 86400, 3600)
+    assert [s[0] for s in result[1]] == [float(start % 7) for start, _end in time_windows]
+
+    # Only the slice which was not complete during the first query is fetched again
+    assert prediction.retrieve_grouped_data_from_rrd(rrd_column, time_windows,
+                                                     slices_file) == result
+    assert rrd_column.queries[1] == time_windows[:1]
+
+    # The slices are only kept for the same consolidation function
+    rrd_column.cf = "MIN"
+    assert prediction.retrieve_grouped_data_from_rrd(rrd_column, time_windows,
+                                                     slices_file) == result
+    assert rrd_column.queries[2] == time_windows
+
+
+def test_get_levels_precomputed(monkeypatch, tmpdir):
+    monkeypatch.setattr(prediction.cmk.utils.paths, "var_dir", str(tmpdir))
+    rrd_column = FakeRRDDataColumn()
+    monkeypatch.setattr(
+        prediction.cmk.utils.prediction,
+        "rrd_datacolum", lambda hostname, service_description, dsname, cf: rrd_column)
+    params = {"period": "hour", "horizon": 3, "levels_upper": ("absolute", (1, 2))}
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+
+    levels = prediction.get_levels("host", "CPU load", "load15", params, "MAX")
+    assert len(rrd_column.queries) == 1
+
+    # The up to date prediction is only read
+    assert prediction.get_levels("host", "CPU load", "load15", params, "MAX") == levels
+    assert len(rrd_column.queries) == 1
+
+    # Compute the prediction of the next day in advance, but only once
+    assert prediction.precompute_predictions(lead_time=0, max_rate=1000) == 0
+    assert prediction.precompute_predictions(lead_time=86400, max_rate=1000) == 1
+    assert prediction.precompute_predictions(lead_time=86400, max_rate=1000) == 0
+    assert len(rrd_column.queries) == 2
+
+    # The next day the check uses the precomputed prediction
+    now += 86401
+    prediction.get_levels("host", "CPU load", "load15", params, "MAX")
+    assert len(rrd_column.queries) == 2
+    assert prediction.precompute_predictions(lead_time=3600, max_rate=1000) == 0
@@ -1,9 +1,11 @@
 from testlib.base import Scenario
 
 import cmk
+import cmk.utils.paths
 import cmk_base.automations
 import cmk_base.automations.check_mk as automations
 import cmk_base.config as config
+import cmk_base.piggyback as piggyback
 
 
 def test_registered_automations(site):
@@ -118,3 +120,14 @@ def test_analyse_host(monkeypatch):
             "explicit": "explicit"
         },
     }
+
+
+def test_delete_hosts_removes_piggyback_data(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "piggyback_dir", tmp_path / "piggyback")
+    monkeypatch.setattr(cmk.utils.paths, "piggyback_source_dir", tmp_path / "piggyback_sources")
+    cmk.utils.paths.piggyback_source_dir.mkdir()  # pylint: disable=no-member
+    piggyback.store_piggyback_raw_data("source-host", {"pig": [u"<<<check_mk>>>"]})
+    assert piggyback.get_piggybacked_host_names() == ["pig"]
+
+    automations.AutomationDeleteHosts().execute(["source-host"])
+    assert piggyback.get_piggybacked_host_names() == []
@@ -2,6 +2,8 @@
 import errno
 import socket
 import ssl
+import threading
+import time
 from contextlib import closing
 try:
     from pathlib import Path  # Py3 first
@@ -203,3 +205,188 @@ def test_create_socket_no_cert(tmpdir):
         "unix:/tmp/xyz", tls=True, verify=True, ca_file_path="%s/z.pem" % tmpdir)
     with pytest.raises(livestatus.MKLivestatusConfigError, match="Failed to load CA file"):
         live._create_socket(socket.AF_INET)
+
+
+@pytest.fixture()
+def fake_livestatus(sock_path):
+    """Answers the queries sent to the local socket with the given responses
+
+    The responses are sent in small pieces to have them split at arbitrary
+    positions, e.g. in the middle of multi byte UTF-8 characters."""
+    sock = socket.socket(socket.AF_UNIX)
+    sock.bind("%s" % sock_path)
+    sock.listen(1)
+    queries = []
+
+    def serve(*responses):
+        def handle():
+            conn = sock.accept()[0]
+            with closing(conn):
+                for code, body in responses:
+                    query = b""
+                    while not query.endswith(b"\n\n"):
+                        query += conn.recv(4096)
+                    queries.append(query)
+                    response = b"%s %11d\n%s" % (code, len(body), body)
+                    for pos in range(0, len(response), 7):
+                        conn.sendall(response[pos:pos + 7])
+
+        thread = threading.Thread(target=handle)
+        thread.daemon = True
+        thread.start()
+        return queries
+
+    yield serve
+    sock.close()
+
+
+def test_livestatus_invalid_output_format():
+    with pytest.raises(livestatus.MKLivestatusConfigError, match="Invalid output format"):
+        livestatus.SingleSiteConnection("unix:/tmp/xyz", output_format="xml")
+
+
+@pytest.mark.parametrize("output_format,body,result", [
+    ("python", b'[["h\xc3\xa4st", 1, [2.5]],\n["h2", 0, []]]\n', [["h\xc3\xa4st", 1, [2.5]],
+                                                                  ["h2", 0, []]]),
+    ("json", b'[["h\xc3\xa4st",1,[2.5]],\n["h2",0,[]]]\n', [[u"häst", 1, [2.5]], [u"h2", 0, []]]),
+    ("csv", b'h\xc3\xa4st;1;2.5\nh2;0;\n', [[u"häst", u"1", u"2.5"], [u"h2", u"0", u""]]),
+])
+def test_livestatus_query_output_formats(fake_livestatus, output_format, body, result):
+    queries = fake_livestatus(("200", body))
+    live = livestatus.LocalConnection(output_format=output_format)
+
+    assert live.query("GET hosts\nColumns: name state perf\n") == result
+    assert b"OutputFormat: %s\n" % output_format in queries[0]
+
+
+def test_livestatus_iter_query(fake_livestatus):
+    body = b'[["h\xc3\xa4st",1,[2.5]],\n["h2",0,[]]\n]\n'
+    queries = fake_livestatus(("200", body), ("200", body))
+    live = livestatus.LocalConnection()
+
+    rows = live.iter_query("GET hosts\nColumns: name state perf\n")
+    assert next(rows) == [u"häst", 1, [2.5]]
+    assert list(rows) == [[u"h2", 0, []]]
+    assert b"OutputFormat: json\n" in queries[0]
+
+    # The connection is still usable for the next query
+    live.set_prepend_site(True)
+    assert list(live.iter_query("GET hosts\n")) == [[u"", u"häst", 1, [2.5]], [u"", u"h2", 0, []]]
+
+
+def test_livestatus_iter_query_stopped_early(fake_livestatus):
+    fake_livestatus(("200", b'[["a"],\n["b"]]\n'))
+    live = livestatus.LocalConnection()
+    live.connect()
+
+    rows = live.iter_query("GET hosts\nColumns: name\n")
+    assert next(rows) == [u"a"]
+    rows.close()
+    assert live.socket is None
+
+
+def test_livestatus_iter_query_table_not_found(fake_livestatus):
+    fake_livestatus(("404", b"Invalid GET request, no such table 'xyz'\n"))
+    live = livestatus.LocalConnection()
+
+    with pytest.raises(livestatus.MKLivestatusTableNotFoundError, match="no such table"):
+        list(live.iter_query("GET xyz\n"))
+
+
+@pytest.mark.parametrize("chunks", [
+    [b'[]\n'],
+    [b'[[1,', b'2],', b'[3', b',4]]'],
+    [b'', b' ', b'[\n[1,2]\n', b',\n[3,4]]\n'],
+])
+def test_incremental_row_decoder(chunks):
+    decoder = livestatus._IncrementalRowDecoder()
+    rows = []
+    for index, chunk in enumerate(chunks):
+        rows += decoder.feed(chunk, final=index == len(chunks) - 1)
+    assert rows == ([] if chunks == [b'[]\n'] else [[1, 2], [3, 4]])
+
+
+@pytest.mark.parametrize("data", [
+    b'{"a": 1}',
+    b'[[1] [2]]',
+    b'[[1],',
+    b'[[1]] x',
+])
+def test_incremental_row_decoder_malformed(data):
+    with pytest.raises(ValueError):
+        livestatus._IncrementalRowDecoder().feed(data, final=True)
+
+
+def _fake_site(socket_path, *answers):
+    """Answer the queries to a site with (delay, code, body) or close the connection on None"""
+    sock = socket.socket(socket.AF_UNIX)
+    sock.bind(socket_path)
+    sock.listen(2)
+
+    def serve():
+        pending = list(answers)
+        while pending:
+            conn = sock.accept()[0]
+            with closing(conn):
+                while pending:
+                    query = b""
+                    while not query.endswith(b"\n\n"):
+                        query += conn.recv(4096)
+                    answer = pending.pop(0)
+                    if answer is None:
+                        break
+                    delay, code, body = answer
+                    time.sleep(delay)
+                    conn.sendall(b"%s %11d\n%s" % (code, len(body), body))
+        time.sleep(5)
+        sock.close()
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return {"socket": "unix:%s" % socket_path, "persist": True}
+
+
+def test_multisite_query_parallel(tmpdir):
+    sites = {
+        "slow": _fake_site("%s/slow" % tmpdir, (0.3, "200", b'[["a"],\n["b"]]\n')),
+        "fast": _fake_site("%s/fast" % tmpdir, (0, "200", b'[["c"]]\n')),
+        "missing": _fake_site("%s/missing" % tmpdir, (0, "404", b"no such table\n")),
+    }
+    live = livestatus.MultiSiteConnection(sites)
+    live.set_prepend_site(True)
+
+    result = live.query("GET hosts\nColumns: name\n")
+    assert sorted(result) == [["fast", "c"], ["slow", "a"], ["slow", "b"]]
+    assert live.dead_sites() == {}
+    assert sorted(live.alive_sites()) == ["fast", "missing", "slow"]
+
+    stats = live.query_stats()
+    assert sorted(stats) == ["fast", "missing", "slow"]
+    assert stats["fast"]["response_time"] < 0.3 <= stats["slow"]["response_time"]
+    assert stats["slow"]["bytes"] == 15
+
+
+def test_multisite_query_parallel_timeout(tmpdir):
+    sites = {
+        "hanging": _fake_site("%s/hanging" % tmpdir, (5, "200", b'[["a"]]\n')),
+        "fast": _fake_site("%s/fast" % tmpdir, (0, "200", b'[["b"]]\n')),
+    }
+    live = livestatus.MultiSiteConnection(sites)
+    live.set_query_timeout(0.2)
+
+    start = time.time()
+    assert live.query("GET hosts\nColumns: name\n") == [["b"]]
+    assert time.time() - start < 2
+    assert live.alive_sites() == ["fast"]
+    assert "Timeout" in str(live.dead_sites()["hanging"]["exception"])
+
+
+def test_multisite_query_parallel_reconnect(tmpdir):
+    sites = {
+        "closing": _fake_site("%s/closing" % tmpdir, None, (0, "200", b'[["a"]]\n')),
+    }
+    live = livestatus.MultiSiteConnection(sites)
+
+    assert live.query("GET hosts\nColumns: name\n") == [["a"]]
+    assert live.dead_sites() == {}